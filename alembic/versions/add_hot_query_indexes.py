@@ -0,0 +1,75 @@
+"""Tez-tez so'rovlar uchun kompozit indekslar va stocks (warehouse_id, product_id) unique
+
+Revision ID: hot_query_idx
+Revises: cash_payment_type, inv_wh_prev_qty, merge_heads_01
+Create Date: 2026-10-17
+
+Unique indeksdan oldin takroriy stocks qatorlari eng kichik id li qatorga yig'iladi,
+stock_movements.stock_id unga ko'chiriladi, qolganlari o'chiriladi.
+"""
+from typing import Sequence, Union
+from alembic import op
+from sqlalchemy import text
+
+
+revision: str = "hot_query_idx"
+down_revision: Union[str, Sequence[str], None] = ("cash_payment_type", "inv_wh_prev_qty", "merge_heads_01")
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+INDEXES = [
+    ("uq_stocks_warehouse_product", "stocks", ["warehouse_id", "product_id"], True),
+    ("ix_stock_movements_wh_product_created", "stock_movements", ["warehouse_id", "product_id", "created_at"], False),
+    ("ix_stock_movements_document", "stock_movements", ["document_type", "document_id"], False),
+    ("ix_orders_type_status_created", "orders", ["type", "status", "created_at"], False),
+    ("ix_orders_type_date", "orders", ["type", "date"], False),
+    ("ix_orders_created_at", "orders", ["created_at"], False),
+    ("ix_payments_cash_type_status", "payments", ["cash_register_id", "type", "status"], False),
+    ("ix_attendances_employee_date", "attendances", ["employee_id", "date"], False),
+    ("ix_agent_locations_agent_recorded", "agent_locations", ["agent_id", "recorded_at"], False),
+]
+
+KEEP_IDS = (
+    "SELECT MIN(id) FROM stocks WHERE warehouse_id IS NOT NULL AND product_id IS NOT NULL "
+    "GROUP BY warehouse_id, product_id"
+)
+
+
+def _existing_indexes(conn, table: str) -> set:
+    if conn.dialect.name == "sqlite":
+        return {row[1] for row in conn.execute(text(f"PRAGMA index_list({table})"))}
+    return set()
+
+
+def _dedupe_stocks(conn) -> None:
+    conn.execute(text(
+        "UPDATE stocks SET quantity = (SELECT SUM(COALESCE(s2.quantity, 0)) FROM stocks s2 "
+        "WHERE s2.warehouse_id = stocks.warehouse_id AND s2.product_id = stocks.product_id) "
+        "WHERE id IN (SELECT MIN(id) FROM stocks WHERE warehouse_id IS NOT NULL AND product_id IS NOT NULL "
+        "GROUP BY warehouse_id, product_id HAVING COUNT(*) > 1)"
+    ))
+    conn.execute(text(
+        "UPDATE stock_movements SET stock_id = (SELECT MIN(s2.id) FROM stocks s1 JOIN stocks s2 "
+        "ON s2.warehouse_id = s1.warehouse_id AND s2.product_id = s1.product_id WHERE s1.id = stock_movements.stock_id) "
+        "WHERE stock_id IN (SELECT id FROM stocks WHERE warehouse_id IS NOT NULL AND product_id IS NOT NULL "
+        f"AND id NOT IN ({KEEP_IDS}))"
+    ))
+    conn.execute(text(
+        "DELETE FROM stocks WHERE warehouse_id IS NOT NULL AND product_id IS NOT NULL "
+        f"AND id NOT IN ({KEEP_IDS})"
+    ))
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    _dedupe_stocks(conn)
+    for name, table, columns, unique in INDEXES:
+        if name in _existing_indexes(conn, table):
+            continue
+        op.create_index(name, table, columns, unique=unique)
+
+
+def downgrade() -> None:
+    for name, table, _columns, _unique in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
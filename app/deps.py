@@ -3,27 +3,31 @@ Umumiy dependency lar — get_db, get_current_user, require_auth, require_admin.
 Routerlar shu moduldan import qiladi.
 """
 from typing import Optional
-from fastapi import Depends, Cookie
+from fastapi import Depends, Cookie, Request
 from sqlalchemy.orm import Session
 
 from app.models.database import get_db, User
-from app.utils.auth import get_user_from_token
+from app.utils.auth_context import attach_user, decode_token, get_active_user
 
 
 def get_current_user(
+    request: Request,
     session_token: Optional[str] = Cookie(None),
     db: Session = Depends(get_db),
 ) -> Optional[User]:
-    """Cookie dan foydalanuvchini olish"""
+    """Cookie dan foydalanuvchini olish. auth_middleware request.state.auth ni to'ldirgan bo'lsa — qayta ishlatiladi."""
     if not session_token:
         return None
-    user_data = get_user_from_token(session_token)
+    ctx = getattr(request.state, "auth", None)
+    if ctx is not None and ctx.token == session_token:
+        return attach_user(db, ctx.user)
+    user_data = decode_token(session_token)
     if not user_data:
         return None
-    user = db.query(User).filter(User.id == user_data["user_id"]).first()
-    if not user or not user.is_active:
+    user = get_active_user(user_data["user_id"])
+    if not user:
         return None
-    return user
+    return attach_user(db, user)
 
 
 def require_auth(current_user: Optional[User] = Depends(get_current_user)) -> Optional[User]:
@@ -0,0 +1,251 @@
+"""
+Yagona ASGI middleware — avvalgi uchta @app.middleware("http") qatlami o'rniga
+(auth_middleware → csrf_middleware → global_safe_middleware, shu tartibda).
+
+- static, favicon, /ping kabi yo'llar darhol o'tkaziladi;
+- auth: token va faol foydalanuvchi tekshiriladi, natija request.state.auth da (app.utils.auth_context);
+- CSRF: token X-CSRF-Token sarlavhasidan yoki formadan; multipart tanasi to'liq o'qilmaydi —
+  csrf_token maydoni topilguncha o'qilgan qism ilovaga qayta uzatiladi, qolgani oqim bo'yicha o'tadi;
+- ilovadagi istalgan xato: server_error.log, brauzer uchun 500 sahifasi, API uchun JSON.
+"""
+import os
+import traceback
+from datetime import datetime
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from starlette.requests import HTTPConnection
+from starlette.responses import HTMLResponse, JSONResponse, RedirectResponse, Response
+
+from app.utils.auth import generate_csrf_token, verify_csrf_token
+from app.utils.auth_context import AuthContext, decode_token, get_active_user
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HTML_500 = """
+<!DOCTYPE html>
+<html lang="uz">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>500 - Server xatosi - TOTLI HOLVA</title>
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
+</head>
+<body class="bg-light d-flex align-items-center justify-content-center min-vh-100">
+    <div class="text-center p-5">
+        <h1 class="display-1 text-danger">500</h1>
+        <h2 class="text-secondary">Server xatosi</h2>
+        <p class="lead text-muted">Iltimos, keyinroq urinib ko'ring yoki administrator bilan bog'laning.</p>
+        <a href="/" class="btn btn-success mt-3">Bosh sahifaga</a>
+        <a href="/login" class="btn btn-outline-secondary mt-3 ms-2">Kirish</a>
+    </div>
+</body>
+</html>
+"""
+
+# Login, logout, static, favicon, ping — himoya kerak emas (auth ham, CSRF ham)
+_OPEN_PATHS = {"/login", "/logout", "/favicon.ico", "/ping"}
+# Mobil/PWA agent va haydovchi API (alohida token bilan) — session talab qilinmaydi
+_AUTH_FREE_PATHS = {
+    "/api/agent/login", "/api/driver/login", "/api/agent/orders", "/api/agent/partners", "/api/agent/partners/nearest",
+    "/api/stream",  # o'zi tekshiradi: session_token cookie yoki ?token= (PWA)
+}
+_AUTH_FREE_POST = {"/api/agent/location", "/api/driver/location", "/api/agent/location/batch", "/api/driver/location/batch"}
+# CSRF tekshirilmaydigan POST yo'llar (batch — JSON, token tanada, cookie bilan autentifikatsiya yo'q)
+_CSRF_FREE_PATHS = {"/login", "/api/agent/login", "/api/driver/login", "/api/agent/location/batch", "/api/driver/location/batch"}
+_SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+CSRF_COOKIE_MAX_AGE = 86400 * 7
+_CSRF_FIELD = b'name="csrf_token"'
+SERVER_SOURCE_HEADER = (b"x-server-source", b"pwp")
+
+
+def log_server_error(tag: str, tb: str) -> None:
+    """Traceback ni loyiha ildizidagi (yoki joriy papkadagi) server_error.log ga yozadi."""
+    for _dir in [_ROOT, os.getcwd()]:
+        try:
+            if _dir:
+                with open(os.path.join(_dir, "server_error.log"), "a", encoding="utf-8") as f:
+                    f.write("\n--- [%s] %s ---\n%s\n" % (tag, datetime.now().isoformat(), tb))
+                break
+        except Exception:
+            continue
+
+
+def _csrf_cookie_headers(token: str) -> List[Tuple[bytes, bytes]]:
+    r = Response()
+    r.set_cookie("csrf_token", token, path="/", httponly=False, samesite="lax", max_age=CSRF_COOKIE_MAX_AGE)
+    return [h for h in r.raw_headers if h[0] == b"set-cookie"]
+
+
+def _token_from_multipart(buf: bytes) -> Tuple[bool, Optional[str]]:
+    """(topildimi, qiymat). Maydon hali to'liq kelmagan bo'lsa (False, None)."""
+    idx = buf.find(_CSRF_FIELD)
+    if idx == -1:
+        return False, None
+    start = buf.find(b"\r\n\r\n", idx)
+    if start == -1:
+        return False, None
+    start += 4
+    end = buf.find(b"\r\n", start)
+    if end == -1:
+        return False, None
+    return True, buf[start:end].decode("utf-8", errors="replace")
+
+
+class AppMiddleware:
+    """Auth + CSRF + xato sahifasi bitta ASGI qatlamida (BaseHTTPMiddleware task/stream xarajatisiz)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        path = scope.get("path") or "/"
+        if path.startswith("/static"):
+            await self.app(scope, receive, send)
+            return
+        conn = HTTPConnection(scope)
+        method = (scope.get("method") or "GET").upper()
+        state = scope.setdefault("state", {})
+
+        try:
+            denied = self._authenticate(conn, path, method, state)
+        except Exception:
+            tb = traceback.format_exc()
+            traceback.print_exc()
+            log_server_error("auth_middleware", tb)
+            denied = self._auth_error_response(conn, path)
+        if denied is not None:
+            await denied(scope, receive, send)
+            return
+
+        cookie_token = conn.cookies.get("csrf_token")
+        token = cookie_token or generate_csrf_token()
+        state["csrf_token"] = token
+        if method not in _SAFE_METHODS and path not in _CSRF_FREE_PATHS:
+            try:
+                received, receive = await self._received_csrf_token(conn, receive)
+            except Exception:
+                traceback.print_exc()
+                received = None
+            if not verify_csrf_token(received, token):
+                if "text/html" in conn.headers.get("accept", ""):
+                    denied = RedirectResponse(url="/?error=csrf", status_code=303)
+                else:
+                    denied = JSONResponse(status_code=403, content={"detail": "CSRF token noto'g'ri yoki yo'q"})
+                await denied(scope, receive, send)
+                return
+
+        extra_headers = [SERVER_SOURCE_HEADER]
+        if not cookie_token and (method in _SAFE_METHODS or path not in _CSRF_FREE_PATHS):
+            extra_headers += _csrf_cookie_headers(token)
+        await self._call_app(conn, path, scope, receive, send, extra_headers)
+
+    def _authenticate(self, conn: HTTPConnection, path: str, method: str, state: dict) -> Optional[Response]:
+        """None — o'tkazish; aks holda qaytariladigan javob (401 yoki /login ga yo'naltirish)."""
+        if path in _OPEN_PATHS or path in _AUTH_FREE_PATHS:
+            return None
+        if path in _AUTH_FREE_POST and method == "POST":
+            return None
+        is_api = path.startswith("/api/")
+        token = conn.cookies.get("session_token")
+        if not token:
+            if is_api:
+                return JSONResponse(status_code=401, content={"detail": "Login talab qilindi"})
+            return RedirectResponse(url="/login", status_code=303)
+        user_data = decode_token(token)
+        user = get_active_user(user_data["user_id"]) if user_data else None
+        if not user:
+            if is_api:
+                detail = "Foydalanuvchi faol emas" if user_data else "Session muddati tugadi"
+                return JSONResponse(status_code=401, content={"detail": detail})
+            resp = RedirectResponse(url="/login", status_code=303)
+            resp.delete_cookie("session_token")
+            return resp
+        # get_current_user shu kontekstni qayta ishlatadi
+        state["auth"] = AuthContext(token, user)
+        return None
+
+    @staticmethod
+    def _auth_error_response(conn: HTTPConnection, path: str) -> Response:
+        if path == "/login" or path == "/favicon.ico":
+            return JSONResponse(status_code=500, content={"detail": "Server xatosi"})
+        if "text/html" in (conn.headers.get("accept") or ""):
+            resp = RedirectResponse(url="/login?error=please_retry", status_code=303)
+            resp.delete_cookie("session_token", path="/")
+            return resp
+        return JSONResponse(status_code=500, content={"detail": "Server xatosi"})
+
+    @staticmethod
+    async def _received_csrf_token(conn: HTTPConnection, receive):
+        """(token, receive). Tana o'qilgan bo'lsa — o'qilgan qismni qayta beradigan receive qaytadi."""
+        received = conn.headers.get("x-csrf-token")
+        if received:
+            return received, receive
+        content_type = conn.headers.get("content-type", "")
+        if "application/x-www-form-urlencoded" in content_type:
+            multipart = False
+        elif "multipart/form-data" in content_type:
+            multipart = True
+        else:
+            return None, receive
+
+        buf = bytearray()
+        pending = []  # http.disconnect kabi tanasiz xabarlar
+        more_body = True
+        found = False
+        while more_body:
+            message = await receive()
+            if message["type"] != "http.request":
+                pending.append(message)
+                break
+            buf += message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if multipart:
+                found, received = _token_from_multipart(buf)
+                if found:
+                    break
+        if not multipart:
+            received = (parse_qs(buf.decode("utf-8", errors="replace")).get("csrf_token") or [None])[0]
+
+        replay = [{"type": "http.request", "body": bytes(buf), "more_body": more_body}] + pending
+
+        async def replay_receive():
+            if replay:
+                return replay.pop(0)
+            return await receive()
+
+        return received, replay_receive
+
+    async def _call_app(self, conn, path, scope, receive, send, extra_headers):
+        started = False
+
+        async def send_wrapper(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                message["headers"] = list(message.get("headers", [])) + extra_headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except BaseException:
+            tb = traceback.format_exc()
+            traceback.print_exc()
+            log_server_error("global_safe", tb)
+            if started:
+                return  # javob boshlangan — faqat log
+            if path == "/login" or path == "/favicon.ico":
+                r = JSONResponse(status_code=500, content={"detail": "Server xatosi"})
+            elif "text/html" in (conn.headers.get("accept") or ""):
+                # 500 sahifasini ko'rsatamiz, session o'chirilmaydi (logout hissi bermaslik)
+                r = HTMLResponse(content=HTML_500, status_code=500)
+            else:
+                r = JSONResponse(status_code=500, content={"detail": "Server xatosi"})
+            r.raw_headers.append(SERVER_SOURCE_HEADER)
+            await r(scope, receive, send)
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Date, UniqueConstraint, Table, text
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Text, Date, UniqueConstraint, Index, Table, text
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
 from datetime import datetime
 import os
@@ -252,6 +252,10 @@ class Warehouse(Base):
 class Stock(Base):
     """Ombor qoldiqlari"""
     __tablename__ = "stocks"
+    __table_args__ = (
+        # Bitta ombor+mahsulot uchun bitta qator (eski takrorlar migratsiyada birlashtiriladi)
+        Index("uq_stocks_warehouse_product", "warehouse_id", "product_id", unique=True),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     warehouse_id = Column(Integer, ForeignKey("warehouses.id"))
@@ -267,6 +271,10 @@ class Stock(Base):
 class StockMovement(Base):
     """Ombor harakati - har bir operatsiya uchun hujjat"""
     __tablename__ = "stock_movements"
+    __table_args__ = (
+        Index("ix_stock_movements_wh_product_created", "warehouse_id", "product_id", "created_at"),
+        Index("ix_stock_movements_document", "document_type", "document_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     stock_id = Column(Integer, ForeignKey("stocks.id"), nullable=True)  # null bo'lishi mumkin (yangi qoldiq)
@@ -295,6 +303,32 @@ class StockMovement(Base):
     user = relationship("User")
 
 
+class StockSourceFlag(Base):
+    """Ombor+mahsulot bo'yicha tasdiqlangan manba hujjati borligi (qoldiq hisoboti uchun; create_stock_movement yangilaydi)"""
+    __tablename__ = "stock_source_flags"
+    __table_args__ = (UniqueConstraint("warehouse_id", "product_id", name="uq_stock_source_flag_wh_product"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    has_confirmed_source = Column(Boolean, default=False, nullable=False)  # Kamida bitta tasdiqlangan hujjat harakati bor
+    last_movement_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class StockSnapshot(Base):
+    """Kun yakunidagi qoldiq (ombor+mahsulot) — sana bo'yicha qoldiq hisoboti shu nuqtadan boshlab hisoblanadi"""
+    __tablename__ = "stock_snapshots"
+    __table_args__ = (UniqueConstraint("snapshot_date", "warehouse_id", "product_id", name="uq_stock_snapshot_date_wh_product"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    snapshot_date = Column(Date, nullable=False, index=True)  # Shu kun oxiridagi holat
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Float, nullable=False, default=0)  # Oxirgi harakatning quantity_after qiymati
+    created_at = Column(DateTime, default=datetime.now)
+
+
 class WarehouseTransfer(Base):
     """Ombordan omborga o'tkazish hujjati"""
     __tablename__ = "warehouse_transfers"
@@ -677,6 +711,11 @@ class Partner(Base):
 class Order(Base):
     """Buyurtmalar va sotuvlar"""
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_type_status_created", "type", "status", "created_at"),
+        Index("ix_orders_type_date", "type", "date"),
+        Index("ix_orders_created_at", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True)
@@ -723,6 +762,56 @@ class OrderItem(Base):
     warehouse = relationship("Warehouse", foreign_keys=[warehouse_id])
 
 
+class DailySalesRollup(Base):
+    """Kunlik savdo yig'indisi (kun+ombor+kontragent+foydalanuvchi) — dashboardlar shu jadvaldan o'qiydi"""
+    __tablename__ = "daily_sales_rollup"
+    __table_args__ = (UniqueConstraint("day", "warehouse_id", "partner_id", "user_id", name="uq_daily_sales_rollup_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(Date, nullable=False, index=True)  # Order.created_at sanasi
+    warehouse_id = Column(Integer, ForeignKey("warehouses.id"), nullable=True)
+    partner_id = Column(Integer, ForeignKey("partners.id"), nullable=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    sales_total = Column(Float, nullable=False, default=0)  # Bajarilgan sotuvlar summasi
+    sales_count = Column(Integer, nullable=False, default=0)
+    returns_total = Column(Float, nullable=False, default=0)  # Tasdiqlangan qaytarishlar summasi
+    returns_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class PartnerLedgerEntry(Base):
+    """Kontragent hisob-kitob daftari — o'tkazilgan hujjatlar (sotuv, qaytarish, to'lov, xarid, qoldiq hujjati).
+    debit — kontragent bizga qarzdor bo'ladi, credit — qarz kamayadi / biz qarzdor bo'lamiz."""
+    __tablename__ = "partner_ledger"
+    __table_args__ = (
+        Index("ix_partner_ledger_partner_date", "partner_id", "date"),
+        Index("ix_partner_ledger_document", "doc_type", "doc_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    partner_id = Column(Integer, ForeignKey("partners.id"), nullable=False)
+    date = Column(DateTime, nullable=False)  # Hujjat sanasi
+    doc_type = Column(String(20), nullable=False)  # sale, return_sale, payment, purchase, balance_doc
+    doc_id = Column(Integer, nullable=False)
+    doc_number = Column(String(50))
+    debit = Column(Float, nullable=False, default=0)
+    credit = Column(Float, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class PartnerBalanceSnapshot(Base):
+    """Oy boshidagi kontragent qoldig'i — month sanasidan oldingi barcha yozuvlar yig'indisi"""
+    __tablename__ = "partner_balance_snapshots"
+    __table_args__ = (UniqueConstraint("partner_id", "month", name="uq_partner_balance_snapshot"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    partner_id = Column(Integer, ForeignKey("partners.id"), nullable=False)
+    month = Column(Date, nullable=False, index=True)  # Oyning 1-kuni
+    debit = Column(Float, nullable=False, default=0)
+    credit = Column(Float, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.now)
+
+
 class PosDraft(Base):
     """POS: vaqtinchalik saqlangan chek (savat). Chekni saqlash / Chekni yuklash."""
     __tablename__ = "pos_drafts"
@@ -744,12 +833,13 @@ class PosDraft(Base):
 
 class CashRegister(Base):
     """Kassalar. payment_type: POS da qaysi to'lov turiga bog'lanishi (naqd, plastik, click, terminal).
-    Balans = opening_balance (qoldiq) + kirim − chiqim. Qoldiq «Kassa qoldiq hujjati» orqali kiritiladi."""
+    Balans = opening_balance (qoldiq) + kirim − chiqim ± o'tkazmalar; delta sifatida yuritiladi (services/cash_ledger).
+    Qoldiq «Kassa qoldiq hujjati» orqali kiritiladi."""
     __tablename__ = "cash_registers"
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100))
-    balance = Column(Float, default=0)  # Eski maydon (saqlandi); ko'rsatish opening_balance + kirim - chiqim
+    balance = Column(Float, default=0)  # Joriy balans — har bir to'lov/o'tkazmada delta bilan yangilanadi
     opening_balance = Column(Float, default=0)  # Qoldiq — faqat qoldiq hujjati orqali o'rnatiladi
     department_id = Column(Integer, ForeignKey("departments.id"), nullable=True)  # Bo'limga biriktirish
     payment_type = Column(String(20), nullable=True)  # naqd, plastik, click, terminal — POS to'lov turi
@@ -788,6 +878,9 @@ user_partners = Table(
 class Payment(Base):
     """To'lovlar"""
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_cash_type_status", "cash_register_id", "type", "status"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     number = Column(String(50), unique=True, index=True)
@@ -917,6 +1010,9 @@ class Salary(Base):
 class Attendance(Base):
     """Davomat yozuvi (kunlik — bitta xodim, bitta sana)"""
     __tablename__ = "attendances"
+    __table_args__ = (
+        Index("ix_attendances_employee_date", "employee_id", "date"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     employee_id = Column(Integer, ForeignKey("employees.id"), nullable=False)
@@ -1061,6 +1157,9 @@ class Agent(Base):
 class AgentLocation(Base):
     """Agent joylashuvi (GPS)"""
     __tablename__ = "agent_locations"
+    __table_args__ = (
+        Index("ix_agent_locations_agent_recorded", "agent_id", "recorded_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     agent_id = Column(Integer, ForeignKey("agents.id"))
@@ -1156,6 +1255,9 @@ class Driver(Base):
 class DriverLocation(Base):
     """Haydovchi joylashuvi (GPS)"""
     __tablename__ = "driver_locations"
+    __table_args__ = (
+        Index("ix_driver_locations_driver_recorded", "driver_id", "recorded_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     driver_id = Column(Integer, ForeignKey("drivers.id"))
@@ -1169,6 +1271,44 @@ class DriverLocation(Base):
     driver = relationship("Driver", back_populates="locations")
 
 
+class LocationTrack(Base):
+    """Eski GPS tarixi — agent/haydovchining bir kunlik soddalashtirilgan treki (app/services/location_tracks.py).
+    polyline — Google polyline (lat, lng), times — kun boshidan soniyalar (delta, o'sha kodlash)."""
+    __tablename__ = "location_tracks"
+    __table_args__ = (
+        UniqueConstraint("entity_type", "entity_id", "day", name="uq_location_tracks_entity_day"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity_type = Column(String(10), nullable=False)  # agent, driver
+    entity_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    raw_count = Column(Integer, default=0)  # siqishdan oldingi nuqtalar
+    point_count = Column(Integer, default=0)  # saqlangan nuqtalar
+    polyline = Column(Text)
+    times = Column(Text)
+    created_at = Column(DateTime, default=datetime.now)
+
+
+class LatestPosition(Base):
+    """Agent/haydovchining oxirgi joylashuvi — har bir GPS signalida yangilanadi (app/services/latest_positions.py).
+    Xarita va supervayzer sahifalari tarix jadvallarini emas, shu jadvalni bitta so'rovda o'qiydi."""
+    __tablename__ = "latest_positions"
+    __table_args__ = (
+        UniqueConstraint("entity_type", "entity_id", name="uq_latest_positions_entity"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity_type = Column(String(10), nullable=False)  # agent, driver
+    entity_id = Column(Integer, nullable=False)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    accuracy = Column(Float)
+    battery = Column(Integer)
+    speed = Column(Float)
+    recorded_at = Column(DateTime)
+
+
 class Delivery(Base):
     """Yetkazib berishlar"""
     __tablename__ = "deliveries"
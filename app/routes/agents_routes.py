@@ -8,6 +8,7 @@ from sqlalchemy.orm import Session
 
 from app.core import templates
 from app.models.database import get_db, Agent, AgentLocation, Visit
+from app.services.latest_positions import AGENT, latest_positions
 
 router = APIRouter(tags=["agents"])
 
@@ -16,13 +17,9 @@ router = APIRouter(tags=["agents"])
 async def agents_list(request: Request, db: Session = Depends(get_db)):
     agents = db.query(Agent).all()
     today = datetime.now().date()
+    positions = latest_positions(db, AGENT)
     for agent in agents:
-        agent.last_location = (
-            db.query(AgentLocation)
-            .filter(AgentLocation.agent_id == agent.id)
-            .order_by(AgentLocation.recorded_at.desc())
-            .first()
-        )
+        agent.last_location = positions.get(agent.id)
         agent.today_visits = (
             db.query(Visit).filter(Visit.agent_id == agent.id, Visit.visit_date >= today).count()
         )
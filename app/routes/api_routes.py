@@ -1,9 +1,12 @@
 """
 API — stats, products, partners, agent/driver login va location (PWA/mobil).
 """
+import asyncio
 import os
-from datetime import datetime
-from fastapi import APIRouter, Depends, Form, HTTPException
+from datetime import date, datetime
+from typing import Optional
+from fastapi import APIRouter, Cookie, Depends, Form, HTTPException, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
 
@@ -15,17 +18,28 @@ from app.models.database import (
     CashRegister,
     Agent,
     Driver,
-    AgentLocation,
-    DriverLocation,
+    Route,
     User,
 )
-from app.deps import require_auth, get_current_user
+from app.deps import require_auth, require_admin, get_current_user
+from app.services.gps_ingest import MAX_BATCH_POINTS, gps_buffer, parse_points
+from app.services.latest_positions import AGENT, DRIVER, latest_positions
+from app.services.location_tracks import day_track, encode_track
+from app.services.partner_geo import MAX_VIEWPORT_MARKERS, nearest_partners, partners_in_bbox
+from app.services.route_planner import delivery_order, optimize_route
 from app.utils.notifications import get_unread_count, get_user_notifications
 from app.utils.auth import create_session_token, get_user_from_token, verify_password
+from app.utils.live_cache import live_cache, KEY_API_STATS
+from app.utils.live_events import bus, format_sse
+from app.utils.date_range import since_day
+from app.utils.auth_context import decode_token, get_active_user
 from app.logging_config import get_logger
 
 logger = get_logger("api_routes")
 
+API_STATS_TTL = 10  # soniya
+STREAM_PING_SECONDS = 20  # SSE ulanishni proxy/brauzer uzib qo'ymasligi uchun izoh-ping
+
 router = APIRouter(prefix="/api", tags=["api"])
 
 
@@ -35,10 +49,8 @@ async def pwa_config():
     return {"apiBaseUrl": os.getenv("PWA_API_BASE_URL", "").strip()}
 
 
-@router.get("/stats")
-async def api_stats(db: Session = Depends(get_db)):
-    today = datetime.now().date()
-    today_sales = db.query(Order).filter(Order.type == "sale", Order.date >= today).all()
+def _api_stats_payload(db: Session, today) -> dict:
+    today_sales = db.query(Order).filter(Order.type == "sale", since_day(Order.date, today)).all()
     cash = db.query(CashRegister).first()
     return {
         "today_sales": sum(o.total for o in today_sales),
@@ -49,6 +61,65 @@ async def api_stats(db: Session = Depends(get_db)):
     }
 
 
+@router.get("/stats")
+async def api_stats(db: Session = Depends(get_db)):
+    today = datetime.now().date()
+    return live_cache.get_or_set(f"{KEY_API_STATS}:{today}", lambda: _api_stats_payload(db, today), ttl=API_STATS_TTL)
+
+
+def _stream_subscriber(token: Optional[str]) -> tuple:
+    """SSE ulanishi uchun bir martalik autentifikatsiya — sessiya oqim davomida ushlab turilmaydi.
+    (ruxsat, user_id): agent/haydovchi tokeni (PWA) User emas — faqat umumiy hodisalar, shaxsiy bildirishnomasiz."""
+    user_data = decode_token(token)
+    if not user_data:
+        return False, None
+    if user_data.get("user_type") in (AGENT, DRIVER):
+        return True, None
+    user = get_active_user(user_data["user_id"])
+    return (True, user.id) if user else (False, None)
+
+
+@router.get("/stream")
+async def api_stream(
+    request: Request,
+    token: Optional[str] = None,
+    session_token: Optional[str] = Cookie(None),
+):
+    """Server-Sent Events: sales, stock, delivery va notification hodisalari (EventSource("/api/stream")).
+    Polling o'rniga — o'zgarish bo'lgandagina xabar keladi. PWA cookie siz ishlaydi: /api/stream?token=..."""
+    allowed, user_id = _stream_subscriber(session_token or token)
+    if not allowed:
+        raise HTTPException(status_code=401, detail="Login talab qilindi")
+    sub = bus.subscribe(user_id)
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n" + format_sse("ready", {"user_id": user_id})
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    message = await asyncio.wait_for(sub.queue.get(), timeout=STREAM_PING_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield message
+        finally:
+            bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/cache/stats")
+async def api_cache_stats(current_user: User = Depends(require_admin)):
+    """Live kesh hisoblagichlari (hit/miss, hajm) va SSE obunachilar soni — faqat admin."""
+    return {**live_cache.stats(), "stream_subscribers": bus.subscriber_count, "stream_published": bus.published}
+
+
 @router.get("/products")
 async def api_products(db: Session = Depends(get_db)):
     products = db.query(Product).filter(Product.is_active == True).all()
@@ -64,14 +135,10 @@ async def api_partners(db: Session = Depends(get_db)):
 @router.get("/agents/locations")
 async def get_agents_locations(db: Session = Depends(get_db)):
     agents = db.query(Agent).filter(Agent.is_active == True).all()
+    positions = latest_positions(db, AGENT)
     result = []
     for agent in agents:
-        last_loc = (
-            db.query(AgentLocation)
-            .filter(AgentLocation.agent_id == agent.id)
-            .order_by(AgentLocation.recorded_at.desc())
-            .first()
-        )
+        last_loc = positions.get(agent.id)
         if last_loc:
             result.append({
                 "id": agent.id,
@@ -80,7 +147,7 @@ async def get_agents_locations(db: Session = Depends(get_db)):
                 "lat": last_loc.latitude,
                 "lng": last_loc.longitude,
                 "time": last_loc.recorded_at.isoformat(),
-                "battery": getattr(last_loc, "battery", None),
+                "battery": last_loc.battery,
             })
     return result
 
@@ -88,14 +155,10 @@ async def get_agents_locations(db: Session = Depends(get_db)):
 @router.get("/drivers/locations")
 async def get_drivers_locations(db: Session = Depends(get_db)):
     drivers = db.query(Driver).filter(Driver.is_active == True).all()
+    positions = latest_positions(db, DRIVER)
     result = []
     for driver in drivers:
-        last_loc = (
-            db.query(DriverLocation)
-            .filter(DriverLocation.driver_id == driver.id)
-            .order_by(DriverLocation.recorded_at.desc())
-            .first()
-        )
+        last_loc = positions.get(driver.id)
         if last_loc:
             result.append({
                 "id": driver.id,
@@ -105,11 +168,107 @@ async def get_drivers_locations(db: Session = Depends(get_db)):
                 "lat": last_loc.latitude,
                 "lng": last_loc.longitude,
                 "time": last_loc.recorded_at.isoformat(),
-                "speed": getattr(last_loc, "speed", None),
+                "speed": last_loc.speed,
             })
     return result
 
 
+def _track_response(entity_type: str, entity_id: int, day: Optional[str], encoded: bool, db: Session):
+    try:
+        day_value = date.fromisoformat(day) if day else date.today()
+    except ValueError:
+        return JSONResponse({"success": False, "error": "Sana YYYY-MM-DD ko'rinishida bo'lishi kerak"}, status_code=400)
+    result = day_track(db, entity_type, entity_id, day_value)
+    points, track = result["points"], result["track"]
+    out = {"id": entity_id, "day": day_value.isoformat(), "source": result["source"], "count": len(points)}
+    if track is not None:
+        out["raw_count"] = track.raw_count
+    if encoded:
+        # Siqilgan kun — saqlangan satrlar dekodlashsiz qaytadi
+        if result["source"] == "compressed":
+            out["polyline"], out["times"] = track.polyline, track.times
+        else:
+            out["polyline"], out["times"] = encode_track(day_value, points)
+    else:
+        start = datetime.combine(day_value, datetime.min.time())
+        out["points"] = [[lat, lng, int((t - start).total_seconds())] for lat, lng, t in points]
+    return out
+
+
+@router.get("/agents/{agent_id}/track")
+async def get_agent_track(
+    agent_id: int,
+    day: Optional[str] = None,
+    encoded: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_auth),
+):
+    """Agentning bir kunlik treki: points — [lat, lng, kun boshidan soniya]; encoded=1 — polyline + vaqt deltalari."""
+    return _track_response(AGENT, agent_id, day, encoded, db)
+
+
+@router.get("/drivers/{driver_id}/track")
+async def get_driver_track(
+    driver_id: int,
+    day: Optional[str] = None,
+    encoded: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_auth),
+):
+    return _track_response(DRIVER, driver_id, day, encoded, db)
+
+
+@router.post("/routes/{route_id}/optimize")
+async def api_optimize_route(
+    route_id: int,
+    return_to_start: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_auth),
+):
+    """Marshrut nuqtalari tartibini (RoutePoint.order_num) masofa bo'yicha qayta hisoblaydi."""
+    route = db.query(Route).filter(Route.id == route_id).first()
+    if not route:
+        return JSONResponse({"success": False, "error": "Marshrut topilmadi"}, status_code=404)
+    plan = optimize_route(db, route, return_to_start=return_to_start)
+    db.commit()
+    points = sorted(route.points, key=lambda p: p.order_num or 0)
+    return {
+        "success": True,
+        "points": [{"id": p.id, "partner_id": p.partner_id, "order_num": p.order_num} for p in points],
+        "located": len(plan.order),
+        "distance_km": round(plan.distance_m / 1000, 2),
+        "initial_distance_km": round(plan.initial_distance_m / 1000, 2),
+        "elapsed_ms": round(plan.elapsed * 1000, 1),
+    }
+
+
+@router.get("/drivers/{driver_id}/delivery-order")
+async def api_delivery_order(
+    driver_id: int,
+    day: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_auth),
+):
+    """Kutilayotgan yetkazishlar uchun tavsiya tartib (haydovchining oxirgi joylashuvidan boshlab). Bazaga yozmaydi."""
+    try:
+        day_value = date.fromisoformat(day) if day else None
+    except ValueError:
+        return JSONResponse({"success": False, "error": "Sana YYYY-MM-DD ko'rinishida bo'lishi kerak"}, status_code=400)
+    position = latest_positions(db, DRIVER, [driver_id]).get(driver_id)
+    start = (position.latitude, position.longitude) if position else None
+    ordered, unlocated, plan = delivery_order(db, driver_id, day_value, start=start)
+    return {
+        "success": True,
+        "start": list(start) if start else None,
+        "deliveries": [
+            {"id": x.id, "number": x.number, "order_number": x.order_number, "address": x.delivery_address, "stop": i}
+            for i, x in enumerate(ordered, start=1)
+        ],
+        "unlocated": [{"id": x.id, "number": x.number, "order_number": x.order_number, "address": x.delivery_address} for x in unlocated],
+        "distance_km": round(plan.distance_m / 1000, 2),
+    }
+
+
 def _role_dashboard_url(role: str) -> str:
     """Rolga mos dashboard URL. Faqat admin bosh sahifaga; ishlab chiqarish foydalanuvchilari /production/orders da qoladi."""
     role_map = {
@@ -432,6 +591,46 @@ async def agent_partners(token: str = None, db: Session = Depends(get_db)):
         return {"success": False, "error": str(e)}
 
 
+@router.get("/agent/partners/nearest")
+async def agent_nearest_partners(
+    token: str = None,
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    limit: int = 10,
+    radius_m: Optional[float] = None,
+    db: Session = Depends(get_db),
+):
+    """Agent atrofidagi eng yaqin mijozlar (masofa bo'yicha). lat/lng berilmasa — agentning oxirgi GPS nuqtasi."""
+    if not token:
+        return {"success": False, "error": "Token talab qilinadi"}
+    user_data = get_user_from_token(token)
+    if not user_data or user_data.get("user_type") != "agent":
+        return {"success": False, "error": "Invalid token"}
+    if lat is None or lng is None:
+        agent_id = user_data.get("user_id")
+        position = latest_positions(db, AGENT, [agent_id]).get(agent_id)
+        if position is None:
+            return {"success": False, "error": "Joylashuv noma'lum"}
+        lat, lng = position.latitude, position.longitude
+    return {"success": True, "lat": lat, "lng": lng, "partners": nearest_partners(db, lat, lng, k=limit, radius_m=radius_m)}
+
+
+@router.get("/partners/in-bounds")
+async def partners_in_bounds(
+    south: float,
+    west: float,
+    north: float,
+    east: float,
+    limit: int = MAX_VIEWPORT_MARKERS,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_auth),
+):
+    """Xaritaning ko'rinadigan qismidagi mijoz markerlari. truncated — limitga yetdi (xaritani yaqinlashtirish kerak)."""
+    limit = max(1, min(limit, MAX_VIEWPORT_MARKERS))
+    markers = partners_in_bbox(db, south, west, north, east, limit=limit + 1)
+    return {"markers": markers[:limit], "count": min(len(markers), limit), "truncated": len(markers) > limit}
+
+
 @router.get("/agent/visits")
 async def agent_visits(token: str = None, db: Session = Depends(get_db)):
     """Agent uchun tashriflar ro'yxati"""
@@ -456,6 +655,17 @@ async def agent_visits(token: str = None, db: Session = Depends(get_db)):
         return {"success": False, "error": str(e)}
 
 
+def _location_single(entity_type: str, entity_id: int, latitude, longitude, accuracy, battery) -> dict:
+    """Bitta ping — batch bilan bir xil tekshiruv (parse_points: koordinatalar oralig'i)."""
+    points, rejected = parse_points(entity_type, entity_id, [
+        {"latitude": latitude, "longitude": longitude, "accuracy": accuracy, "battery": battery},
+    ])
+    if rejected:
+        return {"success": False, "error": "Koordinatalar noto'g'ri"}
+    gps_buffer.submit(points)
+    return {"success": True, "queued": 1}
+
+
 @router.post("/agent/location")
 async def agent_location_update(
     latitude: float = Form(...),
@@ -463,23 +673,12 @@ async def agent_location_update(
     accuracy: float = Form(None),
     battery: int = Form(None),
     token: str = Form(...),
-    db: Session = Depends(get_db),
 ):
     try:
         user_data = get_user_from_token(token)
         agent_id = user_data.get("user_id", 1) if user_data else 1
-        location = AgentLocation(
-            agent_id=agent_id,
-            latitude=latitude,
-            longitude=longitude,
-            accuracy=accuracy,
-            battery=battery,
-        )
-        db.add(location)
-        db.commit()
-        return {"success": True, "location_id": location.id}
+        return _location_single(AGENT, agent_id, latitude, longitude, accuracy, battery)
     except Exception as e:
-        db.rollback()
         return {"success": False, "error": str(e)}
 
 
@@ -512,23 +711,51 @@ async def driver_location_update(
     accuracy: float = Form(None),
     battery: int = Form(None),
     token: str = Form(...),
-    db: Session = Depends(get_db),
 ):
     try:
         user_data = get_user_from_token(token)
         if not user_data or user_data.get("user_type") != "driver":
             return {"success": False, "error": "Invalid token"}
-        driver_id = user_data["user_id"]
-        location = DriverLocation(
-            driver_id=driver_id,
-            latitude=latitude,
-            longitude=longitude,
-            accuracy=accuracy,
-            battery=battery,
-        )
-        db.add(location)
-        db.commit()
-        return {"success": True, "location_id": location.id}
+        return _location_single(DRIVER, user_data["user_id"], latitude, longitude, accuracy, battery)
     except Exception as e:
-        db.rollback()
         return {"success": False, "error": str(e)}
+
+
+async def _location_batch(request: Request, entity_type: str) -> JSONResponse:
+    """Telefon buferidagi (oflayn) nuqtalar: {"token": ..., "points": [{"latitude", "longitude", "accuracy",
+    "battery", "speed", "recorded_at"}, ...]}. Nuqtalar write-behind navbatiga qo'yiladi."""
+    try:
+        body = await request.json()
+    except Exception:
+        return JSONResponse({"success": False, "error": "JSON xato"}, status_code=400)
+    if not isinstance(body, dict):
+        return JSONResponse({"success": False, "error": "JSON xato"}, status_code=400)
+    user_data = get_user_from_token(body.get("token") or "")
+    if not user_data or user_data.get("user_type") != entity_type:
+        return JSONResponse({"success": False, "error": "Invalid token"}, status_code=401)
+    raw = body.get("points")
+    if not isinstance(raw, list):
+        return JSONResponse({"success": False, "error": "points ro'yxat bo'lishi kerak"}, status_code=400)
+    if len(raw) > MAX_BATCH_POINTS:
+        return JSONResponse(
+            {"success": False, "error": f"Bitta so'rovda ko'pi bilan {MAX_BATCH_POINTS} ta nuqta"}, status_code=413
+        )
+    points, rejected = parse_points(entity_type, user_data["user_id"], raw)
+    gps_buffer.submit(points)
+    return JSONResponse({"success": True, "queued": len(points), "rejected": rejected})
+
+
+@router.post("/agent/location/batch")
+async def agent_location_batch(request: Request):
+    return await _location_batch(request, AGENT)
+
+
+@router.post("/driver/location/batch")
+async def driver_location_batch(request: Request):
+    return await _location_batch(request, DRIVER)
+
+
+@router.get("/gps/stats")
+async def api_gps_stats(current_user: User = Depends(require_admin)):
+    """Write-behind navbati holati (admin)."""
+    return gps_buffer.stats()
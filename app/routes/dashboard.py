@@ -29,9 +29,12 @@ from app.models.database import (
     DriverLocation,
     Visit,
     Warehouse,
+    DailySalesRollup,
 )
 from app.deps import require_auth, require_admin
 from app.utils.dashboard_export import export_executive_dashboard
+from app.services.sales_rollup import daily_sales_totals, top_partners_by_sales
+from app.utils.date_range import before_day, on_day, since_day
 from app.utils.live_data import executive_live_data, warehouse_live_data, delivery_live_data
 
 router = APIRouter(tags=["dashboards"])
@@ -122,17 +125,14 @@ async def executive_dashboard(request: Request, db: Session = Depends(get_db), c
     yesterday = today - timedelta(days=1)
     week_ago = today - timedelta(days=7)
     
+    # Savdo yig'indisi — 7 kun bitta guruhlangan so'rovda (daily_sales_rollup)
+    trend = daily_sales_totals(db, today - timedelta(days=6), today)
+    
     # Bugungi savdo (completed orders)
-    today_sales = db.query(func.sum(Order.total)).filter(
-        func.date(Order.created_at) == today,
-        Order.status == 'completed'
-    ).scalar() or 0
+    today_sales = trend[today]["total"]
     
     # Kechagi savdo
-    yesterday_sales = db.query(func.sum(Order.total)).filter(
-        func.date(Order.created_at) == yesterday,
-        Order.status == 'completed'
-    ).scalar() or 0
+    yesterday_sales = trend[yesterday]["total"]
     
     # O'sish foizi
     sales_growth = 0
@@ -141,14 +141,11 @@ async def executive_dashboard(request: Request, db: Session = Depends(get_db), c
     
     # Bugungi buyurtmalar
     today_orders = db.query(func.count(Order.id)).filter(
-        func.date(Order.created_at) == today
+        on_day(Order.created_at, today)
     ).scalar() or 0
     
     # Bajarilgan buyurtmalar
-    completed_orders = db.query(func.count(Order.id)).filter(
-        func.date(Order.created_at) == today,
-        Order.status == 'completed'
-    ).scalar() or 0
+    completed_orders = trend[today]["count"]
     
     # Faol agentlar
     active_agents = db.query(func.count(Agent.id)).filter(
@@ -171,16 +168,8 @@ async def executive_dashboard(request: Request, db: Session = Depends(get_db), c
     ).scalar() or 0
     
     # 7 kunlik savdo dinamikasi
-    sales_trend_labels = []
-    sales_trend_data = []
-    for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        sales = db.query(func.sum(Order.total)).filter(
-            func.date(Order.created_at) == date,
-            Order.status == 'completed'
-        ).scalar() or 0
-        sales_trend_labels.append(date.strftime('%d.%m'))
-        sales_trend_data.append(float(sales))
+    sales_trend_labels = [d.strftime('%d.%m') for d in trend]
+    sales_trend_data = [v["total"] for v in trend.values()]
     
     # Top 5 mahsulotlar
     top_products_query = db.query(
@@ -191,7 +180,7 @@ async def executive_dashboard(request: Request, db: Session = Depends(get_db), c
     ).join(
         Order, OrderItem.order_id == Order.id
     ).filter(
-        func.date(Order.created_at) >= week_ago,
+        since_day(Order.created_at, week_ago),
         Order.status == 'completed'
     ).group_by(Product.id, Product.name).order_by(
         func.sum(OrderItem.quantity).desc()
@@ -202,16 +191,16 @@ async def executive_dashboard(request: Request, db: Session = Depends(get_db), c
     
     # Top 5 agentlar
     top_agents_query = db.query(
-        Agent.name,
-        func.sum(Order.total).label('total_sales'),
-        func.count(Order.id).label('order_count')
+        Agent.full_name.label('name'),
+        func.sum(DailySalesRollup.sales_total).label('total_sales'),
+        func.sum(DailySalesRollup.sales_count).label('order_count')
     ).join(
-        Order, Agent.id == Order.partner_id  # Assuming agent is partner
+        DailySalesRollup, Agent.id == DailySalesRollup.partner_id  # Assuming agent is partner
     ).filter(
-        func.date(Order.created_at) >= week_ago,
-        Order.status == 'completed'
-    ).group_by(Agent.id, Agent.name).order_by(
-        func.sum(Order.total).desc()
+        DailySalesRollup.day >= week_ago,
+        DailySalesRollup.sales_count > 0
+    ).group_by(Agent.id, Agent.full_name).order_by(
+        func.sum(DailySalesRollup.sales_total).desc()
     ).limit(5).all()
     
     top_agents = [
@@ -311,16 +300,12 @@ async def sales_dashboard(request: Request, db: Session = Depends(get_db), curre
     week_ago = today - timedelta(days=7)
     month_ago = today - timedelta(days=30)
     
-    # Today's sales
-    today_sales = db.query(func.sum(Order.total)).filter(
-        func.date(Order.created_at) == today,
-        Order.status == 'completed'
-    ).scalar() or 0
+    # Savdo yig'indisi — 7 kun bitta so'rovda (daily_sales_rollup)
+    trend = daily_sales_totals(db, today - timedelta(days=6), today)
     
-    yesterday_sales = db.query(func.sum(Order.total)).filter(
-        func.date(Order.created_at) == yesterday,
-        Order.status == 'completed'
-    ).scalar() or 0
+    # Today's sales
+    today_sales = trend[today]["total"]
+    yesterday_sales = trend[yesterday]["total"]
     
     sales_growth = 0
     if yesterday_sales > 0:
@@ -328,21 +313,18 @@ async def sales_dashboard(request: Request, db: Session = Depends(get_db), curre
     
     # Orders
     total_orders = db.query(func.count(Order.id)).filter(
-        func.date(Order.created_at) == today
+        on_day(Order.created_at, today)
     ).scalar() or 0
     
-    completed_orders = db.query(func.count(Order.id)).filter(
-        func.date(Order.created_at) == today,
-        Order.status == 'completed'
-    ).scalar() or 0
+    completed_orders = trend[today]["count"]
     
     # Customers
     active_customers = db.query(func.count(func.distinct(Order.partner_id))).filter(
-        func.date(Order.created_at) >= month_ago
+        since_day(Order.created_at, month_ago)
     ).scalar() or 0
     
     new_customers = db.query(func.count(func.distinct(Order.partner_id))).filter(
-        func.date(Order.created_at) >= week_ago
+        since_day(Order.created_at, week_ago)
     ).scalar() or 0
     
     # Average check
@@ -363,7 +345,7 @@ async def sales_dashboard(request: Request, db: Session = Depends(get_db), curre
         Order.status,
         func.count(Order.id)
     ).filter(
-        func.date(Order.created_at) >= week_ago
+        since_day(Order.created_at, week_ago)
     ).group_by(Order.status).all()
     
     status_map = {'draft': 'Yangi', 'confirmed': 'Jarayonda', 'completed': 'Bajarilgan', 'cancelled': 'Bekor qilingan'}
@@ -373,16 +355,8 @@ async def sales_dashboard(request: Request, db: Session = Depends(get_db), curre
     }
     
     # Weekly Sales
-    weekly_labels = []
-    weekly_data = []
-    for i in range(6, -1, -1):
-        date = today - timedelta(days=i)
-        sales = db.query(func.sum(Order.total)).filter(
-            func.date(Order.created_at) == date,
-            Order.status == 'completed'
-        ).scalar() or 0
-        weekly_labels.append(['Yak', 'Dush', 'Sesh', 'Chor', 'Pay', 'Juma', 'Shan'][date.weekday()])
-        weekly_data.append(float(sales))
+    weekly_labels = [['Yak', 'Dush', 'Sesh', 'Chor', 'Pay', 'Juma', 'Shan'][d.weekday()] for d in trend]
+    weekly_data = [v["total"] for v in trend.values()]
     
     weekly_sales = {"labels": weekly_labels, "data": weekly_data}
     
@@ -390,7 +364,7 @@ async def sales_dashboard(request: Request, db: Session = Depends(get_db), curre
     recent = db.query(Order, Partner.name).join(
         Partner, Order.partner_id == Partner.id, isouter=True
     ).filter(
-        func.date(Order.created_at) >= week_ago
+        since_day(Order.created_at, week_ago)
     ).order_by(Order.created_at.desc()).limit(5).all()
     
     status_text_map = {'draft': 'Yangi', 'confirmed': 'Jarayonda', 'completed': 'Bajarilgan', 'cancelled': 'Bekor qilingan'}
@@ -406,22 +380,14 @@ async def sales_dashboard(request: Request, db: Session = Depends(get_db), curre
     ] or [{'number': '-', 'customer': 'Ma\'lumot yo\'q', 'total': 0, 'status': 'draft', 'status_text': '-'}]
     
     # Top Customers
-    top = db.query(
-        Partner.name,
-        func.count(Order.id).label('order_count'),
-        func.sum(Order.total).label('total_sales')
-    ).join(
-        Order, Partner.id == Order.partner_id
-    ).filter(
-        func.date(Order.created_at) >= month_ago,
-        Order.status == 'completed'
-    ).group_by(Partner.id, Partner.name).order_by(
-        func.sum(Order.total).desc()
-    ).limit(5).all()
+    top = top_partners_by_sales(db, month_ago, today, limit=5)
+    partner_names = dict(
+        db.query(Partner.id, Partner.name).filter(Partner.id.in_([t[0] for t in top])).all()
+    ) if top else {}
     
     top_customers = [
-        {'name': t.name, 'orders': t.order_count, 'total': float(t.total_sales)}
-        for t in top
+        {'name': partner_names.get(pid, 'Noma\'lum'), 'orders': int(cnt or 0), 'total': float(total or 0)}
+        for pid, total, cnt in top
     ] or [{'name': 'Ma\'lumot yo\'q', 'orders': 0, 'total': 0}]
     
     # Fake funnel (not in database yet)
@@ -557,38 +523,32 @@ async def agent_dashboard(request: Request, db: Session = Depends(get_db), curre
     # Today's visits
     today_visits = db.query(func.count(Visit.id)).filter(
         Visit.agent_id == agent.id,
-        func.date(Visit.visit_date) == today
+        on_day(Visit.visit_date, today)
     ).scalar() or 0
     
     completed_visits = db.query(func.count(Visit.id)).filter(
         Visit.agent_id == agent.id,
-        func.date(Visit.visit_date) == today,
+        on_day(Visit.visit_date, today),
         Visit.status == 'visited'
     ).scalar() or 0
     
     visits_percent = int((completed_visits / today_visits * 100)) if today_visits > 0 else 0
     
+    # Savdo yig'indisi — 30 kun bitta so'rovda (daily_sales_rollup)
+    month_trend = daily_sales_totals(db, month_ago, today)
+    
     # Today's sales (orders created by agent)
-    today_sales = db.query(func.sum(Order.total)).filter(
-        func.date(Order.created_at) == today,
-        Order.status == 'completed'
-    ).scalar() or 0
+    today_sales = month_trend[today]["total"]
     
     today_orders = db.query(func.count(Order.id)).filter(
-        func.date(Order.created_at) == today
+        on_day(Order.created_at, today)
     ).scalar() or 0
     
-    completed_orders = db.query(func.count(Order.id)).filter(
-        func.date(Order.created_at) == today,
-        Order.status == 'completed'
-    ).scalar() or 0
+    completed_orders = month_trend[today]["count"]
     
     # Monthly target (placeholder)
     target_total = 25000000
-    month_sales = db.query(func.sum(Order.total)).filter(
-        func.date(Order.created_at) >= month_ago,
-        Order.status == 'completed'
-    ).scalar() or 0
+    month_sales = sum(v["total"] for v in month_trend.values())
     
     target_percent = int((month_sales / target_total * 100)) if target_total > 0 else 0
     
@@ -609,7 +569,7 @@ async def agent_dashboard(request: Request, db: Session = Depends(get_db), curre
         Partner, Visit.partner_id == Partner.id
     ).filter(
         Visit.agent_id == agent.id,
-        func.date(Visit.visit_date) == today
+        on_day(Visit.visit_date, today)
     ).order_by(Visit.check_in_time).all()
     
     schedule = []
@@ -628,7 +588,7 @@ async def agent_dashboard(request: Request, db: Session = Depends(get_db), curre
     recent = db.query(Order, Partner).join(
         Partner, Order.partner_id == Partner.id
     ).filter(
-        func.date(Order.created_at) >= today - timedelta(days=7)
+        since_day(Order.created_at, today - timedelta(days=7))
     ).order_by(Order.created_at.desc()).limit(5).all()
     
     status_map = {'draft': ('Yangi', 'primary'), 'confirmed': ('Jarayonda', 'warning'), 'completed': ('Bajarilgan', 'success'), 'cancelled': ('Bekor qilingan', 'danger')}
@@ -653,7 +613,7 @@ async def agent_dashboard(request: Request, db: Session = Depends(get_db), curre
     ).join(
         Order, Partner.id == Order.partner_id
     ).filter(
-        func.date(Order.created_at) >= month_ago
+        since_day(Order.created_at, month_ago)
     ).group_by(Partner.id).order_by(func.max(Order.created_at).desc()).limit(5).all()
     
     customers = []
@@ -676,15 +636,13 @@ async def agent_dashboard(request: Request, db: Session = Depends(get_db), curre
     daily_target = target_total / 30
     cumulative_sales = 0
     
+    running = []
+    for v in month_trend.values():
+        cumulative_sales += v["total"]
+        running.append(cumulative_sales)
+    
     for i in range(0, 30, 5):
-        date = month_ago + timedelta(days=i)
-        sales = db.query(func.sum(Order.total)).filter(
-            func.date(Order.created_at) >= month_ago,
-            func.date(Order.created_at) <= date,
-            Order.status == 'completed'
-        ).scalar() or 0
-        
-        cumulative_sales = float(sales)
+        cumulative_sales = running[i]
         performance_labels.append(f'{i+1}-kun')
         performance_sales.append(cumulative_sales)
         performance_target.append(daily_target * (i + 1))
@@ -807,7 +765,7 @@ async def production_dashboard(request: Request, db: Session = Depends(get_db),
         today_production = db.query(func.sum(Production.quantity)).join(
             Warehouse, Production.output_warehouse_id == Warehouse.id
         ).filter(
-            func.date(Production.date) == today,
+            on_day(Production.date, today),
             Production.status == 'completed',
             Production.output_warehouse_id.isnot(None),
             or_(
@@ -856,7 +814,7 @@ async def production_dashboard(request: Request, db: Session = Depends(get_db),
     ).join(
         Product, Recipe.product_id == Product.id
     ).filter(
-        func.date(Production.date) >= today - timedelta(days=1),
+        since_day(Production.date, today - timedelta(days=1)),
         Production.status.in_(['draft', 'completed'])
     ).order_by(Production.date.desc()).limit(10).all()
     
@@ -892,7 +850,7 @@ async def production_dashboard(request: Request, db: Session = Depends(get_db),
             production = db.query(func.sum(Production.quantity)).join(
                 Warehouse, Production.output_warehouse_id == Warehouse.id
             ).filter(
-                func.date(Production.date) == date,
+                on_day(Production.date, date),
                 Production.status == 'completed',
                 Production.output_warehouse_id.isnot(None),
                 or_(
@@ -1013,7 +971,7 @@ async def warehouse_dashboard(request: Request, db: Session = Depends(get_db), c
     today_in = db.query(func.sum(PurchaseItem.quantity)).join(
         Purchase, PurchaseItem.purchase_id == Purchase.id
     ).filter(
-        func.date(Purchase.date) == today
+        on_day(Purchase.date, today)
     ).scalar() or 0
     
     # Today's outgoing (from orders - we'll use a simple count for now)
@@ -1066,7 +1024,7 @@ async def warehouse_dashboard(request: Request, db: Session = Depends(get_db), c
     ).join(
         Product, PurchaseItem.product_id == Product.id
     ).filter(
-        func.date(Purchase.date) >= week_ago
+        since_day(Purchase.date, week_ago)
     ).order_by(Purchase.date.desc()).limit(5).all()
     
     recent_moves = []
@@ -1092,7 +1050,7 @@ async def warehouse_dashboard(request: Request, db: Session = Depends(get_db), c
         incoming = db.query(func.sum(PurchaseItem.quantity)).join(
             Purchase, PurchaseItem.purchase_id == Purchase.id
         ).filter(
-            func.date(Purchase.date) == date
+            on_day(Purchase.date, date)
         ).scalar() or 0
         
         chart_labels.append(['Yak', 'Dush', 'Sesh', 'Chor', 'Pay', 'Juma', 'Shan'][date.weekday()])
@@ -1180,11 +1138,11 @@ async def delivery_dashboard(request: Request, db: Session = Depends(get_db), cu
     
     # Today's deliveries
     total_deliveries = db.query(func.count(Delivery.id)).filter(
-        func.date(Delivery.planned_date) == today
+        on_day(Delivery.planned_date, today)
     ).scalar() or 0
     
     completed_deliveries = db.query(func.count(Delivery.id)).filter(
-        func.date(Delivery.planned_date) == today,
+        on_day(Delivery.planned_date, today),
         Delivery.status == 'delivered'
     ).scalar() or 0
     
@@ -1202,7 +1160,7 @@ async def delivery_dashboard(request: Request, db: Session = Depends(get_db), cu
     
     # Delays (deliveries not completed on time)
     delays = db.query(func.count(Delivery.id)).filter(
-        func.date(Delivery.planned_date) < today,
+        before_day(Delivery.planned_date, today),
         Delivery.status.in_(['pending', 'in_progress'])
     ).scalar() or 0
     
@@ -1224,7 +1182,7 @@ async def delivery_dashboard(request: Request, db: Session = Depends(get_db), cu
     ).outerjoin(
         Partner, Order.partner_id == Partner.id
     ).filter(
-        func.date(Delivery.planned_date) >= week_ago
+        since_day(Delivery.planned_date, week_ago)
     ).order_by(Delivery.planned_date.desc()).limit(20).all()
     
     status_map = {
@@ -1256,7 +1214,7 @@ async def delivery_dashboard(request: Request, db: Session = Depends(get_db), cu
         func.count(Delivery.id).label('delivery_count')
     ).outerjoin(
         Delivery, 
-        (Driver.id == Delivery.driver_id) & (func.date(Delivery.planned_date) == today)
+        (Driver.id == Delivery.driver_id) & (on_day(Delivery.planned_date, today))
     ).group_by(Driver.id).order_by(func.count(Delivery.id).desc()).limit(10).all()
     
     drivers = []
@@ -1293,12 +1251,12 @@ async def delivery_dashboard(request: Request, db: Session = Depends(get_db), cu
         date = today - timedelta(days=i)
         
         completed = db.query(func.count(Delivery.id)).filter(
-            func.date(Delivery.planned_date) == date,
+            on_day(Delivery.planned_date, date),
             Delivery.status == 'delivered'
         ).scalar() or 0
         
         delayed = db.query(func.count(Delivery.id)).filter(
-            func.date(Delivery.planned_date) == date,
+            on_day(Delivery.planned_date, date),
             Delivery.status.in_(['pending', 'in_progress', 'failed'])
         ).scalar() or 0
         
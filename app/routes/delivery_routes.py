@@ -13,12 +13,13 @@ from app.models.database import (
     DriverLocation,
     Delivery,
     Agent,
-    AgentLocation,
     Visit,
-    Partner,
-    PartnerLocation,
     Order,
 )
+from app.services.latest_positions import AGENT, DRIVER, latest_positions
+from app.services.partner_geo import partner_index
+from app.utils.live_cache import invalidate_deliveries
+from app.utils.live_events import publish_on_commit
 
 router = APIRouter(tags=["delivery"])
 
@@ -27,13 +28,9 @@ router = APIRouter(tags=["delivery"])
 async def delivery_list(request: Request, db: Session = Depends(get_db)):
     drivers = db.query(Driver).all()
     today = datetime.now().date()
+    positions = latest_positions(db, DRIVER)
     for driver in drivers:
-        driver.last_location = (
-            db.query(DriverLocation)
-            .filter(DriverLocation.driver_id == driver.id)
-            .order_by(DriverLocation.recorded_at.desc())
-            .first()
-        )
+        driver.last_location = positions.get(driver.id)
         driver.today_deliveries = (
             db.query(Delivery)
             .filter(Delivery.driver_id == driver.id, Delivery.created_at >= today)
@@ -112,14 +109,10 @@ async def driver_detail(
 @router.get("/map", response_class=HTMLResponse)
 async def map_view(request: Request, db: Session = Depends(get_db)):
     agents = db.query(Agent).filter(Agent.is_active == True).all()
+    agent_positions = latest_positions(db, AGENT)
     agent_markers = []
     for agent in agents:
-        last_loc = (
-            db.query(AgentLocation)
-            .filter(AgentLocation.agent_id == agent.id)
-            .order_by(AgentLocation.recorded_at.desc())
-            .first()
-        )
+        last_loc = agent_positions.get(agent.id)
         if last_loc:
             agent_markers.append({
                 "id": agent.id,
@@ -130,14 +123,10 @@ async def map_view(request: Request, db: Session = Depends(get_db)):
                 "time": last_loc.recorded_at.strftime("%H:%M"),
             })
     drivers = db.query(Driver).filter(Driver.is_active == True).all()
+    driver_positions = latest_positions(db, DRIVER)
     driver_markers = []
     for driver in drivers:
-        last_loc = (
-            db.query(DriverLocation)
-            .filter(DriverLocation.driver_id == driver.id)
-            .order_by(DriverLocation.recorded_at.desc())
-            .first()
-        )
+        last_loc = driver_positions.get(driver.id)
         if last_loc:
             driver_markers.append({
                 "id": driver.id,
@@ -148,19 +137,8 @@ async def map_view(request: Request, db: Session = Depends(get_db)):
                 "time": last_loc.recorded_at.strftime("%H:%M"),
                 "vehicle": driver.vehicle_number,
             })
-    partner_locations = db.query(PartnerLocation).all()
-    partner_markers = []
-    for loc in partner_locations:
-        partner = db.query(Partner).filter(Partner.id == loc.partner_id).first()
-        if partner and loc.latitude and loc.longitude:
-            partner_markers.append({
-                "id": loc.partner_id,
-                "name": partner.name,
-                "type": "partner",
-                "lat": loc.latitude,
-                "lng": loc.longitude,
-                "address": loc.address,
-            })
+    # Mijoz markerlari sahifaga kiritilmaydi — xarita ko'rinadigan hudud bo'yicha /api/partners/in-bounds dan oladi
+    partner_count = partner_index(db).size
     try:
         from app.config.maps_config import MAP_PROVIDER
         map_provider = MAP_PROVIDER
@@ -175,10 +153,9 @@ async def map_view(request: Request, db: Session = Depends(get_db)):
         "request": request,
         "agents": agents,
         "drivers": drivers,
-        "partner_locations": partner_locations,
+        "partner_count": partner_count,
         "agent_markers": agent_markers,
         "driver_markers": driver_markers,
-        "partner_markers": partner_markers,
         "region_markers": [],
         "map_provider": map_provider,
         "yandex_maps_apikey": yandex_apikey,
@@ -189,16 +166,10 @@ async def map_view(request: Request, db: Session = Depends(get_db)):
 @router.get("/supervisor", response_class=HTMLResponse)
 async def supervisor_dashboard(request: Request, db: Session = Depends(get_db)):
     today = datetime.now().date()
-    total_agents = db.query(Agent).filter(Agent.is_active == True).count()
-    active_agents = 0
-    for agent in db.query(Agent).filter(Agent.is_active == True).all():
-        last_loc = (
-            db.query(AgentLocation)
-            .filter(AgentLocation.agent_id == agent.id, AgentLocation.recorded_at >= today)
-            .first()
-        )
-        if last_loc:
-            active_agents += 1
+    active_agent_list = db.query(Agent).filter(Agent.is_active == True).all()
+    total_agents = len(active_agent_list)
+    positions = latest_positions(db, AGENT, [a.id for a in active_agent_list])
+    active_agents = sum(1 for p in positions.values() if p.recorded_at and p.recorded_at.date() >= today)
     today_visits = db.query(Visit).filter(Visit.visit_date >= today).count()
     today_orders = db.query(Order).filter(Order.type == "sale", Order.date >= today).all()
     today_sales_sum = sum(o.total for o in today_orders)
@@ -210,14 +181,9 @@ async def supervisor_dashboard(request: Request, db: Session = Depends(get_db)):
         .count()
     )
     agent_stats = []
-    for agent in db.query(Agent).filter(Agent.is_active == True).all():
+    for agent in active_agent_list:
         visits = db.query(Visit).filter(Visit.agent_id == agent.id, Visit.visit_date >= today).count()
-        last_loc = (
-            db.query(AgentLocation)
-            .filter(AgentLocation.agent_id == agent.id)
-            .order_by(AgentLocation.recorded_at.desc())
-            .first()
-        )
+        last_loc = positions.get(agent.id)
         agent_stats.append({
             "agent": agent,
             "visits": visits,
@@ -295,5 +261,7 @@ async def add_delivery_order(
         status="pending",
     )
     db.add(delivery)
+    publish_on_commit(db, "delivery", {"driver_id": driver_id, "status": "pending"})
     db.commit()
+    invalidate_deliveries()
     return RedirectResponse(url=f"/delivery/{driver_id}", status_code=303)
@@ -4,6 +4,7 @@ Xodimlar — ro'yxat, qo'shish, tahrir, bo'shatish, ishga qabul, davomat, avansl
 from datetime import datetime, date, timedelta
 from typing import Optional, List
 from urllib.parse import quote
+import calendar
 import io
 import uuid
 
@@ -23,10 +24,14 @@ from app.models.database import (
     Attendance, AttendanceDoc, EmployeeAdvance, EmploymentDoc, DismissalDoc,
     Salary, employee_piecework_tasks,
     ExpenseType, ExpenseDoc, ExpenseDocItem, CashRegister,
-    Warehouse, Product, Unit,
+    Warehouse, Product, Unit, Production, ProductionGroup,
 )
 from app.deps import require_auth, require_admin
 from app.utils.production_order import is_qiyom_recipe, recipe_kg_per_unit
+from app.utils.date_range import in_period
+from app.utils.excel_stream import XlsxWriter
+from app.services.export_jobs import export_job, submit_export
+from app.services.cash_ledger import NO_EFFECT, post_payment_change
 
 router = APIRouter(prefix="/employees", tags=["employees"])
 
@@ -1951,7 +1956,7 @@ async def employee_advance_add(
     pay_count = db.query(Payment).filter(Payment.created_at >= today.replace(hour=0, minute=0, second=0)).count()
     pay_number = f"PAY-{today.strftime('%Y%m%d')}-{pay_count + 1:04d}"
     emp_name = (emp.full_name or f"Xodim {employee_id}")[:100]
-    db.add(Payment(
+    payment = Payment(
         number=pay_number,
         type="expense",
         cash_register_id=cash.id,
@@ -1963,8 +1968,9 @@ async def employee_advance_add(
         description=f"Avans: {emp_name}",
         user_id=current_user.id if current_user else None,
         status="confirmed",
-    ))
-    _sync_cash_balance(db, cash.id)
+    )
+    db.add(payment)
+    post_payment_change(db, NO_EFFECT, payment)
     try:
         db.commit()
     except Exception as e:
@@ -2238,22 +2244,8 @@ async def employee_advances_bulk_delete(
 # OYLIK HISOBLASH
 # ==========================================
 
-@router.get("/salary", response_class=HTMLResponse)
-async def employee_salary_page(
-    request: Request,
-    year: Optional[int] = None,
-    month: Optional[int] = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_auth),
-):
-    """Oylik hisoblash — oy tanlash, xodimlar ro'yxati (base, bonus, deduction, avans, total)"""
-    today = date.today()
-    year = year or today.year
-    month = month or today.month
-    if not (1 <= month <= 12):
-        month = today.month
-    if year < 2020 or year > 2030:
-        year = today.year
+def _salary_rows(db: Session, year: int, month: int) -> list:
+    """Oy bo'yicha oylik qatorlari (asos, bo'lak, bonus, ushlanma, avans, jami, holat) — sahifa va Excel varaq uchun."""
     # Faqat ishga qabul hujjati bor xodimlar ro'yxatda ko'rinadi
     hired_employee_ids = db.query(EmploymentDoc.employee_id).distinct().all()
     hired_ids = [r[0] for r in hired_employee_ids if r[0]]
@@ -2363,8 +2355,7 @@ async def employee_salary_page(
             .filter(
                 Production.operator_id == gr.operator_id,
                 Production.status == "completed",
-                func.date(Production.date) >= start_d,
-                func.date(Production.date) <= end_d,
+                in_period(Production.date, start_d, end_d),
             )
             .all()
         )
@@ -2446,8 +2437,7 @@ async def employee_salary_page(
             .options(joinedload(Production.recipe))
             .filter(
                 Production.status == "completed",
-                func.date(Production.date) >= start_d,
-                func.date(Production.date) <= end_d,
+                in_period(Production.date, start_d, end_d),
             )
             .all()
         )
@@ -2542,6 +2532,26 @@ async def employee_salary_page(
             "worked_days": worked_days_by_emp.get(emp.id, 0) or 0,
             "days_in_month": days_in_month,
         })
+    return rows
+
+
+@router.get("/salary", response_class=HTMLResponse)
+async def employee_salary_page(
+    request: Request,
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_auth),
+):
+    """Oylik hisoblash — oy tanlash, xodimlar ro'yxati (base, bonus, deduction, avans, total)"""
+    today = date.today()
+    year = year or today.year
+    month = month or today.month
+    if not (1 <= month <= 12):
+        month = today.month
+    if year < 2020 or year > 2030:
+        year = today.year
+    rows = _salary_rows(db, year, month)
     cash_doc_id = request.query_params.get("cash_doc")
     try:
         cash_doc_id = int(cash_doc_id) if cash_doc_id else None
@@ -2582,6 +2592,61 @@ async def employee_salary_page(
     })
 
 
+SALARY_TYPE_LABELS = {"oylik": "Oylik", "soatlik": "Soatlik", "bo'lak": "Bo'lak", "bo'lak_oylik": "Bo'lak + oylik"}
+
+
+@export_job("salary_sheet", "Oylik varaqasi")
+def _salary_sheet_book(db: Session, year: int, month: int):
+    """Oylik varaqasi (Oylik hisoblash sahifasidagi jadval) — fon vazifasida quriladi."""
+    xw = XlsxWriter("Oylik", widths=(32, 20, 16, 14, 14, 16, 12, 14, 14, 14, 14, 14, 12))
+    xw.title(f"Oylik hisoblash — {year}-yil {month}-oy")
+    xw.row()
+    xw.header([
+        "Xodim F.I.O.", "Lavozimi", "Ish haqi turi", "Bo'lak", "Oylik (asos)", "Hisoblangan oylik",
+        "Ishlagan kun", "Bonus", "Ushlab qolish", "Avans", "Jami", "To'langan", "Holat",
+    ])
+    totals = {"total": 0.0, "paid": 0.0}
+    for row in _salary_rows(db, year, month):
+        emp = row["employee"]
+        totals["total"] += row["total"]
+        totals["paid"] += row["paid"]
+        xw.row([
+            f"{emp.full_name} ({emp.code})" if emp.code else emp.full_name,
+            emp.position or "",
+            SALARY_TYPE_LABELS.get(emp.salary_type, ""),
+            row["piecework_amount"],
+            row["base_salary"],
+            row["calculated_base"] if row["calculated_base"] is not None else "",
+            f"{row['worked_days']} / {row['days_in_month']}",
+            row["bonus"],
+            row["deduction"],
+            row["advance_deduction"],
+            row["total"],
+            row["paid"],
+            "To'langan" if row["status"] == "paid" else "Kutilmoqda",
+        ])
+    xw.row(["JAMI", "", "", "", "", "", "", "", "", "", totals["total"], totals["paid"], ""])
+    return xw, f"oylik_{year}_{month:02d}.xlsx"
+
+
+@router.get("/salary/export")
+async def employee_salary_export(
+    year: Optional[int] = None,
+    month: Optional[int] = None,
+    current_user: User = Depends(require_auth),
+):
+    """Oylik varaqasini Excelga — fon vazifasi, tayyor bo'lgach /exports/{id} dan yuklanadi."""
+    if not current_user:
+        return RedirectResponse(url="/login", status_code=303)
+    today = date.today()
+    year = year or today.year
+    month = month or today.month
+    if not (1 <= month <= 12) or year < 2020 or year > 2030:
+        return RedirectResponse(url="/employees/salary?error=" + quote("Noto'g'ri oy yoki yil"), status_code=303)
+    job = submit_export("salary_sheet", {"year": year, "month": month}, current_user.id)
+    return RedirectResponse(url=f"/exports/{job.id}", status_code=303)
+
+
 @router.post("/salary/save")
 async def employee_salary_save(
     request: Request,
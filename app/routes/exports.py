@@ -0,0 +1,66 @@
+"""
+Fon eksport vazifalari — holat sahifasi, holat (JSON) va tayyor faylni yuklab olish.
+Vazifalar app/services/export_jobs.py da; eksport route lari submit_export qilib shu yerga yo'naltiradi.
+"""
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, RedirectResponse
+
+from app.core import templates
+from app.models.database import User
+from app.deps import require_auth
+from app.services.export_jobs import DONE, JOB_TTL, get_export_job, user_export_jobs
+from app.utils.excel_stream import XLSX_MEDIA_TYPE
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+
+@router.get("", response_class=HTMLResponse)
+async def exports_list(request: Request, current_user: User = Depends(require_auth)):
+    """Foydalanuvchining joriy eksportlari (muddati o'tmaganlari)."""
+    if not current_user:
+        return RedirectResponse(url="/login", status_code=303)
+    return templates.TemplateResponse("exports/list.html", {
+        "request": request,
+        "current_user": current_user,
+        "jobs": user_export_jobs(current_user.id),
+        "ttl_minutes": int(JOB_TTL.total_seconds() // 60),
+        "page_title": "Eksportlar",
+    })
+
+
+@router.get("/{job_id}", response_class=HTMLResponse)
+async def export_job_page(request: Request, job_id: str, current_user: User = Depends(require_auth)):
+    """Vazifa holati — tayyor bo'lguncha sahifa o'zi yangilanadi."""
+    if not current_user:
+        return RedirectResponse(url="/login", status_code=303)
+    job = get_export_job(job_id, current_user.id)
+    if not job:
+        return RedirectResponse(url="/exports?error=" + quote("Eksport topilmadi yoki muddati o'tgan."), status_code=303)
+    return templates.TemplateResponse("exports/job.html", {
+        "request": request,
+        "current_user": current_user,
+        "job": job,
+        "page_title": "Eksport",
+    })
+
+
+@router.get("/{job_id}/status")
+async def export_job_status(job_id: str, current_user: User = Depends(require_auth)):
+    if not current_user:
+        return JSONResponse({"detail": "Login talab qilindi"}, status_code=401)
+    job = get_export_job(job_id, current_user.id)
+    if not job:
+        return JSONResponse({"detail": "Eksport topilmadi"}, status_code=404)
+    return job.to_dict()
+
+
+@router.get("/{job_id}/download")
+async def export_job_download(job_id: str, current_user: User = Depends(require_auth)):
+    if not current_user:
+        return RedirectResponse(url="/login", status_code=303)
+    job = get_export_job(job_id, current_user.id)
+    if not job or job.status != DONE:
+        return RedirectResponse(url=f"/exports/{job_id}" if job else "/exports", status_code=303)
+    return FileResponse(job.path, media_type=XLSX_MEDIA_TYPE, filename=job.filename)
@@ -1,14 +1,14 @@
 """
 Moliya — kassa, to'lovlar, harajatlar, harajat turlari, kassadan kassaga o'tkazish.
 """
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
 from urllib.parse import quote
 
 from fastapi import APIRouter, Request, Depends, Form, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_, func, text
+from sqlalchemy import or_, text
 from sqlalchemy.exc import OperationalError, IntegrityError
 
 from app.core import templates
@@ -18,39 +18,16 @@ from app.models.database import (
     Direction, Department,
 )
 from app.deps import require_auth, require_admin
-from app.utils.db_schema import ensure_payments_status_column, ensure_cash_opening_balance_column
+from app.utils.date_range import since_day, until_day
+from app.services.cash_ledger import (
+    NO_EFFECT, computed_cash_balances, payment_effect, post_payment_change, post_transfer,
+)
+from app.services.partner_ledger import post_payment_to_ledger
 
 router = APIRouter(prefix="/finance", tags=["finance"])
 cash_router = APIRouter(prefix="/cash", tags=["cash-transfers"])
 
 
-def _cash_balance_formula(db: Session, cash_id: int) -> tuple:
-    cash = db.query(CashRegister).filter(CashRegister.id == cash_id).first()
-    if not cash:
-        return (0.0, 0.0, 0.0)
-    opening = float(getattr(cash, "opening_balance", None) or 0)
-    confirmed = or_(Payment.status == "confirmed", Payment.status == None)
-    income_sum = float(
-        db.query(func.coalesce(func.sum(Payment.amount), 0))
-        .filter(Payment.cash_register_id == cash_id, Payment.type == "income", confirmed)
-        .scalar()
-    ) or 0
-    expense_sum = float(
-        db.query(func.coalesce(func.sum(Payment.amount), 0))
-        .filter(Payment.cash_register_id == cash_id, Payment.type == "expense", confirmed)
-        .scalar()
-    ) or 0
-    return (opening + income_sum - expense_sum, income_sum, expense_sum)
-
-
-def _sync_cash_balance(db: Session, cash_id: int) -> None:
-    cash = db.query(CashRegister).filter(CashRegister.id == cash_id).first()
-    if not cash:
-        return
-    computed, _, _ = _cash_balance_formula(db, cash_id)
-    cash.balance = computed
-
-
 def _next_expense_doc_number(db: Session) -> str:
     today = datetime.now().strftime("%Y%m%d")
     q = db.query(ExpenseDoc).filter(ExpenseDoc.number.isnot(None)).filter(ExpenseDoc.number.like(f"HD-{today}-%"))
@@ -73,7 +50,6 @@ async def finance(
     date_to: Optional[str] = None,
 ):
     """Moliya - kassa. So'nggi to'lovlar sana bo'yicha filtrlanishi mumkin."""
-    ensure_payments_status_column(db)
     cash_registers = db.query(CashRegister).all()
     partners = db.query(Partner).filter(Partner.is_active == True).order_by(Partner.name).all()
     q = (
@@ -84,13 +60,13 @@ async def finance(
     if (date_from or "").strip():
         try:
             df = datetime.strptime(str(date_from).strip()[:10], "%Y-%m-%d").date()
-            q = q.filter(Payment.date >= df)
+            q = q.filter(since_day(Payment.date, df))
         except ValueError:
             pass
     if (date_to or "").strip():
         try:
             dt = datetime.strptime(str(date_to).strip()[:10], "%Y-%m-%d").date()
-            q = q.filter(Payment.date < datetime.combine(dt + timedelta(days=1), datetime.min.time()))
+            q = q.filter(until_day(Payment.date, dt))
         except ValueError:
             pass
     payments = q.limit(200).all()
@@ -101,17 +77,17 @@ async def finance(
         _status_ok = or_(Payment.status == "confirmed", Payment.status == None)
         today_income = db.query(Payment).filter(
             Payment.type == "income",
-            Payment.date >= today,
+            since_day(Payment.date, today),
             _status_ok
         ).all()
         today_expense = db.query(Payment).filter(
             Payment.type == "expense",
-            Payment.date >= today,
+            since_day(Payment.date, today),
             _status_ok
         ).all()
     except OperationalError:
-        today_income = db.query(Payment).filter(Payment.type == "income", Payment.date >= today).all()
-        today_expense = db.query(Payment).filter(Payment.type == "expense", Payment.date >= today).all()
+        today_income = db.query(Payment).filter(Payment.type == "income", since_day(Payment.date, today)).all()
+        today_expense = db.query(Payment).filter(Payment.type == "expense", since_day(Payment.date, today)).all()
     stats = {
         "today_income": sum(p.amount for p in today_income),
         "today_expense": sum(p.amount for p in today_expense),
@@ -138,7 +114,6 @@ async def finance_harajatlar(
     date_to: Optional[str] = None,
 ):
     """Harajatlar jurnali — harajat hujjatlari va boshqa chiqimlar (1C uslubida)."""
-    ensure_payments_status_column(db)
     cash_registers = db.query(CashRegister).all()
     partners = db.query(Partner).filter(Partner.is_active == True).order_by(Partner.name).all()
     expense_docs = (
@@ -166,13 +141,13 @@ async def finance_harajatlar(
     if _df:
         try:
             df = datetime.strptime(_df, "%Y-%m-%d").date()
-            purchases_with_expenses_q = purchases_with_expenses_q.filter(Purchase.date >= datetime.combine(df, datetime.min.time()))
+            purchases_with_expenses_q = purchases_with_expenses_q.filter(since_day(Purchase.date, df))
         except ValueError:
             pass
     if _dt:
         try:
             dt = datetime.strptime(_dt, "%Y-%m-%d").date()
-            purchases_with_expenses_q = purchases_with_expenses_q.filter(Purchase.date < datetime.combine(dt + timedelta(days=1), datetime.min.time()))
+            purchases_with_expenses_q = purchases_with_expenses_q.filter(until_day(Purchase.date, dt))
         except ValueError:
             pass
     purchases_with_expenses = purchases_with_expenses_q.order_by(Purchase.date.desc()).limit(100).all()
@@ -214,13 +189,13 @@ async def finance_harajatlar(
     if (date_from or "").strip():
         try:
             df = datetime.strptime(str(date_from).strip()[:10], "%Y-%m-%d").date()
-            q = q.filter(Payment.date >= df)
+            q = q.filter(since_day(Payment.date, df))
         except ValueError:
             pass
     if (date_to or "").strip():
         try:
             dt = datetime.strptime(str(date_to).strip()[:10], "%Y-%m-%d").date()
-            q = q.filter(Payment.date < datetime.combine(dt + timedelta(days=1), datetime.min.time()))
+            q = q.filter(until_day(Payment.date, dt))
         except ValueError:
             pass
     payments = q.limit(200).all()
@@ -238,13 +213,13 @@ async def finance_harajatlar(
     if filter_date_from:
         try:
             df = datetime.strptime(filter_date_from[:10], "%Y-%m-%d").date()
-            purchase_expenses_q = purchase_expenses_q.filter(Purchase.date >= datetime.combine(df, datetime.min.time()))
+            purchase_expenses_q = purchase_expenses_q.filter(since_day(Purchase.date, df))
         except ValueError:
             pass
     if filter_date_to:
         try:
             dt = datetime.strptime(filter_date_to[:10], "%Y-%m-%d").date()
-            purchase_expenses_q = purchase_expenses_q.filter(Purchase.date < datetime.combine(dt + timedelta(days=1), datetime.min.time()))
+            purchase_expenses_q = purchase_expenses_q.filter(until_day(Purchase.date, dt))
         except ValueError:
             pass
     purchase_expenses_list = purchase_expenses_q.order_by(Purchase.date.desc()).limit(200).all()
@@ -279,11 +254,11 @@ async def finance_harajatlar(
         _status_ok = or_(Payment.status == "confirmed", Payment.status == None)
         today_expense = db.query(Payment).filter(
             Payment.type == "expense",
-            Payment.date >= today,
+            since_day(Payment.date, today),
             _status_ok
         ).all()
     except OperationalError:
-        today_expense = db.query(Payment).filter(Payment.type == "expense", Payment.date >= today).all()
+        today_expense = db.query(Payment).filter(Payment.type == "expense", since_day(Payment.date, today)).all()
     stats = {
         "today_income": 0,
         "today_expense": sum(p.amount for p in today_expense),
@@ -319,10 +294,12 @@ async def finance_kassa_detail(
     cash = db.query(CashRegister).filter(CashRegister.id == cash_register_id).first()
     if not cash:
         raise HTTPException(status_code=404, detail="Kassa topilmadi")
-    ensure_cash_opening_balance_column(db)
-    computed_balance, total_income_all_time, total_expense_all_time = _cash_balance_formula(db, cash_register_id)
-    total_income_all_time = float(total_income_all_time)
-    total_expense_all_time = float(total_expense_all_time)
+    formula = computed_cash_balances(db, [cash_register_id]).get(cash_register_id, {})
+    computed_balance = formula.get("balance", 0.0)
+    total_income_all_time = formula.get("income", 0.0)
+    total_expense_all_time = formula.get("expense", 0.0)
+    transfer_in_all_time = formula.get("transfer_in", 0.0)
+    transfer_out_all_time = formula.get("transfer_out", 0.0)
     stored_balance = float(cash.balance or 0)
     balance_mismatch = abs(computed_balance - stored_balance) > 0.01
     q = (
@@ -334,13 +311,13 @@ async def finance_kassa_detail(
     if (date_from or "").strip():
         try:
             df = datetime.strptime(str(date_from).strip()[:10], "%Y-%m-%d").date()
-            q = q.filter(Payment.date >= df)
+            q = q.filter(since_day(Payment.date, df))
         except ValueError:
             pass
     if (date_to or "").strip():
         try:
             dt = datetime.strptime(str(date_to).strip()[:10], "%Y-%m-%d").date()
-            q = q.filter(Payment.date < datetime.combine(dt + timedelta(days=1), datetime.min.time()))
+            q = q.filter(until_day(Payment.date, dt))
         except ValueError:
             pass
     per_page = 100
@@ -369,6 +346,8 @@ async def finance_kassa_detail(
         "total_expense": total_expense,
         "total_income_all_time": total_income_all_time,
         "total_expense_all_time": total_expense_all_time,
+        "transfer_in_all_time": transfer_in_all_time,
+        "transfer_out_all_time": transfer_out_all_time,
         "computed_balance": computed_balance,
         "stored_balance": stored_balance,
         "balance_mismatch": balance_mismatch,
@@ -393,7 +372,6 @@ async def finance_payment_post(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_auth),
 ):
-    ensure_payments_status_column(db)
     if type not in ("income", "expense"):
         return RedirectResponse(url="/finance?error=type", status_code=303)
     cash = db.query(CashRegister).filter(CashRegister.id == cash_register_id).first()
@@ -411,7 +389,7 @@ async def finance_payment_post(
     pay_count = db.query(Payment).filter(Payment.created_at >= today_start).count()
     pay_number = f"PAY-{datetime.now().strftime('%Y%m%d')}-{pay_count + 1:04d}"
     desc = (description or "").strip() or ("Kirim" if type == "income" else "Chiqim")
-    db.add(Payment(
+    payment = Payment(
         number=pay_number,
         type=type,
         cash_register_id=cash_register_id,
@@ -423,16 +401,15 @@ async def finance_payment_post(
         description=desc,
         user_id=current_user.id if current_user else None,
         status="confirmed",
-    ))
-    _sync_cash_balance(db, cash_register_id)
+    )
+    db.add(payment)
+    db.flush()
+    post_payment_change(db, NO_EFFECT, payment)
+    post_payment_to_ledger(db, payment)
     db.commit()
     return RedirectResponse(url="/finance?success=1", status_code=303)
 
 
-def _payment_apply_balance(db: Session, payment: Payment, sign: int):
-    _sync_cash_balance(db, payment.cash_register_id)
-
-
 @router.post("/payment/{payment_id}/confirm")
 async def finance_payment_confirm(
     payment_id: int,
@@ -445,8 +422,10 @@ async def finance_payment_confirm(
     status = getattr(payment, "status", "confirmed")
     if status == "confirmed":
         return RedirectResponse(url="/finance?msg=already_confirmed", status_code=303)
+    before = payment_effect(payment)
     payment.status = "confirmed"
-    _payment_apply_balance(db, payment, 1)
+    post_payment_change(db, before, payment)
+    post_payment_to_ledger(db, payment)
     db.commit()
     return RedirectResponse(url="/finance?success=confirmed", status_code=303)
 
@@ -463,8 +442,10 @@ async def finance_payment_cancel(
     status = getattr(payment, "status", "confirmed")
     if status == "cancelled":
         return RedirectResponse(url="/finance?msg=already_cancelled", status_code=303)
+    before = payment_effect(payment)
     payment.status = "cancelled"
-    _payment_apply_balance(db, payment, -1)
+    post_payment_change(db, before, payment)
+    post_payment_to_ledger(db, payment)
     db.commit()
     return RedirectResponse(url="/finance?success=cancelled", status_code=303)
 
@@ -528,11 +509,14 @@ async def finance_payment_edit_post(
         p = db.query(Partner).filter(Partner.id == int(partner_id)).first()
         if p:
             pid = p.id
+    before = payment_effect(payment)
     payment.type = type
     payment.amount = amount
     payment.cash_register_id = cash_register_id
     payment.partner_id = pid
     payment.description = (description or "").strip() or ("Kirim" if type == "income" else "Chiqim")
+    post_payment_change(db, before, payment)
+    post_payment_to_ledger(db, payment)
     db.commit()
     return RedirectResponse(url="/finance?success=edited", status_code=303)
 
@@ -551,6 +535,8 @@ async def finance_payment_delete(
             url="/finance?error=" + quote("Tasdiqlangan to'lovni o'chirish mumkin emas. Avval tasdiqni bekor qiling."),
             status_code=303,
         )
+    post_payment_change(db, payment_effect(payment), None)
+    post_payment_to_ledger(db, None, payment_id=payment.id)
     db.delete(payment)
     db.commit()
     return RedirectResponse(url="/finance?success=deleted", status_code=303)
@@ -771,7 +757,6 @@ async def finance_harajat_hujjat_tasdiqlash(
         total = sum(getattr(it, "amount", 0) or 0 for it in doc.items)
         if total <= 0:
             return RedirectResponse(url="/finance/harajatlar?error=no_amount", status_code=303)
-        ensure_payments_status_column(db)
         pay_number = f"PAY-{datetime.now().strftime('%Y%m%d%H%M%S')}-D{doc_id}"
         payment_date = datetime.now()
         if getattr(doc, "date", None):
@@ -806,7 +791,7 @@ async def finance_harajat_hujjat_tasdiqlash(
             text("UPDATE expense_docs SET payment_id = :pid, status = 'confirmed', total_amount = :tot WHERE id = :id"),
             {"pid": payment.id, "tot": total, "id": doc_id}
         )
-        _sync_cash_balance(db, doc.cash_register_id)
+        post_payment_change(db, NO_EFFECT, payment)
         db.commit()
         return RedirectResponse(url="/finance/harajatlar?success=confirmed", status_code=303)
     except HTTPException:
@@ -977,9 +962,8 @@ async def cash_transfer_confirm(
     amount = t.amount or 0
     if (from_cash.balance or 0) < amount:
         return RedirectResponse(url=f"/cash/transfers/{transfer_id}?error=" + quote("Jo'natuvchi kassada yetarli mablag' yo'q."), status_code=303)
-    from_cash.balance = (from_cash.balance or 0) - amount
-    to_cash.balance = (to_cash.balance or 0) + amount
     t.status = "confirmed"
+    post_transfer(db, t, 1)
     t.approved_by_user_id = current_user.id if current_user else None
     t.approved_at = datetime.now()
     db.commit()
@@ -996,13 +980,7 @@ async def cash_transfer_revert(
     t = db.query(CashTransfer).filter(CashTransfer.id == transfer_id).first()
     if not t or t.status != "confirmed":
         return RedirectResponse(url=f"/cash/transfers/{transfer_id}?error=" + quote("Faqat tasdiqlangan hujjatning tasdiqini bekor qilish mumkin."), status_code=303)
-    amount = t.amount or 0
-    from_cash = db.query(CashRegister).filter(CashRegister.id == t.from_cash_id).first()
-    to_cash = db.query(CashRegister).filter(CashRegister.id == t.to_cash_id).first()
-    if from_cash:
-        from_cash.balance = (from_cash.balance or 0) + amount
-    if to_cash:
-        to_cash.balance = max(0, (to_cash.balance or 0) - amount)
+    post_transfer(db, t, -1)
     t.status = "pending_approval"
     t.approved_by_user_id = None
     t.approved_at = None
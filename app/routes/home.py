@@ -12,6 +12,7 @@ from app.models.database import (
     CashRegister, Employee, Production,
 )
 from app.deps import get_current_user, require_auth
+from app.utils.date_range import since_day
 
 router = APIRouter(tags=["home"])
 
@@ -54,12 +55,11 @@ async def home(
             "materials_count": db.query(Product).filter(Product.type == "hom_ashyo", Product.is_active == True).count(),
         }
         today = datetime.now().date()
-        today_start = datetime.combine(today, datetime.min.time())
-        today_sales = db.query(Order).filter(Order.type == "sale", Order.date >= today_start).all()
+        today_sales = db.query(Order).filter(Order.type == "sale", since_day(Order.date, today)).all()
         stats["today_sales"] = sum(s.total for s in today_sales)
         stats["today_orders"] = len(today_sales)
         today_productions = db.query(Production).filter(
-            Production.date >= today_start,
+            since_day(Production.date, today),
             Production.status == "completed",
         ).all()
         stats["today_production"] = sum(p.quantity for p in today_productions if p.quantity)
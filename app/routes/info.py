@@ -8,7 +8,7 @@ from urllib.parse import quote, urlencode
 from fastapi import APIRouter, Request, Depends, Form, File, HTTPException, UploadFile, Query
 from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, or_, text
+from sqlalchemy import text
 from sqlalchemy.exc import OperationalError
 import openpyxl
 
@@ -24,7 +24,6 @@ from app.models.database import (
     ProductPrice,
     ProductPriceHistory,
     CashRegister,
-    Payment,
     Department,
     Direction,
     Position,
@@ -39,7 +38,9 @@ from app.models.database import (
 )
 from app.deps import require_auth, require_admin
 from app.utils.auth import hash_password
-from app.utils.db_schema import ensure_cash_opening_balance_column
+from app.utils.auth_context import invalidate_user
+from app.services.cash_ledger import last_verification, rebuild_cash_balances, set_counted_balance
+from app.services.recipe_costing import invalidate_recipe_costs
 
 router = APIRouter(prefix="/info", tags=["info"])
 
@@ -690,6 +691,7 @@ async def info_prices_edit(
         changed_by_id=current_user.id,
     ))
     db.commit()
+    invalidate_recipe_costs()
     # Saqlashdan keyin filtrlarni saqlab qolish (faqat "Filtrni tozalash" bosilganda tozalash)
     params = {}
     if price_type_id is not None:
@@ -750,39 +752,17 @@ async def info_prices_history(
 
 
 # ---------- Cash ----------
-def _cash_balance_formula(db: Session, cash_id: int) -> float:
-    """Kassa balansi = qoldiq (opening_balance) + kirim - chiqim (faqat tasdiqlangan)."""
-    cash = db.query(CashRegister).filter(CashRegister.id == cash_id).first()
-    if not cash:
-        return 0.0
-    opening = float(getattr(cash, "opening_balance", None) or 0)
-    confirmed = or_(Payment.status == "confirmed", Payment.status.is_(None))
-    income_sum = float(
-        db.query(func.coalesce(func.sum(Payment.amount), 0))
-        .filter(Payment.cash_register_id == cash_id, Payment.type == "income", confirmed)
-        .scalar()
-    ) or 0
-    expense_sum = float(
-        db.query(func.coalesce(func.sum(Payment.amount), 0))
-        .filter(Payment.cash_register_id == cash_id, Payment.type == "expense", confirmed)
-        .scalar()
-    ) or 0
-    return opening + income_sum - expense_sum
-
-
 @router.get("/cash", response_class=HTMLResponse)
 async def info_cash(request: Request, db: Session = Depends(get_db), current_user: User = Depends(require_auth)):
-    ensure_cash_opening_balance_column(db)
-    cash_registers = db.query(CashRegister).all()
+    """Balanslar saqlangan (ledger) qiymatdan; farqlar — scheduler tekshiruvining oxirgi natijasidan."""
+    cash_registers = db.query(CashRegister).options(joinedload(CashRegister.department)).all()
     departments = db.query(Department).filter(Department.is_active == True).all()
-    cash_computed_balance = {}
-    for c in cash_registers:
-        cash_computed_balance[c.id] = _cash_balance_formula(db, c.id)
-    jami_balans = sum(cash_computed_balance.values())
+    jami_balans = sum(float(c.balance or 0) for c in cash_registers)
     return templates.TemplateResponse("info/cash.html", {
         "request": request,
         "cash_registers": cash_registers,
-        "cash_computed_balance": cash_computed_balance,
+        "cash_drift": {d["cash_id"]: d for d in last_verification["drift"]},
+        "cash_verified_at": last_verification["checked_at"],
         "jami_balans": jami_balans,
         "departments": departments,
         "current_user": current_user,
@@ -800,7 +780,6 @@ async def info_cash_add(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_auth),
 ):
-    ensure_cash_opening_balance_column(db)
     pt = (payment_type or "").strip() or None
     if pt and pt not in ("naqd", "plastik", "click", "terminal"):
         pt = None
@@ -814,9 +793,6 @@ async def info_cash_add(
     )
     db.add(cash)
     db.commit()
-    db.refresh(cash)
-    cash.balance = _cash_balance_formula(db, cash.id)
-    db.commit()
     return RedirectResponse(url="/info/cash", status_code=303)
 
 
@@ -830,16 +806,15 @@ async def info_cash_edit(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_auth),
 ):
-    ensure_cash_opening_balance_column(db)
     cash = db.query(CashRegister).filter(CashRegister.id == cash_id).first()
     if not cash:
         raise HTTPException(status_code=404, detail="Kassa topilmadi")
     cash.name = name
-    cash.opening_balance = float(balance)
     cash.department_id = department_id if department_id else None
     pt = (payment_type or "").strip() or None
     cash.payment_type = pt if pt in ("naqd", "plastik", "click", "terminal") else None
-    cash.balance = _cash_balance_formula(db, cash_id)
+    # Forma joriy balansni ko'rsatadi — o'zgartirilsa farq qoldiqqa yoziladi (qoldiq hujjati kabi)
+    set_counted_balance(db, cash, float(balance))
     db.commit()
     return RedirectResponse(url="/info/cash", status_code=303)
 
@@ -860,15 +835,14 @@ async def info_cash_recalculate(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin),
 ):
-    """Kassa balansini formuladan qayta yozadi: balans = qoldiq (opening_balance) + kirim - chiqim (faqat admin)."""
+    """Kassa balansini formuladan qayta yozadi: qoldiq + kirim - chiqim + o'tkazmalar (faqat admin)."""
     cash = db.query(CashRegister).filter(CashRegister.id == cash_id).first()
     if not cash:
         raise HTTPException(status_code=404, detail="Kassa topilmadi")
-    ensure_cash_opening_balance_column(db)
-    cash.balance = _cash_balance_formula(db, cash_id)
+    balance = rebuild_cash_balances(db, [cash_id]).get(cash_id, 0.0)
     db.commit()
     return RedirectResponse(
-        url="/info/cash?recalculated=1&balance=" + quote(str(cash.balance)),
+        url="/info/cash?recalculated=1&balance=" + quote(str(balance)),
         status_code=303,
     )
 
@@ -1277,6 +1251,7 @@ async def info_users_edit(
         if partner:
             user.partners_list.append(partner)
     db.commit()
+    invalidate_user(user_id)
     return RedirectResponse(url="/info/users", status_code=303)
 
 
@@ -1292,6 +1267,7 @@ async def info_users_change_password(
         raise HTTPException(status_code=404, detail="Foydalanuvchi topilmadi")
     user.password_hash = hash_password(new_password)
     db.commit()
+    invalidate_user(user_id)
     return RedirectResponse(url="/info/users", status_code=303)
 
 
@@ -1306,6 +1282,7 @@ async def info_users_delete(
         raise HTTPException(status_code=404, detail="Foydalanuvchi topilmadi")
     db.delete(user)
     db.commit()
+    invalidate_user(user_id)
     return RedirectResponse(url="/info/users", status_code=303)
 
 
@@ -8,12 +8,24 @@ from sqlalchemy.orm import Session
 import openpyxl
 
 from app.core import templates
-from app.models.database import get_db, User, Partner, Order, Purchase
+from app.models.database import get_db, User, Partner, PartnerLocation, Order, Purchase
 from app.deps import require_auth
+from app.services.partner_geo import invalidate_partner_index, set_partner_location
 
 router = APIRouter(prefix="/partners", tags=["partners"])
 
 
+def _coords(latitude: str, longitude: str):
+    """Formadagi yashirin latitude/longitude — ikkalasi to'g'ri bo'lsa (lat, lng), aks holda None."""
+    try:
+        lat, lng = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
 @router.get("", response_class=HTMLResponse)
 async def partners_list(
     request: Request,
@@ -49,6 +61,8 @@ async def partner_add(
     address: str = Form(""),
     credit_limit: float = Form(0),
     discount_percent: float = Form(0),
+    latitude: str = Form(""),
+    longitude: str = Form(""),
     db: Session = Depends(get_db),
 ):
     existing_by_name = db.query(Partner).filter(Partner.name == name).first()
@@ -68,7 +82,12 @@ async def partner_add(
         discount_percent=discount_percent,
     )
     db.add(partner)
+    coords = _coords(latitude, longitude)
+    if coords:
+        db.flush()
+        set_partner_location(db, partner, *coords, address=address)
     db.commit()
+    invalidate_partner_index()
     return RedirectResponse(url="/partners", status_code=303)
 
 
@@ -81,6 +100,8 @@ async def partner_edit(
     address: str = Form(""),
     credit_limit: float = Form(0),
     discount_percent: float = Form(0),
+    latitude: str = Form(""),
+    longitude: str = Form(""),
     db: Session = Depends(get_db),
 ):
     partner = db.query(Partner).filter(Partner.id == partner_id).first()
@@ -99,7 +120,11 @@ async def partner_edit(
     partner.address = address
     partner.credit_limit = credit_limit
     partner.discount_percent = discount_percent
+    coords = _coords(latitude, longitude)
+    if coords:
+        set_partner_location(db, partner, *coords, address=address)
     db.commit()
+    invalidate_partner_index()
     return RedirectResponse(url="/partners", status_code=303)
 
 
@@ -118,8 +143,10 @@ async def partner_delete(
             status_code=400,
             detail="Bu kontragent bilan bog'liq buyurtmalar yoki kirimlar mavjud. O'chirish mumkin emas.",
         )
+    db.query(PartnerLocation).filter(PartnerLocation.partner_id == partner_id).delete(synchronize_session=False)
     db.delete(partner)
     db.commit()
+    invalidate_partner_index()
     return RedirectResponse(url="/partners", status_code=303)
 
 
@@ -203,4 +230,5 @@ async def import_partners(
             if discount_percent is not None:
                 partner.discount_percent = discount_percent
         db.commit()
+    invalidate_partner_index()
     return RedirectResponse(url="/partners", status_code=303)
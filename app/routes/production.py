@@ -8,14 +8,13 @@ from urllib.parse import quote
 
 from fastapi import APIRouter, Request, Depends, Form, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy import text, func
 
 from app.core import templates
 from app.models.database import (
     get_db,
     User,
-    Warehouse,
     Product,
     Recipe,
     RecipeItem,
@@ -23,7 +22,6 @@ from app.models.database import (
     Production,
     ProductionItem,
     ProductionStage,
-    Stock,
     StockMovement,
     Machine,
     Employee,
@@ -33,6 +31,10 @@ from app.deps import require_auth, require_admin, get_current_user
 from app.utils.notifications import check_low_stock_and_notify
 from app.utils.production_order import recipe_kg_per_unit, production_output_quantity_for_stock, notify_managers_production_ready, is_qiyom_recipe
 from app.utils.user_scope import get_warehouses_for_user
+from app.utils.date_range import in_period, since_day, until_day
+from app.services.recipe_costing import get_cost_book, invalidate_recipe_costs, recipe_costs
+from app.services.production_batch import apply_completion, plan_completion, revert_completion, shortage_lines
+from app.services.stock_service import reverse_document_movements
 
 router = APIRouter(prefix="/production", tags=["production"])
 
@@ -43,187 +45,27 @@ def _recipe_max_stage(recipe) -> int:
     return max(s.stage_number for s in recipe.stages)
 
 
-def _calculate_recipe_cost_per_kg(db, recipe_id):
-    """Retsept bo'yicha 1 kg uchun tannarxni hisoblash (rekursiv - yarim tayyor mahsulotlar uchun ham)."""
-    recipe = db.query(Recipe).filter(Recipe.id == recipe_id).first()
-    if not recipe or not recipe.items:
-        return 0.0
-    
-    total_cost = 0.0
-    for item in recipe.items:
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        if not product:
-            continue
-        
-        # Agar yarim tayyor mahsulot bo'lsa, uning retsept tannarxini olamiz
-        if getattr(product, 'type', None) == 'yarim_tayyor':
-            # Yarim tayyor mahsulotning retseptini topamiz
-            semi_recipe = db.query(Recipe).filter(Recipe.product_id == product.id, Recipe.is_active == True).first()
-            if semi_recipe:
-                semi_cost_per_kg = _calculate_recipe_cost_per_kg(db, semi_recipe.id)
-                total_cost += (item.quantity or 0) * semi_cost_per_kg
-            else:
-                # Retsept topilmasa, purchase_price yoki Stock.cost_price ishlatamiz
-                cost = product.purchase_price or 0
-                stock = db.query(Stock).filter(Stock.product_id == product.id).first()
-                if stock and getattr(stock, 'cost_price', None) and stock.cost_price > 0:
-                    cost = stock.cost_price
-                total_cost += (item.quantity or 0) * cost
-        else:
-            # Oddiy xom ashyo uchun purchase_price yoki Stock.cost_price
-            cost = product.purchase_price or 0
-            stock = db.query(Stock).filter(Stock.product_id == product.id).first()
-            if stock and getattr(stock, 'cost_price', None) and stock.cost_price > 0:
-                cost = stock.cost_price
-            total_cost += (item.quantity or 0) * cost
-    
-    # 1 kg uchun tannarx (birlik og'irligi: 400gr -> 0.4, 1kg -> 1)
-    output_qty = recipe_kg_per_unit(recipe)
-    return total_cost / output_qty if output_qty > 0 else 0.0
-
-
 def calculate_production_tannarx(db, production, recipe):
-    """Jami xarajat (faqat xom ashyo) va tannarx = jami ÷ ishlab chiqarish miqdori. Narx: Product.purchase_price yoki shu ombordagi Stock.cost_price."""
+    """Jami xarajat (faqat xom ashyo) va tannarx = jami ÷ ishlab chiqarish miqdori. Narx: Product.purchase_price,
+    yarim tayyor mahsulot uchun — retsept tannarxi (get_cost_book)."""
     if production.production_items:
         items_to_use = [(pi.product_id, float(pi.quantity or 0)) for pi in production.production_items]
     else:
         items_to_use = [(item.product_id, float(item.quantity or 0) * float(production.quantity or 0)) for item in recipe.items]
-    total_material_cost = 0.0
-    for product_id, qty in items_to_use:
-        if qty <= 0:
-            continue
-        product = db.query(Product).filter(Product.id == product_id).first()
-        if not product:
-            continue
-        wh_id = _warehouse_id_for_ingredient(db, product_id, production)
-        if getattr(product, "type", None) == "yarim_tayyor":
-            semi_recipe = db.query(Recipe).filter(Recipe.product_id == product.id, Recipe.is_active == True).first()
-            if semi_recipe:
-                cost_per_kg = _calculate_recipe_cost_per_kg(db, semi_recipe.id)
-                total_material_cost += qty * cost_per_kg
-            else:
-                cost = product.purchase_price or 0
-                st = db.query(Stock).filter(Stock.warehouse_id == wh_id, Stock.product_id == product_id).first()
-                if st and getattr(st, "cost_price", None) and st.cost_price > 0:
-                    cost = st.cost_price
-                total_material_cost += qty * cost
-        else:
-            cost = product.purchase_price or 0
-            st = db.query(Stock).filter(Stock.warehouse_id == wh_id, Stock.product_id == product_id).first()
-            if st and getattr(st, "cost_price", None) and st.cost_price > 0:
-                cost = st.cost_price
-            total_material_cost += qty * cost
+    book = get_cost_book(db)
+    total_material_cost = sum(
+        qty * book.ingredient_cost(product_id)
+        for product_id, qty in items_to_use
+        if qty > 0 and product_id in book.products
+    )
     output_units = production_output_quantity_for_stock(db, production, recipe)
     cost_per_unit = (total_material_cost / output_units) if output_units > 0 else 0.0
     return total_material_cost, output_units, cost_per_unit
 
 
-def _warehouse_id_for_ingredient(db, product_id, production):
-    """Yarim tayyor mahsulot bo'lsa — nomida 'yarim'/'semi' bor ombordan, aks holda 1-ombor (xom ashyo)."""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product or getattr(product, "type", None) != "yarim_tayyor":
-        return production.warehouse_id
-    stocks = db.query(Stock).filter(Stock.product_id == product_id, Stock.quantity > 0).all()
-    for st in stocks:
-        wh = db.query(Warehouse).filter(Warehouse.id == st.warehouse_id).first()
-        if wh and st.warehouse_id:
-            name = (wh.name or "").lower()
-            code = (getattr(wh, "code", None) or "").lower()
-            if "yarim" in name or "semi" in name or "yarim" in code or "semi" in code:
-                return st.warehouse_id
-    if stocks:
-        return stocks[0].warehouse_id
-    return production.warehouse_id
-
-
-def _do_complete_production_stock(db, production, recipe):
-    """Kerak=0 bo'lsa o'tkazib yuboriladi; yetmasa borini tortadi (min(kerak, mavjud)).
-    Xom ashyo 1-ombordan, yarim tayyor mahsulotlar nomida 'yarim'/'semi' bor ombordan chiqariladi."""
-    if production.production_items:
-        items_to_use = [(pi.product_id, pi.quantity) for pi in production.production_items]
-    else:
-        items_to_use = [(item.product_id, item.quantity * production.quantity) for item in recipe.items]
-    items_actual = []
-    for product_id, required in items_to_use:
-        if required is None or required <= 0:
-            items_actual.append((product_id, 0.0))
-            continue
-        wh_id = _warehouse_id_for_ingredient(db, product_id, production)
-        stock = db.query(Stock).filter(
-            Stock.warehouse_id == wh_id,
-            Stock.product_id == product_id,
-        ).first()
-        available = (stock.quantity if stock else 0) or 0
-        actual_use = min(required, available)
-        items_actual.append((product_id, actual_use))
-    for product_id, actual_use in items_actual:
-        if actual_use <= 0:
-            continue
-        wh_id = _warehouse_id_for_ingredient(db, product_id, production)
-        stock = db.query(Stock).filter(
-            Stock.warehouse_id == wh_id,
-            Stock.product_id == product_id,
-        ).first()
-        if stock:
-            stock.quantity -= actual_use
-    total_material_cost = 0.0
-    for product_id, actual_use in items_actual:
-        product = db.query(Product).filter(Product.id == product_id).first()
-        if not product:
-            continue
-        
-        # Yarim tayyor mahsulot uchun retsept tannarxini olamiz
-        if getattr(product, 'type', None) == 'yarim_tayyor':
-            semi_recipe = db.query(Recipe).filter(Recipe.product_id == product.id, Recipe.is_active == True).first()
-            if semi_recipe:
-                cost_per_kg = _calculate_recipe_cost_per_kg(db, semi_recipe.id)
-                total_material_cost += actual_use * cost_per_kg
-            else:
-                # Retsept topilmasa, purchase_price yoki Stock.cost_price
-                cost = product.purchase_price or 0
-                stock = db.query(Stock).filter(Stock.product_id == product_id).first()
-                if stock and getattr(stock, 'cost_price', None) and stock.cost_price > 0:
-                    cost = stock.cost_price
-                total_material_cost += actual_use * cost
-        else:
-            # Oddiy xom ashyo uchun purchase_price yoki Stock.cost_price
-            cost = product.purchase_price or 0
-            stock = db.query(Stock).filter(Stock.product_id == product_id).first()
-            if stock and getattr(stock, 'cost_price', None) and stock.cost_price > 0:
-                cost = stock.cost_price
-            total_material_cost += actual_use * cost
-    output_units = production_output_quantity_for_stock(db, production, recipe)
-    cost_per_unit = (total_material_cost / output_units) if output_units > 0 else 0
-    out_wh_id = production.output_warehouse_id if production.output_warehouse_id else production.warehouse_id
-    product_stock = db.query(Stock).filter(
-        Stock.warehouse_id == out_wh_id,
-        Stock.product_id == recipe.product_id,
-    ).first()
-    if product_stock:
-        product_stock.quantity += output_units
-        qty_old = (product_stock.quantity or 0) - output_units
-        cost_old = getattr(product_stock, "cost_price", None) or 0
-        if qty_old <= 0 or cost_old <= 0:
-            product_stock.cost_price = cost_per_unit
-        else:
-            product_stock.cost_price = (qty_old * cost_old + output_units * cost_per_unit) / (product_stock.quantity or 1)
-    else:
-        new_stock = Stock(warehouse_id=out_wh_id, product_id=recipe.product_id, quantity=output_units)
-        if hasattr(Stock, "cost_price"):
-            new_stock.cost_price = cost_per_unit
-        db.add(new_stock)
-    output_product = db.query(Product).filter(Product.id == recipe.product_id).first()
-    if output_product:
-        product_stock = db.query(Stock).filter(
-            Stock.warehouse_id == out_wh_id,
-            Stock.product_id == recipe.product_id,
-        ).first()
-        old_price = output_product.purchase_price or 0
-        old_qty = (product_stock.quantity - output_units) if product_stock else 0
-        if old_qty > 0 and old_price > 0 and output_units > 0:
-            output_product.purchase_price = (old_qty * old_price + output_units * cost_per_unit) / (old_qty + output_units)
-        elif cost_per_unit > 0:
-            output_product.purchase_price = cost_per_unit
+def _do_complete_production_stock(db, production, recipe, user_id=None):
+    """Bitta buyurtma — production_batch orqali (yetmasa borini tortadi, harakatlar StockMovement ga yoziladi)."""
+    apply_completion(db, plan_completion(db, [production], recipes={recipe.id: recipe}), user_id=user_id)
     return None
 
 
@@ -482,6 +324,7 @@ async def production_recipes(
         "recipe_products_json": recipe_products_json,
         "materials": materials,
         "warehouses": warehouses,
+        "recipe_costs": recipe_costs(db),
         "page_title": "Retseptlar",
     })
 
@@ -508,15 +351,12 @@ async def production_recipe_detail(
     recipe_stages = sorted(recipe.stages, key=lambda s: s.stage_number) if recipe.stages else []
     warehouses = get_warehouses_for_user(db, current_user)
     # Yarim tayyor mahsulotlar uchun retsept tannarxini hisoblash (ko'rsatish uchun)
-    item_recipe_costs = {}
-    for item in recipe.items or []:
-        if not item.product_id:
-            continue
-        product = db.query(Product).filter(Product.id == item.product_id).first()
-        if product and getattr(product, "type", None) == "yarim_tayyor":
-            semi_recipe = db.query(Recipe).filter(Recipe.product_id == product.id, Recipe.is_active == True).first()
-            if semi_recipe:
-                item_recipe_costs[item.product_id] = _calculate_recipe_cost_per_kg(db, semi_recipe.id)
+    book = get_cost_book(db)
+    item_recipe_costs = {
+        item.product_id: book.recipe_cost_per_kg(book.active_recipe[item.product_id])
+        for item in recipe.items or []
+        if item.product_id and book.is_semi_finished(item.product_id) and item.product_id in book.active_recipe
+    }
     return templates.TemplateResponse("production/recipe_detail.html", {
         "request": request,
         "current_user": current_user,
@@ -547,6 +387,7 @@ async def add_recipe(
     )
     db.add(recipe)
     db.commit()
+    invalidate_recipe_costs()
     return RedirectResponse(url=f"/production/recipes/{recipe.id}", status_code=303)
 
 
@@ -563,6 +404,7 @@ async def add_recipe_item(
         raise HTTPException(status_code=404, detail="Retsept topilmadi")
     db.add(RecipeItem(recipe_id=recipe_id, product_id=product_id, quantity=quantity))
     db.commit()
+    invalidate_recipe_costs()
     return RedirectResponse(url=f"/production/recipes/{recipe_id}", status_code=303)
 
 
@@ -579,6 +421,7 @@ async def set_recipe_name(
         raise HTTPException(status_code=404, detail="Retsept topilmadi")
     recipe.name = (name or "").strip() or recipe.name
     db.commit()
+    invalidate_recipe_costs()
     return RedirectResponse(url=f"/production/recipes/{recipe_id}", status_code=303)
 
 
@@ -617,6 +460,7 @@ async def edit_recipe_item(
     item.product_id = product_id
     item.quantity = quantity
     db.commit()
+    invalidate_recipe_costs()
     return RedirectResponse(url=f"/production/recipes/{recipe_id}", status_code=303)
 
 
@@ -669,6 +513,7 @@ async def delete_recipe_item(
         raise HTTPException(status_code=404, detail="Tarkib qatori topilmadi")
     db.delete(item)
     db.commit()
+    invalidate_recipe_costs()
     return RedirectResponse(url=f"/production/recipes/{recipe_id}", status_code=303)
 
 
@@ -686,6 +531,7 @@ async def production_api_quick_recipes(
         .filter(Recipe.is_active == True)
         .all()
     )
+    book = get_cost_book(db)
     out = []
     for r in recipes:
         unit = "kg"
@@ -698,6 +544,7 @@ async def production_api_quick_recipes(
             "unit": unit,
             "wh": str(r.default_warehouse_id) if r.default_warehouse_id else "",
             "whOut": str(r.default_output_warehouse_id) if r.default_output_warehouse_id else "",
+            "costPerKg": round(book.recipe_cost_per_kg(r.id), 2),
         })
     return out
 
@@ -739,8 +586,7 @@ async def production_by_operator(
             joinedload(Production.user),
         )
         .filter(Production.status == "completed")
-        .filter(func.date(Production.date) >= d_from)
-        .filter(func.date(Production.date) <= d_to)
+        .filter(in_period(Production.date, d_from, d_to))
         .order_by(Production.date.desc())
     )
     productions_raw = qry.all()
@@ -971,13 +817,13 @@ async def production_orders(
     if date_from and str(date_from).strip():
         try:
             d_from = datetime.strptime(str(date_from).strip()[:10], "%Y-%m-%d").date()
-            q = q.filter(func.date(Production.date) >= d_from)
+            q = q.filter(since_day(Production.date, d_from))
         except (ValueError, TypeError):
             pass
     if date_to and str(date_to).strip():
         try:
             d_to = datetime.strptime(str(date_to).strip()[:10], "%Y-%m-%d").date()
-            q = q.filter(func.date(Production.date) <= d_to)
+            q = q.filter(until_day(Production.date, d_to))
         except (ValueError, TypeError):
             pass
     productions = q.all()
@@ -1067,41 +913,10 @@ def _production_revert_one(db, production) -> Optional[str]:
     recipe = db.query(Recipe).filter(Recipe.id == production.recipe_id).first()
     if not recipe:
         return "Retsept topilmadi"
-    items_to_use = (
-        [(pi.product_id, float(pi.quantity or 0)) for pi in (production.production_items or [])]
-        if production.production_items
-        else [(item.product_id, float(item.quantity or 0) * float(production.quantity or 0)) for item in (recipe.items or [])]
-    )
-    output_units = production_output_quantity_for_stock(db, production, recipe)
-    out_wh_id = production.output_warehouse_id if production.output_warehouse_id else production.warehouse_id
-    product_stock = db.query(Stock).filter(
-        Stock.warehouse_id == out_wh_id,
-        Stock.product_id == recipe.product_id,
-    ).first()
-    current_qty = float(product_stock.quantity or 0) if product_stock else 0
-    if not product_stock or current_qty < output_units:
-        out_wh = db.query(Warehouse).filter(Warehouse.id == out_wh_id).first()
-        out_product = db.query(Product).filter(Product.id == recipe.product_id).first()
-        wh_name = (out_wh.name if out_wh else "2-ombor") or "2-ombor"
-        prod_name = (out_product.name if out_product else "tayyor mahsulot") or "tayyor mahsulot"
-        return f"«{wh_name}» da «{prod_name}» dan kerak: {output_units:,.1f}, mavjud: {current_qty:,.1f}"
-    product_stock.quantity = current_qty - output_units
-    for product_id, required in items_to_use:
-        stock = db.query(Stock).filter(
-            Stock.warehouse_id == production.warehouse_id,
-            Stock.product_id == product_id,
-        ).first()
-        if stock:
-            stock.quantity = float(stock.quantity or 0) + required
-        else:
-            db.add(Stock(warehouse_id=production.warehouse_id, product_id=product_id, quantity=required))
+    err = revert_completion(db, production, recipe)
+    if err:
+        return err
     production.status = "draft"
-    movements = db.query(StockMovement).filter(
-        StockMovement.document_type == "Production",
-        StockMovement.document_id == production.id,
-    ).all()
-    for m in movements:
-        db.delete(m)
     return None
 
 
@@ -1150,30 +965,38 @@ async def production_orders_bulk_complete(
             url="/production/orders?error=complete&detail=" + quote("Hech qaysi buyurtma tanlanmagan."),
             status_code=303,
         )
-    completed = 0
-    for pid in prod_ids:
-        production = db.query(Production).filter(Production.id == pid).first()
-        if not production or production.status not in ("draft", "in_progress"):
-            continue
-        recipe = db.query(Recipe).filter(Recipe.id == production.recipe_id).first()
-        if not recipe:
-            return RedirectResponse(
-                url="/production/orders?error=complete&detail=" + quote(f"{production.number}: Retsept topilmadi."),
-                status_code=303,
-            )
-        err = _do_complete_production_stock(db, production, recipe)
-        if err:
-            db.rollback()
-            return err
-        production.status = "completed"
-        production.current_stage = _recipe_max_stage(recipe)
-        completed += 1
+    # Eski buyurtmalar birinchi: qoldiq shu tartibda taqsimlanadi
+    productions = (
+        db.query(Production)
+        .options(selectinload(Production.production_items))
+        .filter(Production.id.in_(prod_ids), Production.status.in_(("draft", "in_progress")))
+        .order_by(Production.date, Production.id)
+        .all()
+    )
+    batch = plan_completion(db, productions)
+    no_recipe = next((plan.production for plan in batch.plans if plan.recipe is None), None)
+    if no_recipe is not None:
+        return RedirectResponse(
+            url="/production/orders?error=complete&detail=" + quote(f"{no_recipe.number}: Retsept topilmadi."),
+            status_code=303,
+        )
+    shortages = shortage_lines(db, batch)
+    if shortages and form.get("allow_shortage") != "1":
+        db.rollback()
+        return RedirectResponse(
+            url="/production/orders?error=insufficient_stock&detail=" + quote("; ".join(shortages)),
+            status_code=303,
+        )
+    apply_completion(db, batch, user_id=current_user.id)
+    for plan in batch.plans:
+        plan.production.status = "completed"
+        plan.production.current_stage = _recipe_max_stage(plan.recipe)
+    completed = len(batch.plans)
     db.commit()
+    invalidate_recipe_costs()
     check_low_stock_and_notify(db)
-    for pid in prod_ids:
-        production = db.query(Production).filter(Production.id == pid).first()
-        if production and production.status == "completed":
-            notify_managers_production_ready(db, production)
+    for plan in batch.plans:
+        notify_managers_production_ready(db, plan.production)
     return RedirectResponse(url="/production/orders?bulk_completed=" + str(completed), status_code=303)
 
 
@@ -1294,12 +1117,13 @@ async def complete_production_stage(
         return RedirectResponse(url="/production", status_code=303)
     current = getattr(production, "current_stage", None) or 1
     if current > max_stage:
-        err = _do_complete_production_stock(db, production, recipe)
+        err = _do_complete_production_stock(db, production, recipe, user_id=current_user.id)
         if err:
             return err
         production.status = "completed"
         production.current_stage = max_stage
         db.commit()
+        invalidate_recipe_costs()
         check_low_stock_and_notify(db)
         notify_managers_production_ready(db, production)
         return RedirectResponse(url="/production", status_code=303)
@@ -1332,12 +1156,13 @@ async def complete_production_stage(
         production.status = "in_progress"
         db.commit()
         return RedirectResponse(url="/production/orders", status_code=303)
-    err = _do_complete_production_stock(db, production, recipe)
+    err = _do_complete_production_stock(db, production, recipe, user_id=current_user.id)
     if err:
         return err
     production.status = "completed"
     production.current_stage = max_stage
     db.commit()
+    invalidate_recipe_costs()
     check_low_stock_and_notify(db)
     notify_managers_production_ready(db, production)
     return RedirectResponse(url="/production", status_code=303)
@@ -1355,12 +1180,13 @@ async def complete_production(
     recipe = db.query(Recipe).filter(Recipe.id == production.recipe_id).first()
     if not recipe:
         raise HTTPException(status_code=404, detail="Retsept topilmadi")
-    err = _do_complete_production_stock(db, production, recipe)
+    err = _do_complete_production_stock(db, production, recipe, user_id=current_user.id)
     if err:
         return err
     production.status = "completed"
     production.current_stage = _recipe_max_stage(recipe)
     db.commit()
+    invalidate_recipe_costs()
     check_low_stock_and_notify(db)
     notify_managers_production_ready(db, production)
     return RedirectResponse(url="/production", status_code=303)
@@ -1386,44 +1212,13 @@ async def production_revert(
             url="/production/orders?error=revert&detail=" + quote("Retsept topilmadi."),
             status_code=303,
         )
-    items_to_use = (
-        [(pi.product_id, float(pi.quantity or 0)) for pi in (production.production_items or [])]
-        if production.production_items
-        else [(item.product_id, float(item.quantity or 0) * float(production.quantity or 0)) for item in (recipe.items or [])]
-    )
-    output_units = production_output_quantity_for_stock(db, production, recipe)
-    out_wh_id = production.output_warehouse_id if production.output_warehouse_id else production.warehouse_id
-    product_stock = db.query(Stock).filter(
-        Stock.warehouse_id == out_wh_id,
-        Stock.product_id == recipe.product_id,
-    ).first()
-    current_qty = float(product_stock.quantity or 0) if product_stock else 0
-    if not product_stock or current_qty < output_units:
-        out_wh = db.query(Warehouse).filter(Warehouse.id == out_wh_id).first()
-        out_product = db.query(Product).filter(Product.id == recipe.product_id).first()
-        wh_name = (out_wh.name if out_wh else "2-ombor") or "2-ombor"
-        prod_name = (out_product.name if out_product else "tayyor mahsulot") or "tayyor mahsulot"
-        detail = f"«{wh_name}» da «{prod_name}» dan kerak: {output_units:,.1f}, mavjud: {current_qty:,.1f}. Mahsulot sotilgan yoki ko'chirilgan bo'lishi mumkin — tasdiqni bekor qilish uchun 2-omborda shu miqdorda qoldiq bo'lishi kerak."
+    err = revert_completion(db, production, recipe)
+    if err:
+        detail = f"{err}. Mahsulot sotilgan yoki ko'chirilgan bo'lishi mumkin — tasdiqni bekor qilish uchun 2-omborda shu miqdorda qoldiq bo'lishi kerak."
         return RedirectResponse(
             url="/production/orders?error=revert&detail=" + quote(detail),
             status_code=303,
         )
-    product_stock.quantity = current_qty - output_units
-    for product_id, required in items_to_use:
-        stock = db.query(Stock).filter(
-            Stock.warehouse_id == production.warehouse_id,
-            Stock.product_id == product_id,
-        ).first()
-        if stock:
-            stock.quantity = float(stock.quantity or 0) + required
-        else:
-            db.add(Stock(warehouse_id=production.warehouse_id, product_id=product_id, quantity=required))
-    movements = db.query(StockMovement).filter(
-        StockMovement.document_type == "Production",
-        StockMovement.document_id == production.id,
-    ).all()
-    for m in movements:
-        db.delete(m)
     production.status = "draft"
     db.commit()
     return RedirectResponse(url="/production/orders", status_code=303)
@@ -1448,21 +1243,8 @@ async def delete_production(
     production = db.query(Production).filter(Production.id == prod_id).first()
     if not production:
         raise HTTPException(status_code=404, detail="Buyurtma topilmadi")
-    # Shu buyurtmaga bog'liq barcha StockMovement yozuvlarini topib, qoldiqni teskari yangilash va yozuvlarni o'chirish
-    movements = db.query(StockMovement).filter(
-        StockMovement.document_type == "Production",
-        StockMovement.document_id == prod_id,
-    ).all()
-    for m in movements:
-        stock = db.query(Stock).filter(
-            Stock.warehouse_id == m.warehouse_id,
-            Stock.product_id == m.product_id,
-        ).first()
-        if stock:
-            # Harakatni bekor qilish: qoldiqdan quantity_change ni ayirish
-            new_qty = (stock.quantity or 0) - (m.quantity_change or 0)
-            stock.quantity = max(0.0, new_qty)
-        db.delete(m)
+    # Shu buyurtmaga bog'liq StockMovement yozuvlari teskarisiga qo'llanadi va o'chiriladi
+    reverse_document_movements(db, "Production", prod_id)
     db.delete(production)
     db.commit()
     return RedirectResponse(url="/production/orders", status_code=303)
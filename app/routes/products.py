@@ -18,6 +18,8 @@ from sqlalchemy import or_
 from app.core import templates
 from app.models.database import get_db, Product, Category, Unit, User
 from app.deps import require_auth, require_admin
+from app.utils.excel_stream import XlsxWriter, stream_rows, xlsx_response
+from app.services.recipe_costing import invalidate_recipe_costs
 
 router = APIRouter(prefix="/products", tags=["products"])
 
@@ -41,26 +43,23 @@ async def product_barcode(product_id: int, download: int = 0, db: Session = Depe
 
 @router.get("/export")
 async def export_products(db: Session = Depends(get_db), current_user: User = Depends(require_auth)):
-    products = db.query(Product).all()
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Products"
-    ws.append(["ID", "Kod", "Nomi", "Turi", "O'lchov", "Sotish narxi", "Olish narxi"])
-    for p in products:
-        ws.append([
-            p.id, p.code, p.name, p.type,
-            p.unit.name if p.unit else "",
-            p.sale_price, p.purchase_price,
-        ])
-    stream = io.BytesIO()
-    wb.save(stream)
-    stream.seek(0)
-    return StreamingResponse(
-        stream,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=products.xlsx"},
+    products_q = (
+        db.query(Product.id, Product.code, Product.name, Product.type, Unit.name, Product.sale_price, Product.purchase_price)
+        .outerjoin(Unit, Product.unit_id == Unit.id)
+        .order_by(Product.id)
     )
 
+    def build():
+        xw = XlsxWriter("Products")
+        xw.row(["ID", "Kod", "Nomi", "Turi", "O'lchov", "Sotish narxi", "Olish narxi"])
+        xw.rows(
+            (pid, code, name, ptype, unit_name or "", sale_price, purchase_price)
+            for pid, code, name, ptype, unit_name, sale_price, purchase_price in stream_rows(products_q)
+        )
+        return xw
+
+    return await xlsx_response(build, "products.xlsx")
+
 
 @router.get("/template")
 async def product_import_template(current_user: User = Depends(require_auth)):
@@ -215,6 +214,7 @@ async def import_products(
             except Exception:
                 db.rollback()
                 continue
+        invalidate_recipe_costs()
         if added == 0 and updated == 0:
             return RedirectResponse(
                 url="/products?import_ok=0&detail=" + quote("Hech qanday qator import qilinmadi."),
@@ -378,6 +378,7 @@ async def product_edit(
             shutil.copyfileobj(image.file, buffer)
         product.image = image_filename
     db.commit()
+    invalidate_recipe_costs()
     return RedirectResponse(url="/products", status_code=303)
 
 
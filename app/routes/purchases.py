@@ -28,6 +28,8 @@ from app.models.database import (
 from app.deps import require_auth, require_admin
 from app.utils.notifications import check_low_stock_and_notify
 from app.utils.user_scope import get_warehouses_for_user
+from app.services.partner_ledger import post_purchase_to_ledger
+from app.services.recipe_costing import invalidate_recipe_costs
 from app.utils.product_price import get_suggested_price
 from fastapi.responses import JSONResponse
 from fastapi import Query
@@ -372,14 +374,17 @@ async def purchase_confirm(
             stock.quantity += item.quantity
         else:
             db.add(Stock(warehouse_id=purchase.warehouse_id, product_id=item.product_id, quantity=item.quantity))
+            db.flush()  # hujjatda shu mahsulot yana bo'lsa — keyingi so'rov shu qatorni topsin (uq_stocks_warehouse_product)
     purchase.status = "confirmed"
     total_with_expenses = items_total + total_expenses
     if purchase.partner_id:
         partner = db.query(Partner).filter(Partner.id == purchase.partner_id).first()
         if partner:
             partner.balance -= total_with_expenses
+    post_purchase_to_ledger(db, purchase)
     db.commit()
-    check_low_stock_and_notify(db)
+    invalidate_recipe_costs()
+    check_low_stock_and_notify(db, product_ids={item.product_id for item in purchase.items})
     return RedirectResponse(url="/purchases", status_code=303)
 
 
@@ -419,6 +424,7 @@ async def purchase_revert(
         if partner:
             partner.balance += total_with_expenses
     purchase.status = "draft"
+    post_purchase_to_ledger(db, purchase)
     db.commit()
     return RedirectResponse(url=f"/purchases/edit/{purchase_id}", status_code=303)
 
@@ -32,11 +32,33 @@ from app.models.database import (
     PartnerBalanceDocItem,
 )
 from app.deps import require_auth, require_admin
-from app.services.stock_service import create_stock_movement, delete_stock_movements_for_document
+from app.services.stock_service import (
+    create_stock_movements_bulk,
+    delete_stock_movements_for_document,
+    refresh_stock_source_flags,
+)
+from app.services.cash_ledger import adjust_opening_balance, set_counted_balance
+from app.services.partner_ledger import post_balance_doc_to_ledger
+from app.services.recipe_costing import invalidate_recipe_costs
 
 router = APIRouter(prefix="/qoldiqlar", tags=["qoldiqlar"])
 
 
+def _adjustment_doc_keys(db: Session, doc_id: int) -> set:
+    """Qoldiq hujjatiga tegishli (ombor, mahsulot) kalitlari — qatorlar va qolgan harakatlar bo'yicha."""
+    keys = {
+        (w, p) for w, p in db.query(StockAdjustmentDocItem.warehouse_id, StockAdjustmentDocItem.product_id)
+        .filter(StockAdjustmentDocItem.doc_id == doc_id)
+    }
+    keys.update(
+        (w, p) for w, p in db.query(StockMovement.warehouse_id, StockMovement.product_id).filter(
+            StockMovement.document_type == "StockAdjustmentDoc",
+            StockMovement.document_id == doc_id,
+        )
+    )
+    return keys
+
+
 def _tarix_doc_type_label(doc_type: str) -> str:
     """Hujjat turi uchun o'qiladigan nom (tarix sahifasi)."""
     labels = {
@@ -194,7 +216,7 @@ async def qoldiqlar_kassa_save(
     cash = db.query(CashRegister).filter(CashRegister.id == cash_id).first()
     if not cash:
         raise HTTPException(status_code=404, detail="Kassa topilmadi")
-    cash.balance = balance
+    set_counted_balance(db, cash, balance)
     db.commit()
     return RedirectResponse(url="/qoldiqlar#kassa", status_code=303)
 
@@ -302,7 +324,7 @@ async def qoldiqlar_kassa_hujjat_tasdiqlash(
         cash = db.query(CashRegister).filter(CashRegister.id == item.cash_register_id).first()
         if cash:
             item.previous_balance = cash.balance
-            cash.balance = item.balance
+            set_counted_balance(db, cash, item.balance)
     doc.status = "confirmed"
     db.commit()
     return RedirectResponse(url=f"/qoldiqlar/kassa/hujjat/{doc_id}", status_code=303)
@@ -323,7 +345,7 @@ async def qoldiqlar_kassa_hujjat_revert(
     for item in doc.items:
         cash = db.query(CashRegister).filter(CashRegister.id == item.cash_register_id).first()
         if cash and item.previous_balance is not None:
-            cash.balance = item.previous_balance
+            adjust_opening_balance(db, cash, float(item.previous_balance) - float(item.balance or 0))
     doc.status = "draft"
     db.commit()
     return RedirectResponse(url=f"/qoldiqlar/kassa/hujjat/{doc_id}", status_code=303)
@@ -453,6 +475,7 @@ async def qoldiqlar_kontragent_hujjat_tasdiqlash(
             item.previous_balance = partner.balance
             partner.balance = item.balance
     doc.status = "confirmed"
+    post_balance_doc_to_ledger(db, doc)
     db.commit()
     return RedirectResponse(url=f"/qoldiqlar/kontragent/hujjat/{doc_id}", status_code=303)
 
@@ -474,6 +497,7 @@ async def qoldiqlar_kontragent_hujjat_revert(
         if partner and item.previous_balance is not None:
             partner.balance = item.previous_balance
     doc.status = "draft"
+    post_balance_doc_to_ledger(db, doc)
     db.commit()
     return RedirectResponse(url=f"/qoldiqlar/kontragent/hujjat/{doc_id}", status_code=303)
 
@@ -914,7 +938,7 @@ async def qoldiqlar_tovar_hujjat_tasdiqlash(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_auth),
 ):
-    """Hujjatni tasdiqlash — ombor qoldiqlariga qo'shiladi (create_stock_movement orqali)"""
+    """Hujjatni tasdiqlash — ombor qoldiqlariga qo'shiladi (create_stock_movements_bulk orqali)"""
     doc = db.query(StockAdjustmentDoc).filter(StockAdjustmentDoc.id == doc_id).first()
     if not doc:
         raise HTTPException(status_code=404, detail="Hujjat topilmadi")
@@ -926,54 +950,59 @@ async def qoldiqlar_tovar_hujjat_tasdiqlash(
     doc_warehouse_ids = list({item.warehouse_id for item in doc.items})
     doc_pairs = {(item.warehouse_id, item.product_id) for item in doc.items}
 
+    # Hujjat omborlaridagi barcha qoldiqlar bitta so'rovda (takroriy Stock qatorlari yig'iladi)
+    doc_stock_qty = {}
+    other_stocks = {}
+    for stock in db.query(Stock).filter(Stock.warehouse_id.in_(doc_warehouse_ids)).all():
+        key = (stock.warehouse_id, stock.product_id)
+        if key in doc_pairs:
+            doc_stock_qty[key] = doc_stock_qty.get(key, 0.0) + float(stock.quantity or 0)
+        else:
+            other_stocks[key] = other_stocks.get(key, 0.0) + float(stock.quantity or 0)
+    cost_products = {}
+    cost_ids = {item.product_id for item in doc.items if (item.cost_price or 0) > 0}
+    if cost_ids:
+        cost_products = {p.id: p for p in db.query(Product).filter(Product.id.in_(cost_ids)).all()}
+
+    movements = []
     for item in doc.items:
-        stock = db.query(Stock).filter(
-            Stock.warehouse_id == item.warehouse_id,
-            Stock.product_id == item.product_id,
-        ).first()
-        old_quantity = float(stock.quantity or 0) if stock else 0
+        key = (item.warehouse_id, item.product_id)
+        old_quantity = doc_stock_qty.get(key, 0.0)
         new_quantity = float(item.quantity or 0)
         quantity_change = new_quantity - old_quantity
 
         if abs(quantity_change) > 1e-9:
-            create_stock_movement(
-                db=db,
-                warehouse_id=item.warehouse_id,
-                product_id=item.product_id,
-                quantity_change=quantity_change,
-                operation_type="adjustment",
-                document_type="StockAdjustmentDoc",
-                document_id=doc.id,
-                document_number=doc.number,
-                user_id=current_user.id if current_user else None,
-                note=f"Qoldiq tuzatish: {doc.number}"
-            )
+            movements.append((item.warehouse_id, item.product_id, quantity_change))
+            doc_stock_qty[key] = max(0.0, new_quantity)
         if (item.cost_price or 0) > 0:
-            prod = db.query(Product).filter(Product.id == item.product_id).first()
+            prod = cost_products.get(item.product_id)
             if prod:
                 prod.purchase_price = item.cost_price
+    create_stock_movements_bulk(
+        db,
+        movements,
+        operation_type="adjustment",
+        document_type="StockAdjustmentDoc",
+        document_id=doc.id,
+        document_number=doc.number,
+        user_id=current_user.id if current_user else None,
+        note=f"Qoldiq tuzatish: {doc.number}",
+    )
 
-    for wh_id in doc_warehouse_ids:
-        for stock in db.query(Stock).filter(Stock.warehouse_id == wh_id).all():
-            if (stock.warehouse_id, stock.product_id) in doc_pairs:
-                continue
-            old_q = float(stock.quantity or 0)
-            if old_q > 0:
-                create_stock_movement(
-                    db=db,
-                    warehouse_id=stock.warehouse_id,
-                    product_id=stock.product_id,
-                    quantity_change=-old_q,
-                    operation_type="adjustment",
-                    document_type="StockAdjustmentDoc",
-                    document_id=doc.id,
-                    document_number=doc.number,
-                    user_id=current_user.id if current_user else None,
-                    note=f"Qoldiq tuzatish (hujjatda qatori yo'q): {doc.number}",
-                )
+    create_stock_movements_bulk(
+        db,
+        [(wid, pid, -old_q) for (wid, pid), old_q in other_stocks.items() if old_q > 0],
+        operation_type="adjustment",
+        document_type="StockAdjustmentDoc",
+        document_id=doc.id,
+        document_number=doc.number,
+        user_id=current_user.id if current_user else None,
+        note=f"Qoldiq tuzatish (hujjatda qatori yo'q): {doc.number}",
+    )
 
     doc.status = "confirmed"
     db.commit()
+    invalidate_recipe_costs()
     return RedirectResponse(url=f"/qoldiqlar/tovar/hujjat/{doc_id}", status_code=303)
 
 
@@ -991,24 +1020,21 @@ async def qoldiqlar_tovar_hujjat_apply_to_warehouse(
         raise HTTPException(status_code=400, detail="Faqat tasdiqlangan hujjat uchun")
     doc_warehouse_ids = list({item.warehouse_id for item in doc.items})
     doc_pairs = {(item.warehouse_id, item.product_id) for item in doc.items}
-    for wh_id in doc_warehouse_ids:
-        for stock in db.query(Stock).filter(Stock.warehouse_id == wh_id).all():
-            if (stock.warehouse_id, stock.product_id) in doc_pairs:
-                continue
-            old_q = float(stock.quantity or 0)
-            if old_q > 0:
-                create_stock_movement(
-                    db=db,
-                    warehouse_id=stock.warehouse_id,
-                    product_id=stock.product_id,
-                    quantity_change=-old_q,
-                    operation_type="adjustment",
-                    document_type="StockAdjustmentDoc",
-                    document_id=doc.id,
-                    document_number=doc.number,
-                    user_id=current_user.id if current_user else None,
-                    note=f"Omborni hujjatga moslash: {doc.number}",
-                )
+    other_stocks = {}
+    for stock in db.query(Stock).filter(Stock.warehouse_id.in_(doc_warehouse_ids)).all():
+        key = (stock.warehouse_id, stock.product_id)
+        if key not in doc_pairs:
+            other_stocks[key] = other_stocks.get(key, 0.0) + float(stock.quantity or 0)
+    create_stock_movements_bulk(
+        db,
+        [(wid, pid, -old_q) for (wid, pid), old_q in other_stocks.items() if old_q > 0],
+        operation_type="adjustment",
+        document_type="StockAdjustmentDoc",
+        document_id=doc.id,
+        document_number=doc.number,
+        user_id=current_user.id if current_user else None,
+        note=f"Omborni hujjatga moslash: {doc.number}",
+    )
     db.commit()
     return RedirectResponse(url=f"/qoldiqlar/tovar/hujjat/{doc_id}?applied=1", status_code=303)
 
@@ -1042,8 +1068,12 @@ async def qoldiqlar_tovar_hujjat_revert(
             q = float(stock.quantity or 0) - float(m.quantity_change or 0)
             stock.quantity = max(0, q)
             stock.updated_at = datetime.now()
+    keys = _adjustment_doc_keys(db, doc_id)
     delete_stock_movements_for_document(db, "StockAdjustmentDoc", doc_id)
     doc.status = "draft"
+    db.flush()
+    # Bayroq hujjat holatiga bog'liq — holat o'zgargandan keyin qayta hisoblanadi
+    refresh_stock_source_flags(db, keys)
     db.commit()
     return RedirectResponse(url="/qoldiqlar/tovar/hujjat?reverted=1", status_code=303)
 
@@ -1060,6 +1090,9 @@ async def qoldiqlar_tovar_hujjat_delete(
         raise HTTPException(status_code=404, detail="Hujjat topilmadi")
     if doc.status != "draft":
         raise HTTPException(status_code=400, detail="Faqat qoralama holatidagi hujjatni o'chirish mumkin. Avval tasdiqni bekor qiling.")
+    keys = _adjustment_doc_keys(db, doc_id)
     db.delete(doc)
+    db.flush()
+    refresh_stock_source_flags(db, keys)
     db.commit()
     return RedirectResponse(url="/qoldiqlar#tovar", status_code=303)
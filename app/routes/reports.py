@@ -7,14 +7,25 @@ from datetime import datetime, timedelta
 from fastapi import APIRouter, Request, Depends, File, Form, UploadFile
 from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, or_, and_
+from sqlalchemy import func, and_
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, PatternFill
 
 from app.core import templates
-from app.models.database import get_db, Order, OrderItem, Stock, StockMovement, Product, Partner, Warehouse, User, Production, Recipe, StockAdjustmentDoc, StockAdjustmentDocItem, Employee, Purchase, PurchaseItem, WarehouseTransfer, Payment, ProductPrice
+from app.models.database import get_db, Order, OrderItem, Stock, StockMovement, StockSourceFlag, Product, Partner, Warehouse, User, Production, Recipe, StockAdjustmentDoc, StockAdjustmentDocItem, Employee, Purchase, PurchaseItem, WarehouseTransfer, ProductPrice
 from app.deps import get_current_user, require_auth, require_admin
 from app.utils.user_scope import get_warehouses_for_user
+from app.services.stock_service import (
+    refresh_stock_source_flags,
+    rebuild_stock_source_flags,
+    invalidate_stock_snapshots,
+    stock_quantities_as_of,
+)
+from app.services.export_jobs import export_job, submit_export
+from app.services.partner_ledger import partner_movements
+from app.services.recipe_costing import invalidate_recipe_costs
+from app.utils.date_range import in_period
+from app.utils.excel_stream import XlsxWriter, stream_rows, xlsx_response
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
@@ -124,42 +135,39 @@ async def report_sales_export(
         start_date = datetime.now().replace(day=1).strftime("%Y-%m-%d")
     if not end_date:
         end_date = datetime.now().strftime("%Y-%m-%d")
-    orders = db.query(Order).filter(
-        Order.type == "sale",
-        Order.date >= start_date,
-        Order.date <= end_date + " 23:59:59",
-    ).order_by(Order.date.desc()).all()
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Savdo"
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    ws["A1"] = "Savdo hisoboti"
-    ws["A1"].font = Font(bold=True, size=14)
-    ws["A2"] = f"Davr: {start_date} — {end_date}"
-    ws.append(["№", "Sana", "Buyurtma", "Mijoz", "Jami", "Holat"])
-    for c in range(1, 7):
-        ws.cell(row=4, column=c).fill = header_fill
-        ws.cell(row=4, column=c).font = Font(bold=True, color="FFFFFF")
-    for i, o in enumerate(orders, 1):
-        ws.append([
-            i,
-            o.date.strftime("%d.%m.%Y %H:%M") if o.date else "",
-            o.number or "",
-            o.partner.name if o.partner else "",
-            float(o.total or 0),
-            o.status or "",
-        ])
-    total = sum(o.total or 0 for o in orders)
-    ws.append(["", "", "", "JAMI:", total, ""])
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename=savdo_{start_date}_{end_date}.xlsx"},
+    try:
+        start_day = datetime.strptime(start_date[:10], "%Y-%m-%d")
+        end_day = datetime.strptime(end_date[:10], "%Y-%m-%d")
+    except ValueError:
+        return RedirectResponse(url="/reports/sales?error=date", status_code=303)
+    orders_q = (
+        db.query(Order.date, Order.number, Partner.name, Order.total, Order.status)
+        .outerjoin(Partner, Order.partner_id == Partner.id)
+        .filter(Order.type == "sale", in_period(Order.date, start_day, end_day))
+        .order_by(Order.date.desc())
     )
 
+    def build():
+        xw = XlsxWriter("Savdo", widths=(7, 18, 18, 32, 16, 12))
+        xw.title("Savdo hisoboti")
+        xw.row([f"Davr: {start_date} — {end_date}"])
+        xw.header(["№", "Sana", "Buyurtma", "Mijoz", "Jami", "Holat"])
+        total = 0.0
+        for i, (date, number, partner_name, order_total, status) in enumerate(stream_rows(orders_q), 1):
+            total += order_total or 0
+            xw.row([
+                i,
+                date.strftime("%d.%m.%Y %H:%M") if date else "",
+                number or "",
+                partner_name or "",
+                float(order_total or 0),
+                status or "",
+            ])
+        xw.row(["", "", "", "JAMI:", total, ""])
+        return xw
+
+    return await xlsx_response(build, f"savdo_{start_date}_{end_date}.xlsx")
+
 
 @router.get("/stock", response_class=HTMLResponse)
 async def report_stock(
@@ -570,6 +578,9 @@ async def report_stock_source_remove_movement(
     elif add_back > 0:
         db.add(Stock(warehouse_id=m.warehouse_id, product_id=m.product_id, quantity=add_back))
     db.delete(m)
+    db.flush()
+    refresh_stock_source_flags(db, [(m.warehouse_id, m.product_id)])
+    invalidate_stock_snapshots(db, m.created_at)
     db.commit()
     return RedirectResponse(
         url=f"/reports/stock/source?warehouse_id={warehouse_id}&product_id={product_id}&removed=1&msg=" + quote("Noto'g'ri harakat olib tashlandi, qoldiq qaytarildi."),
@@ -623,8 +634,12 @@ async def report_stock_cleanup_orphan_movements(
                 stocks[0].updated_at = datetime.now()
         elif add_back > 0:
             db.add(Stock(warehouse_id=wh_id, product_id=prod_id, quantity=add_back))
+            db.flush()  # shu ombor+mahsulot uchun keyingi harakat shu qatorni topsin
         db.delete(m)
         reverted += 1
+    db.flush()
+    refresh_stock_source_flags(db, [(m.warehouse_id, m.product_id) for m in orphans])
+    invalidate_stock_snapshots(db, min((m.created_at for m in orphans if m.created_at), default=None))
     db.commit()
     msg = quote(f"O'chirilgan hujjatlar harakatlari: {reverted} ta tozalandi (ombordan omborga, ishlab chiqarish, kirim, qoldiq tuzatish). Qoldiq qaytarildi.")
     return RedirectResponse(url=f"/reports/stock?cleanup_orphan=1&msg={msg}", status_code=303)
@@ -664,8 +679,12 @@ async def report_stock_cleanup_orphan_sale_movements(
                 stocks[0].updated_at = datetime.now()
         elif add_back > 0:
             db.add(Stock(warehouse_id=wh_id, product_id=prod_id, quantity=add_back))
+            db.flush()  # shu ombor+mahsulot uchun keyingi harakat shu qatorni topsin
         db.delete(m)
         reverted += 1
+    db.flush()
+    refresh_stock_source_flags(db, [(m.warehouse_id, m.product_id) for m in orphans])
+    invalidate_stock_snapshots(db, min((m.created_at for m in orphans if m.created_at), default=None))
     db.commit()
     msg = quote(f"O'chirilgan sotuv/qaytish harakatlari: {reverted} ta tozalandi, qoldiq qaytarildi.")
     return RedirectResponse(url=f"/reports/stock?cleanup_sale=1&msg={msg}", status_code=303)
@@ -715,12 +734,16 @@ async def report_stock_recalculate_from_movements(
         StockMovement.document_id.isnot(None),
     ).all()
     deleted_orphans = 0
+    first_deleted_at = None
     for m in orphan_production_movements:
         if m.document_id not in existing_production_ids:
             db.delete(m)
             deleted_orphans += 1
+            if m.created_at and (first_deleted_at is None or m.created_at < first_deleted_at):
+                first_deleted_at = m.created_at
     if deleted_orphans:
         db.flush()
+        invalidate_stock_snapshots(db, first_deleted_at)
     # Tasdiqlangan qoldiq tuzatish hujjatlarini aniqlash (boshqa hujjat turlari hammasi hisobga olinadi)
     adj_ids = db.query(StockMovement.document_id).filter(
         StockMovement.document_type == "StockAdjustmentDoc",
@@ -778,6 +801,7 @@ async def report_stock_recalculate_from_movements(
         else:
             db.add(Stock(warehouse_id=wh_id, product_id=prod_id, quantity=qty))
             created += 1
+    rebuild_stock_source_flags(db)
     db.commit()
     from urllib.parse import quote
     msg_parts = [f"Stock qoldiqlari harakatlar tarixidan qayta hisoblandi: {updated} yangilandi, {created} yangi qator."]
@@ -823,10 +847,19 @@ async def report_stock_cleanup_orphans(
 
     # StockMovement: product_id yoki warehouse_id mavjud emas
     deleted_movements = 0
+    deleted_keys = set()
+    first_deleted_at = None
     for m in db.query(StockMovement).all():
         if (m.product_id not in valid_product_ids) or (m.warehouse_id not in valid_warehouse_ids):
             db.delete(m)
             deleted_movements += 1
+            deleted_keys.add((m.warehouse_id, m.product_id))
+            if m.created_at and (first_deleted_at is None or m.created_at < first_deleted_at):
+                first_deleted_at = m.created_at
+    if deleted_keys:
+        db.flush()
+        refresh_stock_source_flags(db, deleted_keys)
+        invalidate_stock_snapshots(db, first_deleted_at)
 
     # StockAdjustmentDocItem: product_id, warehouse_id yoki doc_id mavjud emas
     deleted_items = 0
@@ -845,29 +878,16 @@ async def report_stock_cleanup_orphans(
 
 
 def _stock_report_as_of_date(db: Session, report_date, wh_id: int = None):
-    """Berilgan sanagacha bo'lgan harakatlar bo'yicha qoldiqni hisoblaydi. report_date — date yoki YYYY-MM-DD string."""
+    """Berilgan sanagacha bo'lgan harakatlar bo'yicha qoldiqni hisoblaydi. report_date — date yoki YYYY-MM-DD string.
+    Eng yaqin kunlik snapshotdan (stock_snapshots) boshlab faqat keyingi harakatlar o'qiladi."""
     if isinstance(report_date, str):
         try:
             report_date = datetime.strptime(report_date.strip()[:10], "%Y-%m-%d").date()
         except (ValueError, TypeError):
             report_date = datetime.now().date()
-    if not isinstance(report_date, datetime):
-        report_date = datetime.combine(report_date, datetime.max.time())
-    else:
-        report_date = report_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-    q = (
-        db.query(StockMovement)
-        .filter(StockMovement.created_at <= report_date)
-        .order_by(StockMovement.warehouse_id, StockMovement.product_id, StockMovement.created_at.desc())
-    )
-    if wh_id:
-        q = q.filter(StockMovement.warehouse_id == wh_id)
-    rows = q.all()
-    last_by_key = {}
-    for m in rows:
-        key = (m.warehouse_id, m.product_id)
-        if key not in last_by_key:
-            last_by_key[key] = float(m.quantity_after or 0)
+    if isinstance(report_date, datetime):
+        report_date = report_date.date()
+    last_by_key = stock_quantities_as_of(db, report_date, wh_id)
     if not last_by_key:
         return []
     wh_ids = list({k[0] for k in last_by_key})
@@ -886,52 +906,62 @@ def _stock_report_as_of_date(db: Session, report_date, wh_id: int = None):
 
 
 def _stock_report_filtered(db: Session, wh_id: int = None):
-    """Stock jadvalidan faqat tasdiqlangan manba va qoldiq > 0 bo'lgan qatorlarni qaytaradi (hisobot va eksport uchun)."""
+    """Stock jadvalidan faqat tasdiqlangan manba va qoldiq > 0 bo'lgan qatorlarni qaytaradi (hisobot va eksport uchun).
+    Manba bayrog'i stock_source_flags jadvalida saqlanadi (create_stock_movement yangilaydi) — bitta so'rov."""
+    total_qty = func.sum(Stock.quantity)
     q = (
-        db.query(Stock)
+        db.query(Warehouse, Product, total_qty)
+        .select_from(Stock)
         .join(Product, Stock.product_id == Product.id)
         .join(Warehouse, Stock.warehouse_id == Warehouse.id)
-        .order_by(Warehouse.name, Product.name)
+        .join(
+            StockSourceFlag,
+            and_(
+                StockSourceFlag.warehouse_id == Stock.warehouse_id,
+                StockSourceFlag.product_id == Stock.product_id,
+            ),
+        )
+        .filter(StockSourceFlag.has_confirmed_source == True)
+        .group_by(Warehouse.id, Product.id)
+        .having(total_qty > 0)
     )
     if wh_id:
         q = q.filter(Stock.warehouse_id == wh_id)
-    rows = q.all()
-    aggregated = {}
-    for s in rows:
-        key = (s.warehouse_id, s.product_id)
-        if key not in aggregated:
-            aggregated[key] = {"warehouse": s.warehouse, "product": s.product, "quantity": 0}
-        aggregated[key]["quantity"] += float(s.quantity or 0)
-    keys = list(aggregated.keys())
-    allowed_keys = set()
-    if keys:
-        mov_q = db.query(StockMovement).filter(
-            or_(*[and_(StockMovement.warehouse_id == k[0], StockMovement.product_id == k[1]) for k in keys])
-        ).all()
-        adj_doc_ids = {m.document_id for m in mov_q if (m.document_type or "") == "StockAdjustmentDoc" and m.document_id}
-        confirmed_adj_ids = set()
-        if adj_doc_ids:
-            confirmed_adj_ids = {
-                d.id for d in db.query(StockAdjustmentDoc.id).filter(
-                    StockAdjustmentDoc.id.in_(adj_doc_ids),
-                    StockAdjustmentDoc.status == "confirmed",
-                ).all()
-            }
-        for m in mov_q:
-            key = (m.warehouse_id, m.product_id)
-            if key not in aggregated:
-                continue
-            if (m.document_type or "") == "StockAdjustmentDoc":
-                if m.document_id in confirmed_adj_ids:
-                    allowed_keys.add(key)
-            else:
-                allowed_keys.add(key)
-    if allowed_keys:
-        aggregated = {k: v for k, v in aggregated.items() if k in allowed_keys}
+    result = [{"warehouse": wh, "product": prod, "quantity": float(qty or 0)} for wh, prod, qty in q.all()]
+    return sorted(result, key=lambda x: ((x["warehouse"].name or "").lower(), (x["product"].name or "").lower()))
+
+
+@export_job("stock", "Qoldiq hisoboti")
+def _stock_export_book(db: Session, warehouse_id: int = None, report_date: str = None):
+    """Qoldiq hisoboti kitobi: report_date berilsa — shu sana bo'yicha (og'ir, fon vazifasida), aks holda joriy."""
+    if report_date:
+        values = _stock_report_as_of_date(db, report_date, warehouse_id)
+        title_suffix = " — " + report_date
+        subtitle = report_date + " sana bo'yicha"
     else:
-        aggregated = {}
-    aggregated = {k: v for k, v in aggregated.items() if float(v.get("quantity") or 0) > 0}
-    return sorted(aggregated.values(), key=lambda x: ((x["warehouse"].name or "").lower(), (x["product"].name or "").lower()))
+        values = _stock_report_filtered(db, warehouse_id)
+        title_suffix = ""
+        subtitle = datetime.now().strftime("%d.%m.%Y %H:%M")
+    xw = XlsxWriter("Qoldiq", widths=(24, 32, 16, 12, 12, 14, 16))
+    xw.title("Qoldiq hisoboti" + title_suffix)
+    xw.row([subtitle])
+    xw.header(["Ombor", "Mahsulot", "Kod", "Qoldiq", "Minimal", "Narx", "Summa"])
+    for v in values:
+        p = v["product"]
+        wh = v["warehouse"]
+        qty = float(v["quantity"] or 0)
+        price = getattr(p, "purchase_price", 0) or 0
+        xw.row([
+            wh.name if wh else "",
+            p.name if p else "",
+            (p.barcode or p.code or "") if p else "",
+            qty,
+            float(getattr(p, "min_stock", 0) or 0),
+            float(price),
+            float(qty * price),
+        ])
+    fn_date = report_date.replace("-", "") if report_date else datetime.now().strftime("%Y%m%d")
+    return xw, f"qoldiq_{fn_date}.xlsx"
 
 
 @router.get("/stock/export")
@@ -941,6 +971,7 @@ async def report_stock_export(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_auth),
 ):
+    """Joriy qoldiq — darhol yuklanadi; sana bo'yicha qoldiq — fon vazifasi (/exports/{id})."""
     if not current_user:
         return RedirectResponse(url="/login", status_code=303)
     wh_id = None
@@ -950,43 +981,11 @@ async def report_stock_export(
         except (ValueError, TypeError):
             wh_id = None
     if report_date and str(report_date).strip():
-        values = _stock_report_as_of_date(db, report_date.strip()[:10], wh_id)
-    else:
-        values = _stock_report_filtered(db, wh_id)
-    stocks = [{"warehouse": v["warehouse"], "product": v["product"], "quantity": v["quantity"]} for v in values]
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Qoldiq"
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    ws["A1"] = "Qoldiq hisoboti" + (" — " + report_date[:10] if report_date and report_date.strip() else "")
-    ws["A1"].font = Font(bold=True, size=14)
-    ws["A2"] = report_date[:10] + " sana bo'yicha" if report_date and report_date.strip() else datetime.now().strftime("%d.%m.%Y %H:%M")
-    ws.append(["Ombor", "Mahsulot", "Kod", "Qoldiq", "Minimal", "Narx", "Summa"])
-    for c in range(1, 8):
-        ws.cell(row=4, column=c).fill = header_fill
-        ws.cell(row=4, column=c).font = Font(bold=True, color="FFFFFF")
-    for s in stocks:
-        p = s.product
-        wh = s.warehouse
-        min_s = getattr(p, "min_stock", 0) or 0
-        price = getattr(p, "purchase_price", 0) or 0
-        ws.append([
-            wh.name if wh else "",
-            p.name if p else "",
-            (p.barcode or p.code or "") if p else "",
-            float(s.quantity or 0),
-            float(min_s),
-            float(price),
-            float((s.quantity or 0) * price),
-        ])
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    fn_date = (report_date or "").strip()[:10].replace("-", "") if report_date else datetime.now().strftime("%Y%m%d")
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename=qoldiq_{fn_date}.xlsx"},
+        job = submit_export("stock", {"warehouse_id": wh_id, "report_date": report_date.strip()[:10]}, current_user.id)
+        return RedirectResponse(url=f"/exports/{job.id}", status_code=303)
+    return await xlsx_response(
+        lambda: _stock_export_book(db, wh_id)[0],
+        f"qoldiq_{datetime.now().strftime('%Y%m%d')}.xlsx",
     )
 
 
@@ -1120,6 +1119,7 @@ async def report_stock_import(
             sale_price=sp,
         ))
     db.commit()
+    invalidate_recipe_costs()
     return RedirectResponse(
         url=f"/qoldiqlar/tovar/hujjat/{doc.id}?from=import&msg=" + quote("Hujjat qoralama. Qoldiq hisobotida ko'rinishi uchun «Tasdiqlash» bosing."),
         status_code=303,
@@ -1199,131 +1199,27 @@ async def report_debts(request: Request, db: Session = Depends(get_db), current_
 async def report_debts_export(db: Session = Depends(get_db), current_user: User = Depends(require_auth)):
     if not current_user:
         return RedirectResponse(url="/login", status_code=303)
-    debtors = db.query(Partner).filter(Partner.balance != 0).order_by(Partner.name).all()
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Qarzdorlik"
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    ws["A1"] = "Qarzdorlik hisoboti"
-    ws["A1"].font = Font(bold=True, size=14)
-    ws["A2"] = datetime.now().strftime("%d.%m.%Y %H:%M")
-    ws.append(["Kod", "Mijoz", "Telefon", "Balans (qarz +)", "Kredit limiti"])
-    for c in range(1, 6):
-        ws.cell(row=4, column=c).fill = header_fill
-        ws.cell(row=4, column=c).font = Font(bold=True, color="FFFFFF")
-    for p in debtors:
-        ws.append([
-            p.code or "",
-            p.name or "",
-            p.phone or "",
-            float(p.balance or 0),
-            float(p.credit_limit or 0),
-        ])
-    total = sum(p.balance for p in debtors if (p.balance or 0) > 0)
-    ws.append(["", "", "JAMI QARZ:", total, ""])
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename=qarzdorlik_{datetime.now().strftime('%Y%m%d')}.xlsx"},
+    debtors_q = (
+        db.query(Partner.code, Partner.name, Partner.phone, Partner.balance, Partner.credit_limit)
+        .filter(Partner.balance != 0)
+        .order_by(Partner.name)
     )
+    printed_at = datetime.now().strftime("%d.%m.%Y %H:%M")
 
+    def build():
+        xw = XlsxWriter("Qarzdorlik", widths=(12, 36, 18, 18, 16))
+        xw.title("Qarzdorlik hisoboti")
+        xw.row([printed_at])
+        xw.header(["Kod", "Mijoz", "Telefon", "Balans (qarz +)", "Kredit limiti"])
+        total = 0.0
+        for code, name, phone, balance, credit_limit in stream_rows(debtors_q):
+            if (balance or 0) > 0:
+                total += balance
+            xw.row([code or "", name or "", phone or "", float(balance or 0), float(credit_limit or 0)])
+        xw.row(["", "", "JAMI QARZ:", total, ""])
+        return xw
 
-def _build_partner_movements(db: Session, partner_id: int, date_from: datetime, date_to: datetime, period_only: bool):
-    """
-    Kontragent uchun harakatlar ro'yxati (1C uslubida).
-    period_only=True: faqat [date_from, date_to] oralig'idagi qatorlar.
-    Qaytadi: (rows, opening_debit, opening_credit) yoki period_only=True bo'lsa (rows, 0, 0).
-    Balans: Debit = kontragent bizga qarzdor (sotuv), Credit = to'lov/xarid/qaytarish.
-    """
-    partner = db.query(Partner).filter(Partner.id == partner_id).first()
-    if not partner:
-        return [], 0.0, 0.0
-    date_from_start = date_from.replace(hour=0, minute=0, second=0, microsecond=0)
-    date_to_end = date_to.replace(hour=23, minute=59, second=59, microsecond=999999)
-    rows = []
-
-    # Sotuvlar (debit) va qaytarishlar (credit)
-    q_orders = db.query(Order).filter(
-        Order.partner_id == partner_id,
-        Order.type.in_(["sale", "return_sale"]),
-    )
-    if period_only:
-        q_orders = q_orders.filter(Order.date >= date_from_start, Order.date <= date_to_end)
-    for o in q_orders.order_by(Order.date):
-        debit = float(o.total or 0) if o.type == "sale" else 0.0
-        credit = float(o.total or 0) if o.type == "return_sale" else 0.0
-        doc_label = f"{'Sotuv' if o.type == 'sale' else 'Qaytarish'} {o.number or ''} {o.date.strftime('%d.%m.%Y %H:%M') if o.date else ''}".strip()
-        rows.append({
-            "date": o.date,
-            "doc_type": "Sotuv" if o.type == "sale" else "Qaytarish",
-            "doc_number": o.number or "",
-            "doc_label": doc_label,
-            "doc_url": f"/sales/edit/{o.id}",
-            "debit": debit,
-            "credit": credit,
-        })
-
-    # To'lovlar: income = credit (ular bizga to'ladı), expense = debit (biz ularga to'ladık) — faqat tasdiqlangan
-    q_payments = db.query(Payment).filter(Payment.partner_id == partner_id)
-    if hasattr(Payment, "status"):
-        q_payments = q_payments.filter(or_(Payment.status == "confirmed", Payment.status == None))
-    if period_only:
-        q_payments = q_payments.filter(Payment.date >= date_from_start, Payment.date <= date_to_end)
-    for p in q_payments.order_by(Payment.date):
-        if p.type == "income":
-            doc_label = f"To'lov (kirim) {p.number or ''} {p.date.strftime('%d.%m.%Y %H:%M') if p.date else ''}".strip()
-            rows.append({
-                "date": p.date,
-                "doc_type": "To'lov (kirim)",
-                "doc_number": p.number or "",
-                "doc_label": doc_label,
-                "doc_url": f"/finance/payment/{p.id}/edit",
-                "debit": 0.0,
-                "credit": float(p.amount or 0),
-            })
-        else:
-            doc_label = f"To'lov (chiqim) {p.number or ''} {p.date.strftime('%d.%m.%Y %H:%M') if p.date else ''}".strip()
-            rows.append({
-                "date": p.date,
-                "doc_type": "To'lov (chiqim)",
-                "doc_number": p.number or "",
-                "doc_label": doc_label,
-                "doc_url": f"/finance/payment/{p.id}/edit",
-                "debit": float(p.amount or 0),
-                "credit": 0.0,
-            })
-
-    # Xaridlar (biz yetkazuvchiga qarzdormiz — credit)
-    q_purchases = db.query(Purchase).filter(Purchase.partner_id == partner_id)
-    if period_only:
-        q_purchases = q_purchases.filter(Purchase.date >= date_from_start, Purchase.date <= date_to_end)
-    for p in q_purchases.order_by(Purchase.date):
-        total_val = float((p.total or 0) + (p.total_expenses or 0))
-        doc_label = f"Tovarlar kirimi (xarid) {p.number or ''} {p.date.strftime('%d.%m.%Y %H:%M') if p.date else ''}".strip()
-        rows.append({
-            "date": p.date,
-            "doc_type": "Xarid",
-            "doc_number": p.number or "",
-            "doc_label": doc_label,
-            "doc_url": f"/purchases/edit/{p.id}",
-            "debit": 0.0,
-            "credit": total_val,
-        })
-
-    rows.sort(key=lambda r: r["date"])
-    opening_debit = 0.0
-    opening_credit = 0.0
-    if not period_only:
-        # Opening = barcha harakatlar perioddan oldin
-        for r in rows:
-            if r["date"] < date_from_start:
-                opening_debit += r["debit"]
-                opening_credit += r["credit"]
-        rows = [r for r in rows if date_from_start <= r["date"] <= date_to_end]
-    return rows, opening_debit, opening_credit
+    return await xlsx_response(build, f"qarzdorlik_{datetime.now().strftime('%Y%m%d')}.xlsx")
 
 
 @router.get("/partner-reconciliation", response_class=HTMLResponse)
@@ -1362,7 +1258,7 @@ async def report_partner_reconciliation(
     if partner_id:
         partner_obj = db.query(Partner).filter(Partner.id == partner_id).first()
         if partner_obj:
-            rows, opening_debit, opening_credit = _build_partner_movements(db, partner_id, dt_from, dt_to, period_only=False)
+            rows, opening_debit, opening_credit = partner_movements(db, partner_id, dt_from, dt_to)
             total_debit = sum(r["debit"] for r in rows)
             total_credit = sum(r["credit"] for r in rows)
             date_from_start = dt_from.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -1429,34 +1325,15 @@ async def report_partner_reconciliation(
     })
 
 
-@router.get("/partner-reconciliation/export")
-async def report_partner_reconciliation_export(
-    partner_id: int = None,
-    date_from: str = None,
-    date_to: str = None,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_auth),
-):
-    """Kontragent solishtirish hisobotini Excelga eksport."""
-    if not current_user:
-        return RedirectResponse(url="/reports", status_code=303)
-    if not partner_id:
-        return RedirectResponse(url="/reports/partner-reconciliation?error=partner", status_code=303)
+@export_job("partner_reconciliation", "Kontragent solishtirish")
+def _partner_reconciliation_book(db: Session, partner_id: int, date_from: str, date_to: str):
+    """Kontragent solishtirish kitobi (3 varaq) — fon vazifasida quriladi."""
     partner = db.query(Partner).filter(Partner.id == partner_id).first()
     if not partner:
-        return RedirectResponse(url="/reports/partner-reconciliation", status_code=303)
-    today = datetime.now()
-    if not date_from:
-        date_from = (today.replace(day=1)).strftime("%Y-%m-%d")
-    if not date_to:
-        date_to = today.strftime("%Y-%m-%d")
-    try:
-        dt_from = datetime.strptime(date_from, "%Y-%m-%d")
-        dt_to = datetime.strptime(date_to, "%Y-%m-%d")
-    except (ValueError, TypeError):
-        dt_from = today.replace(day=1)
-        dt_to = today
-    rows, opening_debit, opening_credit = _build_partner_movements(db, partner_id, dt_from, dt_to, period_only=False)
+        raise ValueError("Kontragent topilmadi")
+    dt_from = datetime.strptime(date_from, "%Y-%m-%d")
+    dt_to = datetime.strptime(date_to, "%Y-%m-%d")
+    rows, opening_debit, opening_credit = partner_movements(db, partner_id, dt_from, dt_to)
     total_debit = sum(r["debit"] for r in rows)
     total_credit = sum(r["credit"] for r in rows)
     opening_balance = opening_debit - opening_credit
@@ -1584,12 +1461,39 @@ async def report_partner_reconciliation_export(
     if not products_sold:
         ws_sale.cell(row=5, column=1, value="Davrda sotuv bo'lmagan.")
 
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    filename = f"kontragent_solishtirish_{partner.id}_{date_from}_{date_to}.xlsx"
-    return StreamingResponse(
-        buf,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    return wb, f"kontragent_solishtirish_{partner.id}_{date_from}_{date_to}.xlsx"
+
+
+@router.get("/partner-reconciliation/export")
+async def report_partner_reconciliation_export(
+    partner_id: int = None,
+    date_from: str = None,
+    date_to: str = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_auth),
+):
+    """Kontragent solishtirish hisobotini Excelga eksport — fon vazifasi sifatida quriladi."""
+    if not current_user:
+        return RedirectResponse(url="/reports", status_code=303)
+    if not partner_id:
+        return RedirectResponse(url="/reports/partner-reconciliation?error=partner", status_code=303)
+    partner = db.query(Partner).filter(Partner.id == partner_id).first()
+    if not partner:
+        return RedirectResponse(url="/reports/partner-reconciliation", status_code=303)
+    today = datetime.now()
+    if not date_from:
+        date_from = (today.replace(day=1)).strftime("%Y-%m-%d")
+    if not date_to:
+        date_to = today.strftime("%Y-%m-%d")
+    try:
+        datetime.strptime(date_from, "%Y-%m-%d")
+        datetime.strptime(date_to, "%Y-%m-%d")
+    except (ValueError, TypeError):
+        date_from = today.replace(day=1).strftime("%Y-%m-%d")
+        date_to = today.strftime("%Y-%m-%d")
+    job = submit_export(
+        "partner_reconciliation",
+        {"partner_id": partner_id, "date_from": date_from, "date_to": date_to},
+        current_user.id,
     )
+    return RedirectResponse(url=f"/exports/{job.id}", status_code=303)
@@ -41,8 +41,11 @@ from app.utils.production_order import (
     get_product_stock_in_warehouse,
     notify_operator_semi_finished_available,
 )
-from app.utils.db_schema import ensure_orders_payment_due_date_column, ensure_order_item_warehouse_id_column
-from app.services.stock_service import create_stock_movement
+from app.utils.date_range import in_period, on_day
+from app.services.stock_service import create_stock_movements_bulk
+from app.services.pos_checkout import complete_pos_checkout, PosCheckoutError
+from app.services.sales_rollup import apply_order_to_rollup
+from app.services.partner_ledger import post_order_to_ledger
 from app.services.pos_helpers import (
     get_pos_price_type as _get_pos_price_type,
     get_pos_warehouses_for_user as _get_pos_warehouses_for_user,
@@ -140,7 +143,6 @@ async def sales_new(
     db: Session = Depends(get_db),
     current_user: User = Depends(require_auth),
 ):
-    ensure_order_item_warehouse_id_column(db)
     products = db.query(Product).options(
         joinedload(Product.unit),
     ).filter(
@@ -485,8 +487,10 @@ async def sales_confirm(
         if stock:
             stock.quantity -= item.quantity
     order.status = "completed"
+    apply_order_to_rollup(db, order)
+    post_order_to_ledger(db, order)
     db.commit()
-    check_low_stock_and_notify(db)
+    check_low_stock_and_notify(db, product_ids={item.product_id for item in order.items})
     return RedirectResponse(url=f"/sales/edit/{order_id}", status_code=303)
 
 
@@ -532,6 +536,8 @@ async def sales_revert(
         if stock:
             stock.quantity = (stock.quantity or 0) + item.quantity
     order.status = "draft"
+    apply_order_to_rollup(db, order, sign=-1)
+    post_order_to_ledger(db, order)
     db.commit()
     return RedirectResponse(url=f"/sales/edit/{order_id}", status_code=303)
 
@@ -598,7 +604,6 @@ async def sales_pos(
     current_user: User = Depends(require_auth),
 ):
     """Sotuv oynasi: faqat sotuvchi (yoki admin/menejer). Tovarlar foydalanuvchi bo'limi/omboridan."""
-    ensure_orders_payment_due_date_column(db)
     role = (current_user.role or "").strip()
     if role not in ("sotuvchi", "admin", "manager"):
         return RedirectResponse(url="/?error=pos_access", status_code=303)
@@ -618,7 +623,7 @@ async def sales_pos(
     pos_today_orders = db.query(Order).filter(
         Order.type == "sale",
         Order.status == "completed",
-        func.date(Order.created_at) == today_date,
+        on_day(Order.created_at, today_date),
     ).order_by(Order.created_at.desc()).limit(10).all()
     if not sales_warehouse and role == "sotuvchi":
         err = "no_warehouse"
@@ -758,8 +763,7 @@ async def sales_pos_daily_orders(
     orders = db.query(Order).filter(
         Order.type == o_type,
         Order.status == "completed",
-        func.date(Order.created_at) >= d_from,
-        func.date(Order.created_at) <= d_to,
+        in_period(Order.created_at, d_from, d_to),
     ).order_by(Order.created_at.desc()).limit(200).all()
     out = []
     for o in orders:
@@ -870,7 +874,6 @@ async def sales_pos_complete(
     current_user: User = Depends(require_auth),
 ):
     """POS savatni sotuv qilish. Naqd mijoz → pul kassaga; boshqa kontragent → qarz."""
-    ensure_orders_payment_due_date_column(db)
     role = (current_user.role or "").strip()
     if role not in ("sotuvchi", "admin", "manager"):
         return RedirectResponse(url="/?error=pos_access", status_code=303)
@@ -917,41 +920,10 @@ async def sales_pos_complete(
             pass
     if not product_ids or len(quantities) < len(product_ids):
         return RedirectResponse(url="/sales/pos?error=empty", status_code=303)
-    price_type = _get_pos_price_type(db)
-    last_order = db.query(Order).filter(Order.type == "sale").order_by(Order.id.desc()).first()
-    new_number = f"S-{datetime.now().strftime('%Y%m%d')}-{(last_order.id + 1) if last_order else 1:04d}"
-    order = Order(
-        number=new_number,
-        type="sale",
-        partner_id=partner.id,
-        warehouse_id=warehouse.id,
-        price_type_id=price_type.id if price_type else None,
-        user_id=current_user.id if current_user else None,
-        status="draft",
-        payment_type=payment_type,
-    )
-    db.add(order)
-    db.commit()
-    db.refresh(order)
-    total_order = 0.0
-    items_for_stock = []
+    cart = []
     for i in range(min(len(product_ids), len(quantities))):
-        pid, qty = product_ids[i], float(quantities[i])
-        if not pid or qty <= 0:
-            continue
         price = prices[i] if i < len(prices) and prices[i] >= 0 else None
-        if price is None or price < 0:
-            pp = db.query(ProductPrice).filter(ProductPrice.product_id == pid, ProductPrice.price_type_id == order.price_type_id).first()
-            if pp:
-                price = pp.sale_price or 0
-            else:
-                prod = db.query(Product).filter(Product.id == pid).first()
-                price = (prod.sale_price or prod.purchase_price or 0) if prod else 0
-        total_row = qty * price
-        db.add(OrderItem(order_id=order.id, product_id=pid, quantity=qty, price=price, total=total_row))
-        total_order += total_row
-        items_for_stock.append((pid, qty))
-    order.subtotal = total_order
+        cart.append((product_ids[i], float(quantities[i]), price))
     discount_percent = 0.0
     discount_amount = 0.0
     try:
@@ -962,87 +934,47 @@ async def sales_pos_complete(
         discount_amount = float(form.get("discount_amount") or 0)
     except (ValueError, TypeError):
         pass
-    discount_sum = (total_order * discount_percent / 100.0) + discount_amount
-    if discount_sum > total_order:
-        discount_sum = total_order
-    order.discount_percent = discount_percent
-    order.discount_amount = discount_amount
-    order.total = total_order - discount_sum
     is_cash_client = (partner.id == default_partner.id)
+    payment_due_date = None
+    cash_register = None
     if is_cash_client:
-        order.paid = order.total
-        order.debt = 0
+        department_id = getattr(warehouse, "department_id", None) if warehouse else None
+        if not department_id and current_user:
+            department_id = getattr(current_user, "department_id", None)
+        cash_register = _get_pos_cash_register(db, payment_type, department_id)
     else:
-        order.paid = 0
-        order.debt = order.total
         due_str = (form.get("payment_due_date") or "").strip()
         if due_str:
             try:
-                order.payment_due_date = datetime.strptime(due_str, "%Y-%m-%d").date()
+                payment_due_date = datetime.strptime(due_str, "%Y-%m-%d").date()
             except (ValueError, TypeError):
-                order.payment_due_date = (datetime.now() + timedelta(days=7)).date()
-        else:
-            order.payment_due_date = (datetime.now() + timedelta(days=7)).date()
-    for pid, qty in items_for_stock:
-        stock = db.query(Stock).filter(
-            Stock.warehouse_id == order.warehouse_id,
-            Stock.product_id == pid
-        ).first()
-        if not stock or (stock.quantity or 0) < qty:
-            prod = db.query(Product).filter(Product.id == pid).first()
-            name = prod.name if prod else f"#{pid}"
-            mavjud = float(stock.quantity or 0) if stock else 0
-            order.status = "cancelled"
-            db.commit()
-            detail = f"Yetarli yo'q: {name} (savatda: {qty}, omborda: {mavjud:.0f})"
-            url = "/sales/pos?error=stock&detail=" + quote(detail)
-            if warehouse and warehouse.id:
-                url += "&warehouse_id=" + str(warehouse.id)
-            return RedirectResponse(url=url, status_code=303)
-    for pid, qty in items_for_stock:
-        create_stock_movement(
-            db=db,
-            warehouse_id=order.warehouse_id,
-            product_id=pid,
-            quantity_change=-qty,
-            operation_type="sale",
-            document_type="Sale",
-            document_id=order.id,
-            document_number=order.number,
+                payment_due_date = None
+    price_type = _get_pos_price_type(db)
+    try:
+        order = complete_pos_checkout(
+            db,
+            warehouse=warehouse,
+            partner=partner,
+            is_cash_client=is_cash_client,
+            cart=cart,
+            price_type_id=price_type.id if price_type else None,
+            payment_type=payment_type,
             user_id=current_user.id if current_user else None,
-            note=f"Sotuv (POS {payment_type}): {order.number}"
+            discount_percent=discount_percent,
+            discount_amount=discount_amount,
+            payment_due_date=payment_due_date,
+            cash_register=cash_register,
         )
-    order.status = "completed"
+    except PosCheckoutError as e:
+        db.rollback()
+        url = "/sales/pos?error=" + e.code
+        if e.detail:
+            url += "&detail=" + quote(e.detail)
+        if warehouse and warehouse.id:
+            url += "&warehouse_id=" + str(warehouse.id)
+        return RedirectResponse(url=url, status_code=303)
     db.commit()
-    if is_cash_client:
-        department_id = getattr(warehouse, "department_id", None) if warehouse else None
-        if not department_id and current_user:
-            department_id = getattr(current_user, "department_id", None)
-        cash_register = _get_pos_cash_register(db, payment_type, department_id)
-        if cash_register and (order.total or 0) > 0:
-            today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-            pay_count = db.query(Payment).filter(Payment.created_at >= today_start).count()
-            pay_number = f"PAY-{datetime.now().strftime('%Y%m%d')}-{pay_count + 1:04d}"
-            pay_type = "cash" if payment_type == "naqd" else ("click" if payment_type == "click" else ("terminal" if payment_type == "terminal" else "card"))
-            db.add(Payment(
-                number=pay_number,
-                type="income",
-                cash_register_id=cash_register.id,
-                partner_id=order.partner_id,
-                order_id=order.id,
-                amount=order.total,
-                payment_type=pay_type,
-                category="sale",
-                description=f"POS sotuv {order.number}",
-                user_id=current_user.id if current_user else None,
-            ))
-            if getattr(cash_register, "balance", None) is not None:
-                cash_register.balance = (cash_register.balance or 0) + (order.total or 0)
-                db.commit()
-    else:
-        partner.balance = (partner.balance or 0) + (order.total or 0)
-        db.commit()
-    check_low_stock_and_notify(db)
+    check_low_stock_and_notify(db, product_ids={pid for pid, _, _ in cart})
     return RedirectResponse(url="/sales/pos?success=1&number=" + order.number, status_code=303)
 
 
@@ -1219,7 +1151,7 @@ async def sales_return_create(
         )
     count = db.query(Order).filter(
         Order.type == "return_sale",
-        func.date(Order.created_at) == today_start
+        on_day(Order.created_at, today_start)
     ).count()
     new_number = f"R-{datetime.now().strftime('%Y%m%d')}-{count + 1:04d}"
     return_order = Order(
@@ -1237,6 +1169,7 @@ async def sales_return_create(
     db.commit()
     db.refresh(return_order)
     total_return = 0.0
+    return_movements = []
     for i in range(min(len(product_ids), len(quantities))):
         pid, qty = product_ids[i], quantities[i]
         if not pid or qty <= 0:
@@ -1248,22 +1181,23 @@ async def sales_return_create(
         total_row = qty * price
         db.add(OrderItem(order_id=return_order.id, product_id=pid, quantity=qty, price=price, total=total_row))
         total_return += total_row
-        create_stock_movement(
-            db=db,
-            warehouse_id=return_warehouse_id,
-            product_id=pid,
-            quantity_change=+qty,
-            operation_type="return_sale",
-            document_type="SaleReturn",
-            document_id=return_order.id,
-            document_number=return_order.number,
-            user_id=current_user.id if current_user else None,
-            note=f"Savdodan qaytarish: {sale.number} -> {return_order.number}",
-        )
+        return_movements.append((return_warehouse_id, pid, +qty))
+    create_stock_movements_bulk(
+        db,
+        return_movements,
+        operation_type="return_sale",
+        document_type="SaleReturn",
+        document_id=return_order.id,
+        document_number=return_order.number,
+        user_id=current_user.id if current_user else None,
+        note=f"Savdodan qaytarish: {sale.number} -> {return_order.number}",
+    )
     return_order.subtotal = total_return
     return_order.total = total_return
     return_order.paid = total_return
     return_order.debt = 0
+    apply_order_to_rollup(db, return_order)
+    post_order_to_ledger(db, return_order)
     db.commit()
     wh_name = ""
     if return_warehouse_id:
@@ -1330,20 +1264,19 @@ async def sales_return_revert(
             url="/sales/returns?error=revert&detail=" + quote("Hujjatda ombor ko'rsatilmagan."),
             status_code=303
         )
-    for item in doc.items:
-        create_stock_movement(
-            db=db,
-            warehouse_id=wh_id,
-            product_id=item.product_id,
-            quantity_change=-(item.quantity or 0),
-            operation_type="return_sale_revert",
-            document_type="SaleReturnRevert",
-            document_id=doc.id,
-            document_number=doc.number,
-            user_id=current_user.id if current_user else None,
-            note=f"Qaytarish tasdiqini bekor: {doc.number}",
-        )
+    create_stock_movements_bulk(
+        db,
+        [(wh_id, item.product_id, -(item.quantity or 0)) for item in doc.items],
+        operation_type="return_sale_revert",
+        document_type="SaleReturnRevert",
+        document_id=doc.id,
+        document_number=doc.number,
+        user_id=current_user.id if current_user else None,
+        note=f"Qaytarish tasdiqini bekor: {doc.number}",
+    )
     doc.status = "cancelled"
+    apply_order_to_rollup(db, doc, sign=-1)
+    post_order_to_ledger(db, doc)
     db.commit()
     return RedirectResponse(url="/sales/return/document/" + doc.number + "?reverted=1", status_code=303)
 
@@ -1482,19 +1415,18 @@ async def sales_return_confirm(
     wh_id = doc.warehouse_id
     if not wh_id:
         return RedirectResponse(url="/sales/returns?error=confirm&detail=" + quote("Hujjatda ombor ko'rsatilmagan."), status_code=303)
-    for item in doc.items:
-        create_stock_movement(
-            db=db,
-            warehouse_id=wh_id,
-            product_id=item.product_id,
-            quantity_change=+(item.quantity or 0),
-            operation_type="return_sale",
-            document_type="SaleReturn",
-            document_id=doc.id,
-            document_number=doc.number,
-            user_id=current_user.id if current_user else None,
-            note=f"Qaytarish qayta tasdiqlandi: {doc.number}",
-        )
+    create_stock_movements_bulk(
+        db,
+        [(wh_id, item.product_id, +(item.quantity or 0)) for item in doc.items],
+        operation_type="return_sale",
+        document_type="SaleReturn",
+        document_id=doc.id,
+        document_number=doc.number,
+        user_id=current_user.id if current_user else None,
+        note=f"Qaytarish qayta tasdiqlandi: {doc.number}",
+    )
     doc.status = "completed"
+    apply_order_to_rollup(db, doc)
+    post_order_to_ledger(db, doc)
     db.commit()
     return RedirectResponse(url="/sales/return/document/" + doc.number + "?confirmed=1", status_code=303)
@@ -9,8 +9,8 @@ from urllib.parse import quote, unquote
 import openpyxl
 from fastapi import APIRouter, Request, Depends, Form, HTTPException
 from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import or_, and_, func, text
+from sqlalchemy.orm import Session, contains_eager, joinedload
+from sqlalchemy import or_, and_, func
 from typing import Optional
 
 from app.core import templates
@@ -21,9 +21,6 @@ from app.models.database import (
     Stock,
     Product,
     Purchase,
-    PurchaseItem,
-    Production,
-    Recipe,
     StockAdjustmentDoc,
     StockAdjustmentDocItem,
     WarehouseTransfer,
@@ -31,13 +28,18 @@ from app.models.database import (
     Unit,
     ProductPrice,
 )
-from app.services.stock_service import create_stock_movement, delete_stock_movements_for_document
+from app.services.stock_service import create_stock_movements_bulk, delete_stock_movements_for_document
+from app.services.stock_provenance import stock_sources_for
+from app.services.recipe_costing import invalidate_recipe_costs
+from app.utils.excel_stream import XlsxWriter, stream_rows, xlsx_response
 from app.deps import require_auth, require_admin
 from app.utils.user_scope import get_warehouses_for_user
 
 router = APIRouter(prefix="/warehouse", tags=["warehouse"])
 inventory_router = APIRouter(prefix="/inventory", tags=["inventory"])
 
+STOCKS_PER_PAGE = 100
+
 
 def _warehouses_for_user(db: Session, user: User):
     """Foydalanuvchi uchun ko'rinadigan omborlar: sozlamada belgilangan yoki admin/raxbar uchun barcha."""
@@ -49,80 +51,42 @@ async def warehouse_list(
     request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_auth),
+    warehouse_id: Optional[int] = None,
+    page: Optional[int] = None,
 ):
     if not current_user:
         return RedirectResponse(url="/login", status_code=303)
     warehouses = _warehouses_for_user(db, current_user)
     wh_ids = [w.id for w in warehouses]
-    stocks_q = db.query(Stock).join(Product).join(Warehouse).filter(Stock.quantity > 0)
+    if warehouse_id and wh_ids and warehouse_id not in wh_ids:
+        warehouse_id = None
+    stocks_q = (
+        db.query(Stock)
+        .join(Product)
+        .join(Warehouse)
+        .options(contains_eager(Stock.product), contains_eager(Stock.warehouse))
+        .filter(Stock.quantity > 0)
+    )
+    counts_q = db.query(Stock.warehouse_id, func.count(Stock.id)).filter(Stock.quantity > 0)
     if wh_ids:
         stocks_q = stocks_q.filter(Stock.warehouse_id.in_(wh_ids))
-    stocks = stocks_q.all()
-    stock_sources = {}
-    for s in stocks:
-        items = []
-        purchases = (
-            db.query(Purchase)
-            .join(PurchaseItem, Purchase.id == PurchaseItem.purchase_id)
-            .filter(
-                Purchase.warehouse_id == s.warehouse_id,
-                PurchaseItem.product_id == s.product_id,
-                Purchase.status == "confirmed",
-            )
-            .order_by(Purchase.date.desc())
-            .limit(3)
-            .all()
-        )
-        for p in purchases:
-            items.append((p.number, f"/purchases/edit/{p.id}", p.date.strftime("%d.%m.%Y") if p.date else ""))
-        out_wh_id = s.warehouse_id
-        # Production query - max_stage muammosini oldini olish
-        # Bazada max_stage ustuni bo'lmasligi mumkin, shuning uchun faqat mavjud ustunlarni ishlatamiz
-        try:
-            # Faqat kerakli ustunlarni tanlab, max_stage ni o'z ichiga olmaydigan so'rov
-            # SQLAlchemy modelda max_stage bor, lekin bazada yo'q bo'lishi mumkin
-            result = db.execute(
-                text("""
-                    SELECT p.id, p.number, p.date
-                    FROM productions p
-                    INNER JOIN recipes r ON p.recipe_id = r.id
-                    WHERE p.status = 'completed'
-                      AND r.product_id = :product_id
-                      AND (
-                          p.output_warehouse_id = :warehouse_id
-                          OR (p.output_warehouse_id IS NULL AND p.warehouse_id = :warehouse_id)
-                      )
-                    ORDER BY p.date DESC
-                    LIMIT 3
-                """),
-                {"product_id": s.product_id, "warehouse_id": out_wh_id}
-            )
-            productions = result.fetchall()
-            for pr in productions:
-                pr_date = pr.date.strftime("%d.%m.%Y") if pr.date else ""
-                items.append((pr.number, "/production/orders", pr_date))
-        except Exception as prod_error:
-            # Database da max_stage yoki boshqa ustunlar yo'q bo'lishi mumkin - e'tiborsiz qoldiramiz
-            print(f"Production query error (warehouse {s.warehouse_id}, product {s.product_id}): {prod_error}")
-            import traceback
-            traceback.print_exc()
-        adj_docs = (
-            db.query(StockAdjustmentDoc)
-            .join(StockAdjustmentDocItem, StockAdjustmentDoc.id == StockAdjustmentDocItem.doc_id)
-            .filter(
-                StockAdjustmentDoc.status == "confirmed",
-                StockAdjustmentDocItem.warehouse_id == s.warehouse_id,
-                StockAdjustmentDocItem.product_id == s.product_id,
-            )
-            .order_by(StockAdjustmentDoc.date.desc())
-            .limit(3)
-            .distinct()
-            .all()
-        )
-        for doc in adj_docs:
-            items.append((doc.number, f"/qoldiqlar/tovar/hujjat/{doc.id}", doc.date.strftime("%d.%m.%Y") if doc.date else ""))
-        items.sort(key=lambda x: x[2] or "", reverse=True)
-        stock_sources[s.id] = items[:8]
+        counts_q = counts_q.filter(Stock.warehouse_id.in_(wh_ids))
+    if warehouse_id:
+        stocks_q = stocks_q.filter(Stock.warehouse_id == warehouse_id)
+    warehouse_counts = dict(counts_q.group_by(Stock.warehouse_id).all())
+    per_page = STOCKS_PER_PAGE
+    page = max(1, int(page)) if page else 1
+    total_count = warehouse_counts.get(warehouse_id, 0) if warehouse_id else sum(warehouse_counts.values())
+    total_pages = max(1, (total_count + per_page - 1) // per_page) if total_count else 1
+    page = min(page, total_pages)
+    stocks = (
+        stocks_q.order_by(Warehouse.name, Product.name, Stock.id)
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+        .all()
+    )
+    # Oxirgi kirim hujjatlari — sahifadagi qatorlar uchun 3 ta so'rov (har qator uchun 3 ta emas)
+    stock_sources = stock_sources_for(db, stocks)
     # Hujjatlar ro'yxati — mahsulotlar hujjat ichida ko'riladi
     qoldiq_docs = (
         db.query(StockAdjustmentDoc)
@@ -142,6 +106,13 @@ async def warehouse_list(
         "warehouses": warehouses,
         "stocks": stocks,
         "stock_sources": stock_sources,
+        "warehouse_counts": warehouse_counts,
+        "filter_warehouse_id": warehouse_id,
+        "page": page,
+        "per_page": per_page,
+        "total_count": total_count,
+        "total_pages": total_pages,
+        "pagination_query": f"warehouse_id={warehouse_id}" if warehouse_id else "",
         "qoldiq_docs": qoldiq_docs,
         "purchase_docs": purchase_docs,
         "current_user": current_user,
@@ -166,33 +137,24 @@ async def warehouse_stock_zero(
 
 @router.get("/export")
 async def warehouse_export(db: Session = Depends(get_db), current_user: User = Depends(require_auth)):
-    stocks = db.query(Stock).join(Product).join(Warehouse).filter(Stock.quantity > 0).all()
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "Qoldiqlar"
-    ws.append(["Ombor nomi", "Ombor kodi", "Mahsulot kodi", "Mahsulot nomi", "Qoldiq", "Tannarx (so'm)", "Summa (so'm)"])
-    for s in stocks:
-        pr, wh = s.product, s.warehouse
-        tannarx = (pr.purchase_price or 0) if pr else 0
-        summa = s.quantity * tannarx
-        ws.append([
-            wh.name if wh else "",
-            wh.code if wh else "",
-            pr.code if pr else "",
-            pr.name if pr else "",
-            s.quantity,
-            tannarx,
-            summa,
-        ])
-    stream = io.BytesIO()
-    wb.save(stream)
-    stream.seek(0)
-    return StreamingResponse(
-        stream,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": "attachment; filename=ombor_qoldiqlari.xlsx"},
+    stocks_q = (
+        db.query(Warehouse.name, Warehouse.code, Product.code, Product.name, Stock.quantity, Product.purchase_price)
+        .join(Product, Stock.product_id == Product.id)
+        .join(Warehouse, Stock.warehouse_id == Warehouse.id)
+        .filter(Stock.quantity > 0)
+        .order_by(Warehouse.name, Product.name)
     )
 
+    def build():
+        xw = XlsxWriter("Qoldiqlar", widths=(24, 12, 14, 32, 12, 16, 18))
+        xw.row(["Ombor nomi", "Ombor kodi", "Mahsulot kodi", "Mahsulot nomi", "Qoldiq", "Tannarx (so'm)", "Summa (so'm)"])
+        for wh_name, wh_code, pr_code, pr_name, quantity, purchase_price in stream_rows(stocks_q):
+            tannarx = purchase_price or 0
+            xw.row([wh_name or "", wh_code or "", pr_code or "", pr_name or "", quantity, tannarx, quantity * tannarx])
+        return xw
+
+    return await xlsx_response(build, "ombor_qoldiqlari.xlsx")
+
 
 @router.get("/template")
 async def warehouse_template(db: Session = Depends(get_db), current_user: User = Depends(require_auth)):
@@ -291,12 +253,14 @@ async def warehouse_import(
                 stock.quantity = qty
             else:
                 db.add(Stock(warehouse_id=warehouse.id, product_id=product.id, quantity=qty))
+                db.flush()  # faylda shu mahsulot yana bo'lsa — keyingi so'rov shu qatorni topsin
             if tannarx is not None:
                 product.purchase_price = tannarx
             if sotuv_narxi is not None:
                 product.sale_price = sotuv_narxi
             updated += 1
         db.commit()
+        invalidate_recipe_costs()
         detail = f"Yuklandi: {updated} ta"
         if skipped:
             detail += f", o'tkazib yuborildi: {skipped} ta"
@@ -534,6 +498,7 @@ async def warehouse_transfer_confirm(
             dest.quantity += item.quantity
         else:
             db.add(Stock(warehouse_id=transfer.to_warehouse_id, product_id=item.product_id, quantity=item.quantity))
+            db.flush()  # hujjatda shu mahsulot yana bo'lsa — keyingi so'rov shu qatorni topsin
     transfer.status = "confirmed"
     db.commit()
     return RedirectResponse(url=f"/warehouse/transfers/{transfer_id}?confirmed=1", status_code=303)
@@ -568,6 +533,7 @@ async def warehouse_transfer_revert(
             src.quantity += item.quantity
         else:
             db.add(Stock(warehouse_id=transfer.from_warehouse_id, product_id=item.product_id, quantity=item.quantity))
+            db.flush()
     transfer.status = "draft"
     db.commit()
     return RedirectResponse(url="/warehouse/transfers?reverted=1", status_code=303)
@@ -646,23 +612,6 @@ async def warehouse_transfer(
 # INVENTORY ROUTES (inventory_router)
 # ==========================================
 
-def _ensure_inventory_columns(db: Session) -> None:
-    """SQLite: stock_adjustment_docs.warehouse_id va stock_adjustment_doc_items.previous_quantity ustunlari yo'q bo'lsa qo'shadi."""
-    try:
-        r = db.execute(text("PRAGMA table_info(stock_adjustment_docs)"))
-        cols_doc = [row[1] for row in r.fetchall()]
-        if "warehouse_id" not in cols_doc:
-            db.execute(text("ALTER TABLE stock_adjustment_docs ADD COLUMN warehouse_id INTEGER REFERENCES warehouses(id)"))
-            db.commit()
-        r = db.execute(text("PRAGMA table_info(stock_adjustment_doc_items)"))
-        cols_item = [row[1] for row in r.fetchall()]
-        if "previous_quantity" not in cols_item:
-            db.execute(text("ALTER TABLE stock_adjustment_doc_items ADD COLUMN previous_quantity REAL"))
-            db.commit()
-    except Exception:
-        db.rollback()
-
-
 def _parse_doc_date(s: str):
     """Sana matnini parse qiladi: YYYY-MM-DDTHH:MM, dd.mm.yyyy HH:MM, dd.mm.yyyy va boshqa formatlar."""
     import re
@@ -732,18 +681,10 @@ async def inventory_list_page(
             .all()
         )
     except Exception:
-        try:
-            _ensure_inventory_columns(db)
-            docs = (
-                db.query(StockAdjustmentDoc)
-                .filter(StockAdjustmentDoc.warehouse_id.isnot(None))
-                .order_by(StockAdjustmentDoc.created_at.desc())
-                .limit(200)
-                .all()
-            )
-        except Exception:
-            docs = []
-            migration_warning = "Inventarizatsiya uchun bazada warehouse_id ustuni kerak. Loyiha ildizida: alembic upgrade head"
+        # Ustunlar ishga tushishda ensure_schema() bilan qo'shiladi; bu yerda DDL bajarilmaydi
+        db.rollback()
+        docs = []
+        migration_warning = "Inventarizatsiya uchun bazada warehouse_id ustuni kerak. Dasturni qayta ishga tushiring yoki: alembic upgrade head"
     message = request.query_params.get("message", "").strip()
     return templates.TemplateResponse("inventory/list.html", {
         "request": request,
@@ -1153,29 +1094,35 @@ async def inventory_confirm(
             for r in rows[1:]:
                 db.delete(r)
     db.commit()
+    current_qty = {}
+    if pairs:
+        for s in db.query(Stock).filter(
+            Stock.warehouse_id.in_({p[0] for p in pairs}),
+            Stock.product_id.in_({p[1] for p in pairs}),
+        ).all():
+            key = (s.warehouse_id, s.product_id)
+            current_qty[key] = current_qty.get(key, 0.0) + float(s.quantity or 0)
+    movements = []
     for item in doc.items:
-        stocks = db.query(Stock).filter(
-            Stock.warehouse_id == item.warehouse_id,
-            Stock.product_id == item.product_id,
-        ).all()
-        old_qty = sum(float(s.quantity or 0) for s in stocks)
+        key = (item.warehouse_id, item.product_id)
+        old_qty = current_qty.get(key, 0.0)
         new_qty = float(item.quantity or 0)
         if hasattr(item, "previous_quantity"):
             item.previous_quantity = old_qty
         quantity_change = new_qty - old_qty
         if abs(quantity_change) > 1e-9:
-            create_stock_movement(
-                db=db,
-                warehouse_id=item.warehouse_id,
-                product_id=item.product_id,
-                quantity_change=quantity_change,
-                operation_type="adjustment",
-                document_type="StockAdjustmentDoc",
-                document_id=doc.id,
-                document_number=doc.number,
-                user_id=current_user.id,
-                note=f"Inventarizatsiya: {doc.number}",
-            )
+            movements.append((item.warehouse_id, item.product_id, quantity_change))
+            current_qty[key] = max(0.0, new_qty)
+    create_stock_movements_bulk(
+        db,
+        movements,
+        operation_type="adjustment",
+        document_type="StockAdjustmentDoc",
+        document_id=doc.id,
+        document_number=doc.number,
+        user_id=current_user.id,
+        note=f"Inventarizatsiya: {doc.number}",
+    )
     doc.status = "confirmed"
     db.commit()
     return RedirectResponse(url=f"/inventory/{doc_id}?message=Tasdiqlandi.", status_code=303)
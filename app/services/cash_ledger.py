@@ -0,0 +1,160 @@
+"""
+Kassa balansi (ledger) — CashRegister.balance joriy qiymatni saqlaydi, har bir o'zgarish delta sifatida
+yoziladi: to'lov yaratish/tasdiqlash/bekor qilish/tahrir/o'chirish, kassadan kassaga o'tkazma, qoldiq hujjati.
+Sahifalar Payment tarixini qayta yig'maydi.
+
+Formula (tekshiruv va qayta hisoblash uchun):
+    balans = opening_balance + kirim − chiqim (tasdiqlangan to'lovlar)
+             + kelgan − jo'natilgan (tasdiqlangan o'tkazmalar)
+
+Qoldiq hujjati kassani sanalgan summaga keltiradi — farq opening_balance ga ham yoziladi, formula mos qoladi.
+verify_cash_balances() formulani guruhlangan so'rovlar bilan hisoblab, farqlarni qaytaradi (scheduler).
+
+    before = payment_effect(payment)
+    payment.status = "cancelled"
+    post_payment_change(db, before, payment)
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+
+from app.models.database import CashRegister, CashTransfer, Payment
+
+CONFIRMED_PAYMENT = or_(Payment.status == "confirmed", Payment.status.is_(None))
+DRIFT_TOLERANCE = 0.01  # so'm — bundan kichik farq yaxlitlash hisoblanadi
+
+Effect = Tuple[Optional[int], float]  # (kassa id, balansga imzoli ta'sir)
+NO_EFFECT: Effect = (None, 0.0)
+
+# Oxirgi tekshiruv natijasi — /info/cash sahifasida ko'rsatiladi
+last_verification = {"checked_at": None, "drift": []}
+
+
+def payment_effect(payment: Optional[Payment]) -> Effect:
+    """To'lovning kassa balansiga ta'siri: tasdiqlangan (yoki status bo'sh) kirim +, chiqim −, qolganlari 0."""
+    if payment is None or not payment.cash_register_id:
+        return NO_EFFECT
+    if payment.status not in (None, "confirmed"):
+        return (payment.cash_register_id, 0.0)
+    amount = float(payment.amount or 0)
+    if payment.type == "income":
+        return (payment.cash_register_id, amount)
+    if payment.type == "expense":
+        return (payment.cash_register_id, -amount)
+    return (payment.cash_register_id, 0.0)
+
+
+def post_cash_delta(db: Session, cash_id: Optional[int], delta: float) -> None:
+    """balance = balance + delta — bitta UPDATE (parallel so'rovlar bir-birining yozuvini yo'qotmaydi).
+    Sessiyadagi kassa obyektining balance maydoni eskiradi va keyingi o'qishda yangilanadi. Commit chaqiruvchida."""
+    if not cash_id or abs(delta) < 1e-9:
+        return
+    db.query(CashRegister).filter(CashRegister.id == cash_id).update(
+        {CashRegister.balance: func.coalesce(CashRegister.balance, 0) + delta},
+        synchronize_session=False,
+    )
+    cash = db.identity_map.get(identity_key(CashRegister, cash_id))
+    if cash is not None:
+        db.expire(cash, ["balance"])
+
+
+def post_payment_change(db: Session, before: Effect, payment: Optional[Payment]) -> None:
+    """before = payment_effect(...) o'zgarishdan oldin (yangi to'lov uchun NO_EFFECT);
+    payment — o'zgarishdan keyingi holat (o'chirilgan bo'lsa None)."""
+    after = payment_effect(payment)
+    if before[0] == after[0]:
+        post_cash_delta(db, after[0], after[1] - before[1])
+    else:
+        post_cash_delta(db, before[0], -before[1])
+        post_cash_delta(db, after[0], after[1])
+
+
+def post_transfer(db: Session, transfer: CashTransfer, sign: int = 1) -> None:
+    """Tasdiqlangan o'tkazma (sign=+1) yoki tasdiqning bekor qilinishi (sign=-1)."""
+    amount = float(transfer.amount or 0) * sign
+    post_cash_delta(db, transfer.from_cash_id, -amount)
+    post_cash_delta(db, transfer.to_cash_id, amount)
+
+
+def adjust_opening_balance(db: Session, cash: CashRegister, delta: float) -> None:
+    """Qoldiqni (opening_balance) va joriy balansni bir xil deltaga o'zgartiradi."""
+    cash.opening_balance = float(cash.opening_balance or 0) + delta
+    post_cash_delta(db, cash.id, delta)
+
+
+def set_counted_balance(db: Session, cash: CashRegister, counted: float) -> float:
+    """Kassani sanalgan summaga keltiradi (qoldiq hujjati, kassa tahriri). Qaytaradi: qo'llangan delta."""
+    delta = float(counted or 0) - float(cash.balance or 0)
+    if abs(delta) >= 1e-9:
+        adjust_opening_balance(db, cash, delta)
+    return delta
+
+
+def computed_cash_balances(db: Session, cash_ids: Optional[Iterable[int]] = None) -> Dict[int, dict]:
+    """Formula bo'yicha: {cash_id: {"opening", "income", "expense", "transfer_in", "transfer_out", "balance"}}.
+    To'lovlar bitta GROUP BY (kassa, tur), o'tkazmalar ikkita — kassalar soniga bog'liq emas."""
+    ids = None if cash_ids is None else list(cash_ids)
+    cash_q = db.query(CashRegister.id, CashRegister.opening_balance)
+    pay_q = (
+        db.query(Payment.cash_register_id, Payment.type, func.coalesce(func.sum(Payment.amount), 0))
+        .filter(Payment.cash_register_id.isnot(None), Payment.type.in_(("income", "expense")), CONFIRMED_PAYMENT)
+    )
+    out_q = db.query(CashTransfer.from_cash_id, func.coalesce(func.sum(CashTransfer.amount), 0)).filter(
+        CashTransfer.status == "confirmed"
+    )
+    in_q = db.query(CashTransfer.to_cash_id, func.coalesce(func.sum(CashTransfer.amount), 0)).filter(
+        CashTransfer.status == "confirmed"
+    )
+    if ids is not None:
+        if not ids:
+            return {}
+        cash_q = cash_q.filter(CashRegister.id.in_(ids))
+        pay_q = pay_q.filter(Payment.cash_register_id.in_(ids))
+        out_q = out_q.filter(CashTransfer.from_cash_id.in_(ids))
+        in_q = in_q.filter(CashTransfer.to_cash_id.in_(ids))
+    result = {
+        cid: {"opening": float(opening or 0), "income": 0.0, "expense": 0.0, "transfer_in": 0.0, "transfer_out": 0.0}
+        for cid, opening in cash_q.all()
+    }
+    for cid, p_type, total in pay_q.group_by(Payment.cash_register_id, Payment.type).all():
+        if cid in result:
+            result[cid][p_type] = float(total or 0)
+    for cid, total in out_q.group_by(CashTransfer.from_cash_id).all():
+        if cid in result:
+            result[cid]["transfer_out"] = float(total or 0)
+    for cid, total in in_q.group_by(CashTransfer.to_cash_id).all():
+        if cid in result:
+            result[cid]["transfer_in"] = float(total or 0)
+    for r in result.values():
+        r["balance"] = r["opening"] + r["income"] - r["expense"] + r["transfer_in"] - r["transfer_out"]
+    return result
+
+
+def verify_cash_balances(db: Session) -> List[dict]:
+    """Saqlangan balansni formula bilan solishtiradi. Qaytaradi: farqi bor kassalar
+    [{"cash_id", "name", "stored", "computed", "drift"}]; natija last_verification ga ham yoziladi."""
+    computed = computed_cash_balances(db)
+    drift = []
+    for cid, name, stored in db.query(CashRegister.id, CashRegister.name, CashRegister.balance).all():
+        expected = computed.get(cid, {}).get("balance", 0.0)
+        diff = float(stored or 0) - expected
+        if abs(diff) > DRIFT_TOLERANCE:
+            drift.append({"cash_id": cid, "name": name, "stored": float(stored or 0), "computed": expected, "drift": diff})
+    last_verification["checked_at"] = datetime.now()
+    last_verification["drift"] = drift
+    return drift
+
+
+def rebuild_cash_balances(db: Session, cash_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+    """Balansni formuladan qayta yozadi (admin «qayta hisoblash», sxema migratsiyasi). Qaytaradi: {cash_id: balans}.
+    Commit chaqiruvchida."""
+    balances = {cid: r["balance"] for cid, r in computed_cash_balances(db, cash_ids).items()}
+    for cash in db.query(CashRegister).filter(CashRegister.id.in_(list(balances))).all():
+        cash.balance = balances[cash.id]
+    db.flush()
+    if last_verification["drift"]:
+        last_verification["drift"] = [d for d in last_verification["drift"] if d["cash_id"] not in balances]
+    return balances
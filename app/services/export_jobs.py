@@ -0,0 +1,180 @@
+"""
+Fon eksport vazifalari — og'ir hisobot/eksportlar so'rov ichida emas, ishchi oqimlar hovuzida quriladi.
+Route vazifani navbatga qo'yadi va /exports/{id} sahifasiga yo'naltiradi; tayyor fayl exports/ papkasida,
+JOB_TTL dan keyin avtomatik o'chiriladi (scheduler → prune_export_jobs).
+
+    @export_job("salary_sheet", "Oylik varaqasi")
+    def _salary_sheet(db, year, month):
+        xw = XlsxWriter("Oylik")
+        ...
+        return xw, f"oylik_{year}_{month:02d}.xlsx"
+
+    job = submit_export("salary_sheet", {"year": 2026, "month": 3}, current_user.id)
+
+Bir xil foydalanuvchi bir xil parametrlar bilan yana bossa — navbatdagi/ishlayotgan vazifa qaytariladi.
+"""
+import os
+import threading
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from app.models.database import SessionLocal
+
+_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+EXPORT_DIR = os.path.join(_root, "exports")
+JOB_TTL = timedelta(hours=1)  # tayyor fayl shuncha vaqt saqlanadi
+MAX_WORKERS = 2  # bir vaqtda quriladigan eksportlar
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+STATUS_LABELS = {QUEUED: "Navbatda", RUNNING: "Tayyorlanmoqda", DONE: "Tayyor", FAILED: "Xato"}
+
+_builders: Dict[str, Callable] = {}
+_titles: Dict[str, str] = {}
+_jobs: Dict[str, "ExportJob"] = {}
+_inflight: Dict[tuple, str] = {}  # (kind, user_id, params) -> job_id
+_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+class ExportJob:
+    """Bitta eksport vazifasi holati (faqat xotirada — server qayta ishga tushsa navbat yo'qoladi)."""
+
+    def __init__(self, kind: str, params: dict, user_id: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.user_id = user_id
+        self.status = QUEUED
+        self.filename = None
+        self.path = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+
+    @property
+    def key(self) -> tuple:
+        return (self.kind, self.user_id, tuple(sorted(self.params.items())))
+
+    @property
+    def pending(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    @property
+    def title(self) -> str:
+        return _titles.get(self.kind, self.kind)
+
+    @property
+    def status_label(self) -> str:
+        return STATUS_LABELS.get(self.status, self.status)
+
+    @property
+    def expires_at(self) -> Optional[datetime]:
+        return self.finished_at + JOB_TTL if self.finished_at else None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "title": self.title,
+            "status": self.status,
+            "status_label": self.status_label,
+            "filename": self.filename,
+            "error": self.error,
+            "download_url": f"/exports/{self.id}/download" if self.status == DONE else None,
+            "created_at": self.created_at.isoformat(timespec="seconds"),
+            "expires_at": self.expires_at.isoformat(timespec="seconds") if self.expires_at else None,
+        }
+
+
+def export_job(kind: str, title: str):
+    """Eksport quruvchisini ro'yxatdan o'tkazadi: fn(db, **params) -> (kitob, fayl nomi).
+    Kitob — XlsxWriter yoki openpyxl Workbook (ikkalasida ham .save(path) bor)."""
+    def register(fn):
+        _builders[kind] = fn
+        _titles[kind] = title
+        return fn
+    return register
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="export")
+    return _executor
+
+
+def _run(job: ExportJob) -> None:
+    job.status = RUNNING
+    db = SessionLocal()
+    try:
+        book, filename = _builders[job.kind](db, **job.params)
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        path = os.path.join(EXPORT_DIR, f"{job.id}.xlsx")
+        book.save(path)
+        job.path, job.filename, job.status = path, filename, DONE
+    except Exception as e:
+        job.error, job.status = str(e) or type(e).__name__, FAILED
+        print(f"[Export] {job.kind} xato: {e}\n{traceback.format_exc()}")
+    finally:
+        db.close()
+        job.finished_at = datetime.now()
+        with _lock:
+            if _inflight.get(job.key) == job.id:
+                del _inflight[job.key]
+
+
+def submit_export(kind: str, params: dict, user_id: int) -> ExportJob:
+    """Vazifani navbatga qo'yadi; xuddi shunday vazifa navbatda/ishlayotgan bo'lsa o'shani qaytaradi."""
+    if kind not in _builders:
+        raise KeyError(f"Noma'lum eksport turi: {kind}")
+    prune_export_jobs()
+    job = ExportJob(kind, params, user_id)
+    with _lock:
+        existing = _jobs.get(_inflight.get(job.key, ""))
+        if existing is not None and existing.pending:
+            return existing
+        _jobs[job.id] = job
+        _inflight[job.key] = job.id
+    _get_executor().submit(_run, job)
+    return job
+
+
+def get_export_job(job_id: str, user_id: int) -> Optional[ExportJob]:
+    """Faqat vazifa egasiga ko'rinadi."""
+    job = _jobs.get(job_id)
+    return job if job is not None and job.user_id == user_id else None
+
+
+def user_export_jobs(user_id: int) -> List[ExportJob]:
+    return sorted((j for j in _jobs.values() if j.user_id == user_id), key=lambda j: j.created_at, reverse=True)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def prune_export_jobs(now: Optional[datetime] = None) -> int:
+    """Muddati o'tgan vazifalar va fayllarini o'chiradi (qayta ishga tushishdan qolgan yetim fayllar ham).
+    Qaytadi: o'chirilgan vazifalar soni."""
+    now = now or datetime.now()
+    with _lock:
+        expired = [j for j in _jobs.values() if j.expires_at and j.expires_at <= now]
+        for job in expired:
+            del _jobs[job.id]
+        known = {os.path.basename(j.path) for j in _jobs.values() if j.path}
+    for job in expired:
+        if job.path:
+            _remove_file(job.path)
+    if os.path.isdir(EXPORT_DIR):
+        cutoff = (now - JOB_TTL).timestamp()
+        for name in os.listdir(EXPORT_DIR):
+            path = os.path.join(EXPORT_DIR, name)
+            if name not in known and os.path.isfile(path) and os.path.getmtime(path) < cutoff:
+                _remove_file(path)
+    return len(expired)
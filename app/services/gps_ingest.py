@@ -0,0 +1,229 @@
+"""
+GPS signallarini qabul qilish — write-behind bufer. /api/{agent,driver}/location va .../location/batch nuqtalarni
+navbatga qo'yadi va darhol javob beradi; fon oqimi har FLUSH_INTERVAL soniyada barcha qurilmalar nuqtalarini bitta
+tranzaksiyada yozadi (agent_locations / driver_locations — executemany, latest_positions — har bir qurilma uchun bitta).
+Shunda har bir signal uchun alohida commit (fsync) bo'lmaydi va POS bilan yozish qulfi uchun kurash kamayadi.
+
+    points, rejected = parse_points(AGENT, agent_id, body["points"])
+    gps_buffer.submit(points)
+
+Server to'xtaganda (shutdown) gps_buffer.stop() qolganini yozadi. Yozishda xato bo'lsa nuqtalar navbatga qaytadi
+(MAX_PENDING dan oshganda eng eskilari tashlab yuboriladi).
+"""
+import threading
+import traceback
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.database import AgentLocation, DriverLocation, SessionLocal
+from app.services.latest_positions import AGENT, DRIVER, record_position
+
+FLUSH_INTERVAL = 1.0  # soniya
+FLUSH_AT = 2000  # shuncha nuqta yig'ilsa interval kutilmaydi
+MAX_PENDING = 200_000  # xotiradagi navbat chegarasi
+MAX_BATCH_POINTS = 5000  # bitta batch so'rovidagi nuqtalar
+CLOCK_SKEW = timedelta(minutes=5)  # telefon soati oldinda bo'lsa — server vaqti olinadi
+
+
+class GpsPoint(NamedTuple):
+    entity_type: str
+    entity_id: int
+    latitude: float
+    longitude: float
+    accuracy: Optional[float]
+    battery: Optional[int]
+    speed: Optional[float]
+    recorded_at: datetime
+
+
+def _number(value, cast=float):
+    if value is None or value == "":
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_points(entity_type: str, entity_id: int, raw: Iterable[dict], now: datetime = None) -> Tuple[List[GpsPoint], int]:
+    """JSON nuqtalar ro'yxati -> (GpsPoint lar, rad etilganlar soni). Kalitlar: latitude/lat, longitude/lng,
+    accuracy, battery, speed, recorded_at (ISO; bo'lmasa yoki kelajakda bo'lsa — hozir)."""
+    now = now or datetime.now()
+    points: List[GpsPoint] = []
+    rejected = 0
+    for item in raw:
+        if not isinstance(item, dict):
+            rejected += 1
+            continue
+        lat = _number(item.get("latitude", item.get("lat")))
+        lng = _number(item.get("longitude", item.get("lng")))
+        if lat is None or lng is None or not (-90 <= lat <= 90) or not (-180 <= lng <= 180):
+            rejected += 1
+            continue
+        recorded_at = now
+        raw_at = item.get("recorded_at")
+        if raw_at:
+            try:
+                recorded_at = datetime.fromisoformat(str(raw_at).replace("Z", "+00:00"))
+            except ValueError:
+                rejected += 1
+                continue
+            if recorded_at.tzinfo is not None:
+                recorded_at = recorded_at.astimezone().replace(tzinfo=None)
+            if recorded_at > now + CLOCK_SKEW:
+                recorded_at = now
+        points.append(GpsPoint(
+            entity_type, entity_id, lat, lng,
+            _number(item.get("accuracy")), _number(item.get("battery"), int), _number(item.get("speed")),
+            recorded_at,
+        ))
+    return points, rejected
+
+
+def write_points(db: Session, points: List[GpsPoint]) -> int:
+    """Tarix jadvallariga bitta executemany va har bir qurilmaning eng yangi nuqtasi latest_positions ga.
+    Commit chaqiruvchida."""
+    agent_rows, driver_rows, newest = [], [], {}
+    for p in points:
+        row = {
+            "latitude": p.latitude,
+            "longitude": p.longitude,
+            "accuracy": p.accuracy,
+            "battery": p.battery,
+            "recorded_at": p.recorded_at,
+        }
+        if p.entity_type == AGENT:
+            row["agent_id"] = p.entity_id
+            agent_rows.append(row)
+        elif p.entity_type == DRIVER:
+            row["driver_id"] = p.entity_id
+            row["speed"] = p.speed
+            driver_rows.append(row)
+        else:
+            continue
+        key = (p.entity_type, p.entity_id)
+        if key not in newest or p.recorded_at >= newest[key].recorded_at:
+            newest[key] = p
+    if agent_rows:
+        db.bulk_insert_mappings(AgentLocation, agent_rows)
+    if driver_rows:
+        db.bulk_insert_mappings(DriverLocation, driver_rows)
+    for p in newest.values():
+        record_position(
+            db, p.entity_type, p.entity_id, p.recorded_at,
+            latitude=p.latitude, longitude=p.longitude, accuracy=p.accuracy, battery=p.battery, speed=p.speed,
+        )
+    return len(agent_rows) + len(driver_rows)
+
+
+def _write_with_session(points: List[GpsPoint]) -> int:
+    db = SessionLocal()
+    try:
+        n = write_points(db, points)
+        db.commit()
+        return n
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+class GpsWriteBehind:
+    """Jarayon ichidagi navbat va uni yozuvchi fon oqimi (birinchi submit da ishga tushadi)."""
+
+    def __init__(self, writer: Callable[[List[GpsPoint]], int] = None, interval: float = FLUSH_INTERVAL,
+                 flush_at: int = FLUSH_AT, max_pending: int = MAX_PENDING):
+        self.writer = writer or _write_with_session
+        self.interval = interval
+        self.flush_at = flush_at
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self.written = 0
+        self.flushes = 0
+        self.dropped = 0
+        self.failures = 0
+
+    def submit(self, points: List[GpsPoint]) -> int:
+        """Navbatga qo'shish. Qaytaradi: navbatdagi nuqtalar soni."""
+        if not points:
+            return len(self._pending)
+        with self._lock:
+            self._pending.extend(points)
+            self._trim()
+            pending = len(self._pending)
+        self._ensure_thread()
+        if pending >= self.flush_at:
+            self._wake.set()
+        return pending
+
+    def _trim(self) -> None:
+        while len(self._pending) > self.max_pending:
+            self._pending.popleft()
+            self.dropped += 1
+
+    def flush(self) -> int:
+        """Navbatdagi hamma nuqtani bitta yozuvda yozadi. Xato bo'lsa nuqtalar navbat boshiga qaytadi."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = list(self._pending)
+                self._pending.clear()
+            try:
+                written = self.writer(batch)
+            except Exception:
+                traceback.print_exc()
+                with self._lock:
+                    self.failures += 1
+                    self._pending.extendleft(reversed(batch))
+                    self._trim()
+                return 0
+            self.written += written
+            self.flushes += 1
+            return written
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="gps-write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def stop(self) -> int:
+        """Fon oqimini to'xtatib, qolganini yozadi (shutdown)."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(self.interval * 5, 5))
+            self._thread = None
+        return self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "written": self.written,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
+
+
+gps_buffer = GpsWriteBehind()
@@ -0,0 +1,85 @@
+"""
+Agent va haydovchilarning oxirgi joylashuvi (latest_positions). GPS signali kelganda tarix jadvaliga
+(agent_locations / driver_locations) yoziladi va shu yerda upsert qilinadi — xarita, supervayzer va ro'yxat
+sahifalari har bir agent uchun "ORDER BY recorded_at DESC LIMIT 1" o'rniga bitta so'rov bilan o'qiydi.
+
+    record_position(db, AGENT, agent_id, recorded_at, latitude=lat, longitude=lng)   # commit chaqiruvchida
+    latest_positions(db, DRIVER)                                                     # {driver_id: LatestPosition}
+
+GPS signallari gps_ingest.write_points() orqali yoziladi — u har bir qurilmaning eng yangi nuqtasini record_position() ga beradi.
+"""
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from app.models.database import AgentLocation, DriverLocation, LatestPosition
+
+AGENT = "agent"
+DRIVER = "driver"
+_FIELDS = ("latitude", "longitude", "accuracy", "battery", "speed")
+_HISTORY = {
+    AGENT: (AgentLocation, AgentLocation.agent_id),
+    DRIVER: (DriverLocation, DriverLocation.driver_id),
+}
+
+
+def record_position(db: Session, entity_type: str, entity_id: int, recorded_at: datetime, **fields) -> bool:
+    """Oxirgi joylashuvni yangilaydi. Kechikib kelgan (eskiroq) signal joriy qiymatni almashtirmaydi.
+    Qaytaradi: yozildimi."""
+    values = {name: fields.get(name) for name in _FIELDS}
+    values["recorded_at"] = recorded_at
+    current = db.query(LatestPosition).filter(
+        LatestPosition.entity_type == entity_type,
+        LatestPosition.entity_id == entity_id,
+    )
+    updated = current.filter(
+        or_(LatestPosition.recorded_at.is_(None), LatestPosition.recorded_at <= recorded_at)
+    ).update(values, synchronize_session=False)
+    if updated:
+        return True
+    if current.with_entities(LatestPosition.id).first() is not None:
+        return False
+    db.add(LatestPosition(entity_type=entity_type, entity_id=entity_id, **values))
+    return True
+
+
+def latest_positions(db: Session, entity_type: str, ids: Optional[Iterable[int]] = None) -> Dict[int, LatestPosition]:
+    """{entity_id: LatestPosition} — bitta so'rov. ids berilsa faqat shular."""
+    q = db.query(LatestPosition).filter(LatestPosition.entity_type == entity_type)
+    if ids is not None:
+        ids = set(ids)
+        if not ids:
+            return {}
+        q = q.filter(LatestPosition.entity_id.in_(ids))
+    return {p.entity_id: p for p in q.all()}
+
+
+def rebuild_latest_positions(db: Session) -> int:
+    """Jadvalni tarixdan qayta quradi (birinchi ishga tushish). Qaytaradi: yozilgan qatorlar soni. Commit chaqiruvchida."""
+    db.query(LatestPosition).delete(synchronize_session=False)
+    rows = []
+    for entity_type, (model, key) in _HISTORY.items():
+        last = (
+            db.query(key.label("eid"), func.max(model.recorded_at).label("last_at"))
+            .filter(key.isnot(None), model.recorded_at.isnot(None))
+            .group_by(key)
+            .subquery()
+        )
+        seen = set()
+        for loc in (
+            db.query(model)
+            .join(last, and_(key == last.c.eid, model.recorded_at == last.c.last_at))
+            .order_by(model.id.desc())
+        ):
+            eid = getattr(loc, key.key)
+            if eid in seen:
+                continue  # bir xil vaqtdagi signallardan oxirgi yozilgani
+            seen.add(eid)
+            row = {name: getattr(loc, name, None) for name in _FIELDS}
+            row.update(entity_type=entity_type, entity_id=eid, recorded_at=loc.recorded_at)
+            rows.append(row)
+    db.bulk_insert_mappings(LatestPosition, rows)
+    db.flush()
+    return len(rows)
@@ -0,0 +1,134 @@
+"""
+GPS tarixini saqlash bosqichlari: oxirgi RAW_KEEP_DAYS kun — xom nuqtalar (agent_locations / driver_locations),
+undan eskisi — har bir agent/haydovchi-kun uchun bitta location_tracks qatori (Douglas–Peucker bilan
+soddalashtirilgan, polyline + vaqt deltalari). Scheduler har kecha track_days_to_compress -> compress_day chaqiradi.
+
+    day_track(db, AGENT, 5, date(2026, 3, 1))   # xom yoki siqilgan — farqi yo'q, vaqt bo'yicha tartiblangan
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.database import AgentLocation, DriverLocation, LocationTrack
+from app.services.latest_positions import AGENT, DRIVER
+from app.utils.geo import decode_ints, decode_polyline, douglas_peucker, encode_ints, encode_polyline
+
+RAW_KEEP_DAYS = 14
+SIMPLIFY_TOLERANCE_M = 8.0
+STOP_GAP_SECONDS = 300  # shundan uzun tanaffus — to'xtash; ikki tomonidagi nuqtalar saqlanadi
+
+_HISTORY = {
+    AGENT: (AgentLocation, AgentLocation.agent_id),
+    DRIVER: (DriverLocation, DriverLocation.driver_id),
+}
+
+TrackPoint = Tuple[float, float, datetime]
+
+
+def _day_bounds(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+def simplify_track(points: List[TrackPoint], tolerance_m: float = SIMPLIFY_TOLERANCE_M,
+                   stop_gap: int = STOP_GAP_SECONDS) -> List[TrackPoint]:
+    """Vaqt bo'yicha tartiblangan nuqtalar. Trek to'xtashlarda bo'laklarga ajratiladi, har bo'lak alohida soddalashtiriladi."""
+    kept: List[TrackPoint] = []
+    segment: List[TrackPoint] = []
+    for p in points:
+        if segment and (p[2] - segment[-1][2]).total_seconds() > stop_gap:
+            kept.extend(segment[i] for i in douglas_peucker(segment, tolerance_m))
+            segment = []
+        segment.append(p)
+    if segment:
+        kept.extend(segment[i] for i in douglas_peucker(segment, tolerance_m))
+    return kept
+
+
+def encode_track(day: date, points: List[TrackPoint]) -> Tuple[str, str]:
+    start = datetime.combine(day, time.min)
+    return (
+        encode_polyline([(lat, lng) for lat, lng, _t in points]),
+        encode_ints([(int((t - start).total_seconds()),) for _lat, _lng, t in points]),
+    )
+
+
+def decode_track(track: LocationTrack) -> List[TrackPoint]:
+    start = datetime.combine(track.day, time.min)
+    coords = decode_polyline(track.polyline or "")
+    seconds = decode_ints(track.times or "", 1)
+    return [(lat, lng, start + timedelta(seconds=s)) for (lat, lng), (s,) in zip(coords, seconds)]
+
+
+def _raw_points(db: Session, entity_type: str, entity_id: int, day: date) -> List[TrackPoint]:
+    model, key = _HISTORY[entity_type]
+    start, end = _day_bounds(day)
+    return [
+        (lat, lng, at)
+        for lat, lng, at in db.query(model.latitude, model.longitude, model.recorded_at)
+        .filter(key == entity_id, model.recorded_at >= start, model.recorded_at < end)
+        .order_by(model.recorded_at, model.id)
+        if lat is not None and lng is not None
+    ]
+
+
+def _track_row(db: Session, entity_type: str, entity_id: int, day: date) -> Optional[LocationTrack]:
+    return db.query(LocationTrack).filter(
+        LocationTrack.entity_type == entity_type,
+        LocationTrack.entity_id == entity_id,
+        LocationTrack.day == day,
+    ).first()
+
+
+def track_days_to_compress(db: Session, keep_days: int = RAW_KEEP_DAYS, today: date = None) -> List[Tuple[str, int, date]]:
+    """(entity_type, entity_id, kun) — xom nuqtalari keep_days dan eski bo'lgan kunlar."""
+    cutoff = datetime.combine((today or date.today()) - timedelta(days=keep_days), time.min)
+    out = []
+    for entity_type, (model, key) in _HISTORY.items():
+        rows = (
+            db.query(key, func.date(model.recorded_at))
+            .filter(key.isnot(None), model.recorded_at < cutoff)
+            .distinct()
+            .all()
+        )
+        out.extend((entity_type, eid, date.fromisoformat(str(day))) for eid, day in rows)
+    return sorted(out, key=lambda r: (r[2], r[0], r[1]))
+
+
+def compress_day(db: Session, entity_type: str, entity_id: int, day: date) -> int:
+    """Kunning xom nuqtalarini (va avval siqilgan trekni — kechikkan nuqtalar bo'lsa) bitta trekka yig'adi,
+    xom qatorlarni o'chiradi. Qaytaradi: o'chirilgan xom qatorlar. Commit chaqiruvchida."""
+    raw = _raw_points(db, entity_type, entity_id, day)
+    if not raw:
+        return 0
+    track = _track_row(db, entity_type, entity_id, day)
+    points = raw + (decode_track(track) if track else [])
+    points.sort(key=lambda p: p[2])
+    kept = simplify_track(points)
+    polyline, times = encode_track(day, kept)
+    if track is None:
+        track = LocationTrack(entity_type=entity_type, entity_id=entity_id, day=day, raw_count=0)
+        db.add(track)
+    track.raw_count = (track.raw_count or 0) + len(raw)
+    track.point_count = len(kept)
+    track.polyline = polyline
+    track.times = times
+    model, key = _HISTORY[entity_type]
+    start, end = _day_bounds(day)
+    return db.query(model).filter(
+        key == entity_id, model.recorded_at >= start, model.recorded_at < end
+    ).delete(synchronize_session=False)
+
+
+def day_track(db: Session, entity_type: str, entity_id: int, day: date) -> Dict:
+    """Kunlik trek: {"points": [(lat, lng, datetime)], "source": raw | compressed | mixed | empty, "track": LocationTrack|None}."""
+    raw = _raw_points(db, entity_type, entity_id, day)
+    track = _track_row(db, entity_type, entity_id, day)
+    if track is None:
+        return {"points": raw, "source": "raw" if raw else "empty", "track": None}
+    if not raw:
+        return {"points": decode_track(track), "source": "compressed", "track": track}
+    points = sorted(raw + decode_track(track), key=lambda p: p[2])
+    return {"points": points, "source": "mixed", "track": track}
@@ -0,0 +1,115 @@
+"""
+Mijozlar manzillari bo'yicha fazoviy indeks (app.utils.geo.GridIndex) — xaritada faqat ko'rinadigan hudud
+markerlari va agent uchun "yaqin atrofdagi do'konlar". Indeks jarayon keshida (INDEX_TTL); manzil, nom yoki
+faollik o'zgarganda invalidate_partner_index() chaqiriladi. Tashqi xarita xizmati kerak emas.
+
+    partners_in_bbox(db, 41.2, 69.1, 41.4, 69.4)       # [marker, ...]
+    nearest_partners(db, 41.31, 69.24, k=10)           # [marker + distance_m, ...]
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.database import Partner, PartnerLocation
+from app.utils.geo import GridIndex
+from app.utils.live_cache import TTLCache
+
+INDEX_TTL = 600  # sekund — tahrirda invalidate_partner_index(), TTL faqat zaxira
+CELL_DEG = 0.01  # ~1.1 km katak
+MAX_VIEWPORT_MARKERS = 2000
+NEAREST_MAX = 50
+
+index_cache = TTLCache(maxsize=2, default_ttl=INDEX_TTL)
+_KEY_INDEX = "partner_index"
+
+
+def _marker(partner_id, location_id, name, address, phone, lat, lng) -> Dict:
+    return {
+        "id": partner_id,
+        "location_id": location_id,
+        "name": name,
+        "type": "partner",
+        "lat": lat,
+        "lng": lng,
+        "address": address,
+        "phone": phone,
+    }
+
+
+def load_partner_markers(db: Session) -> List[Dict]:
+    """Faol mijozlarning barcha manzillari — 2 so'rov. partner_locations qatori bo'lmagan mijoz uchun
+    partners.latitude/longitude olinadi."""
+    rows = (
+        db.query(
+            PartnerLocation.partner_id, PartnerLocation.id, Partner.name, PartnerLocation.address, Partner.address,
+            Partner.phone, PartnerLocation.latitude, PartnerLocation.longitude,
+        )
+        .join(Partner, Partner.id == PartnerLocation.partner_id)
+        .filter(Partner.is_active == True, PartnerLocation.latitude.isnot(None), PartnerLocation.longitude.isnot(None))
+        .order_by(PartnerLocation.partner_id, PartnerLocation.id)
+        .all()
+    )
+    markers = [
+        _marker(pid, loc_id, name, loc_address or address, phone, lat, lng)
+        for pid, loc_id, name, loc_address, address, phone, lat, lng in rows
+    ]
+    located = {m["id"] for m in markers}
+    for pid, name, address, phone, lat, lng in (
+        db.query(Partner.id, Partner.name, Partner.address, Partner.phone, Partner.latitude, Partner.longitude)
+        .filter(Partner.is_active == True, Partner.latitude.isnot(None), Partner.longitude.isnot(None))
+        .all()
+    ):
+        if pid not in located:
+            markers.append(_marker(pid, None, name, address, phone, lat, lng))
+    return markers
+
+
+def build_partner_index(db: Session) -> GridIndex:
+    index = GridIndex(CELL_DEG)
+    for m in load_partner_markers(db):
+        index.add(m["lat"], m["lng"], m)
+    return index
+
+
+def partner_index(db: Session) -> GridIndex:
+    return index_cache.get_or_set(_KEY_INDEX, lambda: build_partner_index(db))
+
+
+def invalidate_partner_index() -> None:
+    """Mijoz qo'shildi/o'chirildi yoki nomi, manzili, koordinatasi o'zgardi."""
+    index_cache.invalidate()
+
+
+def partners_in_bbox(db: Session, south: float, west: float, north: float, east: float,
+                     limit: int = MAX_VIEWPORT_MARKERS) -> List[Dict]:
+    return partner_index(db).within_bbox(south, west, north, east, limit=limit)
+
+
+def nearest_partners(db: Session, lat: float, lng: float, k: int = 10,
+                     radius_m: Optional[float] = None) -> List[Dict]:
+    """Eng yaqin k ta manzil (masofa bo'yicha), har biriga distance_m qo'shilgan nusxa."""
+    k = max(1, min(k, NEAREST_MAX))
+    return [
+        dict(marker, distance_m=round(distance))
+        for distance, marker in partner_index(db).nearest(lat, lng, k=k, max_distance_m=radius_m)
+    ]
+
+
+def set_partner_location(db: Session, partner: Partner, lat: float, lng: float, address: str = None) -> PartnerLocation:
+    """Asosiy manzil koordinatasi: partners.latitude/longitude va is_primary partner_locations qatori.
+    Commit va invalidate_partner_index() chaqiruvchida."""
+    partner.latitude, partner.longitude = lat, lng
+    loc = (
+        db.query(PartnerLocation)
+        .filter(PartnerLocation.partner_id == partner.id, PartnerLocation.is_primary == True)
+        .order_by(PartnerLocation.id)
+        .first()
+    )
+    if loc is None:
+        loc = PartnerLocation(partner_id=partner.id, name="Asosiy", is_primary=True)
+        db.add(loc)
+        db.flush()  # autoflush=False — shu tranzaksiyadagi keyingi chaqiruv ham shu qatorni topsin
+    loc.latitude, loc.longitude = lat, lng
+    if address is not None:
+        loc.address = address
+    return loc
@@ -0,0 +1,300 @@
+"""
+Kontragent hisob-kitob daftari (partner_ledger) — o'tkazilgan hujjatlar tasdiqlanganda yoziladi, tasdiq
+bekor qilinganda o'chiriladi. Solishtirish dalolatnomasi butun tarixni emas, faqat davr yozuvlarini o'qiydi:
+davr boshidagi qoldiq = oylik snapshot (partner_balance_snapshots) + oy boshidan davrgacha bo'lgan yozuvlar.
+
+    order.status = "completed"
+    post_order_to_ledger(db, order)   # status qanday bo'lsa shunga moslaydi (bekor qilinsa — o'chiradi)
+
+Orqa sana bilan yozilgan hujjat keyingi oylarning snapshotlarini bitta UPDATE bilan tuzatadi.
+Balans: debit − credit (musbat — kontragent bizga qarzdor).
+"""
+from datetime import date, datetime, time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app.models.database import (
+    Order,
+    PartnerBalanceDoc,
+    PartnerBalanceSnapshot,
+    PartnerLedgerEntry,
+    Payment,
+    Purchase,
+)
+
+DOC_LABELS = {
+    "sale": "Sotuv",
+    "return_sale": "Qaytarish",
+    "purchase": "Xarid",
+    "balance_doc": "Qoldiq hujjati",
+}
+DOC_LINK_LABELS = {"purchase": "Tovarlar kirimi (xarid)"}
+
+Entry = Tuple[int, datetime, float, float]  # (partner_id, sana, debit, credit)
+
+
+def month_start(d) -> date:
+    return date(d.year, d.month, 1)
+
+
+def _next_month(d: date) -> date:
+    return date(d.year + 1, 1, 1) if d.month == 12 else date(d.year, d.month + 1, 1)
+
+
+def _shift_snapshots(db: Session, partner_id: int, when: datetime, debit: float, credit: float) -> None:
+    """Yozuv sanasidan keyingi oylarning snapshotlariga qo'shadi (orqa sana bilan o'tkazilgan hujjat)."""
+    if not debit and not credit:
+        return
+    db.query(PartnerBalanceSnapshot).filter(
+        PartnerBalanceSnapshot.partner_id == partner_id,
+        PartnerBalanceSnapshot.month > when.date(),
+    ).update(
+        {
+            PartnerBalanceSnapshot.debit: PartnerBalanceSnapshot.debit + debit,
+            PartnerBalanceSnapshot.credit: PartnerBalanceSnapshot.credit + credit,
+        },
+        synchronize_session=False,
+    )
+
+
+def sync_document(db: Session, doc_type: str, doc_id: int, doc_number: Optional[str], entries: Iterable[Entry]) -> None:
+    """Hujjatning daftardagi yozuvlarini entries bilan almashtiradi (bo'sh ro'yxat — o'chirish). Commit chaqiruvchida."""
+    old = db.query(PartnerLedgerEntry).filter(
+        PartnerLedgerEntry.doc_type == doc_type, PartnerLedgerEntry.doc_id == doc_id
+    ).all()
+    for e in old:
+        _shift_snapshots(db, e.partner_id, e.date, -(e.debit or 0), -(e.credit or 0))
+        db.delete(e)
+    for partner_id, when, debit, credit in entries:
+        if not partner_id or (not debit and not credit):
+            continue
+        when = when or datetime.now()
+        db.add(PartnerLedgerEntry(
+            partner_id=partner_id,
+            date=when,
+            doc_type=doc_type,
+            doc_id=doc_id,
+            doc_number=doc_number,
+            debit=debit,
+            credit=credit,
+        ))
+        _shift_snapshots(db, partner_id, when, debit, credit)
+    db.flush()
+
+
+def post_order_to_ledger(db: Session, order: Order) -> None:
+    """Bajarilgan sotuv — debit, tasdiqlangan qaytarish — credit; boshqa holatlarda yozuv o'chiriladi."""
+    if order.type not in ("sale", "return_sale"):
+        return
+    entries = []
+    if order.status == "completed" and order.partner_id:
+        amount = float(order.total or 0)
+        when = order.date or order.created_at
+        entries.append((order.partner_id, when, amount, 0.0) if order.type == "sale" else (order.partner_id, when, 0.0, amount))
+    sync_document(db, order.type, order.id, order.number, entries)
+
+
+def post_payment_to_ledger(db: Session, payment: Optional[Payment], payment_id: Optional[int] = None) -> None:
+    """Tasdiqlangan to'lov: kirim — credit (kontragent to'ladi), chiqim — debit (biz to'ladik).
+    O'chirilgan to'lov uchun payment=None, payment_id beriladi."""
+    pid = payment.id if payment is not None else payment_id
+    entries = []
+    if payment is not None and payment.partner_id and payment.status in (None, "confirmed"):
+        amount = float(payment.amount or 0)
+        when = payment.date or payment.created_at
+        if payment.type == "income":
+            entries.append((payment.partner_id, when, 0.0, amount))
+        elif payment.type == "expense":
+            entries.append((payment.partner_id, when, amount, 0.0))
+    sync_document(db, "payment", pid, payment.number if payment is not None else None, entries)
+
+
+def post_purchase_to_ledger(db: Session, purchase: Purchase) -> None:
+    """Tasdiqlangan xarid (xarajatlar bilan) — credit: biz yetkazuvchiga qarzdormiz."""
+    entries = []
+    if purchase.status == "confirmed" and purchase.partner_id:
+        amount = float((purchase.total or 0) + (purchase.total_expenses or 0))
+        entries.append((purchase.partner_id, purchase.date or purchase.created_at, 0.0, amount))
+    sync_document(db, "purchase", purchase.id, purchase.number, entries)
+
+
+def post_balance_doc_to_ledger(db: Session, doc: PartnerBalanceDoc) -> None:
+    """Qoldiq hujjati: hujjat sanasidagi daftar qoldig'ini kiritilgan summaga keltiruvchi tuzatish yozuvi."""
+    sync_document(db, "balance_doc", doc.id, doc.number, [])
+    if doc.status != "confirmed":
+        return
+    when = doc.date or doc.created_at or datetime.now()
+    entries = []
+    for item in doc.items:
+        if not item.partner_id:
+            continue
+        debit, credit = partner_totals_before(db, item.partner_id, when, inclusive=True)
+        diff = float(item.balance or 0) - (debit - credit)
+        entries.append((item.partner_id, when, diff, 0.0) if diff > 0 else (item.partner_id, when, 0.0, -diff))
+    sync_document(db, "balance_doc", doc.id, doc.number, entries)
+
+
+def partner_totals_before(db: Session, partner_id: int, when: datetime, inclusive: bool = False) -> Tuple[float, float]:
+    """when gacha bo'lgan (debit, credit) yig'indisi: oxirgi snapshot + undan keyingi yozuvlar (bir oydan oshmaydi)."""
+    snap = (
+        db.query(PartnerBalanceSnapshot.month, PartnerBalanceSnapshot.debit, PartnerBalanceSnapshot.credit)
+        .filter(PartnerBalanceSnapshot.partner_id == partner_id, PartnerBalanceSnapshot.month <= when.date())
+        .order_by(PartnerBalanceSnapshot.month.desc())
+        .first()
+    )
+    q = db.query(
+        func.coalesce(func.sum(PartnerLedgerEntry.debit), 0),
+        func.coalesce(func.sum(PartnerLedgerEntry.credit), 0),
+    ).filter(
+        PartnerLedgerEntry.partner_id == partner_id,
+        PartnerLedgerEntry.date <= when if inclusive else PartnerLedgerEntry.date < when,
+    )
+    debit = credit = 0.0
+    if snap is not None:
+        q = q.filter(PartnerLedgerEntry.date >= datetime.combine(snap.month, time.min))
+        debit, credit = float(snap.debit or 0), float(snap.credit or 0)
+    d, c = q.one()
+    return debit + float(d or 0), credit + float(c or 0)
+
+
+def _doc_url(doc_type: str, doc_id: int) -> str:
+    if doc_type in ("sale", "return_sale"):
+        return f"/sales/edit/{doc_id}"
+    if doc_type == "payment":
+        return f"/finance/payment/{doc_id}/edit"
+    if doc_type == "purchase":
+        return f"/purchases/edit/{doc_id}"
+    return f"/qoldiqlar/kontragent/hujjat/{doc_id}"
+
+
+def partner_movements(db: Session, partner_id: int, date_from: datetime, date_to: datetime) -> Tuple[List[dict], float, float]:
+    """Solishtirish dalolatnomasi: (davr qatorlari, opening_debit, opening_credit).
+    Qatorlarda balance — shu yozuvdan keyingi qoldiq (debit − credit)."""
+    start = datetime.combine(date_from.date(), time.min)
+    end = datetime.combine(date_to.date(), time.max)
+    opening_debit, opening_credit = partner_totals_before(db, partner_id, start)
+    balance = opening_debit - opening_credit
+    rows = []
+    for e in (
+        db.query(PartnerLedgerEntry)
+        .filter(PartnerLedgerEntry.partner_id == partner_id, PartnerLedgerEntry.date >= start, PartnerLedgerEntry.date <= end)
+        .order_by(PartnerLedgerEntry.date, PartnerLedgerEntry.id)
+    ):
+        debit, credit = float(e.debit or 0), float(e.credit or 0)
+        balance += debit - credit
+        if e.doc_type == "payment":
+            doc_type = "To'lov (kirim)" if credit else "To'lov (chiqim)"
+        else:
+            doc_type = DOC_LABELS.get(e.doc_type, e.doc_type)
+        label = DOC_LINK_LABELS.get(e.doc_type, doc_type)
+        rows.append({
+            "date": e.date,
+            "doc_type": doc_type,
+            "doc_number": e.doc_number or "",
+            "doc_label": f"{label} {e.doc_number or ''} {e.date.strftime('%d.%m.%Y %H:%M')}".strip(),
+            "doc_url": _doc_url(e.doc_type, e.doc_id),
+            "debit": debit,
+            "credit": credit,
+            "balance": balance,
+        })
+    return rows, opening_debit, opening_credit
+
+
+def write_partner_snapshots(db: Session, month: date) -> int:
+    """month (1-kun) uchun snapshot: oldingi snapshot + oradagi yozuvlar, kontragentlar bo'yicha guruhlangan.
+    Mavjud bo'lsa qayta yoziladi. Qaytaradi: yozilgan qatorlar soni. Commit chaqiruvchida."""
+    month = month_start(month)
+    month_dt = datetime.combine(month, time.min)
+    prev_month = (
+        db.query(func.max(PartnerBalanceSnapshot.month)).filter(PartnerBalanceSnapshot.month < month).scalar()
+    )
+    totals: Dict[int, List[float]] = {}
+    q = db.query(
+        PartnerLedgerEntry.partner_id,
+        func.coalesce(func.sum(PartnerLedgerEntry.debit), 0),
+        func.coalesce(func.sum(PartnerLedgerEntry.credit), 0),
+    ).filter(PartnerLedgerEntry.date < month_dt)
+    if prev_month is not None:
+        if isinstance(prev_month, str):
+            prev_month = date.fromisoformat(prev_month[:10])
+        for partner_id, debit, credit in db.query(
+            PartnerBalanceSnapshot.partner_id, PartnerBalanceSnapshot.debit, PartnerBalanceSnapshot.credit
+        ).filter(PartnerBalanceSnapshot.month == prev_month):
+            totals[partner_id] = [float(debit or 0), float(credit or 0)]
+        prev_dt = datetime.combine(prev_month, time.min)
+        # Oldingi snapshotda yo'q kontragent (birinchi hujjati orqa sana bilan kiritilgan) — boshidan yig'iladi
+        missing = db.query(
+            PartnerLedgerEntry.partner_id,
+            func.coalesce(func.sum(PartnerLedgerEntry.debit), 0),
+            func.coalesce(func.sum(PartnerLedgerEntry.credit), 0),
+        ).filter(
+            PartnerLedgerEntry.date < prev_dt,
+            PartnerLedgerEntry.partner_id.notin_(list(totals) or [0]),
+        ).group_by(PartnerLedgerEntry.partner_id).all()
+        for partner_id, debit, credit in missing:
+            totals[partner_id] = [float(debit or 0), float(credit or 0)]
+        q = q.filter(PartnerLedgerEntry.date >= prev_dt)
+    for partner_id, debit, credit in q.group_by(PartnerLedgerEntry.partner_id):
+        t = totals.setdefault(partner_id, [0.0, 0.0])
+        t[0] += float(debit or 0)
+        t[1] += float(credit or 0)
+    db.query(PartnerBalanceSnapshot).filter(PartnerBalanceSnapshot.month == month).delete(synchronize_session=False)
+    if totals:
+        db.bulk_insert_mappings(PartnerBalanceSnapshot, [
+            {"partner_id": pid, "month": month, "debit": d, "credit": c, "created_at": datetime.now()}
+            for pid, (d, c) in totals.items()
+        ])
+    db.flush()
+    return len(totals)
+
+
+def rebuild_partner_ledger(db: Session) -> int:
+    """Daftarni hujjatlardan to'liq qayta yozadi va oylik snapshotlarni tiklaydi. Qaytaradi: yozuvlar soni."""
+    db.query(PartnerBalanceSnapshot).delete(synchronize_session=False)
+    db.query(PartnerLedgerEntry).delete(synchronize_session=False)
+    rows = []
+    for o in db.query(Order).filter(
+        Order.type.in_(("sale", "return_sale")), Order.status == "completed", Order.partner_id.isnot(None)
+    ):
+        amount = float(o.total or 0)
+        rows.append({
+            "partner_id": o.partner_id, "date": o.date or o.created_at or datetime.now(), "doc_type": o.type,
+            "doc_id": o.id, "doc_number": o.number,
+            "debit": amount if o.type == "sale" else 0.0, "credit": amount if o.type == "return_sale" else 0.0,
+        })
+    for p in db.query(Payment).filter(
+        Payment.partner_id.isnot(None), Payment.type.in_(("income", "expense")),
+        or_(Payment.status == "confirmed", Payment.status.is_(None)),
+    ):
+        amount = float(p.amount or 0)
+        rows.append({
+            "partner_id": p.partner_id, "date": p.date or p.created_at or datetime.now(), "doc_type": "payment",
+            "doc_id": p.id, "doc_number": p.number,
+            "debit": amount if p.type == "expense" else 0.0, "credit": amount if p.type == "income" else 0.0,
+        })
+    for p in db.query(Purchase).filter(Purchase.status == "confirmed", Purchase.partner_id.isnot(None)):
+        rows.append({
+            "partner_id": p.partner_id, "date": p.date or p.created_at or datetime.now(), "doc_type": "purchase",
+            "doc_id": p.id, "doc_number": p.number,
+            "debit": 0.0, "credit": float((p.total or 0) + (p.total_expenses or 0)),
+        })
+    rows = [r for r in rows if r["debit"] or r["credit"]]
+    if rows:
+        db.bulk_insert_mappings(PartnerLedgerEntry, rows)
+    db.flush()
+    # Qoldiq hujjatlari oldingi yozuvlarga bog'liq — sana tartibida, snapshotlarsiz
+    docs = db.query(PartnerBalanceDoc).filter(PartnerBalanceDoc.status == "confirmed").order_by(PartnerBalanceDoc.date).all()
+    for doc in docs:
+        post_balance_doc_to_ledger(db, doc)
+    first = db.query(func.min(PartnerLedgerEntry.date)).scalar()
+    if first is not None:
+        if isinstance(first, str):
+            first = datetime.fromisoformat(first)
+        month = _next_month(month_start(first))
+        current = month_start(datetime.now())
+        while month <= current:
+            write_partner_snapshots(db, month)
+            month = _next_month(month)
+    return db.query(PartnerLedgerEntry).count()
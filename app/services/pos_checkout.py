@@ -0,0 +1,175 @@
+"""POS chekini yakunlash — bitta tranzaksiyada, savat hajmidan qat'i nazar belgilangan sondagi so'rovlar bilan.
+Narx, mahsulot va qoldiq savatdagi barcha mahsulotlar uchun oldindan bitta-bitta so'rovda olinadi;
+buyurtma qatorlari executemany, ombor harakatlari create_stock_movements_bulk bilan yoziladi. Commit chaqiruvchida."""
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.database import (
+    CashRegister,
+    Order,
+    OrderItem,
+    Partner,
+    Payment,
+    Product,
+    ProductPrice,
+    Stock,
+    Warehouse,
+)
+from app.services.cash_ledger import NO_EFFECT, post_payment_change
+from app.services.partner_ledger import post_order_to_ledger, post_payment_to_ledger
+from app.services.sales_rollup import apply_order_to_rollup
+from app.services.stock_service import create_stock_movements_bulk
+
+
+class PosCheckoutError(Exception):
+    """Chekni yakunlab bo'lmadi. code — /sales/pos?error= parametri (empty, stock, ...)."""
+
+    def __init__(self, code: str, detail: str = ""):
+        super().__init__(detail or code)
+        self.code = code
+        self.detail = detail
+
+
+def _pos_payment_type(payment_type: str) -> str:
+    """POS to'lov turi (naqd, plastik, click, terminal) → Payment.payment_type."""
+    if payment_type == "naqd":
+        return "cash"
+    if payment_type in ("click", "terminal"):
+        return payment_type
+    return "card"
+
+
+def _available_by_product(db: Session, warehouse_id: int, product_ids) -> dict:
+    """Ombordagi qoldiq mahsulot bo'yicha (takroriy Stock qatorlari yig'ilgan) — bitta so'rov."""
+    rows = (
+        db.query(Stock.product_id, func.sum(Stock.quantity))
+        .filter(Stock.warehouse_id == warehouse_id, Stock.product_id.in_(product_ids))
+        .group_by(Stock.product_id)
+        .all()
+    )
+    return {pid: float(qty or 0) for pid, qty in rows}
+
+
+def complete_pos_checkout(
+    db: Session,
+    *,
+    warehouse: Warehouse,
+    partner: Partner,
+    is_cash_client: bool,
+    cart: List[Tuple[int, float, Optional[float]]],
+    price_type_id: Optional[int],
+    payment_type: str,
+    user_id: Optional[int] = None,
+    discount_percent: float = 0.0,
+    discount_amount: float = 0.0,
+    payment_due_date=None,
+    cash_register: Optional[CashRegister] = None,
+) -> Order:
+    """Savat (product_id, miqdor, narx yoki None) bo'yicha yakunlangan sotuv yaratadi.
+    Qoldiq yetmasa hech narsa yozilmaydi — PosCheckoutError("stock") ko'tariladi."""
+    lines = [(int(pid), float(qty), price) for pid, qty, price in cart if pid and qty and float(qty) > 0]
+    if not lines:
+        raise PosCheckoutError("empty")
+    product_ids = sorted({pid for pid, _, _ in lines})
+
+    products = {p.id: p for p in db.query(Product).filter(Product.id.in_(product_ids)).all()}
+    type_prices = {}
+    if price_type_id and any(price is None or price < 0 for _, _, price in lines):
+        type_prices = {
+            pp.product_id: pp.sale_price or 0
+            for pp in db.query(ProductPrice).filter(
+                ProductPrice.product_id.in_(product_ids),
+                ProductPrice.price_type_id == price_type_id,
+            ).all()
+        }
+
+    available_by_product = _available_by_product(db, warehouse.id, product_ids)
+    required = {}
+    for pid, qty, _ in lines:
+        required[pid] = required.get(pid, 0.0) + qty
+    for pid in product_ids:
+        available = available_by_product.get(pid, 0.0)
+        if available < required[pid]:
+            prod = products.get(pid)
+            name = prod.name if prod else f"#{pid}"
+            raise PosCheckoutError("stock", f"Yetarli yo'q: {name} (savatda: {required[pid]}, omborda: {available:.0f})")
+
+    priced_lines = []
+    subtotal = 0.0
+    for pid, qty, price in lines:
+        if price is None or price < 0:
+            if pid in type_prices:
+                price = type_prices[pid]
+            else:
+                prod = products.get(pid)
+                price = (prod.sale_price or prod.purchase_price or 0) if prod else 0
+        priced_lines.append((pid, qty, price))
+        subtotal += qty * price
+    discount_sum = (subtotal * discount_percent / 100.0) + discount_amount
+    if discount_sum > subtotal:
+        discount_sum = subtotal
+    total = subtotal - discount_sum
+
+    now = datetime.now()
+    last_order_id = db.query(Order.id).filter(Order.type == "sale").order_by(Order.id.desc()).limit(1).scalar()
+    order = Order(
+        number=f"S-{now.strftime('%Y%m%d')}-{(last_order_id + 1) if last_order_id else 1:04d}",
+        type="sale",
+        partner_id=partner.id,
+        warehouse_id=warehouse.id,
+        price_type_id=price_type_id,
+        user_id=user_id,
+        status="completed",
+        payment_type=payment_type,
+        subtotal=subtotal,
+        discount_percent=discount_percent,
+        discount_amount=discount_amount,
+        total=total,
+        paid=total if is_cash_client else 0,
+        debt=0 if is_cash_client else total,
+        payment_due_date=None if is_cash_client else (payment_due_date or (now + timedelta(days=7)).date()),
+    )
+    db.add(order)
+    db.flush()
+
+    db.bulk_insert_mappings(OrderItem, [
+        {"order_id": order.id, "product_id": pid, "quantity": qty, "price": price, "total": qty * price}
+        for pid, qty, price in priced_lines
+    ])
+    create_stock_movements_bulk(
+        db,
+        [(warehouse.id, pid, -qty) for pid, qty, _ in priced_lines],
+        operation_type="sale",
+        document_type="Sale",
+        document_id=order.id,
+        document_number=order.number,
+        user_id=user_id,
+        note=f"Sotuv (POS {payment_type}): {order.number}",
+    )
+
+    if is_cash_client:
+        if cash_register and total > 0:
+            payment = Payment(
+                number=f"PAY-{now.strftime('%Y%m%d')}-S{order.id}",
+                type="income",
+                cash_register_id=cash_register.id,
+                partner_id=partner.id,
+                order_id=order.id,
+                amount=total,
+                payment_type=_pos_payment_type(payment_type),
+                category="sale",
+                description=f"POS sotuv {order.number}",
+                user_id=user_id,
+            )
+            db.add(payment)
+            db.flush()
+            post_payment_change(db, NO_EFFECT, payment)
+            post_payment_to_ledger(db, payment)
+    else:
+        partner.balance = (partner.balance or 0) + total
+    apply_order_to_rollup(db, order)
+    post_order_to_ledger(db, order)
+    return order
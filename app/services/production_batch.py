@@ -0,0 +1,254 @@
+"""
+Ishlab chiqarishni yakunlash — bitta yoki bir nechta buyurtma uchun bitta rezervatsiya o'tishi.
+Barcha buyurtmalarning tarkib talablari yig'iladi, kerakli Stock qatorlari bir marta yuklanadi, qoldiq buyurtmalar
+tartibida taqsimlanadi (oldingi buyurtmaning chiqimi keyingisiga ham yetadi), harakatlar bitta bulk insert bilan yoziladi.
+
+    batch = plan_completion(db, productions)
+    shortage_lines(db, batch)        # commitdan oldin — qaysi buyurtmaga nima yetmaydi
+    apply_completion(db, batch, user_id)
+    db.commit()
+    invalidate_recipe_costs()        # tayyor mahsulot narxi o'zgardi
+    revert_completion(db, production, recipe)   # tasdiqni bekor qilish — yozilgan harakatlar teskarisiga
+
+Yetmasa borini tortadi (min(kerak, mavjud)) — bitta buyurtmani yakunlashdagi kabi; rad etish chaqiruvchida.
+Xom ashyo buyurtmadagi 1-ombordan, yarim tayyor mahsulot nomida 'yarim'/'semi' bor ombordan chiqariladi.
+Commit (va undan keyin invalidate_recipe_costs) chaqiruvchida.
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from app.models.database import Product, Production, Recipe, Stock, Warehouse
+from app.services.recipe_costing import get_cost_book
+from app.services.stock_service import (
+    create_document_movements_bulk,
+    document_movement_totals,
+    load_stock_rows,
+    reverse_document_movements,
+)
+from app.utils.production_order import output_quantity_for_product, production_output_quantity_for_stock
+
+OPERATION = "production"
+DOCUMENT_TYPE = "Production"
+_EPS = 1e-9
+
+
+class CompletionPlan:
+    """Bitta buyurtma: draws — (ombor, mahsulot, kerak, ajratilgan), chiqim — (output_wh, recipe.product_id, output_units)."""
+
+    __slots__ = ("production", "recipe", "draws", "output_wh", "output_units", "output_qty_before", "material_cost")
+
+    def __init__(self, production, recipe):
+        self.production = production
+        self.recipe = recipe
+        self.draws: List[Tuple[int, int, float, float]] = []
+        self.output_wh: Optional[int] = None
+        self.output_units = 0.0
+        self.output_qty_before = 0.0
+        self.material_cost = 0.0
+
+    @property
+    def shortages(self) -> List[Tuple[int, int, float, float]]:
+        return [d for d in self.draws if d[3] < d[2] - _EPS]
+
+    @property
+    def cost_per_unit(self) -> float:
+        return self.material_cost / self.output_units if self.output_units > 0 else 0.0
+
+
+class CompletionBatch:
+    """plan_completion natijasi: rejalar (buyurtmalar tartibida) va yuklangan Stock qatorlari / chiqim mahsulotlari."""
+
+    def __init__(self, plans: List[CompletionPlan], stocks: Dict[tuple, Stock], products: Dict[int, Product]):
+        self.plans = plans
+        self.stocks = stocks
+        self.products = products
+
+
+def _requirements(production, recipe) -> List[Tuple[int, float]]:
+    if production.production_items:
+        items = [(pi.product_id, pi.quantity) for pi in production.production_items]
+    else:
+        items = [(item.product_id, (item.quantity or 0) * (production.quantity or 0)) for item in recipe.items]
+    return [(pid, float(qty or 0)) for pid, qty in items if pid]
+
+
+def semi_finished_warehouses(db: Session, product_ids: Iterable[int]) -> Dict[int, int]:
+    """Yarim tayyor mahsulot -> chiqariladigan ombor (nomi/kodi 'yarim'/'semi' bo'lgani, aks holda qoldig'i bor birinchisi).
+    Topilmasa kalit bo'lmaydi — buyurtmaning 1-ombori ishlatiladi."""
+    product_ids = set(product_ids)
+    if not product_ids:
+        return {}
+    rows = (
+        db.query(Stock.product_id, Stock.warehouse_id, Warehouse.id, Warehouse.name, Warehouse.code)
+        .outerjoin(Warehouse, Warehouse.id == Stock.warehouse_id)
+        .filter(Stock.product_id.in_(product_ids), Stock.quantity > 0)
+        .order_by(Stock.id)
+        .all()
+    )
+    first: Dict[int, int] = {}
+    semi: Dict[int, int] = {}
+    for pid, wh_id, found_wh, name, code in rows:
+        first.setdefault(pid, wh_id)
+        label = ((name or "") + " " + (code or "")).lower()
+        if wh_id and found_wh is not None and ("yarim" in label or "semi" in label):
+            semi.setdefault(pid, wh_id)
+    return {pid: semi.get(pid, first[pid]) for pid in first}
+
+
+def plan_completion(db: Session, productions: List[Production], recipes: Optional[Dict[int, Recipe]] = None) -> CompletionBatch:
+    """Berilgan tartibda taqsimlash. Retsept topilmagan buyurtmada plan.recipe = None (hech narsa ajratilmaydi)."""
+    if recipes is None:
+        recipe_ids = {p.recipe_id for p in productions if p.recipe_id}
+        recipes = {
+            r.id: r
+            for r in db.query(Recipe)
+            .options(selectinload(Recipe.items), selectinload(Recipe.stages))
+            .filter(Recipe.id.in_(recipe_ids))
+            .all()
+        } if recipe_ids else {}
+    book = get_cost_book(db)
+    plans = [CompletionPlan(p, recipes.get(p.recipe_id)) for p in productions]
+    requirements = {id(plan): _requirements(plan.production, plan.recipe) for plan in plans if plan.recipe}
+
+    semi_ids = {pid for reqs in requirements.values() for pid, _q in reqs if book.is_semi_finished(pid)}
+    semi_wh = semi_finished_warehouses(db, semi_ids)
+    out_ids = {plan.recipe.product_id for plan in plans if plan.recipe}
+    out_products = {
+        p.id: p for p in db.query(Product).options(joinedload(Product.unit)).filter(Product.id.in_(out_ids)).all()
+    } if out_ids else {}
+
+    # Qoldig'i hali yo'q yarim tayyor mahsulot — shu partiyada oldinroq chiqarilgan omboridan olinadi
+    sources: Dict[int, List[Tuple[int, float, int]]] = {}
+    produced_at: Dict[int, int] = {}
+    keys = set()
+    for plan in plans:
+        if not plan.recipe:
+            continue
+        production = plan.production
+        plan.output_wh = production.output_warehouse_id or production.warehouse_id
+        rows = []
+        for pid, required in requirements[id(plan)]:
+            wh_id = semi_wh.get(pid) or produced_at.get(pid) or production.warehouse_id
+            rows.append((pid, required, wh_id))
+            keys.add((wh_id, pid))
+        sources[id(plan)] = rows
+        keys.add((plan.output_wh, plan.recipe.product_id))
+        if book.is_semi_finished(plan.recipe.product_id):
+            produced_at.setdefault(plan.recipe.product_id, plan.output_wh)
+    stocks = load_stock_rows(db, keys)
+    available = {key: float(stock.quantity or 0) for key, stock in stocks.items()}
+
+    for plan in plans:
+        if not plan.recipe:
+            continue
+        production = plan.production
+        for pid, required, wh_id in sources[id(plan)]:
+            if required <= 0:
+                continue
+            allocated = min(required, available.get((wh_id, pid), 0.0))
+            if allocated > 0:
+                available[(wh_id, pid)] -= allocated
+            plan.draws.append((wh_id, pid, required, allocated))
+            if pid in book.products:
+                plan.material_cost += allocated * book.ingredient_cost(pid)
+        out_key = (plan.output_wh, plan.recipe.product_id)
+        plan.output_units = output_quantity_for_product(out_products.get(plan.recipe.product_id), production, plan.recipe)
+        plan.output_qty_before = available.get(out_key, 0.0)
+        available[out_key] = plan.output_qty_before + plan.output_units
+    return CompletionBatch(plans, stocks, out_products)
+
+
+def shortage_lines(db: Session, batch: CompletionBatch) -> List[str]:
+    """'PR-...: Shakar (Asosiy) — kerak 10.0, mavjud 4.0' ko'rinishidagi qatorlar (yetmovchilik bo'lmasa — bo'sh)."""
+    short = [(plan, d) for plan in batch.plans for d in plan.shortages]
+    if not short:
+        return []
+    product_ids = {d[1] for _p, d in short}
+    wh_ids = {d[0] for _p, d in short}
+    product_names = dict(db.query(Product.id, Product.name).filter(Product.id.in_(product_ids)).all())
+    wh_names = dict(db.query(Warehouse.id, Warehouse.name).filter(Warehouse.id.in_(wh_ids)).all())
+    return [
+        f"{plan.production.number}: {product_names.get(pid) or pid} ({wh_names.get(wh_id) or wh_id}) — "
+        f"kerak {required:,.1f}, mavjud {allocated:,.1f}"
+        for plan, (wh_id, pid, required, allocated) in short
+    ]
+
+
+def apply_completion(db: Session, batch: CompletionBatch, user_id: Optional[int] = None) -> int:
+    """Rejani yozadi: xom ashyo chiqimi va tayyor mahsulot kirimi StockMovement (bulk), tayyor mahsulot narxi
+    (o'rtacha og'irlikli purchase_price). Buyurtma statusini chaqiruvchi o'rnatadi. Yozilgan harakatlar soni.
+    Narx o'zgargani uchun commit dan keyin invalidate_recipe_costs() chaqirilishi kerak (rollback bo'lsa — kesh eskirmaydi)."""
+    items = []
+    for plan in batch.plans:
+        if not plan.recipe:
+            continue
+        number = plan.production.number
+        for wh_id, pid, _required, allocated in plan.draws:
+            if allocated > 0:
+                items.append((plan.production.id, number, wh_id, pid, -allocated))
+        if plan.output_units > 0:
+            items.append((plan.production.id, number, plan.output_wh, plan.recipe.product_id, plan.output_units))
+        product = batch.products.get(plan.recipe.product_id)
+        if product is None:
+            continue
+        old_price = product.purchase_price or 0
+        cost_per_unit = plan.cost_per_unit
+        if plan.output_qty_before > 0 and old_price > 0 and plan.output_units > 0:
+            product.purchase_price = (
+                (plan.output_qty_before * old_price + plan.output_units * cost_per_unit)
+                / (plan.output_qty_before + plan.output_units)
+            )
+        elif cost_per_unit > 0:
+            product.purchase_price = cost_per_unit
+    return create_document_movements_bulk(db, items, OPERATION, DOCUMENT_TYPE, user_id=user_id, stocks=batch.stocks)
+
+
+def _output_shortage(db: Session, wh_id: int, product_id: int, required: float, available: float) -> str:
+    wh = db.query(Warehouse).filter(Warehouse.id == wh_id).first()
+    product = db.query(Product).filter(Product.id == product_id).first()
+    wh_name = (wh.name if wh else "2-ombor") or "2-ombor"
+    prod_name = (product.name if product else "tayyor mahsulot") or "tayyor mahsulot"
+    return f"«{wh_name}» da «{prod_name}» dan kerak: {required:,.1f}, mavjud: {available:,.1f}"
+
+
+def _revert_by_recipe(db: Session, production, recipe) -> Optional[str]:
+    """Harakatlar yozilmagan davrda yakunlangan buyurtma: retsept bo'yicha (tayyor mahsulot chiqqan omboridan olinadi,
+    xom ashyo buyurtma omboriga qaytadi)."""
+    output_units = production_output_quantity_for_stock(db, production, recipe)
+    out_wh_id = production.output_warehouse_id or production.warehouse_id
+    stocks = load_stock_rows(db, [(out_wh_id, recipe.product_id)])
+    product_stock = stocks.get((out_wh_id, recipe.product_id))
+    current_qty = float(product_stock.quantity or 0) if product_stock else 0.0
+    if not product_stock or current_qty < output_units:
+        return _output_shortage(db, out_wh_id, recipe.product_id, output_units, current_qty)
+    product_stock.quantity = current_qty - output_units
+    returned: Dict[Tuple[int, int], float] = {}
+    for pid, required in _requirements(production, recipe):
+        key = (production.warehouse_id, pid)
+        returned[key] = returned.get(key, 0.0) + required
+    stocks = load_stock_rows(db, returned)
+    for key, required in returned.items():
+        if key in stocks:
+            stocks[key].quantity = float(stocks[key].quantity or 0) + required
+        else:
+            db.add(Stock(warehouse_id=key[0], product_id=key[1], quantity=required))
+    return None
+
+
+def revert_completion(db: Session, production, recipe) -> Optional[str]:
+    """Yakunlashni bekor qiladi: yozilgan Production harakatlari teskarisiga qo'llanadi — xom ashyo aynan tortilgan
+    omboriga (yarim tayyor ombori ham) va tortilgan miqdorda qaytadi, tayyor mahsulot chiqqan omboridan olinadi.
+    Tayyor mahsulot qoldig'i yetmasa — xabar qaytaradi, hech narsa o'zgarmaydi. Status va commit chaqiruvchida."""
+    totals = document_movement_totals(db, DOCUMENT_TYPE, production.id)
+    if not totals:
+        return _revert_by_recipe(db, production, recipe)
+    stocks = load_stock_rows(db, [key for key, change in totals.items() if change > 0])
+    for (wh_id, pid), change in totals.items():
+        if change <= 0:
+            continue
+        available = float(stocks[(wh_id, pid)].quantity or 0) if (wh_id, pid) in stocks else 0.0
+        if available < change - _EPS:
+            return _output_shortage(db, wh_id, pid, change, available)
+    reverse_document_movements(db, DOCUMENT_TYPE, production.id, totals=totals)
+    return None
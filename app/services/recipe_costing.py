@@ -0,0 +1,137 @@
+"""
+Retsept tannarxi — retseptlar grafi (retsept → tarkib → yarim tayyor mahsulot retsepti) bir marta yuklanadi
+(3 ta so'rov), topologik tartibda har bir retseptning 1 kg tannarxi hisoblanadi va eslab qolinadi.
+Natija jarayon keshida (COST_TTL); narx yoki retsept o'zgarganda invalidate_recipe_costs() chaqiriladi.
+
+    book = get_cost_book(db)
+    book.recipe_cost_per_kg(recipe.id)
+    book.ingredient_cost(product_id)      # yarim tayyor — retsept bo'yicha, xom ashyo — narx
+
+Xom ashyo narxi — Product.purchase_price (Stock jadvalida alohida tannarx ustuni yo'q).
+"""
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.database import Product, Recipe, RecipeItem
+from app.utils.live_cache import TTLCache
+from app.utils.production_order import recipe_kg_per_unit
+
+COST_TTL = 300  # sekund — narx/retsept tahririda invalidate_recipe_costs(), TTL faqat zaxira
+SEMI_FINISHED = "yarim_tayyor"
+
+cost_cache = TTLCache(maxsize=4, default_ttl=COST_TTL)
+_KEY_BOOK = "recipe_costs"
+
+
+class _RecipeInfo:
+    __slots__ = ("id", "product_id", "name", "output_quantity", "is_active", "items")
+
+    def __init__(self, rid, product_id, name, output_quantity, is_active):
+        self.id = rid
+        self.product_id = product_id
+        self.name = name
+        self.output_quantity = output_quantity
+        self.is_active = is_active
+        self.items: List[Tuple[int, float]] = []
+
+
+class CostBook:
+    """Yuklangan narxlar va retsept grafi. Barcha retseptlar tannarxi konstruktorda hisoblanadi —
+    tayyor obyekt faqat o'qiladi (keshdan bir nechta oqim bemalol ishlatadi)."""
+
+    def __init__(self, products: Dict[int, tuple], recipes: Dict[int, _RecipeInfo]):
+        self.products = products  # id -> (type, purchase_price)
+        self.recipes = recipes
+        self.active_recipe: Dict[int, int] = {}  # mahsulot -> faol retsept (eng kichik id)
+        for rid in sorted(recipes):
+            r = recipes[rid]
+            if r.is_active and r.product_id not in self.active_recipe:
+                self.active_recipe[r.product_id] = rid
+        self.costs: Dict[int, float] = {}
+        for rid in self._topological_order():
+            self.costs[rid] = self._compute(rid)
+
+    def _semi_recipe(self, product_id: int) -> Optional[int]:
+        product = self.products.get(product_id)
+        if product is None or product[0] != SEMI_FINISHED:
+            return None
+        return self.active_recipe.get(product_id)
+
+    def _topological_order(self) -> List[int]:
+        """Avval ichki (yarim tayyor) retseptlar. Aylana bog'lanish bo'lsa — o'sha tarkib narx bo'yicha olinadi."""
+        order: List[int] = []
+        state: Dict[int, int] = {}  # 1 — ko'rilmoqda, 2 — tayyor
+        for root in self.recipes:
+            if root in state:
+                continue
+            stack = [(root, iter(self.recipes[root].items))]
+            state[root] = 1
+            while stack:
+                rid, it = stack[-1]
+                for product_id, _qty in it:
+                    child = self._semi_recipe(product_id)
+                    if child is not None and child not in state:
+                        state[child] = 1
+                        stack.append((child, iter(self.recipes[child].items)))
+                        break
+                else:
+                    stack.pop()
+                    state[rid] = 2
+                    order.append(rid)
+        return order
+
+    def material_cost(self, product_id: int) -> float:
+        product = self.products.get(product_id)
+        return float(product[1] or 0) if product else 0.0
+
+    def ingredient_cost(self, product_id: int) -> float:
+        """1 birlik (kg) tarkib narxi: yarim tayyor bo'lsa retsept tannarxi, aks holda material_cost."""
+        semi = self._semi_recipe(product_id)
+        if semi is not None and semi in self.costs:
+            return self.costs[semi]
+        return self.material_cost(product_id)
+
+    def _compute(self, rid: int) -> float:
+        recipe = self.recipes[rid]
+        if not recipe.items:
+            return 0.0
+        total = sum(qty * self.ingredient_cost(pid) for pid, qty in recipe.items if pid in self.products)
+        output_qty = recipe_kg_per_unit(recipe)
+        return total / output_qty if output_qty > 0 else 0.0
+
+    def recipe_cost_per_kg(self, recipe_id: int) -> float:
+        return self.costs.get(recipe_id, 0.0)
+
+    def is_semi_finished(self, product_id: int) -> bool:
+        product = self.products.get(product_id)
+        return product is not None and product[0] == SEMI_FINISHED
+
+
+def load_cost_book(db: Session) -> CostBook:
+    """Keshsiz: mahsulotlar, retseptlar va tarkiblar — jami 3 ta so'rov."""
+    products = {pid: (p_type, price) for pid, p_type, price in db.query(Product.id, Product.type, Product.purchase_price)}
+    recipes = {
+        rid: _RecipeInfo(rid, product_id, name, output_quantity, bool(is_active))
+        for rid, product_id, name, output_quantity, is_active in db.query(
+            Recipe.id, Recipe.product_id, Recipe.name, Recipe.output_quantity, Recipe.is_active
+        )
+    }
+    for recipe_id, product_id, qty in db.query(RecipeItem.recipe_id, RecipeItem.product_id, RecipeItem.quantity).order_by(RecipeItem.id):
+        if recipe_id in recipes and product_id:
+            recipes[recipe_id].items.append((product_id, float(qty or 0)))
+    return CostBook(products, recipes)
+
+
+def get_cost_book(db: Session) -> CostBook:
+    return cost_cache.get_or_set(_KEY_BOOK, lambda: load_cost_book(db))
+
+
+def recipe_costs(db: Session) -> Dict[int, float]:
+    """Barcha retseptlar: {recipe_id: 1 kg tannarxi}."""
+    return dict(get_cost_book(db).costs)
+
+
+def invalidate_recipe_costs() -> None:
+    """Mahsulot narxi (purchase_price) yoki retsept (tarkib, nom, chiqish miqdori, faollik) o'zgardi."""
+    cost_cache.invalidate()
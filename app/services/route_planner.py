@@ -0,0 +1,283 @@
+"""
+Marshrut tartibi — tashqi xizmatsiz. Masofalar matritsasi mijoz koordinatalaridan (haversine, to'g'ri chiziq),
+tartib: eng yaqin qo'shni (nearest neighbour) + 2-opt va Or-opt yaxshilash, TIME_LIMIT soniya ichida.
+Yaxshilashlar faqat har nuqtaning NEIGHBOURS ta eng yaqin qo'shnisi bo'yicha ko'riladi — 200+ nuqta ham soniyadan tez.
+
+    plan = optimize_route(db, route)           # RoutePoint.order_num yoziladi, commit chaqiruvchida
+    plan = plan_order(coords, start=(lat, lng))   # faqat hisoblash
+
+NumPy o'rnatilgan bo'lsa matritsa vektorlashgan holda quriladi; yo'q bo'lsa — sof Python (natija bir xil).
+"""
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.database import Delivery, Order, Partner, PartnerLocation, RoutePoint
+from app.utils.geo import EARTH_RADIUS_M, haversine_m
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TIME_LIMIT = 0.5  # soniya — yaxshilash bosqichi uchun
+NEIGHBOURS = 12
+OR_OPT_SEGMENTS = (1, 2, 3)
+_EPS = 1e-7
+
+Coord = Tuple[float, float]
+
+
+class RoutePlan(NamedTuple):
+    order: List[int]  # coords indekslari, tashrif tartibida
+    distance_m: float  # start bo'lsa — undan boshlab (return_to_start bo'lsa qaytish bilan)
+    initial_distance_m: float  # eng yaqin qo'shni natijasi
+    moves: int  # qo'llangan 2-opt / Or-opt o'zgarishlari
+    elapsed: float
+
+
+def distance_matrix(coords: Sequence[Coord]) -> List[List[float]]:
+    """Juftlik masofalar (metr), ichma-ich ro'yxat — yechuvchi element bo'yicha o'qiydi, bu ro'yxatda tezroq."""
+    n = len(coords)
+    if n == 0:
+        return []
+    if np is not None:
+        arr = np.radians(np.asarray(coords, dtype=float))
+        lat, lng = arr[:, 0:1], arr[:, 1:2]
+        a = np.sin((lat.T - lat) / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin((lng.T - lng) / 2) ** 2
+        return (2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))).tolist()
+    matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        lat1, lng1 = coords[i]
+        row = matrix[i]
+        for j in range(i + 1, n):
+            row[j] = matrix[j][i] = haversine_m(lat1, lng1, coords[j][0], coords[j][1])
+    return matrix
+
+
+def _neighbour_lists(d: List[List[float]], nodes: List[int], k: int) -> Dict[int, List[int]]:
+    if np is not None and len(nodes) > k + 1:
+        idx = np.asarray(nodes)
+        sub = np.asarray(d)[np.ix_(idx, idx)]
+        np.fill_diagonal(sub, np.inf)
+        part = np.argpartition(sub, k, axis=1)[:, :k]
+        out = {}
+        for row, a in enumerate(nodes):
+            cand = part[row]
+            out[a] = [nodes[c] for c in cand[np.argsort(sub[row, cand])]]
+        return out
+    return {a: sorted((b for b in nodes if b != a), key=d[a].__getitem__)[:k] for a in nodes}
+
+
+def _path_length(d: List[List[float]], path: List[int]) -> float:
+    return sum(d[path[i]][path[i + 1]] for i in range(len(path) - 1))
+
+
+def _nearest_neighbour(d: List[List[float]], first: int, stops: List[int]) -> List[int]:
+    left = set(stops)
+    order = []
+    current = first
+    while left:
+        row = d[current]
+        current = min(left, key=row.__getitem__)
+        left.remove(current)
+        order.append(current)
+    return order
+
+
+def _two_opt(d, p: List[int], pos: List[int], neigh: Dict[int, List[int]], deadline: float) -> int:
+    """Yo'l uchlari (p[0], p[-1]) qotirilgan. Yangi qirra (a, c) faqat a ning qo'shnilari orasidan."""
+    last = len(p) - 1
+    moves = 0
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(last):
+            a, a_next = p[i], p[i + 1]
+            d_a = d[a]
+            base = d_a[a_next]
+            for c in neigh.get(a, ()):
+                g1 = base - d_a[c]
+                if g1 <= _EPS:
+                    break
+                j = pos[c]
+                if j > i + 1:
+                    # p[i+1..j] teskari: (a, a_next) + (c, c_next) -> (a, c) + (a_next, c_next)
+                    c_next = p[j + 1]
+                    gain = g1 + d[c][c_next] - d[a_next][c_next]
+                    lo, hi = i + 1, j
+                elif j < i - 1 and j >= 0:
+                    # p[j+1..i] teskari: (c, c_after) + (a, a_next) -> (c, a) + (c_after, a_next)
+                    c_after = p[j + 1]
+                    gain = base + d[c][c_after] - d_a[c] - d[c_after][a_next]
+                    lo, hi = j + 1, i
+                else:
+                    continue
+                if gain > _EPS:
+                    p[lo:hi + 1] = p[lo:hi + 1][::-1]
+                    for k in range(lo, hi + 1):
+                        pos[p[k]] = k
+                    moves += 1
+                    improved = True
+                    break
+            if improved and time.perf_counter() >= deadline:
+                break
+    return moves
+
+
+def _or_opt(d, p: List[int], pos: List[int], neigh: Dict[int, List[int]], deadline: float) -> int:
+    """1-3 nuqtali bo'lakni (teskari ham) boshqa qirra orasiga ko'chirish."""
+    last = len(p) - 1
+    moves = 0
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for seg_len in OR_OPT_SEGMENTS:
+            i = 1
+            while i + seg_len - 1 <= last - 1:
+                j = i + seg_len - 1
+                prev, first, end, nxt = p[i - 1], p[i], p[j], p[j + 1]
+                removal = d[prev][first] + d[end][nxt] - d[prev][nxt]
+                if removal <= _EPS:
+                    i += 1
+                    continue
+                best = None
+                for anchor in (first, end):
+                    for c in neigh.get(anchor, ()):
+                        k = pos[c]
+                        if i - 1 <= k <= j:
+                            continue
+                        for u in (k - 1, k):  # qirra (p[u], p[u+1]) — c uning bir uchi
+                            if u < 0 or u >= last or i - 1 <= u <= j:
+                                continue
+                            x, y = p[u], p[u + 1]
+                            base = d[x][y]
+                            fwd = d[x][first] + d[end][y] - base
+                            rev = d[x][end] + d[first][y] - base
+                            cost, reverse = (fwd, False) if fwd <= rev else (rev, True)
+                            gain = removal - cost
+                            if gain > _EPS and (best is None or gain > best[0]):
+                                best = (gain, u, reverse)
+                if best is None:
+                    i += 1
+                    continue
+                _gain, u, reverse = best
+                segment = p[i:j + 1]
+                if reverse:
+                    segment.reverse()
+                rest = p[:i] + p[j + 1:]
+                insert_at = u + 1 if u < i else u + 1 - seg_len
+                p[:] = rest[:insert_at] + segment + rest[insert_at:]
+                for k, node in enumerate(p):
+                    pos[node] = k
+                moves += 1
+                improved = True
+                if time.perf_counter() >= deadline:
+                    return moves
+    return moves
+
+
+def plan_order(coords: Sequence[Coord], start: Optional[Coord] = None, return_to_start: bool = False,
+               time_limit: float = TIME_LIMIT) -> RoutePlan:
+    """Tashrif tartibi. start — ombor/agent joylashuvi (yo'l shundan boshlanadi); bo'lmasa yo'lning ikki uchi erkin."""
+    started = time.perf_counter()
+    n = len(coords)
+    if n == 0:
+        return RoutePlan([], 0.0, 0.0, 0, 0.0)
+    points = list(coords) + ([start] if start is not None else [])
+    d = distance_matrix(points)
+    # Virtual uch (V): hammagacha 0 m — yo'lning erkin uchi. Yo'l: [bosh] + tashriflar + [oxir], uchlar qotirilgan.
+    virtual = len(points)
+    for row in d:
+        row.append(0.0)
+    d.append([0.0] * (virtual + 1))
+    stops = list(range(n))
+    if start is None:
+        head = tail = virtual
+        seed = min(stops, key=lambda s: (coords[s][1], coords[s][0]))  # eng g'arbiy nuqtadan
+        order = [seed] + _nearest_neighbour(d, seed, [s for s in stops if s != seed])
+    else:
+        head, tail = n, (n if return_to_start else virtual)
+        order = _nearest_neighbour(d, head, stops)
+    p = [head] + order + [tail]
+    initial = _path_length(d, p)
+    moves = 0
+    if n > 2:
+        pos = [0] * (virtual + 1)
+        for k, node in enumerate(p):
+            pos[node] = k
+        neigh = _neighbour_lists(d, stops, min(NEIGHBOURS, n - 1))
+        deadline = time.perf_counter() + time_limit
+        while time.perf_counter() < deadline:
+            step = _two_opt(d, p, pos, neigh, deadline) + _or_opt(d, p, pos, neigh, deadline)
+            moves += step
+            if not step:
+                break
+    return RoutePlan(p[1:-1], _path_length(d, p), initial, moves, time.perf_counter() - started)
+
+
+def partner_coords(db: Session, partner_ids: Sequence[int]) -> Dict[int, Coord]:
+    """Asosiy partner_locations manzili, bo'lmasa partners.latitude/longitude."""
+    ids = list(set(partner_ids))
+    if not ids:
+        return {}
+    out: Dict[int, Coord] = {}
+    for pid, lat, lng in (
+        db.query(Partner.id, Partner.latitude, Partner.longitude)
+        .filter(Partner.id.in_(ids), Partner.latitude.isnot(None), Partner.longitude.isnot(None))
+    ):
+        out[pid] = (lat, lng)
+    for pid, lat, lng, _primary in (
+        db.query(PartnerLocation.partner_id, PartnerLocation.latitude, PartnerLocation.longitude, PartnerLocation.is_primary)
+        .filter(PartnerLocation.partner_id.in_(ids), PartnerLocation.latitude.isnot(None), PartnerLocation.longitude.isnot(None))
+        .order_by(PartnerLocation.is_primary, PartnerLocation.id.desc())
+    ):
+        out[pid] = (lat, lng)  # oxirgi yozilgani — asosiy (is_primary=True tartibda oxirida)
+    return out
+
+
+def optimize_route(db: Session, route, start: Optional[Coord] = None, return_to_start: bool = False,
+                   time_limit: float = TIME_LIMIT) -> RoutePlan:
+    """RoutePoint.order_num ni 1..N qayta yozadi. Koordinatasiz nuqtalar oxirida, avvalgi tartibida.
+    Qaytaradi: RoutePlan (order — koordinatali nuqtalar ichidagi indekslar). Commit chaqiruvchida."""
+    points = (
+        db.query(RoutePoint)
+        .filter(RoutePoint.route_id == route.id)
+        .order_by(RoutePoint.order_num, RoutePoint.id)
+        .all()
+    )
+    coords = partner_coords(db, [p.partner_id for p in points])
+    located = [p for p in points if p.partner_id in coords]
+    unlocated = [p for p in points if p.partner_id not in coords]
+    plan = plan_order([coords[p.partner_id] for p in located], start, return_to_start, time_limit)
+    for num, point in enumerate([located[i] for i in plan.order] + unlocated, start=1):
+        point.order_num = num
+    return plan
+
+
+def delivery_order(db: Session, driver_id: int, day: date = None, start: Optional[Coord] = None,
+                   time_limit: float = TIME_LIMIT) -> Tuple[List[Delivery], List[Delivery], RoutePlan]:
+    """Haydovchining kutilayotgan yetkazishlari uchun tavsiya tartib: (tartiblangan, koordinatasiz, plan).
+    Koordinata buyurtma mijozidan (order_id yoki order_number bo'yicha). Bazaga yozmaydi."""
+    query = db.query(Delivery).filter(Delivery.driver_id == driver_id, Delivery.status.in_(("pending", "in_progress")))
+    if day is not None:
+        start_dt = datetime.combine(day, datetime.min.time())
+        query = query.filter(Delivery.planned_date >= start_dt, Delivery.planned_date < start_dt + timedelta(days=1))
+    deliveries = query.order_by(Delivery.id).all()
+    ids = [x.order_id for x in deliveries if x.order_id]
+    numbers = [x.order_number for x in deliveries if not x.order_id and x.order_number]
+    by_id, by_number = {}, {}
+    if ids or numbers:
+        for oid, number, pid in db.query(Order.id, Order.number, Order.partner_id).filter(
+            (Order.id.in_(ids)) | (Order.number.in_(numbers))
+        ):
+            by_id[oid] = pid
+            by_number[number] = pid
+    partner_of = {x.id: by_id.get(x.order_id) if x.order_id else by_number.get(x.order_number) for x in deliveries}
+    coords = partner_coords(db, [pid for pid in partner_of.values() if pid])
+    located = [x for x in deliveries if coords.get(partner_of[x.id])]
+    unlocated = [x for x in deliveries if not coords.get(partner_of[x.id])]
+    plan = plan_order([coords[partner_of[x.id]] for x in located], start, False, time_limit)
+    return [located[i] for i in plan.order], unlocated, plan
@@ -0,0 +1,153 @@
+"""Kunlik savdo yig'indisi (daily_sales_rollup) — sotuv bajarilganda, bekor qilinganda va qaytarishda
+o'sib/kamayib boradi. Dashboardlar Order jadvalini skanerlamasdan shu jadvaldan kun bo'yicha o'qiydi."""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.database import DailySalesRollup, Order
+from app.utils.live_cache import SALES_KEYS
+from app.utils.live_events import invalidate_on_commit, publish_on_commit
+
+
+def _key_filter(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def apply_order_to_rollup(db: Session, order: Order, sign: int = 1) -> None:
+    """Bajarilgan sotuv (sign=+1) yoki uning bekor qilinishi (sign=-1) ni yig'indiga qo'shadi.
+    return_sale turidagi hujjatlar returns_* ustunlariga yoziladi. Commit chaqiruvchida."""
+    if order.type not in ("sale", "return_sale"):
+        return
+    day = (order.created_at or datetime.now()).date()
+    row = db.query(DailySalesRollup).filter(
+        DailySalesRollup.day == day,
+        _key_filter(DailySalesRollup.warehouse_id, order.warehouse_id),
+        _key_filter(DailySalesRollup.partner_id, order.partner_id),
+        _key_filter(DailySalesRollup.user_id, order.user_id),
+    ).first()
+    if row is None:
+        row = DailySalesRollup(
+            day=day,
+            warehouse_id=order.warehouse_id,
+            partner_id=order.partner_id,
+            user_id=order.user_id,
+            sales_total=0,
+            sales_count=0,
+            returns_total=0,
+            returns_count=0,
+        )
+        db.add(row)
+    amount = float(order.total or 0) * sign
+    if order.type == "sale":
+        row.sales_total = (row.sales_total or 0) + amount
+        row.sales_count = (row.sales_count or 0) + sign
+    else:
+        row.returns_total = (row.returns_total or 0) + amount
+        row.returns_count = (row.returns_count or 0) + sign
+    db.flush()
+    invalidate_on_commit(db, SALES_KEYS)
+    publish_on_commit(db, "sales", {
+        "order_id": order.id,
+        "number": order.number,
+        "type": order.type,
+        "warehouse_id": order.warehouse_id,
+        "day": day.isoformat(),
+        "total": amount,
+        "count": sign,
+    })
+
+
+def rebuild_sales_rollup(db: Session) -> int:
+    """Yig'indini orders jadvalidan to'liq qayta hisoblaydi. Qaytaradi: yozilgan qatorlar soni."""
+    db.query(DailySalesRollup).delete(synchronize_session=False)
+    day_col = func.date(Order.created_at)
+    rows = db.query(
+        day_col,
+        Order.warehouse_id,
+        Order.partner_id,
+        Order.user_id,
+        Order.type,
+        func.coalesce(func.sum(Order.total), 0),
+        func.count(Order.id),
+    ).filter(
+        Order.status == "completed",
+        Order.type.in_(("sale", "return_sale")),
+        Order.created_at.isnot(None),
+    ).group_by(day_col, Order.warehouse_id, Order.partner_id, Order.user_id, Order.type).all()
+    merged: Dict[tuple, dict] = {}
+    for day_str, wh_id, partner_id, user_id, o_type, total, cnt in rows:
+        key = (date.fromisoformat(str(day_str)[:10]), wh_id, partner_id, user_id)
+        m = merged.setdefault(key, {
+            "day": key[0], "warehouse_id": wh_id, "partner_id": partner_id, "user_id": user_id,
+            "sales_total": 0.0, "sales_count": 0, "returns_total": 0.0, "returns_count": 0,
+        })
+        if o_type == "sale":
+            m["sales_total"] += float(total or 0)
+            m["sales_count"] += int(cnt or 0)
+        else:
+            m["returns_total"] += float(total or 0)
+            m["returns_count"] += int(cnt or 0)
+    if merged:
+        now = datetime.now()
+        for m in merged.values():
+            m["updated_at"] = now
+        db.bulk_insert_mappings(DailySalesRollup, list(merged.values()))
+    db.flush()
+    return len(merged)
+
+
+def ensure_sales_rollup(db: Session) -> None:
+    """Yig'indi jadvali bo'sh, lekin bajarilgan sotuvlar mavjud bo'lsa — bir martalik to'ldirish (startup)."""
+    if db.query(DailySalesRollup.id).first() is not None:
+        return
+    if db.query(Order.id).filter(Order.status == "completed").first() is None:
+        return
+    rebuild_sales_rollup(db)
+    db.commit()
+
+
+def daily_sales_totals(
+    db: Session,
+    start: date,
+    end: date,
+    partner_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+) -> Dict[date, dict]:
+    """[start, end] oralig'idagi har kun uchun {"total", "count", "returns"} — bitta guruhlangan so'rov.
+    Ma'lumot bo'lmagan kunlar ham 0 bilan qaytadi."""
+    q = db.query(
+        DailySalesRollup.day,
+        func.coalesce(func.sum(DailySalesRollup.sales_total), 0),
+        func.coalesce(func.sum(DailySalesRollup.sales_count), 0),
+        func.coalesce(func.sum(DailySalesRollup.returns_total), 0),
+    ).filter(DailySalesRollup.day >= start, DailySalesRollup.day <= end)
+    if partner_id is not None:
+        q = q.filter(DailySalesRollup.partner_id == partner_id)
+    if user_id is not None:
+        q = q.filter(DailySalesRollup.user_id == user_id)
+    result = {}
+    d = start
+    while d <= end:
+        result[d] = {"total": 0.0, "count": 0, "returns": 0.0}
+        d += timedelta(days=1)
+    for day, total, cnt, returns in q.group_by(DailySalesRollup.day).all():
+        result[day] = {"total": float(total or 0), "count": int(cnt or 0), "returns": float(returns or 0)}
+    return result
+
+
+def top_partners_by_sales(db: Session, start: date, end: date, limit: int = 5) -> List[tuple]:
+    """Oraliqda eng ko'p sotuv qilingan kontragentlar: [(partner_id, sales_total, sales_count), ...]."""
+    total_col = func.sum(DailySalesRollup.sales_total)
+    return db.query(
+        DailySalesRollup.partner_id,
+        total_col,
+        func.sum(DailySalesRollup.sales_count),
+    ).filter(
+        DailySalesRollup.day >= start,
+        DailySalesRollup.day <= end,
+        DailySalesRollup.partner_id.isnot(None),
+    ).group_by(DailySalesRollup.partner_id).having(
+        func.sum(DailySalesRollup.sales_count) > 0
+    ).order_by(total_col.desc()).limit(limit).all()
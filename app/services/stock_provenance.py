@@ -0,0 +1,120 @@
+"""
+Qoldiq manbalari (provenance) — har bir (ombor, mahsulot) uchun oxirgi kirim hujjatlari:
+tasdiqlangan xaridlar, yakunlangan ishlab chiqarishlar va tasdiqlangan qoldiq hujjatlari.
+Har bir manba turi uchun bitta so'rov (ROW_NUMBER() OVER (PARTITION BY ombor, mahsulot)),
+qator soniga bog'liq emas — /warehouse sahifasidagi N+1 o'rniga.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models.database import (
+    Production,
+    Purchase,
+    PurchaseItem,
+    Recipe,
+    Stock,
+    StockAdjustmentDoc,
+    StockAdjustmentDocItem,
+)
+
+PER_SOURCE = 3  # har bir manba turidan nechta hujjat
+MAX_SOURCES = 8  # bir qatorda jami nechta hujjat ko'rsatiladi
+
+Key = Tuple[int, int]  # (warehouse_id, product_id)
+SourceItem = Tuple[str, str, str]  # (hujjat raqami, havola, sana "dd.mm.yyyy")
+
+
+def _latest(db: Session, rows, per_source: int):
+    """rows (id, number, date, warehouse_id, product_id) dan har bir kalit uchun eng yangi per_source tasi."""
+    sub = rows.subquery()
+    rn = func.row_number().over(
+        partition_by=(sub.c.warehouse_id, sub.c.product_id),
+        order_by=(sub.c.date.desc(), sub.c.id.desc()),
+    ).label("rn")
+    ranked = select(sub, rn).subquery()
+    return db.execute(select(ranked).where(ranked.c.rn <= per_source)).fetchall()
+
+
+def latest_sources(db: Session, keys: Iterable[Key], per_source: int = PER_SOURCE) -> Dict[Key, List[SourceItem]]:
+    """{(warehouse_id, product_id): [(raqam, havola, sana), ...]} — sana bo'yicha kamayish tartibida."""
+    keys = set(keys)
+    if not keys:
+        return {}
+    wh_ids = sorted({wh for wh, _ in keys})
+    pids = sorted({pid for _, pid in keys})
+    found = defaultdict(list)  # key -> [(date, number, url)]
+
+    purchases = (
+        select(
+            Purchase.id.label("id"),
+            Purchase.number.label("number"),
+            Purchase.date.label("date"),
+            Purchase.warehouse_id.label("warehouse_id"),
+            PurchaseItem.product_id.label("product_id"),
+        )
+        .join(PurchaseItem, Purchase.id == PurchaseItem.purchase_id)
+        .where(
+            Purchase.status == "confirmed",
+            Purchase.warehouse_id.in_(wh_ids),
+            PurchaseItem.product_id.in_(pids),
+        )
+        .distinct()
+    )
+    for r in _latest(db, purchases, per_source):
+        found[(r.warehouse_id, r.product_id)].append((r.date, r.number, f"/purchases/edit/{r.id}"))
+
+    # Mahsulot chiqadigan ombor: output_warehouse_id, bo'lmasa warehouse_id.
+    # Faqat kerakli ustunlar tanlanadi — eski bazada productions.max_stage bo'lmasligi mumkin.
+    out_wh = func.coalesce(Production.output_warehouse_id, Production.warehouse_id)
+    productions = (
+        select(
+            Production.id.label("id"),
+            Production.number.label("number"),
+            Production.date.label("date"),
+            out_wh.label("warehouse_id"),
+            Recipe.product_id.label("product_id"),
+        )
+        .join(Recipe, Production.recipe_id == Recipe.id)
+        .where(
+            Production.status == "completed",
+            out_wh.in_(wh_ids),
+            Recipe.product_id.in_(pids),
+        )
+    )
+    for r in _latest(db, productions, per_source):
+        found[(r.warehouse_id, r.product_id)].append((r.date, r.number, "/production/orders"))
+
+    adjustments = (
+        select(
+            StockAdjustmentDoc.id.label("id"),
+            StockAdjustmentDoc.number.label("number"),
+            StockAdjustmentDoc.date.label("date"),
+            StockAdjustmentDocItem.warehouse_id.label("warehouse_id"),
+            StockAdjustmentDocItem.product_id.label("product_id"),
+        )
+        .join(StockAdjustmentDocItem, StockAdjustmentDoc.id == StockAdjustmentDocItem.doc_id)
+        .where(
+            StockAdjustmentDoc.status == "confirmed",
+            StockAdjustmentDocItem.warehouse_id.in_(wh_ids),
+            StockAdjustmentDocItem.product_id.in_(pids),
+        )
+        .distinct()
+    )
+    for r in _latest(db, adjustments, per_source):
+        found[(r.warehouse_id, r.product_id)].append((r.date, r.number, f"/qoldiqlar/tovar/hujjat/{r.id}"))
+
+    result = {}
+    for key in keys:
+        docs = sorted(found.get(key, ()), key=lambda x: (x[0] is not None, x[0]), reverse=True)[:MAX_SOURCES]
+        result[key] = [(number, url, d.strftime("%d.%m.%Y") if d else "") for d, number, url in docs]
+    return result
+
+
+def stock_sources_for(db: Session, stocks: Iterable[Stock]) -> Dict[int, List[SourceItem]]:
+    """{stock.id: manbalar} — warehouse/list.html shablonidagi stock_sources shakli."""
+    stocks = list(stocks)
+    by_key = latest_sources(db, {(s.warehouse_id, s.product_id) for s in stocks})
+    return {s.id: by_key.get((s.warehouse_id, s.product_id), []) for s in stocks}
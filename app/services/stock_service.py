@@ -1,8 +1,11 @@
 """Ombor harakati (StockMovement) yaratish va o'chirish."""
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm import Session
 
-from app.models.database import Stock, StockMovement
+from app.models.database import Stock, StockMovement, StockSourceFlag, StockSnapshot, StockAdjustmentDoc
+from app.utils.live_cache import STOCK_KEYS
+from app.utils.live_events import invalidate_on_commit, publish_on_commit
 
 
 def create_stock_movement(
@@ -18,24 +21,11 @@ def create_stock_movement(
     note: str = None
 ):
     """Har bir operatsiya uchun StockMovement yozuvini yaratish.
-    Chiqim (quantity_change < 0) bo'lganda avval bitta ombor+mahsulot uchun barcha Stock qatorlarini birlashtiradi."""
-    rows = db.query(Stock).filter(
+    stocks jadvalida (warehouse_id, product_id) unique — bitta ombor+mahsulot uchun bitta qator."""
+    stock = db.query(Stock).filter(
         Stock.warehouse_id == warehouse_id,
         Stock.product_id == product_id
-    ).all()
-    if len(rows) > 1:
-        total = sum(float(r.quantity or 0) for r in rows)
-        keep = rows[0]
-        keep.quantity = total
-        keep.updated_at = datetime.now()
-        for r in rows[1:]:
-            db.delete(r)
-        db.flush()
-        stock = keep
-    elif len(rows) == 1:
-        stock = rows[0]
-    else:
-        stock = None
+    ).first()
 
     if stock:
         stock.quantity = (stock.quantity or 0) + quantity_change
@@ -69,13 +59,406 @@ def create_stock_movement(
         note=note
     )
     db.add(movement)
+    _mark_stock_source(db, warehouse_id, product_id)
+    invalidate_on_commit(db, STOCK_KEYS)
+    publish_on_commit(db, "stock", {"warehouse_id": warehouse_id, "product_id": product_id, "quantity": quantity_after})
     return movement
 
 
+def create_stock_movements_bulk(
+    db: Session,
+    items,
+    operation_type: str,
+    document_type: str,
+    document_id: int,
+    document_number: str = None,
+    user_id: int = None,
+    note: str = None
+) -> int:
+    """Bitta hujjatning ko'p qatorli harakatlari: items — (warehouse_id, product_id, quantity_change) ro'yxati.
+    Natija create_stock_movement ni ketma-ket chaqirish bilan bir xil, lekin barcha Stock qatorlari bitta so'rovda
+    olinadi va harakatlar bitta bulk_insert_mappings bilan yoziladi."""
+    return create_document_movements_bulk(
+        db,
+        [(document_id, document_number, w, p, q) for w, p, q in items],
+        operation_type,
+        document_type,
+        user_id=user_id,
+        note=note,
+    )
+
+
+def load_stock_rows(db: Session, keys) -> dict:
+    """{(warehouse_id, product_id): Stock} — berilgan kalitlar uchun mavjud qatorlar bitta so'rovda."""
+    keys = set(keys)
+    if not keys:
+        return {}
+    rows = db.query(Stock).filter(
+        Stock.warehouse_id.in_({k[0] for k in keys}),
+        Stock.product_id.in_({k[1] for k in keys}),
+    ).all()
+    return {(r.warehouse_id, r.product_id): r for r in rows if (r.warehouse_id, r.product_id) in keys}
+
+
+def create_document_movements_bulk(
+    db: Session,
+    items,
+    operation_type: str,
+    document_type: str,
+    user_id: int = None,
+    note: str = None,
+    stocks: dict = None,
+) -> int:
+    """Bir turdagi bir nechta hujjat harakatlari: items — (document_id, document_number, warehouse_id, product_id,
+    quantity_change). stocks — load_stock_rows natijasi (chaqiruvchi oldindan yuklagan bo'lsa, qayta so'ralmaydi)."""
+    items = [(doc_id, doc_number, int(w), int(p), float(q or 0)) for doc_id, doc_number, w, p, q in items]
+    if not items:
+        return 0
+    keys = {(w, p) for _d, _n, w, p, _q in items}
+    stocks = dict(stocks) if stocks is not None else load_stock_rows(db, keys)
+    now = datetime.now()
+    missing = [k for k in keys if k not in stocks]
+    for key in missing:
+        stocks[key] = Stock(warehouse_id=key[0], product_id=key[1], quantity=0)
+        db.add(stocks[key])
+    if missing:
+        db.flush()
+    movements = []
+    for doc_id, doc_number, wid, pid, change in items:
+        stock = stocks[(wid, pid)]
+        stock.quantity = max(0.0, float(stock.quantity or 0) + change)
+        stock.updated_at = now
+        movements.append({
+            "stock_id": stock.id,
+            "warehouse_id": wid,
+            "product_id": pid,
+            "operation_type": operation_type,
+            "document_type": document_type,
+            "document_id": doc_id,
+            "document_number": doc_number,
+            "quantity_change": change,
+            "quantity_after": stock.quantity,
+            "user_id": user_id,
+            "note": note,
+            "created_at": now,
+        })
+    db.bulk_insert_mappings(StockMovement, movements)
+    mark_stock_sources(db, keys)
+    invalidate_on_commit(db, STOCK_KEYS)
+    for (wid, pid) in keys:
+        publish_on_commit(db, "stock", {"warehouse_id": wid, "product_id": pid, "quantity": stocks[(wid, pid)].quantity})
+    return len(movements)
+
+
+def _mark_stock_source(db: Session, warehouse_id: int, product_id: int) -> None:
+    """Ombor+mahsulot uchun tasdiqlangan manba bayrog'ini o'rnatish (harakat faqat tasdiqlash paytida yoziladi)."""
+    now = datetime.now()
+    flag = db.query(StockSourceFlag).filter(
+        StockSourceFlag.warehouse_id == warehouse_id,
+        StockSourceFlag.product_id == product_id,
+    ).first()
+    if flag:
+        flag.has_confirmed_source = True
+        flag.last_movement_at = now
+        return
+    db.add(StockSourceFlag(
+        warehouse_id=warehouse_id,
+        product_id=product_id,
+        has_confirmed_source=True,
+        last_movement_at=now,
+    ))
+    db.flush()
+
+
+def mark_stock_sources(db: Session, keys) -> None:
+    """_mark_stock_source ning to'plam varianti: bir so'rovda mavjud bayroqlar, yangilari bitta INSERT bilan."""
+    keys = {(int(w), int(p)) for w, p in keys if w is not None and p is not None}
+    if not keys:
+        return
+    now = datetime.now()
+    existing = {
+        (f.warehouse_id, f.product_id): f
+        for f in db.query(StockSourceFlag).filter(
+            StockSourceFlag.warehouse_id.in_({k[0] for k in keys}),
+            StockSourceFlag.product_id.in_({k[1] for k in keys}),
+        ).all()
+    }
+    new_rows = []
+    for key in keys:
+        flag = existing.get(key)
+        if flag is not None:
+            flag.has_confirmed_source = True
+            flag.last_movement_at = now
+        else:
+            new_rows.append({
+                "warehouse_id": key[0],
+                "product_id": key[1],
+                "has_confirmed_source": True,
+                "last_movement_at": now,
+                "updated_at": now,
+            })
+    if new_rows:
+        db.bulk_insert_mappings(StockSourceFlag, new_rows)
+
+
+def _confirmed_source_query(db: Session):
+    """(warehouse_id, product_id, oxirgi harakat) — tasdiqlangan hujjat harakati bor kalitlar.
+    Qoldiq tuzatish hujjati faqat status == confirmed bo'lsa hisobga olinadi."""
+    return (
+        db.query(StockMovement.warehouse_id, StockMovement.product_id, func.max(StockMovement.created_at))
+        .outerjoin(
+            StockAdjustmentDoc,
+            and_(
+                StockMovement.document_type == "StockAdjustmentDoc",
+                StockAdjustmentDoc.id == StockMovement.document_id,
+            ),
+        )
+        .filter(or_(
+            StockMovement.document_type.is_(None),
+            StockMovement.document_type != "StockAdjustmentDoc",
+            StockAdjustmentDoc.status == "confirmed",
+        ))
+        .group_by(StockMovement.warehouse_id, StockMovement.product_id)
+    )
+
+
+def refresh_stock_source_flags(db: Session, keys) -> None:
+    """Berilgan (warehouse_id, product_id) kalitlari uchun bayroqni harakatlardan qayta hisoblash (harakat o'chirilganda)."""
+    keys = {(int(w), int(p)) for w, p in keys if w is not None and p is not None}
+    if not keys:
+        return
+    wh_ids = {k[0] for k in keys}
+    prod_ids = {k[1] for k in keys}
+    sourced = {}
+    for wid, pid, last_at in _confirmed_source_query(db).filter(
+        StockMovement.warehouse_id.in_(wh_ids),
+        StockMovement.product_id.in_(prod_ids),
+    ).all():
+        if (wid, pid) in keys:
+            sourced[(wid, pid)] = last_at
+    existing = {
+        (f.warehouse_id, f.product_id): f
+        for f in db.query(StockSourceFlag).filter(
+            StockSourceFlag.warehouse_id.in_(wh_ids),
+            StockSourceFlag.product_id.in_(prod_ids),
+        ).all()
+    }
+    for key in keys:
+        flag = existing.get(key)
+        if flag is None:
+            if key not in sourced:
+                continue
+            flag = StockSourceFlag(warehouse_id=key[0], product_id=key[1])
+            db.add(flag)
+        flag.has_confirmed_source = key in sourced
+        flag.last_movement_at = sourced.get(key)
+    db.flush()
+
+
+def rebuild_stock_source_flags(db: Session) -> int:
+    """Barcha bayroqlarni StockMovement tarixidan qayta qurish (birinchi ishga tushish va qayta hisoblashda)."""
+    db.query(StockSourceFlag).delete(synchronize_session=False)
+    rows = _confirmed_source_query(db).all()
+    now = datetime.now()
+    db.bulk_insert_mappings(StockSourceFlag, [
+        {
+            "warehouse_id": wid,
+            "product_id": pid,
+            "has_confirmed_source": True,
+            "last_movement_at": last_at,
+            "updated_at": now,
+        }
+        for wid, pid, last_at in rows
+        if wid is not None and pid is not None
+    ])
+    db.flush()
+    return len(rows)
+
+
+def ensure_stock_source_flags(db: Session) -> None:
+    """Bayroq jadvali bo'sh, lekin harakatlar mavjud bo'lsa — bir martalik to'ldirish (startup)."""
+    if db.query(StockSourceFlag.id).first() is not None:
+        return
+    if db.query(StockMovement.id).first() is None:
+        return
+    rebuild_stock_source_flags(db)
+    db.commit()
+
+
 def delete_stock_movements_for_document(db: Session, document_type: str, document_id: int) -> int:
     """Hujjat tasdiqi bekor qilinganda shu hujjatga tegishli StockMovement yozuvlarini o'chiradi."""
+    keys = db.query(StockMovement.warehouse_id, StockMovement.product_id).filter(
+        StockMovement.document_type == document_type,
+        StockMovement.document_id == document_id,
+    ).distinct().all()
+    first_at = db.query(func.min(StockMovement.created_at)).filter(
+        StockMovement.document_type == document_type,
+        StockMovement.document_id == document_id,
+    ).scalar()
     deleted = db.query(StockMovement).filter(
         StockMovement.document_type == document_type,
         StockMovement.document_id == document_id,
     ).delete(synchronize_session=False)
+    if deleted:
+        refresh_stock_source_flags(db, keys)
+        invalidate_stock_snapshots(db, first_at)
     return deleted
+
+
+def document_movement_totals(db: Session, document_type: str, document_id: int) -> dict:
+    """{(warehouse_id, product_id): jami quantity_change} — hujjat yozgan harakatlar."""
+    rows = db.query(
+        StockMovement.warehouse_id, StockMovement.product_id, func.sum(StockMovement.quantity_change),
+    ).filter(
+        StockMovement.document_type == document_type,
+        StockMovement.document_id == document_id,
+        StockMovement.warehouse_id.isnot(None),
+        StockMovement.product_id.isnot(None),
+    ).group_by(StockMovement.warehouse_id, StockMovement.product_id).all()
+    return {(w, p): float(total or 0) for w, p, total in rows}
+
+
+def reverse_document_movements(db: Session, document_type: str, document_id: int, totals: dict = None) -> int:
+    """Hujjat harakatlarini bekor qiladi: har (ombor, mahsulot) qoldig'idan yozilgan o'zgarish ayiriladi (0 dan pastga
+    tushmaydi), keyin harakatlar o'chiriladi. totals — document_movement_totals natijasi. O'chirilgan harakatlar soni."""
+    if totals is None:
+        totals = document_movement_totals(db, document_type, document_id)
+    stocks = load_stock_rows(db, totals)
+    now = datetime.now()
+    for key, change in totals.items():
+        stock = stocks.get(key)
+        if stock is None:
+            if change >= 0:
+                continue
+            stock = stocks[key] = Stock(warehouse_id=key[0], product_id=key[1], quantity=0)
+            db.add(stock)
+        stock.quantity = max(0.0, float(stock.quantity or 0) - change)
+        stock.updated_at = now
+        publish_on_commit(db, "stock", {"warehouse_id": key[0], "product_id": key[1], "quantity": stock.quantity})
+    db.flush()
+    deleted = delete_stock_movements_for_document(db, document_type, document_id)
+    invalidate_on_commit(db, STOCK_KEYS)
+    return deleted
+
+
+# Kunlik snapshotlar shu muddatdan eskirsa faqat oy oxiridagisi qoldiriladi
+SNAPSHOT_DAILY_KEEP_DAYS = 90
+
+
+def _last_quantities_in_window(db: Session, start: datetime = None, end: datetime = None, wh_id: int = None) -> dict:
+    """[start, end) oralig'idagi har bir (ombor, mahsulot) uchun oxirgi harakatning quantity_after qiymati."""
+    sub = db.query(
+        StockMovement.warehouse_id.label("wid"),
+        StockMovement.product_id.label("pid"),
+        func.max(StockMovement.created_at).label("last_at"),
+    )
+    if start is not None:
+        sub = sub.filter(StockMovement.created_at >= start)
+    if end is not None:
+        sub = sub.filter(StockMovement.created_at < end)
+    if wh_id:
+        sub = sub.filter(StockMovement.warehouse_id == wh_id)
+    sub = sub.group_by(StockMovement.warehouse_id, StockMovement.product_id).subquery()
+    rows = (
+        db.query(StockMovement.warehouse_id, StockMovement.product_id, StockMovement.id, StockMovement.quantity_after)
+        .join(sub, and_(
+            StockMovement.warehouse_id == sub.c.wid,
+            StockMovement.product_id == sub.c.pid,
+            StockMovement.created_at == sub.c.last_at,
+        ))
+        .all()
+    )
+    result = {}
+    last_ids = {}
+    for wid, pid, mid, qty_after in rows:
+        key = (wid, pid)
+        # Bir xil vaqtdagi harakatlar — keyingi yozilgani (katta id) hisobga olinadi
+        if key not in last_ids or mid > last_ids[key]:
+            last_ids[key] = mid
+            result[key] = float(qty_after or 0)
+    return result
+
+
+def _nearest_snapshot_date(db: Session, on_or_before: date):
+    return db.query(func.max(StockSnapshot.snapshot_date)).filter(StockSnapshot.snapshot_date <= on_or_before).scalar()
+
+
+def stock_quantities_as_of(db: Session, as_of: date, wh_id: int = None) -> dict:
+    """as_of kun oxiridagi qoldiq {(warehouse_id, product_id): quantity}.
+    Eng yaqin snapshotdan boshlanadi va faqat undan keyingi harakatlar o'qiladi."""
+    end = datetime.combine(as_of + timedelta(days=1), datetime.min.time())
+    snap_date = _nearest_snapshot_date(db, as_of)
+    if snap_date is None:
+        return _last_quantities_in_window(db, end=end, wh_id=wh_id)
+    q = db.query(StockSnapshot.warehouse_id, StockSnapshot.product_id, StockSnapshot.quantity).filter(
+        StockSnapshot.snapshot_date == snap_date
+    )
+    if wh_id:
+        q = q.filter(StockSnapshot.warehouse_id == wh_id)
+    result = {(wid, pid): float(qty or 0) for wid, pid, qty in q.all()}
+    if snap_date < as_of:
+        start = datetime.combine(snap_date + timedelta(days=1), datetime.min.time())
+        result.update(_last_quantities_in_window(db, start=start, end=end, wh_id=wh_id))
+    return result
+
+
+def write_stock_snapshot(db: Session, snapshot_date: date) -> int:
+    """snapshot_date kun yakunidagi qoldiqni stock_snapshots ga yozadi (faqat o'tgan kunlar uchun).
+    Oldingi snapshot + shu oraliqdagi harakatlardan quriladi."""
+    if snapshot_date >= date.today():
+        return 0
+    quantities = stock_quantities_as_of(db, snapshot_date)
+    db.query(StockSnapshot).filter(StockSnapshot.snapshot_date == snapshot_date).delete(synchronize_session=False)
+    now = datetime.now()
+    db.bulk_insert_mappings(StockSnapshot, [
+        {"snapshot_date": snapshot_date, "warehouse_id": wid, "product_id": pid, "quantity": qty, "created_at": now}
+        for (wid, pid), qty in quantities.items()
+        if wid is not None and pid is not None
+    ])
+    db.flush()
+    return len(quantities)
+
+
+def fill_stock_snapshots(db: Session, until: date, keep_days: int = SNAPSHOT_DAILY_KEEP_DAYS) -> tuple:
+    """Oxirgi snapshotdan until gacha yetishmagan kunlarni yozadi: invalidate_stock_snapshots o'chirgan oraliq
+    va server o'chiq bo'lgan kechalar. keep_days dan eski kunlardan faqat oy oxiri (prune natijasi bilan bir xil).
+    Snapshot umuman bo'lmasa — faqat until. Qaytaradi: (kunlar, qatorlar)."""
+    latest = _nearest_snapshot_date(db, until)
+    if latest is not None and latest >= until:
+        return 0, 0
+    day = until if latest is None else latest + timedelta(days=1)
+    cutoff = date.today() - timedelta(days=keep_days)
+    days = rows = 0
+    while day <= until:
+        if day >= cutoff or (day + timedelta(days=1)).month != day.month:
+            rows += write_stock_snapshot(db, day)
+            days += 1
+        day += timedelta(days=1)
+    return days, rows
+
+
+def prune_stock_snapshots(db: Session, keep_days: int = SNAPSHOT_DAILY_KEEP_DAYS) -> int:
+    """keep_days dan eski kunlik snapshotlarni o'chiradi, har oyning oxirgi snapshoti saqlanadi."""
+    cutoff = date.today() - timedelta(days=keep_days)
+    dates = [r[0] for r in db.query(StockSnapshot.snapshot_date).filter(
+        StockSnapshot.snapshot_date < cutoff
+    ).distinct().all()]
+    month_last = {}
+    for d in dates:
+        key = (d.year, d.month)
+        if key not in month_last or d > month_last[key]:
+            month_last[key] = d
+    to_delete = [d for d in dates if d != month_last[(d.year, d.month)]]
+    if not to_delete:
+        return 0
+    return db.query(StockSnapshot).filter(StockSnapshot.snapshot_date.in_(to_delete)).delete(synchronize_session=False)
+
+
+def invalidate_stock_snapshots(db: Session, since) -> int:
+    """Harakat tarixi o'zgarganda (o'chirish) shu sanadan keyingi snapshotlarni bekor qiladi.
+    O'chirilgan oraliqni kechki vazifa fill_stock_snapshots bilan qayta yozadi."""
+    if since is None:
+        return 0
+    if isinstance(since, datetime):
+        since = since.date()
+    return db.query(StockSnapshot).filter(StockSnapshot.snapshot_date >= since).delete(synchronize_session=False)
@@ -0,0 +1,78 @@
+/*
+ * /api/stream (SSE) mijozi — sahifadagi barcha obunalar uchun bitta EventSource.
+ * Hodisa kelganda tegishli /live manzili qayta o'qiladi (qisqa debounce bilan).
+ * EventSource yo'q yoki server ulanishni rad etsa (401, proxy) — oldingi polling ga qaytadi.
+ *
+ *   LiveStream.watch(['sales'], '/dashboard/executive/live', function (data) { ... }, 60000);
+ */
+(function (window) {
+    'use strict';
+
+    var DEBOUNCE_MS = 1000;
+    var watchers = [];
+    var source = null;
+    var polling = false;
+
+    function load(w) {
+        fetch(w.url, { credentials: 'same-origin', headers: { 'Accept': 'application/json' } })
+            .then(function (r) { return r.ok ? r.json() : null; })
+            .then(function (data) { if (data) w.onData(data); })
+            .catch(function () { });
+    }
+
+    function schedule(w) {
+        if (w.timer) return;
+        w.timer = setTimeout(function () {
+            w.timer = null;
+            load(w);
+        }, DEBOUNCE_MS);
+    }
+
+    function startPolling(w) {
+        load(w);
+        w.poller = setInterval(function () { load(w); }, w.pollMs);
+    }
+
+    function fallBackToPolling() {
+        if (polling) return;
+        polling = true;
+        if (source) {
+            source.close();
+            source = null;
+        }
+        watchers.forEach(startPolling);
+    }
+
+    function listen(w) {
+        w.events.forEach(function (name) {
+            source.addEventListener(name, function () { schedule(w); });
+        });
+    }
+
+    function connect() {
+        if (!window.EventSource) {
+            fallBackToPolling();
+            return;
+        }
+        source = new EventSource('/api/stream');
+        // "ready" har (qayta) ulanishda keladi — uzilish paytida o'tkazib yuborilganlarni yangilash
+        source.addEventListener('ready', function () { watchers.forEach(load); });
+        source.onerror = function () {
+            // CONNECTING — brauzer o'zi qayta ulanadi (retry: 5000); CLOSED — server rad etdi
+            if (source && source.readyState === EventSource.CLOSED) fallBackToPolling();
+        };
+    }
+
+    window.LiveStream = {
+        watch: function (events, url, onData, pollMs) {
+            var w = { events: events, url: url, onData: onData, pollMs: pollMs || 60000, timer: null, poller: null };
+            watchers.push(w);
+            if (polling) {
+                startPolling(w);
+                return;
+            }
+            if (!source) connect();
+            if (source) listen(w);
+        }
+    };
+})(window);
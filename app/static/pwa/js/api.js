@@ -17,7 +17,7 @@ const API = {
         return await response.json();
     },
 
-    // Send Location
+    // Send Location — tarmoq bo'lmasa yoki server javob bermasa nuqta LocationBuffer ga tushadi
     async sendLocation(userType, latitude, longitude, accuracy, battery, token) {
         console.log('=== SENDING LOCATION ===');
         console.log('User Type:', userType);
@@ -37,18 +37,65 @@ const API = {
         const url = `${API_BASE_URL}/api/${userType}/location`;
         console.log('URL:', url);
 
-        const response = await fetch(url, {
-            method: 'POST',
-            body: formData
-        });
+        const point = {
+            latitude: latitude,
+            longitude: longitude,
+            accuracy: accuracy || 0,
+            battery: battery || 100,
+            recorded_at: new Date().toISOString()
+        };
+        let response = null;
+        if (navigator.onLine !== false) {
+            try {
+                response = await fetch(url, {
+                    method: 'POST',
+                    body: formData
+                });
+            } catch (error) {
+                console.warn('Tarmoq xatosi:', error.message);
+            }
+        }
+        if (!response || response.status >= 500) {
+            LocationBuffer.add(userType, point);
+            return {
+                success: false,
+                buffered: true,
+                error: 'Aloqa yo\'q — lokatsiya saqlandi, aloqa tiklanganda yuboriladi'
+            };
+        }
 
         const result = await response.json();
         console.log('Response Status:', response.status);
         console.log('Response:', result);
 
+        if (result.success) {
+            LocationBuffer.flush(token);
+        }
         return result;
     },
 
+    // Send buffered (offline) locations in one request
+    // points: [{latitude, longitude, accuracy, battery, speed, recorded_at (ISO)}]
+    async sendLocations(userType, points, token) {
+        const response = await fetch(`${API_BASE_URL}/api/${userType}/location/batch`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ token: token, points: points })
+        });
+        return await response.json();
+    },
+
+    // Server-Sent Events (/api/stream): handlers = {notification: fn(data), stock: fn(data), ...}
+    // EventSource bo'lmasa null — sahifa jonli yangilanishsiz ishlayveradi
+    openStream(token, handlers) {
+        if (!window.EventSource) return null;
+        const source = new EventSource(`${API_BASE_URL}/api/stream?token=${encodeURIComponent(token)}`);
+        Object.keys(handlers).forEach(name => {
+            source.addEventListener(name, e => handlers[name](JSON.parse(e.data)));
+        });
+        return source;
+    },
+
     // Get Orders (Agent only)
     async getOrders(token) {
         const response = await fetch(`${API_BASE_URL}/api/agent/orders?token=${encodeURIComponent(token)}`);
@@ -59,6 +106,16 @@ const API = {
     async getPartners(token) {
         const response = await fetch(`${API_BASE_URL}/api/agent/partners?token=${encodeURIComponent(token)}`);
         return await response.json();
+    },
+
+    // Nearest Partners (Agent only) — lat/lng bo'lmasa server oxirgi GPS nuqtasini oladi
+    async getNearestPartners(token, latitude, longitude, limit = 10) {
+        let url = `${API_BASE_URL}/api/agent/partners/nearest?token=${encodeURIComponent(token)}&limit=${limit}`;
+        if (latitude != null && longitude != null) {
+            url += `&lat=${latitude}&lng=${longitude}`;
+        }
+        const response = await fetch(url);
+        return await response.json();
     }
 };
 
@@ -82,6 +139,49 @@ const Storage = {
     }
 };
 
+// Oflayn GPS buferi: yuborilmagan pinglar localStorage da saqlanadi va aloqa tiklanganda
+// /api/{userType}/location/batch orqali yozilgan vaqti (recorded_at) bilan yuboriladi
+const LocationBuffer = {
+    KEY: 'pendingLocations',
+    MAX_POINTS: 5000,  // serverdagi MAX_BATCH_POINTS; to'lsa eng eskilari tashlanadi
+    flushing: false,
+
+    add(userType, point) {
+        const pending = Storage.get(this.KEY) || {};
+        pending[userType] = (pending[userType] || []).concat([point]).slice(-this.MAX_POINTS);
+        Storage.set(this.KEY, pending);
+    },
+
+    count() {
+        const pending = Storage.get(this.KEY) || {};
+        return Object.keys(pending).reduce((n, userType) => n + pending[userType].length, 0);
+    },
+
+    async flush(token) {
+        if (this.flushing || !token || !this.count()) return;
+        this.flushing = true;
+        try {
+            const pending = Storage.get(this.KEY);
+            for (const userType of Object.keys(pending)) {
+                const points = pending[userType];
+                if (!points.length) continue;
+                const result = await API.sendLocations(userType, points, token);
+                if (!result.success) return;  // token eskirgan va h.k. — keyingi urinishda
+                // Yuborish paytida qo'shilgan nuqtalar saqlanib qoladi
+                const current = Storage.get(this.KEY) || {};
+                current[userType] = (current[userType] || []).slice(points.length);
+                Storage.set(this.KEY, current);
+            }
+        } catch (error) {
+            console.warn('GPS buferi yuborilmadi:', error.message);
+        } finally {
+            this.flushing = false;
+        }
+    }
+};
+
+window.addEventListener('online', () => LocationBuffer.flush(Session.getToken()));
+
 // Session Management
 const Session = {
     save(userData, token) {
@@ -0,0 +1,82 @@
+"""
+So'rov doirasidagi autentifikatsiya konteksti.
+auth_middleware tokenni bir marta tekshiradi va foydalanuvchini yuklaydi — natija request.state.auth da;
+get_current_user uni qayta ishlatadi (HMAC va User so'rovi takrorlanmaydi).
+Tekshirilgan tokenlar va faol foydalanuvchilar qisqa TTL keshda; foydalanuvchi tahrirlansa invalidate_user().
+"""
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.database import SessionLocal, User
+from app.utils.auth import get_user_from_token
+from app.utils.live_cache import TTLCache
+
+AUTH_TTL = 30  # sekund — tahrirdan keyin invalidate_user() chaqiriladi, TTL faqat zaxira
+
+auth_cache = TTLCache(maxsize=1024, default_ttl=AUTH_TTL)
+
+
+def _token_key(token: str) -> str:
+    return f"token:{token}"
+
+
+def _user_key(user_id: int) -> str:
+    # Oxiridagi ":" — "user:1" prefiksi "user:10" ni ham o'chirib yubormasligi uchun
+    return f"user:{user_id}:"
+
+
+class AuthContext:
+    """Middleware tomonidan tekshirilgan token va (sessiyadan ajratilgan) faol foydalanuvchi."""
+
+    __slots__ = ("token", "user")
+
+    def __init__(self, token: str, user: User):
+        self.token = token
+        self.user = user
+
+    @property
+    def user_id(self) -> int:
+        return self.user.id
+
+
+def decode_token(token: Optional[str]) -> Optional[dict]:
+    """get_user_from_token, natija keshlanadi (yaroqsiz token keshlanmaydi)."""
+    if not token:
+        return None
+    key = _token_key(token)
+    user_data = auth_cache.get(key)
+    if user_data is None:
+        user_data = get_user_from_token(token)
+        if user_data:
+            auth_cache.set(key, user_data)
+    return user_data
+
+
+def get_active_user(user_id: int) -> Optional[User]:
+    """Faol foydalanuvchi (sessiyaga bog'lanmagan nusxa). Keshda bo'lmasa — qisqa SessionLocal bilan yuklanadi.
+    Qaytgan obyektni o'zgartirmang: route sessiyasida db.merge(user, load=False) orqali ishlating."""
+    key = _user_key(user_id)
+    user = auth_cache.get(key)
+    if user is not None:
+        return user
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        if not user or not user.is_active:
+            return None
+        db.expunge(user)
+    finally:
+        db.close()
+    auth_cache.set(key, user)
+    return user
+
+
+def attach_user(db: Session, user: User) -> User:
+    """Keshdagi foydalanuvchini route sessiyasiga qo'shadi — SELECT bajarilmaydi."""
+    return db.merge(user, load=False)
+
+
+def invalidate_user(user_id: int) -> None:
+    """Foydalanuvchi tahrirlandi, o'chirildi yoki faolsizlantirildi."""
+    auth_cache.invalidate(_user_key(user_id))
@@ -4,18 +4,17 @@ Excel va PDF export funksiyalari
 """
 
 from fastapi import Request, Depends
-from fastapi.responses import StreamingResponse, RedirectResponse
+from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 from sqlalchemy import func
-import io
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill
 
 from app.models.database import (
     get_db, User, Order, OrderItem, Agent, Stock, Product, Partner
 )
 from app.utils.auth import get_user_from_token
+from app.utils.date_range import on_day, since_day
+from app.utils.excel_stream import XlsxWriter, xlsx_response
 
 
 async def export_executive_dashboard(request: Request, db: Session):
@@ -37,147 +36,85 @@ async def export_executive_dashboard(request: Request, db: Session):
     # Get data
     today = datetime.now().date()
     week_ago = today - timedelta(days=7)
-    
-    # Create Excel workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Rahbariyat Hisoboti"
-    
-    # Header styling
-    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
-    header_font = Font(color="FFFFFF", bold=True, size=12)
-    
-    # Title
-    ws['A1'] = 'TOTLI HOLVA - Rahbariyat Hisoboti'
-    ws['A1'].font = Font(bold=True, size=16)
-    ws['A2'] = f'Sana: {datetime.now().strftime("%d.%m.%Y %H:%M")}'
-    
-    # Today's sales
-    today_sales = db.query(func.sum(Order.total)).filter(
-        func.date(Order.created_at) == today,
-        Order.status == 'completed'
-    ).scalar() or 0
-    
-    yesterday_sales = db.query(func.sum(Order.total)).filter(
-        func.date(Order.created_at) == today - timedelta(days=1),
-        Order.status == 'completed'
-    ).scalar() or 0
-    
-    sales_growth = 0
-    if yesterday_sales > 0:
-        sales_growth = ((today_sales - yesterday_sales) / yesterday_sales) * 100
-    
-    # KPI Section
-    ws['A4'] = 'ASOSIY KO\'RSATKICHLAR'
-    ws['A4'].font = header_font
-    ws['A4'].fill = header_fill
-    ws.merge_cells('A4:B4')
-    
-    ws['A5'] = 'Bugungi savdo'
-    ws['B5'] = f"{today_sales:,.0f} so'm"
-    ws['A6'] = 'O\'sish'
-    ws['B6'] = f"{sales_growth:.1f}%"
-    
-    today_orders = db.query(func.count(Order.id)).filter(
-        func.date(Order.created_at) == today
-    ).scalar() or 0
-    
-    ws['A7'] = 'Bugungi buyurtmalar'
-    ws['B7'] = today_orders
-    
-    active_agents = db.query(func.count(Agent.id)).filter(
-        Agent.is_active == True
-    ).scalar() or 0
-    
-    ws['A8'] = 'Faol agentlar'
-    ws['B8'] = active_agents
-    
-    # Top Products
-    ws['A10'] = 'TOP 5 MAHSULOTLAR'
-    ws['A10'].font = header_font
-    ws['A10'].fill = header_fill
-    ws.merge_cells('A10:C10')
-    
-    ws['A11'] = '#'
-    ws['B11'] = 'Mahsulot'
-    ws['C11'] = 'Miqdor'
-    for cell in ['A11', 'B11', 'C11']:
-        ws[cell].font = Font(bold=True)
-        ws[cell].fill = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
-    
-    top_products = db.query(
-        Product.name,
-        func.sum(OrderItem.quantity).label('total_qty')
-    ).join(
-        OrderItem, Product.id == OrderItem.product_id
-    ).join(
-        Order, OrderItem.order_id == Order.id
-    ).filter(
-        func.date(Order.created_at) >= week_ago,
-        Order.status == 'completed'
-    ).group_by(Product.id, Product.name).order_by(
-        func.sum(OrderItem.quantity).desc()
-    ).limit(5).all()
-    
-    row = 12
-    for i, (name, qty) in enumerate(top_products, 1):
-        ws[f'A{row}'] = i
-        ws[f'B{row}'] = name
-        ws[f'C{row}'] = int(qty)
-        row += 1
-    
-    # Top Agents
-    ws[f'A{row+1}'] = 'TOP 5 AGENTLAR'
-    ws[f'A{row+1}'].font = header_font
-    ws[f'A{row+1}'].fill = header_fill
-    ws.merge_cells(f'A{row+1}:D{row+1}')
-    
-    row += 2
-    ws[f'A{row}'] = '#'
-    ws[f'B{row}'] = 'Agent'
-    ws[f'C{row}'] = 'Savdo'
-    ws[f'D{row}'] = 'Buyurtmalar'
-    for cell in [f'A{row}', f'B{row}', f'C{row}', f'D{row}']:
-        ws[cell].font = Font(bold=True)
-        ws[cell].fill = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
-    
-    top_agents = db.query(
-        Agent.full_name,
-        func.sum(Order.total).label('total_sales'),
-        func.count(Order.id).label('order_count')
-    ).join(
-        Order, Agent.id == Order.partner_id
-    ).filter(
-        func.date(Order.created_at) >= week_ago,
-        Order.status == 'completed'
-    ).group_by(Agent.id, Agent.full_name).order_by(
-        func.sum(Order.total).desc()
-    ).limit(5).all()
-    
-    row += 1
-    for i, agent in enumerate(top_agents, 1):
-        ws[f'A{row}'] = i
-        ws[f'B{row}'] = agent.full_name
-        ws[f'C{row}'] = f"{agent.total_sales:,.0f} so'm"
-        ws[f'D{row}'] = agent.order_count
-        row += 1
-    
-    # Adjust column widths
-    ws.column_dimensions['A'].width = 5
-    ws.column_dimensions['B'].width = 30
-    ws.column_dimensions['C'].width = 20
-    ws.column_dimensions['D'].width = 15
-    
-    # Save to BytesIO
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
+
+    def build():
+        xw = XlsxWriter("Rahbariyat Hisoboti", widths=(5, 30, 20, 15))
+        xw.title('TOTLI HOLVA - Rahbariyat Hisoboti', size=16)
+        xw.row([f'Sana: {datetime.now().strftime("%d.%m.%Y %H:%M")}'])
+        xw.row()
+
+        # Today's sales
+        today_sales = db.query(func.sum(Order.total)).filter(
+            on_day(Order.created_at, today),
+            Order.status == 'completed'
+        ).scalar() or 0
+
+        yesterday_sales = db.query(func.sum(Order.total)).filter(
+            on_day(Order.created_at, today - timedelta(days=1)),
+            Order.status == 'completed'
+        ).scalar() or 0
+
+        sales_growth = 0
+        if yesterday_sales > 0:
+            sales_growth = ((today_sales - yesterday_sales) / yesterday_sales) * 100
+
+        today_orders = db.query(func.count(Order.id)).filter(
+            on_day(Order.created_at, today)
+        ).scalar() or 0
+
+        active_agents = db.query(func.count(Agent.id)).filter(
+            Agent.is_active == True
+        ).scalar() or 0
+
+        # KPI Section
+        xw.section('ASOSIY KO\'RSATKICHLAR', span=2)
+        xw.row(['Bugungi savdo', f"{today_sales:,.0f} so'm"])
+        xw.row(['O\'sish', f"{sales_growth:.1f}%"])
+        xw.row(['Bugungi buyurtmalar', today_orders])
+        xw.row(['Faol agentlar', active_agents])
+        xw.row()
+
+        # Top Products
+        top_products = db.query(
+            Product.name,
+            func.sum(OrderItem.quantity).label('total_qty')
+        ).join(
+            OrderItem, Product.id == OrderItem.product_id
+        ).join(
+            Order, OrderItem.order_id == Order.id
+        ).filter(
+            since_day(Order.created_at, week_ago),
+            Order.status == 'completed'
+        ).group_by(Product.id, Product.name).order_by(
+            func.sum(OrderItem.quantity).desc()
+        ).limit(5).all()
+
+        xw.section('TOP 5 MAHSULOTLAR', span=3)
+        xw.subheader(['#', 'Mahsulot', 'Miqdor'])
+        for i, (name, qty) in enumerate(top_products, 1):
+            xw.row([i, name, int(qty)])
+        xw.row()
+
+        # Top Agents
+        top_agents = db.query(
+            Agent.full_name,
+            func.sum(Order.total).label('total_sales'),
+            func.count(Order.id).label('order_count')
+        ).join(
+            Order, Agent.id == Order.partner_id
+        ).filter(
+            since_day(Order.created_at, week_ago),
+            Order.status == 'completed'
+        ).group_by(Agent.id, Agent.full_name).order_by(
+            func.sum(Order.total).desc()
+        ).limit(5).all()
+
+        xw.section('TOP 5 AGENTLAR', span=4)
+        xw.subheader(['#', 'Agent', 'Savdo', 'Buyurtmalar'])
+        for i, agent in enumerate(top_agents, 1):
+            xw.row([i, agent.full_name, f"{agent.total_sales:,.0f} so'm", agent.order_count])
+        return xw
+
     # Return as downloadable file
     filename = f"rahbariyat_hisobot_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-    
-    return StreamingResponse(
-        output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
-    )
+    return await xlsx_response(build, filename)
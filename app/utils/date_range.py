@@ -0,0 +1,80 @@
+"""
+Sana filtrlari — func.date(ustun) == kun o'rniga yarim ochiq oraliq: ustun >= boshlanish AND ustun < tugash.
+func.date() ustunni o'rab oladi va SQLite indeksdan foydalana olmaydi; oraliq esa indeks bo'yicha qidiriladi.
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple, Union
+
+from sqlalchemy import Date, and_, true
+
+DayLike = Union[date, datetime]
+
+
+def day_start(day: DayLike) -> datetime:
+    """Kun boshlanishi (00:00:00). datetime berilsa vaqt qismi tashlanadi."""
+    if isinstance(day, datetime):
+        day = day.date()
+    return datetime.combine(day, datetime.min.time())
+
+
+def day_bounds(day: DayLike) -> Tuple[datetime, datetime]:
+    """[kun 00:00, keyingi kun 00:00)"""
+    start = day_start(day)
+    return start, start + timedelta(days=1)
+
+
+def period_bounds(start_day: DayLike, end_day: DayLike) -> Tuple[datetime, datetime]:
+    """[start_day 00:00, end_day dan keyingi kun 00:00) — end_day ham oraliqqa kiradi."""
+    return day_start(start_day), day_start(end_day) + timedelta(days=1)
+
+
+def month_bounds(year: int, month: int) -> Tuple[datetime, datetime]:
+    """[oyning 1-kuni, keyingi oyning 1-kuni)"""
+    start = datetime(year, month, 1)
+    end = datetime(year + 1, 1, 1) if month == 12 else datetime(year, month + 1, 1)
+    return start, end
+
+
+def _bound(column, moment: datetime):
+    """Date ustun uchun sana, DateTime uchun datetime (SQLite da satr sifatida solishtiriladi)."""
+    if isinstance(getattr(column, "type", None), Date):
+        return moment.date()
+    return moment
+
+
+def on_day(column, day: DayLike):
+    """func.date(column) == day"""
+    start, end = day_bounds(day)
+    return and_(column >= _bound(column, start), column < _bound(column, end))
+
+
+def since_day(column, day: DayLike):
+    """func.date(column) >= day"""
+    return column >= _bound(column, day_start(day))
+
+
+def until_day(column, day: DayLike):
+    """func.date(column) <= day"""
+    return column < _bound(column, day_start(day) + timedelta(days=1))
+
+
+def before_day(column, day: DayLike):
+    """func.date(column) < day"""
+    return column < _bound(column, day_start(day))
+
+
+def in_period(column, start_day: Optional[DayLike] = None, end_day: Optional[DayLike] = None):
+    """start_day <= func.date(column) <= end_day; chegaralardan biri None bo'lsa — ochiq."""
+    clauses = []
+    if start_day is not None:
+        clauses.append(since_day(column, start_day))
+    if end_day is not None:
+        clauses.append(until_day(column, end_day))
+    if not clauses:
+        return true()
+    return and_(*clauses)
+
+
+def in_month(column, year: int, month: int):
+    start, end = month_bounds(year, month)
+    return and_(column >= _bound(column, start), column < _bound(column, end))
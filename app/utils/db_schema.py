@@ -1,56 +1,186 @@
-"""Ma'lumotlar bazasi jadval ustunlarini tekshirish (migration-style)."""
+"""Ma'lumotlar bazasi sxemasini tekshirish (migration-style).
+
+Barcha tekshiruvlar faqat ishga tushishda — ensure_schema() orqali — bajariladi;
+so'rov handlerlari DDL (ALTER TABLE / CREATE INDEX) chaqirmaydi.
+"""
+from datetime import datetime
+from typing import Dict, List, Set, Tuple
+
 from sqlalchemy.orm import Session
 from sqlalchemy import text
 from sqlalchemy.exc import OperationalError
 
+from app.services.cash_ledger import rebuild_cash_balances
+from app.services.latest_positions import rebuild_latest_positions
+from app.services.partner_ledger import rebuild_partner_ledger
 
-def ensure_orders_payment_due_date_column(db: Session) -> None:
-    """Agar orders jadvalida payment_due_date ustuni bo'lmasa, qo'shadi."""
-    try:
-        db.execute(text("ALTER TABLE orders ADD COLUMN payment_due_date DATE"))
-        db.commit()
-    except OperationalError as e:
-        db.rollback()
-        if "duplicate column" not in str(e).lower():
-            raise
-    except Exception:
-        db.rollback()
-
-
-def ensure_order_item_warehouse_id_column(db: Session) -> None:
-    """Agar order_items jadvalida warehouse_id ustuni bo'lmasa, qo'shadi."""
-    try:
-        db.execute(text("ALTER TABLE order_items ADD COLUMN warehouse_id INTEGER REFERENCES warehouses(id)"))
-        db.commit()
-    except OperationalError as e:
-        db.rollback()
-        if "duplicate column" not in str(e).lower():
-            raise
-    except Exception:
-        db.rollback()
-
-
-def ensure_payments_status_column(db: Session) -> None:
-    """Agar payments jadvalida status ustuni bo'lmasa, qo'shadi."""
-    try:
-        db.execute(text("ALTER TABLE payments ADD COLUMN status VARCHAR(20) DEFAULT 'confirmed'"))
-        db.commit()
-    except OperationalError as e:
-        db.rollback()
-        if "duplicate column" not in str(e).lower():
-            raise
-    except Exception:
-        db.rollback()
-
-
-def ensure_cash_opening_balance_column(db: Session) -> None:
-    """Agar cash_registers jadvalida opening_balance ustuni bo'lmasa, qo'shadi."""
-    try:
-        db.execute(text("ALTER TABLE cash_registers ADD COLUMN opening_balance FLOAT DEFAULT 0"))
+
+# create_all mavjud jadvalga yangi ustun qo'shmaydi — eski bazalar uchun: (jadval, ustun, DDL turi).
+# Yangi ustun qo'shilsa shu ro'yxatga yoziladi.
+COLUMN_GUARDS: List[Tuple[str, str, str]] = [
+    ("orders", "payment_due_date", "DATE"),
+    ("order_items", "warehouse_id", "INTEGER REFERENCES warehouses(id)"),
+    ("payments", "status", "VARCHAR(20) DEFAULT 'confirmed'"),
+    ("cash_registers", "opening_balance", "FLOAT DEFAULT 0"),
+    ("stock_adjustment_docs", "warehouse_id", "INTEGER REFERENCES warehouses(id)"),
+    ("stock_adjustment_doc_items", "previous_quantity", "REAL"),
+]
+
+
+# Oxirgi joylashuvlar (4-bosqich) uchun — 1-bosqichdan keyin qo'shilgan, u yerda alohida yaratiladi
+DRIVER_LOCATIONS_INDEX = ("ix_driver_locations_driver_recorded", "driver_locations", ("driver_id", "recorded_at"), False)
+
+# Tez-tez ishlatiladigan so'rov shakllari uchun indekslar: (nomi, jadval, ustunlar, unique).
+# Modelda ham __table_args__ da e'lon qilingan — yangi bazada create_all, eski bazada shu ro'yxat yaratadi.
+HOT_QUERY_INDEXES = [
+    ("uq_stocks_warehouse_product", "stocks", ("warehouse_id", "product_id"), True),
+    ("ix_stock_movements_wh_product_created", "stock_movements", ("warehouse_id", "product_id", "created_at"), False),
+    ("ix_stock_movements_document", "stock_movements", ("document_type", "document_id"), False),
+    ("ix_orders_type_status_created", "orders", ("type", "status", "created_at"), False),
+    ("ix_orders_type_date", "orders", ("type", "date"), False),
+    ("ix_orders_created_at", "orders", ("created_at",), False),
+    ("ix_payments_cash_type_status", "payments", ("cash_register_id", "type", "status"), False),
+    ("ix_attendances_employee_date", "attendances", ("employee_id", "date"), False),
+    ("ix_agent_locations_agent_recorded", "agent_locations", ("agent_id", "recorded_at"), False),
+    DRIVER_LOCATIONS_INDEX,
+]
+
+_STOCK_KEEP_IDS = (
+    "SELECT MIN(id) FROM stocks WHERE warehouse_id IS NOT NULL AND product_id IS NOT NULL "
+    "GROUP BY warehouse_id, product_id"
+)
+
+
+def merge_duplicate_stocks(db: Session) -> int:
+    """Bir ombor+mahsulot uchun bir nechta stocks qatori bo'lsa — miqdorlarni eng kichik id li qatorga
+    yig'adi, stock_movements.stock_id ni unga ko'chiradi va qolganlarini o'chiradi. Qaytaradi: o'chirilgan qatorlar."""
+    db.execute(text(
+        "UPDATE stocks SET quantity = (SELECT SUM(COALESCE(s2.quantity, 0)) FROM stocks s2 "
+        "WHERE s2.warehouse_id = stocks.warehouse_id AND s2.product_id = stocks.product_id) "
+        "WHERE id IN (SELECT MIN(id) FROM stocks WHERE warehouse_id IS NOT NULL AND product_id IS NOT NULL "
+        "GROUP BY warehouse_id, product_id HAVING COUNT(*) > 1)"
+    ))
+    db.execute(text(
+        "UPDATE stock_movements SET stock_id = (SELECT MIN(s2.id) FROM stocks s1 JOIN stocks s2 "
+        "ON s2.warehouse_id = s1.warehouse_id AND s2.product_id = s1.product_id WHERE s1.id = stock_movements.stock_id) "
+        "WHERE stock_id IN (SELECT id FROM stocks WHERE warehouse_id IS NOT NULL AND product_id IS NOT NULL "
+        f"AND id NOT IN ({_STOCK_KEEP_IDS}))"
+    ))
+    result = db.execute(text(
+        "DELETE FROM stocks WHERE warehouse_id IS NOT NULL AND product_id IS NOT NULL "
+        f"AND id NOT IN ({_STOCK_KEEP_IDS})"
+    ))
+    return result.rowcount or 0
+
+
+def create_index(db: Session, name: str, table: str, columns: Tuple[str, ...], unique: bool) -> None:
+    db.execute(text(
+        f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"
+    ))
+
+
+def ensure_hot_query_indexes(db: Session) -> None:
+    """HOT_QUERY_INDEXES dagi indekslarni yaratadi (mavjud bo'lsa o'tkazib yuboriladi).
+    Unique indeksdan oldin takroriy stocks qatorlari birlashtiriladi. Biror indeks yaratilmasa qolganlari saqlanadi,
+    lekin RuntimeError — bosqich versiyasi yozilmaydi va keyingi ishga tushishda qayta bajariladi."""
+    merged = merge_duplicate_stocks(db)
+    if merged:
+        print(f"[Schema] stocks: {merged} ta takroriy qator birlashtirildi")
+    failed = []
+    for index in HOT_QUERY_INDEXES:
+        try:
+            create_index(db, *index)
+        except OperationalError as e:
+            print(f"[Schema] {index[0]}: {e}")
+            failed.append(index[0])
+    db.commit()
+    if failed:
+        raise RuntimeError(f"indekslar yaratilmadi: {', '.join(failed)}")
+
+
+def table_columns(db: Session, table: str) -> Set[str]:
+    """PRAGMA table_info — jadval ustunlari nomlari (jadval bo'lmasa bo'sh to'plam)."""
+    return {row[1] for row in db.execute(text(f"PRAGMA table_info({table})"))}
+
+
+def ensure_columns(db: Session) -> List[str]:
+    """COLUMN_GUARDS dagi yetishmayotgan ustunlarni qo'shadi. Har bir jadval uchun PRAGMA bir marta.
+    Qaytaradi: qo'shilgan ustunlar ("jadval.ustun")."""
+    by_table: Dict[str, List[Tuple[str, str]]] = {}
+    for table, column, ddl in COLUMN_GUARDS:
+        by_table.setdefault(table, []).append((column, ddl))
+    added = []
+    for table, columns in by_table.items():
+        existing = table_columns(db, table)
+        if not existing:
+            continue  # jadval yo'q — create_all yaratadi
+        for column, ddl in columns:
+            if column not in existing:
+                db.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                added.append(f"{table}.{column}")
+    db.commit()
+    return added
+
+
+def rebuild_cash_ledger(db: Session) -> None:
+    """Kassa balanslari ledgerga o'tganda bir marta: balans formuladan (o'tkazmalar bilan) qayta yoziladi."""
+    rebuild_cash_balances(db)
+    db.commit()
+
+
+def build_partner_ledger(db: Session) -> None:
+    """Kontragent hisob daftari va oylik snapshotlar mavjud hujjatlardan bir marta to'ldiriladi."""
+    n = rebuild_partner_ledger(db)
+    db.commit()
+    print(f"[Schema] partner_ledger: {n} ta yozuv")
+
+
+def build_latest_positions(db: Session) -> None:
+    """Oxirgi joylashuvlar jadvali: haydovchi tarixiga indeks (1-bosqichni o'tgan bazalarda yo'q)
+    va agent/haydovchi tarixidan bir marta to'ldirish."""
+    create_index(db, *DRIVER_LOCATIONS_INDEX)
+    n = rebuild_latest_positions(db)
+    db.commit()
+    print(f"[Schema] latest_positions: {n} ta yozuv")
+
+
+# Versiyalangan bosqichlar: bazada yozilgan versiyadan kattalari bir marta bajariladi.
+SCHEMA_STEPS = [
+    (1, "hot query indekslari", ensure_hot_query_indexes),
+    (2, "kassa balanslari ledger", rebuild_cash_ledger),
+    (3, "kontragent hisob daftari", build_partner_ledger),
+    (4, "oxirgi joylashuvlar", build_latest_positions),
+]
+SCHEMA_VERSION = max(version for version, _name, _step in SCHEMA_STEPS)
+
+
+def get_schema_version(db: Session) -> int:
+    db.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "id INTEGER PRIMARY KEY, version INTEGER NOT NULL, applied_at DATETIME)"
+    ))
+    row = db.execute(text("SELECT MAX(version) FROM schema_version")).first()
+    return int(row[0] or 0) if row else 0
+
+
+def ensure_schema(db: Session) -> int:
+    """Ishga tushishda bir marta: yetishmayotgan ustunlarni qo'shadi, yozilgan versiyadan keyingi
+    bosqichlarni bajaradi va SCHEMA_VERSION ni schema_version jadvaliga yozadi. Qaytaradi: joriy versiya.
+    Bosqich xato bersa — u va keyingilari yozilmaydi (xato chaqiruvchiga), keyingi ishga tushishda qayta uriniladi."""
+    added = ensure_columns(db)
+    if added:
+        print(f"[Schema] qo'shilgan ustunlar: {', '.join(added)}")
+    current = get_schema_version(db)
+    for version, name, step in SCHEMA_STEPS:
+        if version <= current:
+            continue
+        step(db)
+        db.execute(
+            text("INSERT INTO schema_version (version, applied_at) VALUES (:v, :at)"),
+            {"v": version, "at": datetime.now()},
+        )
         db.commit()
-    except OperationalError as e:
-        db.rollback()
-        if "duplicate column" not in str(e).lower():
-            raise
-    except Exception:
-        db.rollback()
+        print(f"[Schema] v{version}: {name}")
+        current = version
+    db.commit()
+    return current
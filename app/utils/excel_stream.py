@@ -0,0 +1,118 @@
+"""
+Excel eksport — openpyxl write-only rejimi: qatorlar yozilishi bilan vaqtinchalik faylga tushadi,
+butun jadval xotirada yig'ilmaydi. So'rov natijasi yield_per bilan bo'lak-bo'lak o'qiladi,
+fayl ishchi oqimda (threadpool) quriladi — katta eksport boshqa foydalanuvchilarni to'xtatmaydi.
+
+    def build():
+        xw = XlsxWriter("Savdo", widths=(6, 18, 16, 30, 14, 12))
+        xw.title("Savdo hisoboti")
+        xw.header(["№", "Sana", ...])
+        xw.rows(stream_rows(query))
+        return xw
+    return await xlsx_response(build, "savdo.xlsx")
+"""
+import tempfile
+from typing import Callable, Iterable, Iterator, Optional, Sequence
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import StreamingResponse
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+HEADER_FILL = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+HEADER_FONT = Font(bold=True, color="FFFFFF")
+SUBHEADER_FILL = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
+SUBHEADER_FONT = Font(bold=True)
+
+STREAM_BATCH = 1000  # yield_per — bir martada o'qiladigan qatorlar
+SPOOL_MAX_SIZE = 8 * 1024 * 1024  # tayyor fayl shu hajmgacha xotirada, katta bo'lsa diskda
+CHUNK_SIZE = 64 * 1024
+
+
+class XlsxWriter:
+    """Bitta varaqli write-only kitob. Ustun kengliklari birinchi qatordan oldin berilishi kerak (widths=)."""
+
+    def __init__(self, sheet_title: str, widths: Sequence[float] = ()):
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(sheet_title)
+        for i, width in enumerate(widths, 1):
+            self.ws.column_dimensions[get_column_letter(i)].width = width
+        self.rows_written = 0
+
+    def _styled(self, values: Iterable, font: Font, fill: Optional[PatternFill] = None) -> list:
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(self.ws, value=value)
+            cell.font = font
+            if fill is not None:
+                cell.fill = fill
+            cells.append(cell)
+        return cells
+
+    def title(self, text: str, size: int = 14) -> None:
+        self.row(self._styled([text], Font(bold=True, size=size)))
+
+    def header(self, columns: Sequence, fill: PatternFill = HEADER_FILL, font: Font = HEADER_FONT) -> None:
+        self.row(self._styled(columns, font, fill))
+
+    def subheader(self, columns: Sequence) -> None:
+        self.header(columns, SUBHEADER_FILL, SUBHEADER_FONT)
+
+    def section(self, text: str, span: int = 1) -> None:
+        """Bo'lim sarlavhasi; span > 1 bo'lsa A ustunidan boshlab birlashtiriladi."""
+        row = self.rows_written + 1
+        self.header([text], font=Font(bold=True, color="FFFFFF", size=12))
+        if span > 1:
+            self.ws.merged_cells.add(f"A{row}:{get_column_letter(span)}{row}")
+
+    def row(self, values: Sequence = ()) -> None:
+        self.ws.append(list(values))
+        self.rows_written += 1
+
+    def rows(self, iterable: Iterable[Sequence]) -> None:
+        for values in iterable:
+            self.ws.append(list(values))
+            self.rows_written += 1
+
+    def save(self, path: Optional[str] = None):
+        """Kitobni SpooledTemporaryFile ga yozadi va boshiga qaytaradi; path berilsa — shu faylga (fon eksport)."""
+        if path:
+            self.wb.save(path)
+            self.wb.close()
+            return path
+        out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        self.wb.save(out)
+        self.wb.close()
+        out.seek(0)
+        return out
+
+
+def stream_rows(query, batch: int = STREAM_BATCH) -> Iterator:
+    """Query natijasini bo'lak-bo'lak o'qiydi (hamma qator bir vaqtda xotiraga yuklanmaydi).
+    Ustunli so'rovlar (db.query(Order.number, Partner.name, ...)) tavsiya etiladi — ORM obyektlari va lazy-load yo'q."""
+    return iter(query.yield_per(batch))
+
+
+def _iter_file(f) -> Iterator[bytes]:
+    try:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        f.close()
+
+
+async def xlsx_response(build: Callable[[], XlsxWriter], filename: str) -> StreamingResponse:
+    """build() ni ishchi oqimda bajaradi va tayyor faylni bo'laklab yuboradi.
+    build() route sessiyasidan foydalanishi mumkin — u ishlayotganda event loop shu sessiyaga tegmaydi."""
+    f = await run_in_threadpool(lambda: build().save())
+    return StreamingResponse(
+        _iter_file(f),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
@@ -0,0 +1,210 @@
+"""
+Geografik yordamchilar — masofa (haversine), trekni soddalashtirish (Douglas–Peucker), ixcham kodlash
+(Google polyline: koordinatalar 1e-5 aniqlikda, butun sonlar deltalari bilan) va GridIndex (xotiradagi
+to'r bo'yicha fazoviy indeks: ko'rinadigan hudud va eng yaqin nuqtalar).
+"""
+import math
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+EARTH_RADIUS_M = 6371008.8
+POLYLINE_PRECISION = 1e5  # ~1.1 m
+
+
+def haversine_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Ikki nuqta orasidagi masofa (metr)."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp = p2 - p1
+    dl = math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _segment_distance_m(p, a, b, cos_lat: float) -> float:
+    """p nuqtadan [a, b] kesmagacha masofa — kichik hudud uchun tekis (ekvirektangulyar) proyeksiyada."""
+    k = math.radians(1) * EARTH_RADIUS_M
+    px, py = p[1] * cos_lat * k, p[0] * k
+    ax, ay = a[1] * cos_lat * k, a[0] * k
+    bx, by = b[1] * cos_lat * k, b[0] * k
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return math.hypot(px - ax, py - ay)
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length2))
+    return math.hypot(px - (ax + t * dx), py - (ay + t * dy))
+
+
+def douglas_peucker(points: Sequence[Sequence[float]], tolerance_m: float) -> List[int]:
+    """Saqlanadigan nuqtalar indekslari (o'sish tartibida). points — (lat, lng, ...) ketma-ketligi.
+    Rekursiyasiz (stek bilan) — uzun treklar uchun ham xavfsiz."""
+    n = len(points)
+    if n <= 2:
+        return list(range(n))
+    cos_lat = math.cos(math.radians(sum(p[0] for p in points) / n))
+    keep = [False] * n
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        worst, worst_i = -1.0, start
+        for i in range(start + 1, end):
+            d = _segment_distance_m(points[i], points[start], points[end], cos_lat)
+            if d > worst:
+                worst, worst_i = d, i
+        if worst > tolerance_m:
+            keep[worst_i] = True
+            stack.append((start, worst_i))
+            stack.append((worst_i, end))
+    return [i for i in range(n) if keep[i]]
+
+
+def _encode_value(value: int, out: List[str]) -> None:
+    value = ~(value << 1) if value < 0 else value << 1
+    while value >= 0x20:
+        out.append(chr((0x20 | (value & 0x1F)) + 63))
+        value >>= 5
+    out.append(chr(value + 63))
+
+
+def encode_ints(rows: Sequence[Sequence[int]]) -> str:
+    """Butun sonlar qatorlari -> polyline satri (har ustun oldingi qatordan delta)."""
+    out: List[str] = []
+    prev = None
+    for row in rows:
+        if prev is None:
+            prev = [0] * len(row)
+        for j, value in enumerate(row):
+            _encode_value(value - prev[j], out)
+        prev = list(row)
+    return "".join(out)
+
+
+def decode_ints(encoded: str, width: int) -> List[Tuple[int, ...]]:
+    """encode_ints ning teskarisi."""
+    rows: List[Tuple[int, ...]] = []
+    current = [0] * width
+    index, length = 0, len(encoded)
+    while index < length:
+        for j in range(width):
+            shift = result = 0
+            while True:
+                b = ord(encoded[index]) - 63
+                index += 1
+                result |= (b & 0x1F) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            current[j] += ~(result >> 1) if result & 1 else result >> 1
+        rows.append(tuple(current))
+    return rows
+
+
+def encode_polyline(coords: Sequence[Sequence[float]]) -> str:
+    """[(lat, lng), ...] -> Google polyline (xarita kutubxonalari to'g'ridan-to'g'ri o'qiydi)."""
+    return encode_ints([(round(lat * POLYLINE_PRECISION), round(lng * POLYLINE_PRECISION)) for lat, lng, *_ in coords])
+
+
+def decode_polyline(encoded: str) -> List[Tuple[float, float]]:
+    return [(lat / POLYLINE_PRECISION, lng / POLYLINE_PRECISION) for lat, lng in decode_ints(encoded, 2)]
+
+
+METERS_PER_DEGREE = math.radians(1) * EARTH_RADIUS_M
+
+
+class GridIndex:
+    """Nuqtalar cell_deg x cell_deg gradusli kataklarga bo'lingan. within_bbox faqat hududga tushgan kataklarni,
+    nearest — so'rov nuqtasidan halqa-halqa kengayib, k-chi eng yaqindan uzoqroq halqagacha ko'radi.
+
+        index = GridIndex()
+        index.add(41.31, 69.24, payload)
+        index.nearest(41.3, 69.2, k=5)   # [(masofa_m, payload), ...]
+    """
+
+    def __init__(self, cell_deg: float = 0.01):  # ~1.1 km
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, Any]]] = defaultdict(list)
+        self._bounds: Optional[List[int]] = None  # [min_row, max_row, min_col, max_col]
+        self.size = 0
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg)
+
+    def add(self, lat: float, lng: float, payload: Any) -> None:
+        row, col = self._cell(lat, lng)
+        self._cells[(row, col)].append((lat, lng, payload))
+        if self._bounds is None:
+            self._bounds = [row, row, col, col]
+        else:
+            b = self._bounds
+            b[0], b[1], b[2], b[3] = min(b[0], row), max(b[1], row), min(b[2], col), max(b[3], col)
+        self.size += 1
+
+    def within_bbox(self, south: float, west: float, north: float, east: float, limit: int = None) -> List[Any]:
+        """Hudud ichidagi nuqtalar (payload). Xaritaning ko'rinadigan qismi — sahifa faqat shularni oladi."""
+        if self._bounds is None or south > north or west > east:
+            return []
+        r0, c0 = self._cell(south, west)
+        r1, c1 = self._cell(north, east)
+        r0, r1 = max(r0, self._bounds[0]), min(r1, self._bounds[1])
+        c0, c1 = max(c0, self._bounds[2]), min(c1, self._bounds[3])
+        if r0 > r1 or c0 > c1:
+            return []
+        if (r1 - r0 + 1) * (c1 - c0 + 1) > len(self._cells):
+            # Katta hudud (uzoqlashtirilgan xarita) — bo'sh kataklarni aylanmaslik uchun band kataklar bo'yicha
+            cells = [pts for (r, c), pts in self._cells.items() if r0 <= r <= r1 and c0 <= c <= c1]
+        else:
+            cells = [self._cells[(r, c)] for r in range(r0, r1 + 1) for c in range(c0, c1 + 1) if (r, c) in self._cells]
+        out = []
+        for pts in cells:
+            for lat, lng, payload in pts:
+                if south <= lat <= north and west <= lng <= east:
+                    out.append(payload)
+                    if limit is not None and len(out) >= limit:
+                        return out
+        return out
+
+    def nearest(self, lat: float, lng: float, k: int = 10, max_distance_m: float = None) -> List[Tuple[float, Any]]:
+        """Eng yaqin k ta nuqta: [(masofa_m, payload)] — masofa bo'yicha o'sish tartibida."""
+        if self._bounds is None or k <= 0:
+            return []
+        row, col = self._cell(lat, lng)
+        max_ring = max(
+            abs(row - self._bounds[0]), abs(row - self._bounds[1]),
+            abs(col - self._bounds[2]), abs(col - self._bounds[3]),
+        )
+        found: List[Tuple[float, Any]] = []
+
+        def take(pts):
+            for p_lat, p_lng, payload in pts:
+                d = haversine_m(lat, lng, p_lat, p_lng)
+                if max_distance_m is None or d <= max_distance_m:
+                    found.append((d, payload))
+
+        ring = 0
+        while ring <= max_ring:
+            # Halqadagi istalgan nuqta kamida (ring - 1) katak uzoqda; katak eni qutbga yaqin chekkasi bo'yicha olinadi
+            edge_lat = min(89.0, abs(lat) + (ring + 1) * self.cell_deg)
+            floor_m = max(0, ring - 1) * self.cell_deg * METERS_PER_DEGREE * math.cos(math.radians(edge_lat))
+            if max_distance_m is not None and floor_m > max_distance_m:
+                break
+            if len(found) >= k and floor_m > found[k - 1][0]:
+                break
+            if 8 * ring > len(self._cells):
+                # So'rov ma'lumotdan uzoq (yoki nuqtalar k dan kam): halqalar band kataklardan ko'p bo'lib qoldi —
+                # hali ko'rilmagan band kataklarni bir marta aylanib chiqish arzonroq
+                for (r, c), pts in self._cells.items():
+                    if max(abs(r - row), abs(c - col)) >= ring:
+                        take(pts)
+                found.sort(key=lambda item: item[0])
+                del found[k:]
+                break
+            for r in range(row - ring, row + ring + 1):
+                edge = abs(r - row) == ring
+                for c in (range(col - ring, col + ring + 1) if edge else (col - ring, col + ring)):
+                    take(self._cells.get((r, c), ()))
+            found.sort(key=lambda item: item[0])
+            del found[k:]
+            ring += 1
+        return found
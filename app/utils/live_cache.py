@@ -0,0 +1,111 @@
+"""
+Jarayon ichidagi kichik TTL kesh — dashboard live endpointlari va /api/stats uchun.
+Har bir kalit o'z muddati (ttl) bilan saqlanadi, hajm maxsize dan oshsa eng eski ishlatilgan kalit chiqariladi.
+Yozuvlar (sotuv, ombor harakati, yetkazib berish) tegishli kalit prefikslarini invalidate qiladi —
+tranzaksiya ichida live_events.invalidate_on_commit() bilan (commit dan keyin), aks holda shu funksiyalar bilan.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class TTLCache:
+    """Kalit bo'yicha muddatli kesh (LRU chiqarish, hit/miss hisoblagichlari bilan)."""
+
+    def __init__(self, maxsize: int = 256, default_ttl: float = 10.0):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_set(self, key: str, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Keshda bo'lsa qaytaradi, aks holda compute() natijasini saqlab qaytaradi."""
+        _missing = object()
+        value = self.get(key, _missing)
+        if value is _missing:
+            value = compute()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *prefixes: str) -> int:
+        """Berilgan prefiks(lar) bilan boshlanuvchi kalitlarni o'chiradi. Prefiks berilmasa — hammasini."""
+        with self._lock:
+            if not prefixes:
+                removed = len(self._data)
+                self._data.clear()
+            else:
+                keys = [k for k in self._data if k.startswith(prefixes)]
+                for k in keys:
+                    del self._data[k]
+                removed = len(keys)
+            self.invalidations += removed
+            return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+live_cache = TTLCache(maxsize=256, default_ttl=10.0)
+
+# Kalit prefikslari — live_data va api_routes shu nomlar bilan yozadi
+KEY_EXECUTIVE = "live:executive"
+KEY_WAREHOUSE = "live:warehouse"
+KEY_DELIVERY = "live:delivery"
+KEY_API_STATS = "api:stats"
+
+# Sotuv bajarildi / bekor qilindi / qaytarildi — savdo va ombor ko'rsatkichlari eskiradi
+SALES_KEYS = (KEY_EXECUTIVE, KEY_API_STATS, KEY_WAREHOUSE)
+# Ombor harakati yozildi — ombor ko'rsatkichlari eskiradi
+STOCK_KEYS = (KEY_WAREHOUSE,)
+
+
+def invalidate_sales() -> None:
+    """Sotuv bajarildi / bekor qilindi / qaytarildi — savdo va ombor ko'rsatkichlari eskirdi."""
+    live_cache.invalidate(*SALES_KEYS)
+
+
+def invalidate_stock() -> None:
+    """Ombor harakati yozildi — ombor ko'rsatkichlari eskirdi."""
+    live_cache.invalidate(*STOCK_KEYS)
+
+
+def invalidate_deliveries() -> None:
+    """Yetkazib berish qo'shildi yoki holati o'zgardi."""
+    live_cache.invalidate(KEY_DELIVERY)
@@ -1,6 +1,7 @@
 """
 Live Data Endpoints
-Real-time data updates for dashboards
+Real-time data updates for dashboards.
+Natijalar live_cache da qisqa muddat saqlanadi — N ta ochiq dashboard bitta hisoblashni bo'lishadi.
 """
 
 from fastapi import Request, Depends
@@ -10,24 +11,26 @@ from datetime import datetime, timedelta
 from sqlalchemy import func
 
 from app.models.database import (
-    get_db, Order, Stock, Delivery, Production, Notification, Product
+    get_db, Order, Stock, Delivery, Production, Notification, Product, DailySalesRollup
 )
+from app.utils.live_cache import live_cache, KEY_EXECUTIVE, KEY_WAREHOUSE, KEY_DELIVERY
+from app.utils.date_range import on_day
 
+# Kesh muddatlari (soniya) — brauzer polling oralig'idan qisqa
+EXECUTIVE_TTL = 10
+WAREHOUSE_TTL = 15
+DELIVERY_TTL = 10
 
-async def executive_live_data(request: Request, db: Session):
-    """Live data for Executive Dashboard"""
-    
-    today = datetime.now().date()
-    
-    # Today's sales
-    today_sales = db.query(func.sum(Order.total)).filter(
-        func.date(Order.created_at) == today,
-        Order.status == 'completed'
+
+def _executive_payload(db: Session, today) -> dict:
+    # Today's sales (daily_sales_rollup)
+    today_sales = db.query(func.sum(DailySalesRollup.sales_total)).filter(
+        DailySalesRollup.day == today
     ).scalar() or 0
     
     # Today's orders
     today_orders = db.query(func.count(Order.id)).filter(
-        func.date(Order.created_at) == today
+        on_day(Order.created_at, today)
     ).scalar() or 0
     
     # Unread notifications
@@ -35,17 +38,23 @@ async def executive_live_data(request: Request, db: Session):
         Notification.is_read == False
     ).scalar() or 0
     
-    return JSONResponse({
+    return {
         "today_sales": float(today_sales),
         "today_orders": today_orders,
         "unread_notifications": unread_notifications,
         "timestamp": datetime.now().isoformat()
-    })
+    }
 
 
-async def warehouse_live_data(request: Request, db: Session):
-    """Live data for Warehouse Dashboard"""
-    
+async def executive_live_data(request: Request, db: Session):
+    """Live data for Executive Dashboard"""
+    today = datetime.now().date()
+    return JSONResponse(live_cache.get_or_set(
+        f"{KEY_EXECUTIVE}:{today}", lambda: _executive_payload(db, today), ttl=EXECUTIVE_TTL
+    ))
+
+
+def _warehouse_payload(db: Session) -> dict:
     # Low stock count: Stock.quantity < Product.min_stock (Stock da min_quantity yo'q)
     low_stock = db.query(func.count(Stock.id)).join(Product, Stock.product_id == Product.id).filter(
         Stock.quantity < Product.min_stock
@@ -54,32 +63,41 @@ async def warehouse_live_data(request: Request, db: Session):
     # Total products
     total_products = db.query(func.count(Stock.id)).scalar() or 0
     
-    return JSONResponse({
+    return {
         "low_stock": low_stock,
         "total_products": total_products,
         "timestamp": datetime.now().isoformat()
-    })
+    }
 
 
-async def delivery_live_data(request: Request, db: Session):
-    """Live data for Delivery Dashboard"""
-    
-    today = datetime.now().date()
-    
+async def warehouse_live_data(request: Request, db: Session):
+    """Live data for Warehouse Dashboard"""
+    return JSONResponse(live_cache.get_or_set(KEY_WAREHOUSE, lambda: _warehouse_payload(db), ttl=WAREHOUSE_TTL))
+
+
+def _delivery_payload(db: Session, today) -> dict:
     # Today's deliveries
     today_deliveries = db.query(func.count(Delivery.id)).filter(
-        func.date(Delivery.created_at) == today
+        on_day(Delivery.created_at, today)
     ).scalar() or 0
     
     # Completed deliveries
     completed = db.query(func.count(Delivery.id)).filter(
-        func.date(Delivery.created_at) == today,
+        on_day(Delivery.created_at, today),
         Delivery.status == 'delivered'
     ).scalar() or 0
     
-    return JSONResponse({
+    return {
         "today_deliveries": today_deliveries,
         "completed": completed,
         "completion_rate": round((completed / today_deliveries * 100) if today_deliveries > 0 else 0, 1),
         "timestamp": datetime.now().isoformat()
-    })
+    }
+
+
+async def delivery_live_data(request: Request, db: Session):
+    """Live data for Delivery Dashboard"""
+    today = datetime.now().date()
+    return JSONResponse(live_cache.get_or_set(
+        f"{KEY_DELIVERY}:{today}", lambda: _delivery_payload(db, today), ttl=DELIVERY_TTL
+    ))
@@ -0,0 +1,118 @@
+"""
+Jarayon ichidagi pub/sub — /api/stream (SSE) mijozlariga o'zgarishlarni yetkazadi.
+Har bir ulanish o'z asyncio.Queue siga ega; publish() navbatlarga yozadi xolos, shuning uchun
+kutib turgan yuzlab mijozlar hech narsa sarflamaydi. publish() istalgan oqimdan (scheduler ham) chaqirilishi mumkin.
+Sessiya ichidagi o'zgarishlar publish_on_commit() bilan yig'iladi va faqat commit dan keyin yuboriladi;
+live kesh kalitlari ham (invalidate_on_commit) shu yerda, xabardan oldin tozalanadi.
+"""
+import asyncio
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.utils.live_cache import live_cache
+
+# Sekin mijoz navbati to'lsa eng eski xabar tashlab yuboriladi
+QUEUE_MAXSIZE = 100
+
+
+class Subscriber:
+    """Bitta SSE ulanishi: navbat, event loop va (bildirishnomalar uchun) foydalanuvchi."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, user_id: Optional[int] = None):
+        self.loop = loop
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_MAXSIZE)
+        self.dropped = 0
+
+    def _put(self, message: str) -> None:
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+
+class EventBus:
+    def __init__(self):
+        self._subscribers: set = set()
+        self._lock = threading.Lock()
+        self.published = 0
+
+    def subscribe(self, user_id: Optional[int] = None) -> Subscriber:
+        sub = Subscriber(asyncio.get_running_loop(), user_id)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_name: str, data: Dict[str, Any], user_id: Optional[int] = None) -> int:
+        """Xabarni barcha (user_id berilsa — faqat shu foydalanuvchi) obunachilarga yuboradi."""
+        with self._lock:
+            targets = [s for s in self._subscribers if user_id is None or s.user_id == user_id]
+        if not targets:
+            return 0
+        message = format_sse(event_name, data)
+        for sub in targets:
+            try:
+                running = asyncio.get_running_loop()
+            except RuntimeError:
+                running = None
+            if running is sub.loop:
+                sub._put(message)
+            else:
+                try:
+                    sub.loop.call_soon_threadsafe(sub._put, message)
+                except RuntimeError:
+                    # Loop yopilgan — ulanish allaqachon uzilgan
+                    self.unsubscribe(sub)
+        self.published += 1
+        return len(targets)
+
+
+def format_sse(event_name: str, data: Dict[str, Any]) -> str:
+    return f"event: {event_name}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+bus = EventBus()
+
+
+def publish_on_commit(db: Session, event_name: str, data: Dict[str, Any]) -> None:
+    """O'zgarishni sessiyaga yozib qo'yadi; commit bo'lganda bir xil nomdagi hodisalar
+    bitta xabar ({"items": [...]}) bo'lib yuboriladi, rollback da tashlab yuboriladi."""
+    pending: Dict[str, List[dict]] = db.info.setdefault("live_events", {})
+    pending.setdefault(event_name, []).append(data)
+
+
+def invalidate_on_commit(db: Session, prefixes: Iterable[str]) -> None:
+    """Live kesh prefikslarini commit dan keyin tozalash uchun yozib qo'yadi (rollback da tashlab yuboriladi).
+    Tranzaksiya ichida tozalansa, commit gacha kelgan so'rov eski ma'lumotni qayta keshlab qo'yardi."""
+    db.info.setdefault("live_cache_keys", set()).update(prefixes)
+
+
+@event.listens_for(Session, "after_commit")
+def _flush_pending_events(session: Session) -> None:
+    keys = session.info.pop("live_cache_keys", None)
+    if keys:
+        live_cache.invalidate(*keys)
+    pending = session.info.pop("live_events", None)
+    if not pending:
+        return
+    for event_name, items in pending.items():
+        bus.publish(event_name, {"items": items})
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_pending_events(session: Session, previous_transaction) -> None:
+    if not getattr(previous_transaction, "nested", False):
+        session.info.pop("live_events", None)
+        session.info.pop("live_cache_keys", None)
@@ -4,9 +4,10 @@ Create and manage system notifications
 """
 
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Iterable, Optional
 from sqlalchemy.orm import Session
 from app.models.database import Notification, Stock, Product
+from app.utils.live_events import bus
 
 
 def create_notification(db: Session, title: str, message: str,
@@ -36,10 +37,23 @@ def create_notification(db: Session, title: str, message: str,
     db.add(notification)
     db.commit()
     db.refresh(notification)
+    publish_notification(notification)
     
     return notification
 
 
+def publish_notification(notification: Notification):
+    """Yangi bildirishnomani /api/stream obunachilariga yuborish (user_id bo'lsa — faqat o'sha foydalanuvchiga)"""
+    bus.publish("notification", {
+        "id": notification.id,
+        "title": notification.title or "",
+        "message": notification.message or "",
+        "type": notification.notification_type,
+        "priority": notification.priority or "normal",
+        "action_url": notification.action_url,
+    }, user_id=notification.user_id)
+
+
 def get_user_notifications(db: Session, user_id: int, unread_only: bool = False, limit: int = 10):
     """Get notifications for a specific user"""
     
@@ -88,50 +102,81 @@ def get_unread_count(db: Session, user_id: int):
     return count
 
 
+def _low_stock_fields(product_name: str, quantity: float, min_quantity: float, product_id: Optional[int] = None) -> dict:
+    return {
+        "title": "⚠️ Kam qoldiq ogohlantirishi",
+        "message": f"{product_name} mahsulotidan faqat {quantity:,.0f} qoldi (minimal: {min_quantity:,.0f})",
+        "notification_type": "warning",
+        "priority": "high",
+        "action_url": "/warehouse",
+        "related_entity_type": "stock",
+        "related_entity_id": product_id,
+    }
+
+
 def create_low_stock_notification(db: Session, product_name: str, quantity: float, min_quantity: float, product_id: Optional[int] = None):
     """Create notification for low stock"""
-    return create_notification(
-        db=db,
-        title="⚠️ Kam qoldiq ogohlantirishi",
-        message=f"{product_name} mahsulotidan faqat {quantity:,.0f} qoldi (minimal: {min_quantity:,.0f})",
-        notification_type="warning",
-        priority="high",
-        action_url="/warehouse",
-        related_entity_type="stock",
-        related_entity_id=product_id,
-    )
+    return create_notification(db=db, **_low_stock_fields(product_name, quantity, min_quantity, product_id))
 
 
-def check_low_stock_and_notify(db: Session, warehouse_id: Optional[int] = None) -> int:
+def check_low_stock_and_notify(
+    db: Session,
+    warehouse_id: Optional[int] = None,
+    product_ids: Optional[Iterable[int]] = None,
+) -> int:
     """Kirim/sotuv/production tasdiqdan keyin chaqiriladi: kam qolgan tovarlar uchun bildirishnoma yaratadi.
     Bir xil mahsulot uchun 24 soat ichida takroriy bildirishnoma yaratilmaydi.
+    product_ids berilsa faqat shu mahsulotlar tekshiriladi (masalan, sotuvda qatnashganlar).
+    Kam qoldiqlar va avval ogohlantirilganlar ikki so'rovda olinadi, yangilari bitta bulk insert bilan yoziladi.
     Qaytaradi: yaratilgan bildirishnomalar soni."""
-    low_stocks = db.query(Stock).join(Product, Stock.product_id == Product.id).filter(
+    q = db.query(Stock.product_id, Stock.quantity, Product.name, Product.min_stock).join(
+        Product, Stock.product_id == Product.id
+    ).filter(
         Stock.quantity < Product.min_stock,
         Product.is_active == True,
     )
     if warehouse_id is not None:
-        low_stocks = low_stocks.filter(Stock.warehouse_id == warehouse_id)
-    low_stocks = low_stocks.all()
-    created = 0
+        q = q.filter(Stock.warehouse_id == warehouse_id)
+    if product_ids is not None:
+        product_ids = {int(pid) for pid in product_ids}
+        if not product_ids:
+            return 0
+        q = q.filter(Stock.product_id.in_(product_ids))
+    low_stocks = q.order_by(Stock.id).all()
+    if not low_stocks:
+        return 0
     since = datetime.now() - timedelta(hours=24)
-    for stock in low_stocks:
-        existing = db.query(Notification).filter(
+    notified = {
+        pid for (pid,) in db.query(Notification.related_entity_id).filter(
             Notification.related_entity_type == "stock",
-            Notification.related_entity_id == stock.product_id,
+            Notification.related_entity_id.in_({row.product_id for row in low_stocks}),
             Notification.is_read == False,
             Notification.created_at >= since,
-        ).first()
-        if not existing and stock.product:
-            create_low_stock_notification(
-                db,
-                product_name=stock.product.name,
-                quantity=stock.quantity,
-                min_quantity=stock.product.min_stock,
-                product_id=stock.product_id,
-            )
-            created += 1
-    return created
+        ).distinct()
+    }
+    now = datetime.now()
+    rows = []
+    for product_id, quantity, name, min_stock in low_stocks:
+        if product_id in notified:
+            continue
+        notified.add(product_id)  # Bir nechta omborda kam bo'lsa ham bitta bildirishnoma
+        fields = _low_stock_fields(name, quantity or 0, min_stock or 0, product_id)
+        fields.update(user_id=None, is_read=False, created_at=now, expires_at=now + timedelta(days=7))
+        rows.append(fields)
+    if not rows:
+        return 0
+    db.bulk_insert_mappings(Notification, rows)
+    db.commit()
+    for fields in rows:
+        bus.publish("notification", {
+            "id": None,
+            "title": fields["title"],
+            "message": fields["message"],
+            "type": fields["notification_type"],
+            "priority": fields["priority"],
+            "action_url": fields["action_url"],
+        })
+    return len(rows)
 
 
 def create_order_notification(db: Session, order_number: str, customer_name: str, total: float):
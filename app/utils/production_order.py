@@ -112,6 +112,13 @@ def production_output_quantity_for_stock(db: Session, production, recipe) -> flo
     if not recipe:
         return 0.0
     output_product = db.query(Product).filter(Product.id == recipe.product_id).first()
+    return output_quantity_for_product(output_product, production, recipe)
+
+
+def output_quantity_for_product(output_product: Optional[Product], production, recipe) -> float:
+    """production_output_quantity_for_stock — mahsulot (unit bilan) oldindan yuklangan bo'lsa, so'rovsiz."""
+    if not recipe:
+        return 0.0
     if not output_product:
         _unit_str = ""
     else:
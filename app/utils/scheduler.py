@@ -1,12 +1,20 @@
 """
 Reja (scheduler) — kunlik/vaqtli vazifalar.
 Kam qolgan tovar va muddati o'tgan qarzlar uchun bildirishnoma yaratadi.
+Har kecha kun yakunidagi ombor qoldig'i snapshotini yozadi.
+Muddati o'tgan fon eksport fayllarini tozalaydi.
+Eski GPS tarixini kunlik soddalashtirilgan treklarga siqadi.
 """
 
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 
 from app.models.database import SessionLocal, Order
+from app.services.cash_ledger import verify_cash_balances
+from app.services.export_jobs import prune_export_jobs
+from app.services.location_tracks import compress_day, track_days_to_compress
+from app.services.partner_ledger import write_partner_snapshots
+from app.services.stock_service import fill_stock_snapshots, prune_stock_snapshots
 from app.utils.notifications import check_low_stock_and_notify, create_notification
 
 
@@ -40,6 +48,87 @@ def _scheduled_notifications_job():
         db.close()
 
 
+def _stock_snapshot_job():
+    """Kechagi kungacha yetishmagan qoldiq snapshotlari (sana bo'yicha qoldiq hisoboti uchun; o'chirishdan keyin
+    bekor qilingan kunlar ham) va eski snapshotlarni siqish."""
+    db = SessionLocal()
+    try:
+        yesterday = datetime.now().date() - timedelta(days=1)
+        days, n = fill_stock_snapshots(db, yesterday)
+        pruned = prune_stock_snapshots(db)
+        db.commit()
+        print(f"[Scheduler] Qoldiq snapshoti {yesterday}: {days} kun, {n} qator, {pruned} eski qator o'chirildi")
+    except Exception as e:
+        db.rollback()
+        print(f"[Scheduler] snapshot xato: {e}")
+    finally:
+        db.close()
+
+
+def _partner_snapshot_job():
+    """Oy boshida kontragent qoldiqlari snapshoti (solishtirish dalolatnomasi davr boshidan o'qiydi)."""
+    db = SessionLocal()
+    try:
+        n = write_partner_snapshots(db, datetime.now().date())
+        db.commit()
+        print(f"[Scheduler] Kontragent snapshoti: {n} qator")
+    except Exception as e:
+        db.rollback()
+        print(f"[Scheduler] kontragent snapshot xato: {e}")
+    finally:
+        db.close()
+
+
+def _export_cleanup_job():
+    """Muddati o'tgan eksport vazifalari va fayllarini o'chirish."""
+    try:
+        prune_export_jobs()
+    except Exception as e:
+        print(f"[Scheduler] eksport tozalash xato: {e}")
+
+
+def _cash_verify_job():
+    """Kassa balanslarini to'lov/o'tkazma tarixi bilan solishtiradi — faqat xabar beradi, tuzatmaydi."""
+    db = SessionLocal()
+    try:
+        drift = verify_cash_balances(db)
+        if drift:
+            names = ", ".join(f"{d['name']} ({d['drift']:+,.0f})" for d in drift[:5])
+            print(f"[Scheduler] Kassa balansida farq: {names}")
+            create_notification(
+                db,
+                title="Kassa balansida farq",
+                message=f"{len(drift)} ta kassada saqlangan balans hisoblangandan farq qiladi: {names}.",
+                notification_type="warning",
+                priority="high",
+                action_url="/info/cash",
+                related_entity_type="cash_register",
+            )
+    except Exception as e:
+        print(f"[Scheduler] kassa tekshiruvi xato: {e}")
+    finally:
+        db.close()
+
+
+
+def _track_maintenance_job():
+    """RAW_KEEP_DAYS dan eski GPS nuqtalarini agent/haydovchi-kun treklariga siqadi; har kun alohida commit."""
+    db = SessionLocal()
+    try:
+        days = track_days_to_compress(db)
+        deleted = 0
+        for entity_type, entity_id, day in days:
+            deleted += compress_day(db, entity_type, entity_id, day)
+            db.commit()
+        if days:
+            print(f"[Scheduler] GPS treklari: {len(days)} kun siqildi, {deleted} xom nuqta o'chirildi")
+    except Exception as e:
+        db.rollback()
+        print(f"[Scheduler] GPS trek siqish xato: {e}")
+    finally:
+        db.close()
+
+
 _scheduler = None
 
 
@@ -51,8 +140,15 @@ def start_scheduler():
     _scheduler = BackgroundScheduler()
     _scheduler.add_job(_scheduled_notifications_job, "interval", hours=6, id="notifications")
     _scheduler.add_job(_scheduled_notifications_job, "date", run_date=datetime.now() + timedelta(minutes=1), id="notifications_first")
+    _scheduler.add_job(_stock_snapshot_job, "cron", hour=0, minute=15, id="stock_snapshot")
+    _scheduler.add_job(_stock_snapshot_job, "date", run_date=datetime.now() + timedelta(minutes=2), id="stock_snapshot_first")
+    _scheduler.add_job(_partner_snapshot_job, "cron", day=1, hour=0, minute=30, id="partner_snapshot")
+    _scheduler.add_job(_export_cleanup_job, "interval", minutes=15, id="export_cleanup")
+    _scheduler.add_job(_cash_verify_job, "interval", hours=6, id="cash_verify")
+    _scheduler.add_job(_cash_verify_job, "date", run_date=datetime.now() + timedelta(minutes=3), id="cash_verify_first")
+    _scheduler.add_job(_track_maintenance_job, "cron", hour=2, minute=15, id="track_maintenance")
     _scheduler.start()
-    print("[Scheduler] Reja ishga tushdi (har 6 soatda kam qoldiq va qarz eslatmasi)")
+    print("[Scheduler] Reja ishga tushdi (har 6 soatda kam qoldiq va qarz eslatmasi, har kecha qoldiq snapshoti)")
 
 
 def stop_scheduler():
@@ -0,0 +1,137 @@
+"""
+Excel eksport benchmarki — savdo hisoboti (report_sales_export shaklida) 100k buyurtma ustida.
+Eski usul (to'liq Workbook + ORM obyektlari + o.partner lazy-load, event loop ichida)
+va yangi usul (app.utils.excel_stream: ustunli so'rov + yield_per + write-only, threadpool da) solishtiriladi.
+Har bir usul alohida jarayonda ishlaydi — maxrss (eng katta xotira) aralashmasin.
+
+    python scripts/bench_excel_export.py --orders 100000
+"""
+import argparse
+import asyncio
+import io
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base, Order, Partner, _set_sqlite_pragma
+from app.utils.date_range import in_period
+from app.utils.excel_stream import XlsxWriter, stream_rows, xlsx_response
+
+START = datetime(2026, 1, 1)
+
+
+def _seed(path: str, orders: int, partners: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    event.listen(engine, "connect", _set_sqlite_pragma)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    db.bulk_insert_mappings(Partner, [
+        {"id": i, "code": f"K{i}", "name": f"Mijoz {i}", "balance": 0} for i in range(1, partners + 1)
+    ])
+    step = timedelta(days=300) / orders
+    for start in range(0, orders, 10000):
+        db.bulk_insert_mappings(Order, [
+            {
+                "number": f"S-{i}", "type": "sale", "status": "completed", "partner_id": i % partners + 1,
+                "date": START + step * i, "created_at": START + step * i, "total": 1000 + i % 977,
+            }
+            for i in range(start, min(start + 10000, orders))
+        ])
+    db.commit()
+    db.close()
+    engine.dispose()
+
+
+def _legacy(db, start_day, end_day) -> int:
+    """Oldingi report_sales_export: hamma Order .all(), har qatorda o.partner, to'liq Workbook, BytesIO."""
+    from openpyxl import Workbook
+    orders = db.query(Order).filter(
+        Order.type == "sale", in_period(Order.date, start_day, end_day),
+    ).order_by(Order.date.desc()).all()
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["№", "Sana", "Buyurtma", "Mijoz", "Jami", "Holat"])
+    for i, o in enumerate(orders, 1):
+        ws.append([i, o.date.strftime("%d.%m.%Y %H:%M") if o.date else "", o.number or "",
+                   o.partner.name if o.partner else "", float(o.total or 0), o.status or ""])
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.tell()
+
+
+def _streaming_build(db, start_day, end_day):
+    q = (
+        db.query(Order.date, Order.number, Partner.name, Order.total, Order.status)
+        .outerjoin(Partner, Order.partner_id == Partner.id)
+        .filter(Order.type == "sale", in_period(Order.date, start_day, end_day))
+        .order_by(Order.date.desc())
+    )
+    xw = XlsxWriter("Savdo")
+    xw.header(["№", "Sana", "Buyurtma", "Mijoz", "Jami", "Holat"])
+    for i, (date, number, name, total, status) in enumerate(stream_rows(q), 1):
+        xw.row([i, date.strftime("%d.%m.%Y %H:%M") if date else "", number or "", name or "",
+                float(total or 0), status or ""])
+    return xw
+
+
+async def _run(mode: str, db) -> None:
+    start_day, end_day = START, START + timedelta(days=400)
+    lag = {"max": 0.0}
+
+    async def ticker():
+        # Event loop bloklanishini o'lchash: 10 ms lik uyqu qancha kechikdi
+        while True:
+            t = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag["max"] = max(lag["max"], time.perf_counter() - t - 0.01)
+
+    tick = asyncio.ensure_future(ticker())
+    await asyncio.sleep(0.05)
+    started = time.perf_counter()
+    if mode == "legacy":
+        size = _legacy(db, start_day, end_day)
+    else:
+        response = await xlsx_response(lambda: _streaming_build(db, start_day, end_day), "savdo.xlsx")
+        size = 0
+        async for chunk in response.body_iterator:
+            size += len(chunk)
+    elapsed = time.perf_counter() - started
+    await asyncio.sleep(0.02)  # ticker oxirgi (bloklangan) uyqusini hisoblab olsin
+    tick.cancel()
+    maxrss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:<8} {elapsed:7.2f} s   maxrss {maxrss_mb:7.1f} MB   event loop max kechikish "
+          f"{lag['max'] * 1000:8.1f} ms   fayl {size / 1024 / 1024:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Excel export benchmark")
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--partners", type=int, default=2000)
+    parser.add_argument("--mode", choices=("legacy", "stream"))
+    parser.add_argument("--db")
+    args = parser.parse_args()
+
+    if args.mode:
+        engine = create_engine(f"sqlite:///{args.db}", connect_args={"check_same_thread": False})
+        db = sessionmaker(bind=engine)()
+        asyncio.run(_run(args.mode, db))
+        return
+
+    path = os.path.join(tempfile.mkdtemp(prefix="totli_bench_"), "bench.db")
+    _seed(path, args.orders, args.partners)
+    print(f"{args.orders} buyurtma, {args.partners} mijoz")
+    for mode in ("legacy", "stream"):
+        subprocess.run([sys.executable, os.path.abspath(__file__), "--mode", mode, "--db", path], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+GPS qabul qilish benchmarki — soniyasiga signallar (ping/s):
+  1) eski usul: har signal uchun sessiya + INSERT + commit;
+  2) /api/agent/location (write-behind navbat) — N ta qurilma bir vaqtda yuboradi;
+  3) /api/agent/location/batch — har so'rovda --batch ta nuqta (oflayn trek yuklash).
+Ilova ASGI darajasida chaqiriladi (server va tarmoq yo'q), baza vaqtinchalik SQLite faylda.
+2 va 3 da vaqt navbat to'liq bazaga yozilguncha o'lchanadi.
+
+    python scripts/bench_gps_ingest.py --pings 5000 --devices 50 --batch 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine, event
+
+from app.models.database import AgentLocation, Base, SessionLocal, _set_sqlite_pragma
+from app.utils.auth import create_session_token
+from bench_middleware import _call
+
+
+def _count() -> int:
+    db = SessionLocal()
+    try:
+        return db.query(AgentLocation).count()
+    finally:
+        db.close()
+
+
+def _report(label: str, n: int, elapsed: float) -> None:
+    print(f"{label:<36} {n:>7} ta  {n / elapsed:9.0f} ping/s  ({elapsed:.2f} s)")
+
+
+def bench_per_ping_commit(n: int) -> None:
+    started = time.perf_counter()
+    for i in range(n):
+        db = SessionLocal()
+        try:
+            db.add(AgentLocation(agent_id=1 + i % 50, latitude=41.3, longitude=69.2, recorded_at=datetime.now()))
+            db.commit()
+        finally:
+            db.close()
+    _report("har signal — alohida commit", n, time.perf_counter() - started)
+
+
+async def bench_single_endpoint(app, gps_buffer, n: int, devices: int) -> None:
+    tokens = [create_session_token(d + 1, "agent") for d in range(devices)]
+    csrf = "b" * 64
+    before = _count()
+    started = time.perf_counter()
+    for start in range(0, n, devices):
+        calls = []
+        for d in range(min(devices, n - start)):
+            body = f"csrf_token={csrf}&latitude=41.3&longitude=69.2&accuracy=5&battery=80&token={tokens[d]}".encode()
+            calls.append(_call(app, "POST", "/api/agent/location", [
+                ("cookie", f"csrf_token={csrf}"),
+                ("content-type", "application/x-www-form-urlencoded"),
+                ("content-length", str(len(body))),
+            ], body))
+        await asyncio.gather(*calls)
+    accepted = time.perf_counter() - started
+    gps_buffer.stop()
+    elapsed = time.perf_counter() - started
+    assert _count() - before == n, "hamma signal yozilmadi"
+    _report(f"/location write-behind ({devices} qurilma)", n, elapsed)
+    print(f"{'':<36} qabul qilish: {n / accepted:9.0f} ping/s, yozuvlar: {gps_buffer.stats()['flushes']} ta flush")
+
+
+async def bench_batch_endpoint(app, gps_buffer, n: int, devices: int, batch: int) -> None:
+    tokens = [create_session_token(d + 1, "agent") for d in range(devices)]
+    base = datetime.now() - timedelta(hours=2)
+    before = _count()
+    started = time.perf_counter()
+    sent = 0
+    while sent < n:
+        calls = []
+        for d in range(devices):
+            size = min(batch, n - sent)
+            if size <= 0:
+                break
+            points = [
+                {"latitude": 41.3, "longitude": 69.2, "accuracy": 5, "recorded_at": (base + timedelta(seconds=sent + i)).isoformat()}
+                for i in range(size)
+            ]
+            body = json.dumps({"token": tokens[d], "points": points}).encode()
+            calls.append(_call(app, "POST", "/api/agent/location/batch", [
+                ("content-type", "application/json"), ("content-length", str(len(body))),
+            ], body))
+            sent += size
+        await asyncio.gather(*calls)
+    gps_buffer.stop()
+    elapsed = time.perf_counter() - started
+    assert _count() - before == n, "hamma nuqta yozilmadi"
+    _report(f"/location/batch ({batch} nuqta/so'rov)", n, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GPS ingestion benchmark")
+    parser.add_argument("--pings", type=int, default=5000)
+    parser.add_argument("--devices", type=int, default=50, help="bir vaqtda yuboradigan qurilmalar")
+    parser.add_argument("--batch", type=int, default=100, help="batch so'rovidagi nuqtalar")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="totli_bench_")
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", _set_sqlite_pragma)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal.configure(bind=engine)
+
+    from main import app
+    from app.services.gps_ingest import gps_buffer
+
+    bench_per_ping_commit(min(args.pings, 2000))
+    asyncio.run(bench_single_endpoint(app, gps_buffer, args.pings, args.devices))
+    asyncio.run(bench_batch_endpoint(app, gps_buffer, args.pings * 4, args.devices, args.batch))
+
+
+if __name__ == "__main__":
+    main()
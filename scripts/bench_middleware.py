@@ -0,0 +1,127 @@
+"""
+Middleware benchmarki — soniyasiga so'rovlar (req/s): /ping, oddiy forma POST va multipart yuklash.
+Ilova ASGI darajasida to'g'ridan-to'g'ri chaqiriladi (server va tarmoq yo'q), baza vaqtinchalik SQLite faylda.
+
+    python scripts/bench_middleware.py --requests 2000 --upload-kb 1024
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import Request
+from sqlalchemy import create_engine, event
+
+from app.models.database import Base, SessionLocal, User, _set_sqlite_pragma
+from app.utils.auth import create_session_token
+
+CHUNK = 64 * 1024
+BOUNDARY = "----totlibench"
+
+
+def _scope(method: str, path: str, headers: list) -> dict:
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(k.encode(), v.encode()) for k, v in headers],
+        "client": ("127.0.0.1", 50000),
+        "server": ("127.0.0.1", 8080),
+    }
+
+
+async def _call(app, method: str, path: str, headers: list, body: bytes = b"") -> int:
+    chunks = [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)] or [b""]
+    state = {"i": 0, "status": None}
+
+    async def receive():
+        i = state["i"]
+        if i < len(chunks):
+            state["i"] = i + 1
+            return {"type": "http.request", "body": chunks[i], "more_body": i + 1 < len(chunks)}
+        await asyncio.sleep(3600)  # http.disconnect — bu yerga yetib kelmasligi kerak
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            state["status"] = message["status"]
+
+    await app(_scope(method, path, headers), receive, send)
+    return state["status"]
+
+
+def _multipart(token: str, upload_kb: int) -> bytes:
+    # Brauzer tartibi: base.html csrf_token inputini formaning boshiga qo'shadi
+    parts = [
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="csrf_token"\r\n\r\n{token}\r\n'.encode(),
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="import.xlsx"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n".encode(),
+        os.urandom(upload_kb * 1024),
+        f"\r\n--{BOUNDARY}--\r\n".encode(),
+    ]
+    return b"".join(parts)
+
+
+async def _bench(app, label: str, n: int, method: str, path: str, headers: list, body: bytes = b"") -> None:
+    status = await _call(app, method, path, headers, body)
+    started = time.perf_counter()
+    for _ in range(n):
+        await _call(app, method, path, headers, body)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28} status={status}  {n / elapsed:8.0f} req/s  ({elapsed * 1000 / n:.3f} ms/so'rov)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Middleware benchmark")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--upload-kb", type=int, default=1024, help="multipart fayl hajmi (KB)")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="totli_bench_")
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", _set_sqlite_pragma)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal.configure(bind=engine)
+    db = SessionLocal()
+    db.add(User(id=1, username="admin", password_hash="x", full_name="Admin", role="admin", is_active=True))
+    db.commit()
+    db.close()
+
+    from main import app
+
+    @app.post("/_bench/form", include_in_schema=False)
+    async def bench_form(request: Request):
+        form = await request.form()
+        return {"fields": len(form)}
+
+    session = create_session_token(1, "admin")
+    csrf = "b" * 64
+    cookie = ("cookie", f"session_token={session}; csrf_token={csrf}")
+    html = ("accept", "text/html")
+    form_body = f"csrf_token={csrf}&name=Holva&price=12000&unit=kg".encode()
+    upload = _multipart(csrf, args.upload_kb)
+
+    async def run():
+        n = args.requests
+        await _bench(app, "GET /ping", n, "GET", "/ping", [html])
+        await _bench(app, "POST forma (urlencoded)", n, "POST", "/_bench/form", [
+            cookie, html, ("content-type", "application/x-www-form-urlencoded"), ("content-length", str(len(form_body))),
+        ], form_body)
+        await _bench(app, f"POST multipart {args.upload_kb} KB", max(n // 10, 1), "POST", "/_bench/form", [
+            cookie, html, ("content-type", f"multipart/form-data; boundary={BOUNDARY}"), ("content-length", str(len(upload))),
+        ], upload)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+POS chek yakunlash benchmarki — soniyasiga nechta chek (receipts/sec).
+Vaqtinchalik SQLite faylda (WAL, asosiy bazaga tegmaydi).
+
+    python scripts/bench_pos_checkout.py --receipts 500 --cart 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base, CashRegister, Partner, Product, Stock, Warehouse, _set_sqlite_pragma
+from app.services.pos_checkout import complete_pos_checkout
+
+
+def main():
+    parser = argparse.ArgumentParser(description="POS checkout benchmark")
+    parser.add_argument("--receipts", type=int, default=500)
+    parser.add_argument("--cart", type=int, default=20, help="chekdagi qatorlar soni")
+    parser.add_argument("--products", type=int, default=2000)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="totli_bench_")
+    engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", _set_sqlite_pragma)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    db = Session()
+    db.add_all([
+        Warehouse(id=1, code="sotuv", name="Sotuv"),
+        Partner(id=1, code="chakana", name="Chakana xaridor"),
+        CashRegister(id=1, name="Naqd", payment_type="naqd", balance=0),
+    ])
+    db.bulk_insert_mappings(Product, [
+        {"id": pid, "code": f"T{pid}", "name": f"Tovar {pid}", "sale_price": 1000 + pid}
+        for pid in range(1, args.products + 1)
+    ])
+    db.bulk_insert_mappings(Stock, [
+        {"warehouse_id": 1, "product_id": pid, "quantity": 10 ** 9}
+        for pid in range(1, args.products + 1)
+    ])
+    db.commit()
+    db.close()
+
+    started = time.perf_counter()
+    for i in range(args.receipts):
+        db = Session()
+        try:
+            first = (i * args.cart) % args.products
+            cart = [((first + k) % args.products + 1, 1.0, None) for k in range(args.cart)]
+            complete_pos_checkout(
+                db,
+                warehouse=db.get(Warehouse, 1),
+                partner=db.get(Partner, 1),
+                is_cash_client=True,
+                cart=cart,
+                price_type_id=None,
+                payment_type="naqd",
+                cash_register=db.get(CashRegister, 1),
+            )
+            db.commit()
+        finally:
+            db.close()
+    elapsed = time.perf_counter() - started
+    print(f"{args.receipts} ta chek, har birida {args.cart} qator: {elapsed:.2f} s")
+    print(f"receipts/sec: {args.receipts / elapsed:.1f}")
+    print(f"o'rtacha: {elapsed / args.receipts * 1000:.2f} ms/chek")
+
+
+if __name__ == "__main__":
+    main()
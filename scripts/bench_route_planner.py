@@ -0,0 +1,53 @@
+"""
+Marshrut tartibi benchmarki — tasodifiy nuqtalar (Qo'qon atrofi, ~30x30 km), ombordan boshlanadigan yo'l.
+Har o'lcham uchun: berilgan (tasodifiy) tartib, eng yaqin qo'shni va 2-opt/Or-opt dan keyingi uzunlik, vaqt.
+
+    python scripts/bench_route_planner.py --sizes 50 200 500 --runs 3 --time-limit 0.5
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import route_planner
+from app.services.route_planner import distance_matrix, plan_order
+
+DEPOT = (40.533555, 70.930423)
+
+
+def _given_length(coords) -> float:
+    d = distance_matrix([DEPOT] + list(coords))
+    return sum(d[i][i + 1] for i in range(len(coords)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route planner benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--time-limit", type=float, default=route_planner.TIME_LIMIT)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    numpy_state = "bor" if route_planner.np is not None else "yo'q (sof Python)"
+    print(f"NumPy: {numpy_state}, yaxshilash uchun vaqt chegarasi {args.time_limit} s")
+    print(f"{'nuqta':>6} {'matritsa':>10} {'berilgan':>10} {'NN':>10} {'2-opt/Or':>10} {'yutuq':>7} {'harakat':>8} {'vaqt':>8}")
+    for n in args.sizes:
+        for _ in range(args.runs):
+            coords = [(DEPOT[0] - 0.15 + rng.random() * 0.3, DEPOT[1] - 0.15 + rng.random() * 0.3) for _ in range(n)]
+            started = time.perf_counter()
+            distance_matrix(coords + [DEPOT])
+            matrix_s = time.perf_counter() - started
+            plan = plan_order(coords, start=DEPOT, time_limit=args.time_limit)
+            print(
+                f"{n:>6} {matrix_s * 1000:>8.1f}ms {_given_length(coords) / 1000:>8.1f}km "
+                f"{plan.initial_distance_m / 1000:>8.1f}km {plan.distance_m / 1000:>8.1f}km "
+                f"{(1 - plan.distance_m / plan.initial_distance_m) * 100:>6.1f}% {plan.moves:>8} {plan.elapsed * 1000:>6.0f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
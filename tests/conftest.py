@@ -0,0 +1,29 @@
+"""
+Umumiy fixture lar — xotiradagi SQLite baza (asosiy totli_holva.db ga tegmaydi).
+"""
+import pytest
+
+
+@pytest.fixture
+def db():
+    pytest.importorskip("sqlalchemy")
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app.models.database import Base, Product, Warehouse
+
+    # StaticPool — threadpool dagi kod (masalan, Excel eksport) ham shu xotiradagi bazani ko'radi
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine, autocommit=False, autoflush=False)()
+    session.add_all([
+        Warehouse(id=1, code="W1", name="Asosiy"),
+        Product(id=1, code="P1", name="Holva", purchase_price=10),
+        Product(id=2, code="P2", name="Shakar", purchase_price=5),
+    ])
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
@@ -0,0 +1,87 @@
+"""
+So'rov doirasidagi autentifikatsiya konteksti (auth_context) testlari.
+pytest tests/test_auth_context.py -v
+"""
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("fastapi")
+
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import app.utils.auth_context as auth_context
+from app.deps import get_current_user
+from app.models.database import User
+from app.utils.auth import create_session_token
+from app.utils.auth_context import AuthContext, decode_token, get_active_user, invalidate_user
+
+
+@pytest.fixture
+def auth_db(db, monkeypatch):
+    """get_active_user test bazasidan o'qisin; kesh har test uchun toza."""
+    monkeypatch.setattr(auth_context, "SessionLocal", sessionmaker(bind=db.get_bind(), autoflush=False))
+    auth_context.auth_cache.invalidate()
+    db.add(User(id=7, username="kassir", password_hash="x", full_name="Kassir", role="user", is_active=True))
+    db.commit()
+    yield db
+    auth_context.auth_cache.invalidate()
+
+
+def _count_user_selects(db):
+    statements = []
+
+    def before(conn, cursor, statement, *args):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(db.get_bind(), "before_cursor_execute", before)
+    return statements
+
+
+def _request(ctx=None):
+    return SimpleNamespace(state=SimpleNamespace(auth=ctx) if ctx else SimpleNamespace())
+
+
+class TestAuthContext:
+    def test_token_and_user_loaded_once(self, auth_db, monkeypatch):
+        token = create_session_token(7, "kassir")
+        calls = []
+        real = auth_context.get_user_from_token
+        monkeypatch.setattr(auth_context, "get_user_from_token", lambda t: calls.append(t) or real(t))
+        selects = _count_user_selects(auth_db)
+
+        for _ in range(3):
+            user = get_active_user(decode_token(token)["user_id"])
+        assert user.username == "kassir"
+        assert len(calls) == 1
+        assert len(selects) == 1
+
+    def test_dependency_reuses_request_state(self, auth_db):
+        token = create_session_token(7, "kassir")
+        ctx = AuthContext(token, get_active_user(7))
+        selects = _count_user_selects(auth_db)
+
+        current = get_current_user(_request(ctx), session_token=token, db=auth_db)
+        assert current.id == 7 and current in auth_db
+        assert selects == []
+        current.full_name = "Bosh kassir"  # route sessiyasidagi nusxa — keshdagisi o'zgarmaydi
+        auth_db.commit()
+        assert ctx.user.full_name == "Kassir"
+
+    def test_invalidate_on_deactivate(self, auth_db):
+        token = create_session_token(7, "kassir")
+        assert get_current_user(_request(), session_token=token, db=auth_db).id == 7
+
+        auth_db.query(User).filter(User.id == 7).update({"is_active": False})
+        auth_db.commit()
+        assert get_active_user(7) is not None  # hali keshda
+        invalidate_user(7)
+        assert get_active_user(7) is None
+        assert get_current_user(_request(), session_token=token, db=auth_db) is None
+
+    def test_invalid_token(self, auth_db):
+        assert decode_token("buzilgan") is None
+        assert get_current_user(_request(), session_token="buzilgan", db=auth_db) is None
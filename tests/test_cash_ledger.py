@@ -0,0 +1,116 @@
+"""
+Kassa balansi ledger (app/services/cash_ledger.py) testlari.
+pytest tests/test_cash_ledger.py -v
+"""
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import event
+
+from app.models.database import CashRegister, CashTransfer, Payment
+from app.services.cash_ledger import (
+    NO_EFFECT,
+    adjust_opening_balance,
+    computed_cash_balances,
+    last_verification,
+    payment_effect,
+    post_payment_change,
+    post_transfer,
+    rebuild_cash_balances,
+    set_counted_balance,
+    verify_cash_balances,
+)
+
+
+def _cash(db, *amounts):
+    db.add_all([CashRegister(id=i, name=f"Kassa {i}", balance=a, opening_balance=a) for i, a in enumerate(amounts, 1)])
+    db.flush()
+
+
+def _pay(db, number, p_type, amount, cash_id=1, status="confirmed"):
+    payment = Payment(number=number, type=p_type, cash_register_id=cash_id, amount=amount, status=status)
+    db.add(payment)
+    post_payment_change(db, NO_EFFECT, payment)
+    db.flush()
+    return payment
+
+
+def _balance(db, cash_id):
+    return db.get(CashRegister, cash_id).balance
+
+
+class TestCashLedger:
+    def test_payment_lifecycle(self, db):
+        _cash(db, 100)
+        income = _pay(db, "P-1", "income", 500)
+        _pay(db, "P-2", "expense", 200)
+        _pay(db, "P-3", "income", 999, status="draft")
+        assert _balance(db, 1) == 400
+
+        before = payment_effect(income)
+        income.status = "cancelled"
+        post_payment_change(db, before, income)
+        assert _balance(db, 1) == -100
+
+        before = payment_effect(income)
+        income.status, income.amount = "confirmed", 300
+        post_payment_change(db, before, income)
+        assert _balance(db, 1) == 200
+        db.flush()
+        assert verify_cash_balances(db) == []
+
+    def test_transfer_and_counted_balance(self, db):
+        _cash(db, 1000, 0)
+        t = CashTransfer(number="KK-1", from_cash_id=1, to_cash_id=2, amount=300, status="confirmed")
+        db.add(t)
+        post_transfer(db, t, 1)
+        db.flush()
+        assert (_balance(db, 1), _balance(db, 2)) == (700, 300)
+
+        # Qoldiq hujjati: sanalgan 650 — farq qoldiqqa yoziladi, tasdiq bekor qilinsa qaytadi
+        cash = db.get(CashRegister, 1)
+        assert set_counted_balance(db, cash, 650) == -50
+        assert (cash.balance, cash.opening_balance) == (650, 950)
+        db.flush()
+        assert verify_cash_balances(db) == []
+        adjust_opening_balance(db, cash, 50)
+        assert cash.balance == 700
+
+        t.status = "pending_approval"
+        post_transfer(db, t, -1)
+        db.flush()
+        assert (_balance(db, 1), _balance(db, 2)) == (1000, 0)
+        assert verify_cash_balances(db) == []
+
+    def test_verify_reports_drift_and_rebuild_fixes(self, db):
+        _cash(db, 100, 50)
+        _pay(db, "P-1", "income", 40, cash_id=2)
+        db.query(CashRegister).filter(CashRegister.id == 1).update({CashRegister.balance: 175})
+        db.flush()
+        drift = verify_cash_balances(db)
+        assert [(d["cash_id"], d["drift"]) for d in drift] == [(1, 75)]
+        assert last_verification["drift"] == drift
+
+        assert rebuild_cash_balances(db, [1]) == {1: 100}
+        assert last_verification["drift"] == []
+        assert verify_cash_balances(db) == []
+
+    def test_computed_balances_query_count(self, db):
+        _cash(db, *([10] * 20))
+        for i in range(1, 21):
+            _pay(db, f"P-{i}", "income", i, cash_id=i)
+        db.commit()
+        statements = []
+        engine = db.get_bind()
+
+        def _before(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", _before)
+        try:
+            result = computed_cash_balances(db)
+        finally:
+            event.remove(engine, "before_cursor_execute", _before)
+        assert len(statements) == 4  # kassalar, to'lovlar, jo'natilgan, kelgan — kassalar soniga bog'liq emas
+        assert result[7]["balance"] == 17 and result[7]["income"] == 7
@@ -0,0 +1,62 @@
+"""
+Sana oraliqlari (date_range) testlari: natija func.date() bilan bir xil, so'rov rejasi esa indeksdan foydalanadi.
+pytest tests/test_date_range.py -v
+"""
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import func, text
+
+from app.models.database import DailySalesRollup, Order
+from app.utils.date_range import before_day, in_period, on_day, since_day, until_day
+
+
+def _plan(db, query):
+    compiled = query.statement.compile(db.get_bind(), compile_kwargs={"literal_binds": True})
+    return " ".join(row[-1] for row in db.execute(text(f"EXPLAIN QUERY PLAN {compiled}")))
+
+
+def _seed_orders(db):
+    for i, created in enumerate([
+        datetime(2026, 3, 9, 23, 59, 59),
+        datetime(2026, 3, 10, 0, 0, 0),
+        datetime(2026, 3, 10, 18, 30),
+        datetime(2026, 3, 11, 0, 0, 0),
+    ]):
+        db.add(Order(number=f"S-{i}", type="sale", status="completed", created_at=created, date=created))
+    db.commit()
+
+
+class TestDateRange:
+    def test_matches_func_date(self, db):
+        _seed_orders(db)
+        day = date(2026, 3, 10)
+        numbers = lambda cond: sorted(o.number for o in db.query(Order).filter(cond))
+        assert numbers(on_day(Order.created_at, day)) == numbers(func.date(Order.created_at) == day) == ["S-1", "S-2"]
+        assert numbers(since_day(Order.created_at, day)) == ["S-1", "S-2", "S-3"]
+        assert numbers(until_day(Order.created_at, day)) == ["S-0", "S-1", "S-2"]
+        assert numbers(before_day(Order.created_at, day)) == ["S-0"]
+        assert numbers(in_period(Order.created_at, day, date(2026, 3, 11))) == ["S-1", "S-2", "S-3"]
+        assert numbers(in_period(Order.created_at)) == ["S-0", "S-1", "S-2", "S-3"]
+
+    def test_date_column_uses_date_bounds(self, db):
+        db.add(DailySalesRollup(day=date(2026, 3, 10), sales_total=1, sales_count=1))
+        db.commit()
+        assert db.query(DailySalesRollup).filter(on_day(DailySalesRollup.day, date(2026, 3, 10))).count() == 1
+        assert db.query(DailySalesRollup).filter(since_day(DailySalesRollup.day, datetime(2026, 3, 10, 12, 0))).count() == 1
+
+    def test_query_plan_uses_index(self, db):
+        day = date(2026, 3, 10)
+        plan = _plan(db, db.query(func.count(Order.id)).filter(on_day(Order.created_at, day)))
+        assert "SEARCH" in plan and "ix_orders_created_at" in plan
+
+        plan = _plan(db, db.query(Order.id).filter(
+            Order.type == "sale", Order.status == "completed", on_day(Order.created_at, day)
+        ))
+        assert "SEARCH" in plan and "ix_orders_type_status_created" in plan
+
+        plan = _plan(db, db.query(func.count(Order.id)).filter(func.date(Order.created_at) == day))
+        assert "SEARCH" not in plan  # func.date() — to'liq skanerlash
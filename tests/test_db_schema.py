@@ -0,0 +1,112 @@
+"""
+Sxema tekshiruvi, indekslar va stocks takrorlarini birlashtirish (db_schema) testlari.
+pytest tests/test_db_schema.py -v
+"""
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from app.models.database import Base, Stock, StockMovement
+from app.utils.db_schema import (
+    DRIVER_LOCATIONS_INDEX,
+    HOT_QUERY_INDEXES,
+    SCHEMA_STEPS,
+    SCHEMA_VERSION,
+    ensure_hot_query_indexes,
+    ensure_schema,
+    get_schema_version,
+    table_columns,
+)
+
+
+@pytest.fixture
+def legacy_db():
+    """Eski baza: jadvallar bor, lekin yangi indekslar yo'q."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for name, *_ in HOT_QUERY_INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    session = sessionmaker(bind=engine, autoflush=False)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+class TestHotQueryIndexes:
+    def test_merges_duplicate_stocks_before_unique_index(self, legacy_db):
+        db = legacy_db
+        db.add_all([
+            Stock(id=1, warehouse_id=1, product_id=1, quantity=2),
+            Stock(id=2, warehouse_id=1, product_id=1, quantity=3),
+            Stock(id=3, warehouse_id=1, product_id=2, quantity=7),
+        ])
+        db.add(StockMovement(stock_id=2, warehouse_id=1, product_id=1, quantity_change=3, quantity_after=3,
+                             operation_type="purchase", document_type="Purchase", document_id=1))
+        db.commit()
+
+        ensure_hot_query_indexes(db)
+        ensure_hot_query_indexes(db)  # takroriy chaqiruv xavfsiz
+
+        assert {(s.id, s.product_id, s.quantity) for s in db.query(Stock)} == {(1, 1, 5), (3, 2, 7)}
+        assert db.query(StockMovement).one().stock_id == 1
+        names = {row[1] for row in db.execute(text("PRAGMA index_list(stocks)"))}
+        assert "uq_stocks_warehouse_product" in names
+        db.add(Stock(warehouse_id=1, product_id=2, quantity=1))
+        with pytest.raises(IntegrityError):
+            db.commit()
+
+
+class TestEnsureSchema:
+    def test_adds_missing_columns_and_records_version(self, legacy_db):
+        db = legacy_db
+        db.execute(text("ALTER TABLE cash_registers DROP COLUMN opening_balance"))
+        db.execute(text("ALTER TABLE stock_adjustment_doc_items DROP COLUMN previous_quantity"))
+        db.commit()
+
+        assert ensure_schema(db) == SCHEMA_VERSION
+        assert "opening_balance" in table_columns(db, "cash_registers")
+        assert "previous_quantity" in table_columns(db, "stock_adjustment_doc_items")
+        assert "uq_stocks_warehouse_product" in {row[1] for row in db.execute(text("PRAGMA index_list(stocks)"))}
+        assert get_schema_version(db) == SCHEMA_VERSION
+
+    def test_second_run_skips_recorded_steps(self, legacy_db, monkeypatch):
+        db = legacy_db
+        ensure_schema(db)
+        calls = []
+        monkeypatch.setattr(
+            "app.utils.db_schema.SCHEMA_STEPS",
+            [(v, name, lambda _db: calls.append(name)) for v, name, _step in SCHEMA_STEPS],
+        )
+        assert ensure_schema(db) == SCHEMA_VERSION
+        assert calls == []
+        assert db.execute(text("SELECT COUNT(*) FROM schema_version")).scalar() == len(SCHEMA_STEPS)
+
+    def test_failed_index_does_not_advance_version(self, legacy_db, monkeypatch):
+        db = legacy_db
+        monkeypatch.setattr(
+            "app.utils.db_schema.HOT_QUERY_INDEXES",
+            HOT_QUERY_INDEXES + [("ix_bad", "stocks", ("no_such_column",), False)],
+        )
+        with pytest.raises(RuntimeError, match="ix_bad"):
+            ensure_schema(db)
+        db.rollback()
+        assert get_schema_version(db) == 0
+        # qolgan indekslar saqlangan
+        assert "uq_stocks_warehouse_product" in {row[1] for row in db.execute(text("PRAGMA index_list(stocks)"))}
+
+    def test_latest_positions_step_creates_only_its_index(self, legacy_db):
+        db = legacy_db
+        db.execute(text("CREATE TABLE schema_version (id INTEGER PRIMARY KEY, version INTEGER NOT NULL, applied_at DATETIME)"))
+        db.execute(text("INSERT INTO schema_version (version) VALUES (3)"))
+        db.commit()
+        assert ensure_schema(db) == SCHEMA_VERSION
+        assert DRIVER_LOCATIONS_INDEX[0] in {row[1] for row in db.execute(text("PRAGMA index_list(driver_locations)"))}
+        # 1-bosqich indekslari qayta yaratilmaydi
+        assert "uq_stocks_warehouse_product" not in {row[1] for row in db.execute(text("PRAGMA index_list(stocks)"))}
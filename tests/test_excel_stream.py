@@ -0,0 +1,61 @@
+"""
+Excel eksport (app/utils/excel_stream.py) testlari — write-only fayl qayta o'qiladi.
+pytest tests/test_excel_stream.py -v
+"""
+import asyncio
+import io
+
+import pytest
+
+pytest.importorskip("openpyxl")
+
+from openpyxl import load_workbook
+
+from app.models.database import Partner
+from app.utils.excel_stream import XLSX_MEDIA_TYPE, XlsxWriter, stream_rows, xlsx_response
+
+
+def _read(f):
+    return load_workbook(io.BytesIO(f.read()))
+
+
+class TestXlsxWriter:
+    def test_rows_styles_and_merge(self):
+        xw = XlsxWriter("Savdo", widths=(6, 20))
+        xw.title("Savdo hisoboti")
+        xw.section("Bo'lim", span=3)
+        xw.header(["№", "Mijoz", "Jami"])
+        xw.rows([i, f"Mijoz {i}", i * 10] for i in range(1, 4))
+        xw.row()
+        assert xw.rows_written == 7
+        ws = _read(xw.save())["Savdo"]
+        assert ws["A1"].value == "Savdo hisoboti" and ws["A1"].font.bold
+        assert "A2:C2" in {str(r) for r in ws.merged_cells.ranges}
+        assert [c.value for c in ws[3]] == ["№", "Mijoz", "Jami"]
+        assert ws["A3"].fill.start_color.rgb.endswith("4472C4")
+        assert [c.value for c in ws[6]] == [3, "Mijoz 3", 30]
+        assert ws.column_dimensions["B"].width == 20
+
+
+class TestStreaming:
+    def test_stream_rows_and_response(self, db):
+        db.add_all([Partner(code=f"K{i}", name=f"Mijoz {i}") for i in range(25)])
+        db.commit()
+        q = db.query(Partner.name).order_by(Partner.id)
+
+        def build():
+            xw = XlsxWriter("Mijozlar")
+            xw.header(["Nomi"])
+            xw.rows(stream_rows(q, batch=10))
+            return xw
+
+        async def run():
+            response = await xlsx_response(build, "mijozlar.xlsx")
+            body = b"".join([chunk async for chunk in response.body_iterator])
+            return response, body
+
+        response, body = asyncio.run(run())
+        assert response.media_type == XLSX_MEDIA_TYPE
+        assert response.headers["content-disposition"] == "attachment; filename=mijozlar.xlsx"
+        ws = load_workbook(io.BytesIO(body))["Mijozlar"]
+        assert ws.max_row == 26 and ws["A26"].value == "Mijoz 24"
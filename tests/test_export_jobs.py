@@ -0,0 +1,86 @@
+"""
+Fon eksport vazifalari (app/services/export_jobs.py) testlari.
+pytest tests/test_export_jobs.py -v
+"""
+import os
+import threading
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("openpyxl")
+
+from openpyxl import load_workbook
+
+import app.services.export_jobs as export_jobs
+from app.models.database import Product
+from app.services.export_jobs import (
+    DONE,
+    FAILED,
+    JOB_TTL,
+    export_job,
+    get_export_job,
+    prune_export_jobs,
+    submit_export,
+)
+from app.utils.excel_stream import XlsxWriter
+
+release = threading.Event()
+
+
+@export_job("test_products", "Test mahsulotlar")
+def _products_book(db, prefix):
+    release.wait(5)
+    xw = XlsxWriter("Mahsulotlar")
+    xw.rows([f"{prefix}{name}"] for (name,) in db.query(Product.name).order_by(Product.id))
+    return xw, "mahsulotlar.xlsx"
+
+
+@export_job("test_broken", "Xato")
+def _broken_book(db):
+    raise ValueError("buzilgan")
+
+
+@pytest.fixture
+def jobs(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(export_jobs, "EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(export_jobs, "SessionLocal", lambda: db)
+    monkeypatch.setattr(export_jobs, "_jobs", {})
+    monkeypatch.setattr(export_jobs, "_inflight", {})
+    release.clear()
+    return tmp_path
+
+
+def _wait(job):
+    for _ in range(500):
+        if not job.pending:
+            return job
+        threading.Event().wait(0.01)
+    raise AssertionError("vazifa tugamadi")
+
+
+class TestExportJobs:
+    def test_dedup_download_and_expiry(self, jobs):
+        job = submit_export("test_products", {"prefix": "#"}, user_id=1)
+        assert submit_export("test_products", {"prefix": "#"}, user_id=1) is job
+        other_user = submit_export("test_products", {"prefix": "#"}, user_id=2)
+        assert other_user is not job
+        release.set()
+        _wait(job)
+        _wait(other_user)
+        assert job.status == DONE and job.filename == "mahsulotlar.xlsx"
+        ws = load_workbook(job.path)["Mahsulotlar"]
+        assert [r[0].value for r in ws.iter_rows()] == ["#Holva", "#Shakar"]
+        assert get_export_job(job.id, 1) is job and get_export_job(job.id, 2) is None
+        # Tugagan vazifadan keyin yangi so'rov — yangi vazifa
+        again = submit_export("test_products", {"prefix": "#"}, user_id=1)
+        assert again is not job
+        _wait(again)
+
+        assert prune_export_jobs(job.finished_at + JOB_TTL + timedelta(seconds=1)) >= 2
+        assert get_export_job(job.id, 1) is None and not os.path.exists(job.path)
+
+    def test_failed_job(self, jobs):
+        job = _wait(submit_export("test_broken", {}, user_id=1))
+        assert job.status == FAILED and job.error == "buzilgan"
+        assert job.to_dict()["download_url"] is None
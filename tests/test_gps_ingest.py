@@ -0,0 +1,81 @@
+"""
+GPS write-behind (app/services/gps_ingest.py) testlari.
+pytest tests/test_gps_ingest.py -v
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.models.database import AgentLocation, DriverLocation
+from app.services.gps_ingest import GpsPoint, GpsWriteBehind, parse_points, write_points
+from app.services.latest_positions import AGENT, DRIVER, latest_positions
+
+NOW = datetime(2026, 3, 1, 12, 0)
+
+
+def _point(entity_type, entity_id, minute, lat=41.0):
+    return GpsPoint(entity_type, entity_id, lat, 69.0, 5.0, 90, 30.0, NOW + timedelta(minutes=minute))
+
+
+class TestGpsIngest:
+    def test_parse_points(self):
+        points, rejected = parse_points(AGENT, 7, [
+            {"lat": 41.3, "lng": 69.2, "battery": "80", "recorded_at": "2026-03-01T11:58:00"},
+            {"latitude": 41.3, "longitude": 69.2, "recorded_at": "2026-03-02T00:00:00"},  # kelajak — hozir
+            {"latitude": 95, "longitude": 69.2},
+            {"latitude": 41, "longitude": 69, "recorded_at": "kecha"},
+            "x",
+        ], now=NOW)
+        assert rejected == 3
+        assert [(p.entity_id, p.battery, p.recorded_at) for p in points] == [
+            (7, 80, datetime(2026, 3, 1, 11, 58)),
+            (7, None, NOW),
+        ]
+
+    def test_write_points_coalesces_latest(self, db):
+        n = write_points(db, [_point(AGENT, 1, 0), _point(AGENT, 1, 2, lat=42.0), _point(AGENT, 1, 1), _point(DRIVER, 3, 0)])
+        db.commit()
+        assert n == 4
+        assert db.query(AgentLocation).count() == 3
+        assert db.query(DriverLocation).one().speed == 30.0
+        assert latest_positions(db, AGENT)[1].latitude == 42.0
+        assert set(latest_positions(db, DRIVER)) == {3}
+
+    def test_buffer_flushes_in_background_and_requeues_on_error(self):
+        batches = []
+        fail = {"left": 1}
+
+        def writer(points):
+            if fail["left"]:
+                fail["left"] -= 1
+                raise RuntimeError("database is locked")
+            batches.append(list(points))
+            return len(points)
+
+        buf = GpsWriteBehind(writer=writer, interval=0.05, flush_at=1000, max_pending=5)
+        buf.submit([_point(AGENT, 1, i) for i in range(3)])
+        buf.submit([_point(DRIVER, 2, i) for i in range(4)])  # chegara 5 — eng eski 2 tasi tashlanadi
+        deadline = time.time() + 2
+        while not batches and time.time() < deadline:
+            time.sleep(0.02)
+        buf.stop()
+        assert len(batches) == 1 and len(batches[0]) == 5
+        assert batches[0][0] == _point(AGENT, 1, 2)
+        assert buf.stats() == {"pending": 0, "written": 5, "flushes": 1, "dropped": 2, "failures": 1}
+
+    def test_single_ping_rejects_out_of_range(self, monkeypatch):
+        import asyncio
+        from app.routes import api_routes
+        from app.utils.auth import create_session_token
+        submitted = []
+        monkeypatch.setattr(api_routes.gps_buffer, "submit", submitted.extend)
+        token = create_session_token(3, "driver")
+        for lat, lng in ((91.0, 69.2), (41.3, -181.0), (float("nan"), 69.2)):
+            result = asyncio.run(api_routes.driver_location_update(lat, lng, None, None, token))
+            assert result["success"] is False
+        assert submitted == []
+        assert asyncio.run(api_routes.driver_location_update(41.3, 69.2, 5.0, 80, token)) == {"success": True, "queued": 1}
+        assert [(p.entity_type, p.entity_id, p.latitude, p.battery) for p in submitted] == [(DRIVER, 3, 41.3, 80)]
@@ -0,0 +1,51 @@
+"""
+Oxirgi joylashuvlar (app/services/latest_positions.py) testlari.
+pytest tests/test_latest_positions.py -v
+"""
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.models.database import AgentLocation, DriverLocation, LatestPosition
+from app.services.latest_positions import (
+    AGENT,
+    DRIVER,
+    latest_positions,
+    rebuild_latest_positions,
+    record_position,
+)
+
+
+def _ping(db, agent_id, lat, when):
+    loc = AgentLocation(agent_id=agent_id, latitude=lat, longitude=69.2, battery=80, recorded_at=when)
+    db.add(loc)
+    record_position(db, AGENT, agent_id, when, latitude=lat, longitude=69.2, battery=80)
+    db.flush()
+    return loc
+
+
+class TestLatestPositions:
+    def test_upsert_keeps_newest(self, db):
+        _ping(db, 1, 41.1, datetime(2026, 3, 1, 9, 0))
+        _ping(db, 1, 41.3, datetime(2026, 3, 1, 9, 5))
+        _ping(db, 1, 41.2, datetime(2026, 3, 1, 9, 2))  # kechikib kelgan signal
+        _ping(db, 2, 40.0, datetime(2026, 3, 1, 9, 1))
+        assert db.query(LatestPosition).count() == 2
+        positions = latest_positions(db, AGENT)
+        assert positions[1].latitude == 41.3 and positions[1].battery == 80
+        assert set(latest_positions(db, AGENT, [2])) == {2}
+        assert latest_positions(db, DRIVER) == {}
+        assert record_position(db, DRIVER, 1, datetime(2026, 3, 1), latitude=1, speed=30) is True
+
+    def test_rebuild_from_history(self, db):
+        db.add_all([
+            AgentLocation(agent_id=1, latitude=1, longitude=1, recorded_at=datetime(2026, 3, 1, 8)),
+            AgentLocation(agent_id=1, latitude=2, longitude=2, recorded_at=datetime(2026, 3, 1, 10)),
+            DriverLocation(driver_id=5, latitude=3, longitude=3, speed=40, recorded_at=datetime(2026, 3, 1, 9)),
+        ])
+        db.flush()
+        assert rebuild_latest_positions(db) == 2
+        assert latest_positions(db, AGENT)[1].latitude == 2
+        assert latest_positions(db, DRIVER)[5].speed == 40
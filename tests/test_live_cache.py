@@ -0,0 +1,66 @@
+"""
+Live kesh (TTLCache) testlari.
+pytest tests/test_live_cache.py -v
+"""
+import time
+
+from app.utils.live_cache import KEY_WAREHOUSE, TTLCache, live_cache
+
+
+class TestTTLCache:
+    def test_hit_miss_and_expiry(self):
+        cache = TTLCache(maxsize=4, default_ttl=0.05)
+        calls = []
+        compute = lambda: calls.append(1) or len(calls)
+        assert cache.get_or_set("a", compute) == 1
+        assert cache.get_or_set("a", compute) == 1
+        time.sleep(0.06)
+        assert cache.get_or_set("a", compute) == 2
+        stats = cache.stats()
+        assert (stats["hits"], stats["misses"]) == (1, 2)
+
+    def test_lru_eviction(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert cache.get("b") is None
+        assert cache.get("a") == 1
+        assert cache.stats()["evictions"] == 1
+
+    def test_invalidate_by_prefix(self):
+        cache = TTLCache()
+        cache.set("live:executive:2026-01-01", 1)
+        cache.set("live:warehouse", 2)
+        assert cache.invalidate("live:executive") == 1
+        assert cache.get("live:warehouse") == 2
+
+    def test_stock_movement_invalidates_warehouse(self, db):
+        from app.services.stock_service import create_stock_movement
+
+        live_cache.set(KEY_WAREHOUSE, {"low_stock": 0})
+        create_stock_movement(db, 1, 1, 5, "purchase", "Purchase", 1)
+        db.commit()
+        assert live_cache.get(KEY_WAREHOUSE) is None
+
+    def test_value_cached_before_commit_is_invalidated(self, db):
+        # Yozuv va commit orasida keshlangan (eski) qiymat commit dan keyin qolmasligi kerak
+        from app.services.stock_service import create_stock_movement
+
+        live_cache.invalidate(KEY_WAREHOUSE)
+        create_stock_movement(db, 1, 1, 5, "purchase", "Purchase", 1)
+        assert live_cache.get_or_set(KEY_WAREHOUSE, lambda: {"low_stock": 0}) == {"low_stock": 0}
+        db.commit()
+        assert live_cache.get(KEY_WAREHOUSE) is None
+
+    def test_rollback_keeps_cache(self, db):
+        from app.services.stock_service import create_stock_movement
+
+        live_cache.set(KEY_WAREHOUSE, {"low_stock": 0})
+        create_stock_movement(db, 1, 1, 5, "purchase", "Purchase", 1)
+        db.rollback()
+        assert live_cache.get(KEY_WAREHOUSE) == {"low_stock": 0}
+        db.commit()
+        assert live_cache.get(KEY_WAREHOUSE) == {"low_stock": 0}
+        live_cache.invalidate(KEY_WAREHOUSE)
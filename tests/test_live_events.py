@@ -0,0 +1,70 @@
+"""
+SSE pub/sub (live_events) testlari.
+pytest tests/test_live_events.py -v
+"""
+import asyncio
+import json
+import threading
+
+from app.utils.live_events import bus
+
+
+def _drain(sub):
+    messages = []
+    while not sub.queue.empty():
+        messages.append(sub.queue.get_nowait())
+    return messages
+
+
+def _data(message):
+    return json.loads(message.split("data: ", 1)[1])
+
+
+class TestLiveEvents:
+    def test_events_sent_only_after_commit(self, db):
+        from app.services.stock_service import create_stock_movements_bulk
+
+        async def run():
+            sub = bus.subscribe()
+            try:
+                create_stock_movements_bulk(db, [(1, 1, 5), (1, 2, 3)], "purchase", "Purchase", 1)
+                assert _drain(sub) == []
+                db.commit()
+                messages = _drain(sub)
+                assert len(messages) == 1 and messages[0].startswith("event: stock\n")
+                assert len(_data(messages[0])["items"]) == 2
+
+                create_stock_movements_bulk(db, [(1, 1, -1)], "sale", "Sale", 2)
+                db.rollback()
+                db.commit()
+                assert _drain(sub) == []
+            finally:
+                bus.unsubscribe(sub)
+
+        asyncio.run(run())
+
+    def test_user_scoped_publish_from_other_thread(self):
+        async def run():
+            mine, other = bus.subscribe(user_id=1), bus.subscribe(user_id=2)
+            try:
+                t = threading.Thread(target=bus.publish, args=("notification", {"id": 7}), kwargs={"user_id": 1})
+                t.start()
+                t.join()
+                message = await asyncio.wait_for(mine.queue.get(), timeout=1)
+                assert _data(message) == {"id": 7}
+                assert other.queue.empty()
+            finally:
+                bus.unsubscribe(mine)
+                bus.unsubscribe(other)
+
+        asyncio.run(run())
+
+    def test_pwa_token_gets_only_broadcast_events(self):
+        from app.routes.api_routes import _stream_subscriber
+        from app.utils.auth import create_session_token
+
+        # agent id=1 User id=1 ning shaxsiy bildirishnomalarini olmasligi kerak
+        assert _stream_subscriber(create_session_token(1, "agent")) == (True, None)
+        assert _stream_subscriber(create_session_token(3, "driver")) == (True, None)
+        assert _stream_subscriber("yaroqsiz") == (False, None)
+        assert _stream_subscriber(None) == (False, None)
@@ -0,0 +1,81 @@
+"""
+GPS treklarini siqish (app/services/location_tracks.py, app/utils/geo.py) testlari.
+pytest tests/test_location_tracks.py -v
+"""
+from datetime import date, datetime, timedelta
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.models.database import AgentLocation, DriverLocation, LocationTrack
+from app.services.latest_positions import AGENT, DRIVER
+from app.services.location_tracks import compress_day, day_track, track_days_to_compress
+from app.utils.geo import decode_polyline, douglas_peucker, encode_polyline, haversine_m
+
+DAY = date(2026, 3, 1)
+START = datetime(2026, 3, 1, 9, 0)
+
+
+def _line(db, agent_id, n, start=START, step_s=10):
+    """To'g'ri chiziq bo'ylab n ta nuqta (shimolga ~11 m dan) + oxirida burilish."""
+    for i in range(n):
+        db.add(AgentLocation(agent_id=agent_id, latitude=41.3 + i * 0.0001, longitude=69.2,
+                             recorded_at=start + timedelta(seconds=i * step_s)))
+    db.add(AgentLocation(agent_id=agent_id, latitude=41.3 + (n - 1) * 0.0001, longitude=69.21,
+                         recorded_at=start + timedelta(seconds=n * step_s)))
+    db.flush()
+
+
+class TestGeo:
+    def test_polyline_and_simplify(self):
+        # Google polyline hujjatidagi misol
+        coords = [(38.5, -120.2), (40.7, -120.95), (43.252, -126.453)]
+        assert encode_polyline(coords) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+        assert decode_polyline(encode_polyline(coords)) == coords
+        assert 1110 < haversine_m(41.3, 69.2, 41.31, 69.2) < 1113
+        line = [(41.3 + i * 0.0001, 69.2 + (0.00002 if i % 2 else 0)) for i in range(50)]
+        assert douglas_peucker(line, 8.0) == [0, 49]
+
+
+class TestLocationTracks:
+    def test_compress_day_replaces_raw_points(self, db):
+        _line(db, 1, 30)
+        db.add(DriverLocation(driver_id=4, latitude=41.0, longitude=69.0, recorded_at=START))
+        db.flush()
+        deleted = compress_day(db, AGENT, 1, DAY)
+        db.flush()
+        assert deleted == 31
+        assert db.query(AgentLocation).count() == 0
+        assert db.query(DriverLocation).count() == 1
+        track = db.query(LocationTrack).one()
+        assert (track.raw_count, track.point_count) == (31, 3)
+        replay = day_track(db, AGENT, 1, DAY)
+        assert replay["source"] == "compressed"
+        assert [t for _lat, _lng, t in replay["points"]] == [START, START + timedelta(seconds=290), START + timedelta(seconds=300)]
+        assert abs(replay["points"][1][0] - 41.3029) < 1e-6
+
+    def test_late_points_merge_into_existing_track(self, db):
+        _line(db, 1, 10)
+        compress_day(db, AGENT, 1, DAY)
+        # kechikib kelgan oflayn trek — kunning boshqa qismidan
+        _line(db, 1, 10, start=START + timedelta(hours=3))
+        assert day_track(db, AGENT, 1, DAY)["source"] == "mixed"
+        compress_day(db, AGENT, 1, DAY)
+        db.flush()
+        track = db.query(LocationTrack).one()
+        assert track.raw_count == 22 and track.point_count == 6
+        points = day_track(db, AGENT, 1, DAY)["points"]
+        assert [p[2] for p in points] == sorted(p[2] for p in points)
+        assert day_track(db, DRIVER, 1, DAY)["source"] == "empty"
+
+    def test_days_to_compress_respects_retention(self, db):
+        _line(db, 1, 3)
+        _line(db, 2, 3, start=START + timedelta(days=5))
+        db.add(DriverLocation(driver_id=4, latitude=41.0, longitude=69.0, recorded_at=START + timedelta(days=1)))
+        db.flush()
+        today = DAY + timedelta(days=16)
+        assert track_days_to_compress(db, keep_days=14, today=today) == [
+            (AGENT, 1, DAY),
+            (DRIVER, 4, DAY + timedelta(days=1)),
+        ]
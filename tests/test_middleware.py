@@ -0,0 +1,140 @@
+"""
+Yagona ASGI middleware (app/middleware.py) testlari — ilova ASGI darajasida chaqiriladi.
+pytest tests/test_middleware.py -v
+"""
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+import app.middleware as middleware
+from app.middleware import AppMiddleware
+
+CSRF = "c" * 64
+BOUNDARY = "----test"
+
+
+class _User:
+    id = 7
+
+
+async def _inner(scope, receive, send):
+    request = Request(scope, receive)
+    if request.url.path == "/boom":
+        raise RuntimeError("xato")
+    form = await request.form() if request.method == "POST" else {}
+    body = {
+        "fields": sorted(k for k in form if k != "file"),
+        "file_size": len(await form["file"].read()) if "file" in form else 0,
+        "csrf": scope["state"].get("csrf_token"),
+        "user": scope["state"]["auth"].user_id if "auth" in scope["state"] else None,
+    }
+    await JSONResponse(body)(scope, receive, send)
+
+
+def _call(method, path, headers=(), body=b"", chunk=1024):
+    chunks = [body[i:i + chunk] for i in range(0, len(body), chunk)] or [b""]
+    sent = {"chunks": 0}
+    result = {"headers": []}
+
+    async def receive():
+        i = sent["chunks"]
+        if i < len(chunks):
+            sent["chunks"] = i + 1
+            return {"type": "http.request", "body": chunks[i], "more_body": i + 1 < len(chunks)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+            result["headers"] = [(k.decode(), v.decode()) for k, v in message["headers"]]
+        elif message["type"] == "http.response.body":
+            result["body"] = result.get("body", b"") + message.get("body", b"")
+
+    scope = {
+        "type": "http", "method": method, "path": path, "raw_path": path.encode(), "query_string": b"",
+        "root_path": "", "scheme": "http", "server": ("test", 80), "client": ("127.0.0.1", 1),
+        "headers": [(k.encode(), v.encode()) for k, v in headers],
+    }
+    asyncio.run(AppMiddleware(_inner)(scope, receive, send))
+    result["chunks_read"] = sent["chunks"]
+    result["total_chunks"] = len(chunks)
+    return result
+
+
+@pytest.fixture
+def logged_in(monkeypatch, tmp_path):
+    monkeypatch.setattr(middleware, "decode_token", lambda t: {"user_id": 7} if t == "ok" else None)
+    monkeypatch.setattr(middleware, "get_active_user", lambda user_id: _User())
+    monkeypatch.setattr(middleware, "_ROOT", str(tmp_path))
+    return [("cookie", f"session_token=ok; csrf_token={CSRF}")]
+
+
+def _multipart(fields, file_size):
+    parts = [
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode()
+        for k, v in fields
+    ]
+    parts.append(
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="a.xlsx"\r\n'
+        f"Content-Type: application/octet-stream\r\n\r\n".encode() + b"x" * file_size + b"\r\n"
+    )
+    return b"".join(parts) + f"--{BOUNDARY}--\r\n".encode()
+
+
+class TestAuth:
+    def test_redirects_and_401_without_session(self):
+        r = _call("GET", "/", [("accept", "text/html")])
+        assert r["status"] == 303 and ("location", "/login") in r["headers"]
+        assert _call("GET", "/api/stats")["status"] == 401
+        assert _call("GET", "/ping")["status"] == 200
+
+    def test_sets_auth_context_and_csrf_cookie(self, logged_in):
+        r = _call("GET", "/", [("cookie", "session_token=ok")])
+        assert r["status"] == 200 and b'"user":7' in r["body"]
+        assert ("x-server-source", "pwp") in r["headers"]
+        assert any(k == "set-cookie" and v.startswith("csrf_token=") for k, v in r["headers"])
+        assert not any(k == "set-cookie" for k, _ in _call("GET", "/", logged_in)["headers"])
+
+
+class TestCsrf:
+    def test_form_post(self, logged_in):
+        form = ("content-type", "application/x-www-form-urlencoded")
+        r = _call("POST", "/save", logged_in + [form], f"csrf_token={CSRF}&name=Holva".encode())
+        assert r["status"] == 200 and b'"fields":["csrf_token","name"]' in r["body"]
+        r = _call("POST", "/save", logged_in + [form, ("accept", "text/html")], b"name=Holva")
+        assert r["status"] == 303 and ("location", "/?error=csrf") in r["headers"]
+        assert _call("POST", "/save", logged_in + [("x-csrf-token", CSRF)])["status"] == 200
+        assert _call("POST", "/save", logged_in)["status"] == 403
+
+    def test_multipart_token_first_stops_reading_early(self, logged_in, monkeypatch):
+        seen = []
+        real = middleware._token_from_multipart
+        monkeypatch.setattr(middleware, "_token_from_multipart", lambda buf: seen.append(len(buf)) or real(buf))
+        body = _multipart([("csrf_token", CSRF), ("name", "Holva")], 200 * 1024)
+        r = _call("POST", "/import", logged_in + [("content-type", f"multipart/form-data; boundary={BOUNDARY}")], body)
+        assert r["status"] == 200 and b'"file_size":204800' in r["body"]
+        assert max(seen) <= 1024  # faqat birinchi bo'lak skanerlandi, qolgani to'g'ridan-to'g'ri ilovaga
+        assert r["chunks_read"] == r["total_chunks"]
+
+    def test_multipart_token_last_and_missing(self, logged_in):
+        headers = logged_in + [("content-type", f"multipart/form-data; boundary={BOUNDARY}")]
+        body = _multipart([("name", "Holva")], 10 * 1024)
+        body = body.replace(f"--{BOUNDARY}--".encode(), (
+            f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="csrf_token"\r\n\r\n{CSRF}\r\n--{BOUNDARY}--'
+        ).encode())
+        assert _call("POST", "/import", headers, body)["status"] == 200
+        assert _call("POST", "/import", headers, _multipart([("name", "Holva")], 10 * 1024))["status"] == 403
+
+
+class TestErrors:
+    def test_app_error_returns_500_page(self, logged_in, tmp_path):
+        r = _call("GET", "/boom", logged_in + [("accept", "text/html")])
+        assert r["status"] == 500 and b"Server xatosi" in r["body"]
+        assert ("x-server-source", "pwp") in r["headers"]
+        assert _call("GET", "/boom", logged_in)["body"] == b'{"detail":"Server xatosi"}'
+        assert "[global_safe]" in (tmp_path / "server_error.log").read_text(encoding="utf-8")
@@ -0,0 +1,48 @@
+"""
+Kam qoldiq bildirishnomalari (check_low_stock_and_notify) testlari.
+pytest tests/test_notifications.py -v
+"""
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import event
+
+from app.models.database import Notification, Product, Stock, Warehouse
+from app.utils.notifications import check_low_stock_and_notify
+
+
+def _seed(db, n_products):
+    db.add(Warehouse(id=2, code="W2", name="Filial"))
+    for pid in range(10, 10 + n_products):
+        db.add(Product(id=pid, code=f"T{pid}", name=f"Tovar {pid}", min_stock=10, is_active=True))
+        db.add(Stock(warehouse_id=1, product_id=pid, quantity=1))
+        db.add(Stock(warehouse_id=2, product_id=pid, quantity=2))
+    db.commit()
+
+
+class TestLowStockNotify:
+    def test_one_notification_per_product_and_no_repeat(self, db):
+        _seed(db, 3)
+        assert check_low_stock_and_notify(db) == 3
+        assert check_low_stock_and_notify(db) == 0
+        assert db.query(Notification).count() == 3
+        assert {n.related_entity_id for n in db.query(Notification)} == {10, 11, 12}
+
+    def test_product_ids_limits_check(self, db):
+        _seed(db, 3)
+        assert check_low_stock_and_notify(db, product_ids=[11]) == 1
+        assert check_low_stock_and_notify(db, product_ids=[]) == 0
+        assert db.query(Notification).one().related_entity_id == 11
+
+    def test_statement_count_independent_of_low_stock_rows(self, db):
+        _seed(db, 50)
+        statements = []
+        engine = db.get_bind()
+        listener = lambda *args, **kwargs: statements.append(1)
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            assert check_low_stock_and_notify(db) == 50
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert len(statements) <= 3
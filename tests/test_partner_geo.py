@@ -0,0 +1,90 @@
+"""
+Mijozlar fazoviy indeksi (app/services/partner_geo.py, app/utils/geo.GridIndex) testlari.
+pytest tests/test_partner_geo.py -v
+"""
+import random
+import time
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.models.database import Partner, PartnerLocation
+from app.services.partner_geo import (
+    invalidate_partner_index,
+    nearest_partners,
+    partners_in_bbox,
+    set_partner_location,
+)
+from app.utils.geo import GridIndex, haversine_m
+
+
+@pytest.fixture(autouse=True)
+def _fresh_index():
+    invalidate_partner_index()
+    yield
+    invalidate_partner_index()
+
+
+class TestGridIndex:
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        points = [(41 + rng.random() * 0.3, 69 + rng.random() * 0.3, i) for i in range(800)]
+        index = GridIndex(0.01)
+        for lat, lng, i in points:
+            index.add(lat, lng, i)
+        for _ in range(50):
+            lat, lng = 40.95 + rng.random() * 0.4, 68.95 + rng.random() * 0.4
+            brute = sorted((haversine_m(lat, lng, a, b), i) for a, b, i in points)
+            assert [i for _d, i in index.nearest(lat, lng, k=7)] == [i for _d, i in brute[:7]]
+            assert [i for _d, i in index.nearest(lat, lng, k=50, max_distance_m=900)] == [i for d, i in brute if d <= 900][:50]
+            s, w = lat - 0.05, lng - 0.05
+            n, e = s + rng.random() * 0.2, w + rng.random() * 0.2
+            assert sorted(index.within_bbox(s, w, n, e)) == sorted(i for a, b, i in points if s <= a <= n and w <= b <= e)
+        assert len(index.within_bbox(-90, -180, 90, 180)) == 800
+        assert GridIndex().nearest(41, 69) == []
+
+    def test_far_query_and_fewer_points_than_k(self):
+        rng = random.Random(3)
+        points = [(41.2 + rng.random() * 0.2, 69.1 + rng.random() * 0.2, i) for i in range(300)]
+        index = GridIndex(0.001)
+        for lat, lng, i in points:
+            index.add(lat, lng, i)
+        for lat, lng, k in ((0.0, 0.0, 5), (41.3, 69.2, 500), (-33.9, 151.2, 1000)):
+            brute = sorted((haversine_m(lat, lng, a, b), i) for a, b, i in points)
+            started = time.perf_counter()
+            near = index.nearest(lat, lng, k=k)
+            # ilgari (0, 0) dan so'rov ~70 ming halqani aylanardi
+            assert time.perf_counter() - started < 0.5
+            assert [i for _d, i in near] == [i for _d, i in brute[:k]]
+
+
+class TestPartnerGeo:
+    def _partner(self, db, pid, name, lat, lng, active=True):
+        db.add(Partner(id=pid, name=name, type="customer", is_active=active))
+        db.add(PartnerLocation(partner_id=pid, address=f"{name} manzil", latitude=lat, longitude=lng))
+
+    def test_viewport_and_nearest(self, db):
+        self._partner(db, 1, "Chorsu", 41.326, 69.228)
+        self._partner(db, 2, "Yunusobod", 41.366, 69.288)
+        self._partner(db, 3, "Yopiq", 41.3265, 69.2285, active=False)
+        db.add(Partner(id=4, name="Faqat partner", type="customer", is_active=True, latitude=41.311, longitude=69.240))
+        db.flush()
+        assert {m["id"] for m in partners_in_bbox(db, 41.30, 69.20, 41.33, 69.25)} == {1, 4}
+        near = nearest_partners(db, 41.3111, 69.2401, k=2)
+        assert [m["id"] for m in near] == [4, 1]
+        assert near[0]["distance_m"] < 20 and near[1]["name"] == "Chorsu"
+        assert [m["id"] for m in nearest_partners(db, 41.366, 69.288, k=5, radius_m=1000)] == [2]
+
+    def test_set_location_and_invalidate(self, db):
+        db.add(Partner(id=5, name="Yangi", type="customer", is_active=True))
+        db.flush()
+        assert nearest_partners(db, 41.3, 69.2) == []
+        set_partner_location(db, db.get(Partner, 5), 41.3, 69.2, address="Markaz")
+        set_partner_location(db, db.get(Partner, 5), 41.301, 69.2)
+        db.flush()
+        assert nearest_partners(db, 41.3, 69.2) == []  # keshdagi indeks
+        invalidate_partner_index()
+        (marker,) = nearest_partners(db, 41.3, 69.2)
+        assert (marker["lat"], marker["address"]) == (41.301, "Markaz")
+        assert db.query(PartnerLocation).count() == 1
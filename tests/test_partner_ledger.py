@@ -0,0 +1,114 @@
+"""
+Kontragent hisob daftari (app/services/partner_ledger.py) testlari.
+pytest tests/test_partner_ledger.py -v
+"""
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.models.database import (
+    Order,
+    Partner,
+    PartnerBalanceDoc,
+    PartnerBalanceDocItem,
+    PartnerBalanceSnapshot,
+    PartnerLedgerEntry,
+    Payment,
+    Purchase,
+)
+from app.services.partner_ledger import (
+    partner_movements,
+    partner_totals_before,
+    post_balance_doc_to_ledger,
+    post_order_to_ledger,
+    post_payment_to_ledger,
+    post_purchase_to_ledger,
+    rebuild_partner_ledger,
+    write_partner_snapshots,
+)
+
+
+def _order(db, number, total, when, o_type="sale"):
+    order = Order(number=number, type=o_type, partner_id=1, warehouse_id=1, status="completed", total=total, date=when)
+    db.add(order)
+    db.flush()
+    post_order_to_ledger(db, order)
+    return order
+
+
+def _entries(db):
+    return sorted(
+        (e.doc_type, e.doc_id, e.debit, e.credit) for e in db.query(PartnerLedgerEntry).filter(PartnerLedgerEntry.partner_id == 1)
+    )
+
+
+@pytest.fixture
+def partner(db):
+    db.add(Partner(id=1, code="K1", name="Mijoz"))
+    db.flush()
+
+
+class TestPartnerLedger:
+    def test_documents_post_and_revert(self, db, partner):
+        sale = _order(db, "S-1", 1000, datetime(2026, 1, 10))
+        _order(db, "R-1", 200, datetime(2026, 2, 3), o_type="return_sale")
+        pay = Payment(number="P-1", type="income", partner_id=1, amount=300, status="confirmed", date=datetime(2026, 2, 5))
+        purchase = Purchase(number="X-1", partner_id=1, warehouse_id=1, total=400, total_expenses=50,
+                            status="confirmed", date=datetime(2026, 2, 7))
+        db.add_all([pay, purchase])
+        db.flush()
+        post_payment_to_ledger(db, pay)
+        post_purchase_to_ledger(db, purchase)
+
+        rows, opening_debit, opening_credit = partner_movements(db, 1, datetime(2026, 2, 1), datetime(2026, 2, 28))
+        assert (opening_debit, opening_credit) == (1000, 0)
+        assert [(r["doc_type"], r["debit"], r["credit"], r["balance"]) for r in rows] == [
+            ("Qaytarish", 0, 200, 800),
+            ("To'lov (kirim)", 0, 300, 500),
+            ("Xarid", 0, 450, 50),
+        ]
+        assert rows[2]["doc_url"] == f"/purchases/edit/{purchase.id}"
+
+        sale.status = "draft"
+        post_order_to_ledger(db, sale)
+        pay.status = "cancelled"
+        post_payment_to_ledger(db, pay)
+        assert _entries(db) == [("purchase", purchase.id, 0, 450), ("return_sale", 2, 0, 200)]
+
+    def test_opening_reads_snapshot_not_history(self, db, partner):
+        _order(db, "S-1", 1000, datetime(2025, 11, 10))
+        _order(db, "S-2", 500, datetime(2026, 1, 20))
+        assert write_partner_snapshots(db, date(2026, 1, 1)) == 1
+        assert write_partner_snapshots(db, date(2026, 2, 1)) == 1
+        snap = db.query(PartnerBalanceSnapshot).filter(PartnerBalanceSnapshot.month == date(2026, 2, 1)).one()
+        assert snap.debit == 1500
+
+        # Orqa sana bilan kiritilgan hujjat keyingi snapshotlarni tuzatadi
+        _order(db, "S-3", 70, datetime(2025, 12, 31, 23, 0))
+        assert partner_totals_before(db, 1, datetime(2026, 2, 15)) == (1570, 0)
+        # Snapshotdan oldingi tarix o'qilmaydi: eski yozuv qo'lda o'chirilsa ham davr boshi o'zgarmaydi
+        db.query(PartnerLedgerEntry).filter(PartnerLedgerEntry.doc_number == "S-1").delete()
+        assert partner_totals_before(db, 1, datetime(2026, 2, 15)) == (1570, 0)
+
+    def test_balance_doc_and_rebuild(self, db, partner):
+        _order(db, "S-1", 1000, datetime(2026, 1, 10))
+        doc = PartnerBalanceDoc(number="KQ-1", status="confirmed", date=datetime(2026, 1, 20))
+        doc.items = [PartnerBalanceDocItem(partner_id=1, balance=-250)]
+        db.add(doc)
+        db.flush()
+        post_balance_doc_to_ledger(db, doc)
+        assert partner_totals_before(db, 1, datetime(2026, 1, 21)) == (1000, 1250)
+
+        pay = Payment(number="P-1", type="expense", partner_id=1, amount=250, date=datetime(2026, 1, 25))
+        db.add(pay)
+        db.flush()
+        post_payment_to_ledger(db, pay)  # status bo'sh — tasdiqlangan hisoblanadi
+        incremental = _entries(db)
+        rebuild_partner_ledger(db)
+        assert _entries(db) == incremental
+
+        doc.status = "draft"
+        post_balance_doc_to_ledger(db, doc)
+        assert partner_totals_before(db, 1, datetime(2026, 2, 1)) == (1250, 0)
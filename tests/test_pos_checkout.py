@@ -0,0 +1,82 @@
+"""
+POS chek yakunlash (pos_checkout) testlari.
+pytest tests/test_pos_checkout.py -v
+"""
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import event
+
+from app.models.database import CashRegister, Order, OrderItem, Partner, Payment, Product, Stock, StockMovement, Warehouse
+from app.services.pos_checkout import PosCheckoutError, complete_pos_checkout
+
+
+def _seed(db, n_products):
+    db.add_all([Partner(id=1, code="chakana", name="Chakana xaridor"), CashRegister(id=1, name="Naqd", balance=0)])
+    for pid in range(10, 10 + n_products):
+        db.add(Product(id=pid, code=f"T{pid}", name=f"Tovar {pid}", sale_price=1000))
+        db.add(Stock(warehouse_id=1, product_id=pid, quantity=100))
+    db.commit()
+
+
+def _checkout(db, cart):
+    return complete_pos_checkout(
+        db,
+        warehouse=db.get(Warehouse, 1),
+        partner=db.get(Partner, 1),
+        is_cash_client=True,
+        cart=cart,
+        price_type_id=None,
+        payment_type="naqd",
+        user_id=None,
+        cash_register=db.get(CashRegister, 1),
+    )
+
+
+def _count_statements(db, fn):
+    count = {"n": 0}
+
+    def _before(*args, **kwargs):
+        count["n"] += 1
+
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", _before)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", _before)
+    return count["n"]
+
+
+class TestPosCheckout:
+    def test_writes_order_items_movements_and_payment(self, db):
+        _seed(db, 3)
+        order = _checkout(db, [(10, 2, None), (11, 1, 500.0)])
+        db.commit()
+        assert order.status == "completed"
+        assert order.total == 2500
+        assert db.query(OrderItem).count() == 2
+        assert db.query(StockMovement).filter(StockMovement.document_id == order.id).count() == 2
+        assert db.query(Stock).filter(Stock.product_id == 10).one().quantity == 98
+        assert db.query(Payment).one().amount == 2500
+        assert db.get(CashRegister, 1).balance == 2500
+
+    def test_shortage_writes_nothing(self, db):
+        _seed(db, 1)
+        with pytest.raises(PosCheckoutError) as exc:
+            _checkout(db, [(10, 60, None), (10, 50, None)])
+        db.rollback()
+        assert exc.value.code == "stock"
+        assert db.query(Order).count() == 0
+        assert db.query(Stock).one().quantity == 100
+
+    def test_query_count_independent_of_cart_size(self, db):
+        _seed(db, 40)
+        _checkout(db, [(pid, 1, None) for pid in range(10, 50)])
+        db.commit()
+        db.expire_all()
+        small = _count_statements(db, lambda: (_checkout(db, [(10, 1, None)]), db.commit()))
+        db.expire_all()
+        large = _count_statements(db, lambda: (_checkout(db, [(pid, 1, None) for pid in range(10, 50)]), db.commit()))
+        assert large == small
@@ -0,0 +1,97 @@
+"""
+Ishlab chiqarishni ommaviy yakunlash (app/services/production_batch.py) testlari.
+pytest tests/test_production_batch.py -v
+"""
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import event
+
+from app.models.database import Product, Production, Recipe, RecipeItem, Stock, StockMovement, Warehouse
+from app.services.production_batch import apply_completion, plan_completion, revert_completion, shortage_lines
+from app.services.recipe_costing import invalidate_recipe_costs
+
+
+@pytest.fixture
+def shift(db):
+    """Pasta (yarim tayyor, 3) = 1 kg Shakar; Halva (4) = 0.5 kg Pasta + 0.5 kg Holva. 3 ta buyurtma."""
+    db.add_all([
+        Warehouse(id=2, code="YT", name="Yarim tayyor ombori"),
+        Product(id=3, code="P3", name="Pasta", type="yarim_tayyor"),
+        Product(id=4, code="P4", name="Halva", type="tayyor", purchase_price=0),
+        Stock(warehouse_id=1, product_id=1, quantity=100),
+        Stock(warehouse_id=1, product_id=2, quantity=15),
+        Recipe(id=1, product_id=3, name="Pasta", output_quantity=1, is_active=True),
+        RecipeItem(recipe_id=1, product_id=2, quantity=1),
+        Recipe(id=2, product_id=4, name="Halva", output_quantity=1, is_active=True),
+        RecipeItem(recipe_id=2, product_id=3, quantity=0.5),
+        RecipeItem(recipe_id=2, product_id=1, quantity=0.5),
+    ])
+    db.add_all([
+        Production(id=1, number="PR-1", recipe_id=1, warehouse_id=1, output_warehouse_id=2, quantity=10, date=datetime(2026, 1, 1)),
+        Production(id=2, number="PR-2", recipe_id=1, warehouse_id=1, output_warehouse_id=2, quantity=10, date=datetime(2026, 1, 2)),
+        Production(id=3, number="PR-3", recipe_id=2, warehouse_id=1, quantity=8, date=datetime(2026, 1, 3)),
+    ])
+    db.commit()
+    invalidate_recipe_costs()
+    yield db.query(Production).order_by(Production.id).all()
+    invalidate_recipe_costs()
+
+
+def _stock(db, wh_id, product_id):
+    return db.query(Stock.quantity).filter(Stock.warehouse_id == wh_id, Stock.product_id == product_id).scalar()
+
+
+class TestProductionBatch:
+    def test_allocates_in_order_and_reports_shortage(self, db, shift):
+        batch = plan_completion(db, shift)
+        assert [p.draws for p in batch.plans] == [
+            [(1, 2, 10.0, 10.0)],
+            [(1, 2, 10.0, 5.0)],  # Shakar 15 — ikkinchisiga 5 qoladi
+            [(2, 3, 4.0, 4.0), (1, 1, 4.0, 4.0)],  # Pasta oldingi buyurtmalar chiqimidan
+        ]
+        assert shortage_lines(db, batch) == ["PR-2: Shakar (Asosiy) — kerak 10.0, mavjud 5.0"]
+
+    def test_apply_writes_movements_and_stock(self, db, shift):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        engine = db.get_bind()
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            written = apply_completion(db, plan_completion(db, shift), user_id=None)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        db.commit()
+        assert written == 7
+        assert len(statements) < 20
+        assert _stock(db, 1, 2) == 0
+        assert _stock(db, 2, 3) == 16  # 10 + 10 - 4
+        assert _stock(db, 1, 4) == 8
+        moves = db.query(StockMovement.document_id, StockMovement.product_id, StockMovement.quantity_change).filter(
+            StockMovement.document_type == "Production"
+        ).order_by(StockMovement.id).all()
+        assert [(d, p, q) for d, p, q in moves if d == 3] == [(3, 3, -4), (3, 1, -4), (3, 4, 8)]
+        # Tayyor mahsulot narxi: 4 * Pasta (5 so'm/kg) + 4 * Holva (10) = 60 -> 7.5 so'm/kg
+        assert db.get(Product, 4).purchase_price == 7.5
+
+    def test_revert_reverses_recorded_movements(self, db, shift):
+        apply_completion(db, plan_completion(db, shift))
+        db.commit()
+        pr2, pr3 = shift[1], shift[2]
+        # Pasta yarim tayyor omboriga qaytadi (buyurtma omboriga emas), Shakar — tortilgan 5, kerakli 10 emas
+        assert revert_completion(db, pr3, db.get(Recipe, 2)) is None
+        assert revert_completion(db, pr2, db.get(Recipe, 1)) is None
+        db.commit()
+        assert (_stock(db, 2, 3), _stock(db, 1, 3)) == (10, None)
+        assert (_stock(db, 1, 1), _stock(db, 1, 2), _stock(db, 1, 4)) == (100, 5, 0)
+        assert db.query(StockMovement).filter(StockMovement.document_id.in_([2, 3])).count() == 0
+
+        # Tayyor mahsulot sotilgan — qaytarib bo'lmaydi, hech narsa o'zgarmaydi
+        db.query(Stock).filter(Stock.warehouse_id == 2, Stock.product_id == 3).one().quantity = 4
+        assert revert_completion(db, shift[0], db.get(Recipe, 1)) == (
+            "«Yarim tayyor ombori» da «Pasta» dan kerak: 10.0, mavjud: 4.0"
+        )
+        assert _stock(db, 1, 2) == 5
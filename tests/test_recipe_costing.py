@@ -0,0 +1,67 @@
+"""
+Retsept tannarxi (app/services/recipe_costing.py) testlari.
+pytest tests/test_recipe_costing.py -v
+"""
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import event
+
+from app.models.database import Product, Recipe, RecipeItem
+from app.services.recipe_costing import get_cost_book, invalidate_recipe_costs, load_cost_book
+
+
+@pytest.fixture
+def recipes(db):
+    """Holva (3) <- Pasta (yarim tayyor, 4) <- Shakar (2) + Kunjut (5)."""
+    db.add_all([
+        Product(id=3, code="P3", name="Holva 1kg", type="tayyor"),
+        Product(id=4, code="P4", name="Pasta", type="yarim_tayyor"),
+        Product(id=5, code="P5", name="Kunjut", type="hom_ashyo", purchase_price=30),
+        Recipe(id=1, product_id=4, name="Pasta", output_quantity=2, is_active=True),
+        RecipeItem(recipe_id=1, product_id=2, quantity=2),  # 2 * 5
+        RecipeItem(recipe_id=1, product_id=5, quantity=1),  # 1 * 30
+        Recipe(id=2, product_id=3, name="Holva", output_quantity=1, is_active=True),
+        RecipeItem(recipe_id=2, product_id=4, quantity=0.5),
+        RecipeItem(recipe_id=2, product_id=2, quantity=1),
+    ])
+    db.commit()
+    invalidate_recipe_costs()
+    yield
+    invalidate_recipe_costs()
+
+
+class TestRecipeCosting:
+    def test_nested_semi_finished(self, db, recipes):
+        book = load_cost_book(db)
+        assert book.recipe_cost_per_kg(1) == 20  # (10 + 30) / 2
+        assert book.ingredient_cost(4) == 20
+        assert book.recipe_cost_per_kg(2) == 15  # 0.5 * 20 + 1 * 5
+        assert book.ingredient_cost(5) == 30 and book.ingredient_cost(2) == 5
+
+    def test_cycle_falls_back_to_price(self, db, recipes):
+        db.query(Product).filter(Product.id == 4).update({"purchase_price": 8})
+        db.add(RecipeItem(recipe_id=1, product_id=4, quantity=1))  # Pasta o'zini o'z ichiga oladi
+        db.commit()
+        book = load_cost_book(db)
+        assert set(book.costs) == {1, 2}
+        assert book.recipe_cost_per_kg(1) == 24  # (10 + 30 + 8) / 2
+
+    def test_three_queries_and_cache_invalidation(self, db, recipes):
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        engine = db.get_bind()
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            book = get_cost_book(db)
+            assert get_cost_book(db) is book
+            assert len(statements) == 3
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+        db.query(RecipeItem).filter(RecipeItem.recipe_id == 2, RecipeItem.product_id == 2).update({"quantity": 3})
+        db.commit()
+        assert get_cost_book(db).recipe_cost_per_kg(2) == 15  # kesh hali eski
+        invalidate_recipe_costs()
+        assert get_cost_book(db).recipe_cost_per_kg(2) == 25
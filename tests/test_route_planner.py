@@ -0,0 +1,76 @@
+"""
+Marshrut tartibi (app/services/route_planner.py) testlari.
+pytest tests/test_route_planner.py -v
+"""
+import itertools
+import random
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.models.database import Delivery, Order, Partner, PartnerLocation, Route, RoutePoint
+from app.services.route_planner import delivery_order, optimize_route, plan_order
+from app.utils.geo import haversine_m
+
+
+def _length(coords, order, start=None, back=False):
+    pts = [coords[i] for i in order]
+    if start:
+        pts = [start] + pts + ([start] if back else [])
+    return sum(haversine_m(*pts[i], *pts[i + 1]) for i in range(len(pts) - 1))
+
+
+class TestPlanOrder:
+    def test_small_instances_near_optimal(self):
+        rng = random.Random(5)
+        for _ in range(30):
+            n = rng.randint(1, 7)
+            coords = [(40.5 + rng.random() * 0.1, 70.9 + rng.random() * 0.1) for _ in range(n)]
+            start = rng.choice([None, (40.55, 70.95)])
+            back = start is not None and rng.random() < 0.5
+            plan = plan_order(coords, start, back)
+            assert sorted(plan.order) == list(range(n))
+            assert plan.distance_m == pytest.approx(_length(coords, plan.order, start, back))
+            best = min(_length(coords, perm, start, back) for perm in itertools.permutations(range(n)))
+            assert plan.distance_m <= best * 1.05 + 1e-6
+
+    def test_two_hundred_stops_fast(self):
+        rng = random.Random(11)
+        coords = [(40.4 + rng.random() * 0.3, 70.8 + rng.random() * 0.3) for _ in range(200)]
+        plan = plan_order(coords, start=(40.55, 70.95), time_limit=0.5)
+        assert sorted(plan.order) == list(range(200))
+        assert plan.elapsed < 1.0
+        assert plan.distance_m < plan.initial_distance_m * 0.95
+        assert plan.distance_m == pytest.approx(_length(coords, plan.order, (40.55, 70.95)))
+
+
+class TestRoutePlannerDb:
+    def test_optimize_route_and_delivery_order(self, db):
+        # g'arbdan sharqqa bir chiziq: 10 -> 11 -> 12, 13 — koordinatasiz
+        spots = {10: (40.50, 70.90), 11: (40.50, 70.95), 12: (40.50, 71.00)}
+        for pid in (10, 11, 12, 13):
+            db.add(Partner(id=pid, name=f"Do'kon {pid}", type="customer", is_active=True))
+        for pid, (lat, lng) in spots.items():
+            db.add(PartnerLocation(partner_id=pid, latitude=lat, longitude=lng, is_primary=True))
+        db.add(Route(id=1, name="Dushanba", day_of_week=0))
+        for num, pid in enumerate((12, 13, 10, 11), start=1):
+            db.add(RoutePoint(route_id=1, partner_id=pid, order_num=num))
+        db.flush()
+        plan = optimize_route(db, db.get(Route, 1), start=(40.50, 70.89))
+        db.flush()
+        points = db.query(RoutePoint).order_by(RoutePoint.order_num).all()
+        assert [p.partner_id for p in points] == [10, 11, 12, 13]
+        assert plan.distance_m == pytest.approx(haversine_m(40.50, 70.89, 40.50, 71.00))
+
+        db.add(Order(id=1, number="S-1", type="sale", partner_id=12))
+        db.add(Order(id=2, number="S-2", type="sale", partner_id=10))
+        db.add(Delivery(id=1, number="D-1", driver_id=3, order_id=1, status="pending", planned_date=datetime(2026, 3, 1, 9)))
+        db.add(Delivery(id=2, number="D-2", driver_id=3, order_number="S-2", status="pending", planned_date=datetime(2026, 3, 1, 9)))
+        db.add(Delivery(id=3, number="D-3", driver_id=3, order_number="qo'lda", status="pending", planned_date=datetime(2026, 3, 1, 9)))
+        db.add(Delivery(id=4, number="D-4", driver_id=3, order_id=2, status="delivered", planned_date=datetime(2026, 3, 1, 9)))
+        db.flush()
+        ordered, unlocated, _plan = delivery_order(db, 3, start=(40.50, 71.01))
+        assert [x.id for x in ordered] == [1, 2]
+        assert [x.id for x in unlocated] == [3]
@@ -0,0 +1,66 @@
+"""
+Kunlik savdo yig'indisi (sales_rollup) testlari.
+pytest tests/test_sales_rollup.py -v
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.models.database import DailySalesRollup, Order, Partner
+from app.services.sales_rollup import (
+    apply_order_to_rollup,
+    daily_sales_totals,
+    rebuild_sales_rollup,
+    top_partners_by_sales,
+)
+
+
+def _order(db, number, total, o_type="sale", days_ago=0, partner_id=1):
+    order = Order(
+        number=number,
+        type=o_type,
+        partner_id=partner_id,
+        warehouse_id=1,
+        status="completed",
+        total=total,
+        created_at=datetime.now() - timedelta(days=days_ago),
+    )
+    db.add(order)
+    db.flush()
+    return order
+
+
+class TestSalesRollup:
+    def test_complete_revert_and_return(self, db):
+        db.add(Partner(id=1, code="K1", name="Mijoz"))
+        sale = _order(db, "S-1", 1000)
+        apply_order_to_rollup(db, sale)
+        apply_order_to_rollup(db, _order(db, "S-2", 500))
+        apply_order_to_rollup(db, _order(db, "R-1", 200, o_type="return_sale"))
+        db.commit()
+        row = db.query(DailySalesRollup).one()
+        assert (row.sales_total, row.sales_count) == (1500, 2)
+        assert (row.returns_total, row.returns_count) == (200, 1)
+
+        sale.status = "draft"
+        apply_order_to_rollup(db, sale, sign=-1)
+        db.commit()
+        today = datetime.now().date()
+        assert daily_sales_totals(db, today, today)[today] == {"total": 500.0, "count": 1, "returns": 200.0}
+
+    def test_rebuild_matches_incremental(self, db):
+        db.add_all([Partner(id=1, code="K1", name="A"), Partner(id=2, code="K2", name="B")])
+        for number, total, days_ago, partner_id in [("S-1", 100, 0, 1), ("S-2", 300, 1, 2), ("S-3", 50, 1, 1)]:
+            apply_order_to_rollup(db, _order(db, number, total, days_ago=days_ago, partner_id=partner_id))
+        db.commit()
+        today = datetime.now().date()
+        incremental = daily_sales_totals(db, today - timedelta(days=6), today)
+
+        assert rebuild_sales_rollup(db) == 3
+        db.commit()
+        assert daily_sales_totals(db, today - timedelta(days=6), today) == incremental
+        assert len(incremental) == 7
+        assert incremental[today - timedelta(days=1)]["total"] == 350
+        assert [p[0] for p in top_partners_by_sales(db, today - timedelta(days=30), today)] == [2, 1]
@@ -0,0 +1,75 @@
+"""
+Qoldiq manbalari (stock_provenance) testlari: natija qatorma-qator so'rovlar bilan bir xil, so'rovlar soni esa 3 ta.
+pytest tests/test_stock_provenance.py -v
+"""
+from datetime import datetime
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import event
+
+from app.models.database import (
+    Production,
+    Purchase,
+    PurchaseItem,
+    Recipe,
+    Stock,
+    StockAdjustmentDoc,
+    StockAdjustmentDocItem,
+    Warehouse,
+)
+from app.services.stock_provenance import latest_sources, stock_sources_for
+
+
+def _seed(db):
+    db.add(Warehouse(id=2, code="W2", name="Tayyor"))
+    db.add_all([
+        Stock(id=1, warehouse_id=1, product_id=1, quantity=5),
+        Stock(id=2, warehouse_id=1, product_id=2, quantity=3),
+        Stock(id=3, warehouse_id=2, product_id=1, quantity=4),
+    ])
+    for i in range(1, 6):
+        db.add(Purchase(id=i, number=f"XP-{i}", date=datetime(2026, 3, i), warehouse_id=1,
+                        status="confirmed" if i != 5 else "draft"))
+        # Bitta xaridda bir mahsulot ikki qatorda — hujjat bir marta chiqishi kerak
+        db.add_all([
+            PurchaseItem(purchase_id=i, product_id=1, quantity=1, price=1, total=1),
+            PurchaseItem(purchase_id=i, product_id=1, quantity=2, price=1, total=2),
+        ])
+    db.add(Recipe(id=1, product_id=1, name="Holva"))
+    db.add_all([
+        Production(id=1, number="IC-1", date=datetime(2026, 3, 10), recipe_id=1, warehouse_id=1,
+                   output_warehouse_id=2, status="completed"),
+        Production(id=2, number="IC-2", date=datetime(2026, 3, 11), recipe_id=1, warehouse_id=1,
+                   output_warehouse_id=None, status="completed"),
+        Production(id=3, number="IC-3", date=datetime(2026, 3, 12), recipe_id=1, warehouse_id=1, status="draft"),
+    ])
+    db.add(StockAdjustmentDoc(id=1, number="QD-1", date=datetime(2026, 2, 1), status="confirmed"))
+    db.add(StockAdjustmentDocItem(doc_id=1, product_id=2, warehouse_id=1, quantity=3))
+    db.commit()
+
+
+class TestStockProvenance:
+    def test_latest_sources_per_key(self, db):
+        _seed(db)
+        sources = latest_sources(db, {(1, 1), (1, 2), (2, 1)})
+        assert sources[(1, 1)] == [
+            ("IC-2", "/production/orders", "11.03.2026"),
+            ("XP-4", "/purchases/edit/4", "04.03.2026"),
+            ("XP-3", "/purchases/edit/3", "03.03.2026"),
+            ("XP-2", "/purchases/edit/2", "02.03.2026"),
+        ]
+        assert sources[(1, 2)] == [("QD-1", "/qoldiqlar/tovar/hujjat/1", "01.02.2026")]
+        assert sources[(2, 1)] == [("IC-1", "/production/orders", "10.03.2026")]
+
+    def test_three_queries_regardless_of_rows(self, db):
+        _seed(db)
+        stocks = db.query(Stock).all()
+        statements = []
+        event.listen(db.get_bind(), "before_cursor_execute", lambda *a: statements.append(a[2]))
+        result = stock_sources_for(db, stocks)
+        assert len(statements) == 3
+        assert set(result) == {1, 2, 3}
+        assert stock_sources_for(db, []) == {}
@@ -0,0 +1,166 @@
+"""
+Ombor xizmati (stock_service) testlari — xotiradagi SQLite bazada.
+pytest tests/test_stock_service.py -v
+"""
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from app.models.database import Stock, StockAdjustmentDoc, StockSourceFlag
+from app.services.stock_service import (
+    create_stock_movement,
+    create_stock_movements_bulk,
+    delete_stock_movements_for_document,
+    rebuild_stock_source_flags,
+)
+
+
+class TestStockSourceFlags:
+    """create_stock_movement manba bayrog'ini yuritadi, qoldiq hisoboti shu bayroqdan o'qiydi."""
+
+    def test_movement_marks_source(self, db):
+        create_stock_movement(db, 1, 1, 5, "purchase", "Purchase", 10)
+        create_stock_movement(db, 1, 1, 3, "purchase", "Purchase", 11)
+        db.commit()
+        flags = db.query(StockSourceFlag).all()
+        assert len(flags) == 1
+        assert flags[0].has_confirmed_source is True
+        assert db.query(Stock).one().quantity == 8
+
+    def test_revert_clears_source(self, db):
+        db.add(StockAdjustmentDoc(id=7, number="QH-1", status="confirmed"))
+        create_stock_movement(db, 1, 2, 4, "adjustment", "StockAdjustmentDoc", 7)
+        db.commit()
+        delete_stock_movements_for_document(db, "StockAdjustmentDoc", 7)
+        db.commit()
+        flag = db.query(StockSourceFlag).filter(StockSourceFlag.product_id == 2).one()
+        assert flag.has_confirmed_source is False
+
+    def test_report_reads_flags(self, db):
+        from app.routes.reports import _stock_report_filtered
+        create_stock_movement(db, 1, 1, 5, "purchase", "Purchase", 10)
+        db.add(Stock(warehouse_id=1, product_id=2, quantity=9))  # manbasiz qoldiq
+        db.commit()
+        rows = _stock_report_filtered(db)
+        assert [(r["product"].id, r["quantity"]) for r in rows] == [(1, 5.0)]
+
+    def test_rebuild_skips_unconfirmed_adjustment(self, db):
+        db.add(StockAdjustmentDoc(id=8, number="QH-2", status="draft"))
+        create_stock_movement(db, 1, 2, 4, "adjustment", "StockAdjustmentDoc", 8)
+        create_stock_movement(db, 1, 1, 1, "purchase", "Purchase", 12)
+        db.commit()
+        assert rebuild_stock_source_flags(db) == 1
+        db.commit()
+        assert [(f.product_id, f.has_confirmed_source) for f in db.query(StockSourceFlag).all()] == [(1, True)]
+
+    def test_deleting_adjustment_doc_clears_flag(self, db):
+        import asyncio
+        from app.models.database import StockAdjustmentDocItem
+        from app.routes.qoldiqlar import qoldiqlar_tovar_hujjat_delete
+        # Eski ma'lumot: qoralamaga qaytgan hujjat, harakati o'chirilmay qolgan
+        db.add(StockAdjustmentDoc(id=9, number="QH-3", status="confirmed"))
+        db.add(StockAdjustmentDocItem(doc_id=9, product_id=2, warehouse_id=1, quantity=4))
+        create_stock_movement(db, 1, 2, 4, "adjustment", "StockAdjustmentDoc", 9)
+        db.commit()
+        db.get(StockAdjustmentDoc, 9).status = "draft"
+        db.commit()
+        asyncio.run(qoldiqlar_tovar_hujjat_delete(9, db=db, current_user=None))
+        flag = db.query(StockSourceFlag).filter(StockSourceFlag.product_id == 2).one()
+        assert flag.has_confirmed_source is False
+
+
+class TestStockMovementsBulk:
+    """create_stock_movements_bulk natijasi ketma-ket create_stock_movement bilan bir xil."""
+
+    def test_matches_sequential_calls(self, db):
+        from app.models.database import StockMovement
+        items = [(1, 1, 5), (1, 2, -3), (1, 1, -7), (1, 1, 4)]
+        db.add(Stock(warehouse_id=1, product_id=2, quantity=8))
+        db.commit()
+        assert create_stock_movements_bulk(db, items, "purchase", "Purchase", 1) == 4
+        db.commit()
+        bulk = [(m.product_id, m.quantity_change, m.quantity_after) for m in db.query(StockMovement).order_by(StockMovement.id)]
+        assert bulk == [(1, 5, 5), (2, -3, 5), (1, -7, 0), (1, 4, 4)]
+        assert {s.product_id: s.quantity for s in db.query(Stock).all()} == {1: 4, 2: 5}
+        assert db.query(StockSourceFlag).count() == 2
+
+    def test_empty_is_noop(self, db):
+        assert create_stock_movements_bulk(db, [], "sale", "Sale", 1) == 0
+
+
+class TestStockSnapshots:
+    """Sana bo'yicha qoldiq: snapshot + keyingi harakatlar = to'liq tarixdan hisoblangan natija."""
+
+    def _movement(self, db, product_id, change, day):
+        from datetime import datetime
+        m = create_stock_movement(db, 1, product_id, change, "purchase", "Purchase", 100 + day)
+        m.created_at = datetime(2026, 1, day, 12, 0)
+        db.flush()
+
+    def test_as_of_matches_full_replay(self, db):
+        from datetime import date
+        from app.models.database import StockSnapshot
+        from app.services.stock_service import stock_quantities_as_of, write_stock_snapshot
+        self._movement(db, 1, 5, 1)
+        self._movement(db, 2, 7, 2)
+        self._movement(db, 1, -2, 3)
+        db.commit()
+        full = stock_quantities_as_of(db, date(2026, 1, 3))
+        assert write_stock_snapshot(db, date(2026, 1, 2)) == 2
+        db.commit()
+        assert db.query(StockSnapshot).count() == 2
+        assert stock_quantities_as_of(db, date(2026, 1, 3)) == full == {(1, 1): 3.0, (1, 2): 7.0}
+        assert stock_quantities_as_of(db, date(2026, 1, 1)) == {(1, 1): 5.0}
+
+    def test_delete_invalidates_later_snapshots(self, db):
+        from datetime import date
+        from app.models.database import StockSnapshot
+        from app.services.stock_service import write_stock_snapshot
+        self._movement(db, 1, 5, 1)
+        self._movement(db, 2, 7, 2)
+        db.commit()
+        write_stock_snapshot(db, date(2026, 1, 1))
+        write_stock_snapshot(db, date(2026, 1, 2))
+        db.commit()
+        delete_stock_movements_for_document(db, "Purchase", 102)
+        db.commit()
+        assert [r.snapshot_date for r in db.query(StockSnapshot).all()] == [date(2026, 1, 1)]
+
+    def test_fill_rebuilds_invalidated_days(self, db):
+        from datetime import date
+        from app.models.database import StockSnapshot
+        from app.services.stock_service import fill_stock_snapshots, write_stock_snapshot
+        self._movement(db, 1, 5, 1)
+        self._movement(db, 2, 7, 2)
+        self._movement(db, 1, 1, 3)
+        db.commit()
+        for day in (1, 2, 3):
+            write_stock_snapshot(db, date(2026, 1, day))
+        delete_stock_movements_for_document(db, "Purchase", 102)
+        db.commit()
+        assert fill_stock_snapshots(db, date(2026, 1, 4), keep_days=100000) == (3, 3)
+        db.commit()
+        rows = db.query(StockSnapshot).filter(StockSnapshot.snapshot_date == date(2026, 1, 4)).all()
+        assert {(r.product_id, r.quantity) for r in rows} == {(1, 6.0)}
+        assert db.query(StockSnapshot.snapshot_date).distinct().count() == 4
+        # Eski kunlar — faqat oy oxiri
+        assert fill_stock_snapshots(db, date(2026, 2, 2), keep_days=0) == (1, 1)
+        assert fill_stock_snapshots(db, date(2026, 2, 2)) == (0, 0)
+
+
+class TestDuplicateNewStockKeys:
+    """Hujjatda bir yangi mahsulot ikki marta — uq_stocks_warehouse_product buzilmasligi kerak."""
+
+    def test_purchase_with_same_new_product_twice(self, db):
+        import asyncio
+        from app.models.database import Product, Purchase, PurchaseItem
+        from app.routes.purchases import purchase_confirm
+        db.add(Purchase(id=1, number="P-1", warehouse_id=1, total=80, status="draft"))
+        db.add(PurchaseItem(purchase_id=1, product_id=2, quantity=2, price=10, total=20))
+        db.add(PurchaseItem(purchase_id=1, product_id=2, quantity=3, price=20, total=60))
+        db.commit()
+        asyncio.run(purchase_confirm(1, db=db, current_user=None))
+        assert db.get(Purchase, 1).status == "confirmed"
+        assert db.query(Stock).one().quantity == 5
+        # o'rtacha tannarx: ikkinchi qator birinchisining qoldig'ini ko'radi — (2*10 + 3*20) / 5
+        assert db.get(Product, 2).purchase_price == pytest.approx(16)